@@ -0,0 +1,103 @@
+locals {
+  rate_limit_enabled = var.mesh_rate_limit > 0
+  # the send dispatchers share their step function start rate through the same table
+  dispatch_rate_limit_enabled = var.send_via_queue && var.send_dispatch_max_starts_per_second > 0
+  rate_limit_table_enabled    = local.rate_limit_enabled || local.dispatch_rate_limit_enabled
+  rate_limit_table_name       = "${local.name}-rate-limit"
+}
+
+resource "aws_dynamodb_table" "rate_limit" {
+  count        = local.rate_limit_table_enabled ? 1 : 0
+  name         = local.rate_limit_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "mailbox_id"
+
+  attribute {
+    name = "mailbox_id"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = aws_kms_key.mesh.arn
+  }
+
+  point_in_time_recovery {
+    enabled = false # transient rate limit state only
+  }
+}
+
+resource "aws_iam_policy" "rate_limit" {
+  count       = local.rate_limit_table_enabled ? 1 : 0
+  name        = "${local.rate_limit_table_name}-policy"
+  description = "${local.rate_limit_table_name}-policy"
+  policy      = data.aws_iam_policy_document.rate_limit[0].json
+}
+
+data "aws_iam_policy_document" "rate_limit" {
+  count = local.rate_limit_table_enabled ? 1 : 0
+  statement {
+    sid    = "DynamoDBAllow"
+    effect = "Allow"
+
+    actions = [
+      "dynamodb:GetItem",
+      "dynamodb:PutItem",
+    ]
+
+    resources = [
+      aws_dynamodb_table.rate_limit[0].arn
+    ]
+  }
+
+  statement {
+    sid    = "KMSAllow"
+    effect = "Allow"
+
+    actions = [
+      "kms:Decrypt",
+      "kms:GenerateDataKey",
+    ]
+
+    resources = [
+      aws_kms_alias.mesh.target_key_arn
+    ]
+  }
+}
+
+resource "aws_iam_role_policy_attachment" "rate_limit" {
+  for_each = merge(
+    local.rate_limit_enabled ? {
+      poll_mailbox        = aws_iam_role.poll_mailbox.name
+      fetch_message_chunk = aws_iam_role.fetch_message_chunk.name
+      send_message_chunk  = aws_iam_role.send_message_chunk.name
+    } : {},
+    local.dispatch_rate_limit_enabled ? {
+      dispatch_send_messages = aws_iam_role.dispatch_send_messages[0].name
+    } : {},
+  )
+  role       = each.value
+  policy_arn = aws_iam_policy.rate_limit[0].arn
+}
+
+resource "aws_security_group_rule" "rate_limit_dynamodb" {
+  for_each = local.vpc_enabled ? merge(
+    local.rate_limit_enabled ? {
+      poll_mailbox        = aws_security_group.poll_mailbox[0].id
+      fetch_message_chunk = aws_security_group.fetch_message_chunk[0].id
+      send_message_chunk  = aws_security_group.send_message_chunk[0].id
+    } : {},
+    local.dispatch_rate_limit_enabled ? {
+      # the dispatcher shares the check send parameters security group
+      dispatch_send_messages = aws_security_group.check_send_parameters[0].id
+    } : {},
+  ) : {}
+  type              = "egress"
+  security_group_id = each.value
+
+  from_port       = 443
+  to_port         = 443
+  protocol        = "tcp"
+  prefix_list_ids = [var.aws_dynamodb_endpoint_prefix_list_id]
+  description     = "to dynamodb"
+}
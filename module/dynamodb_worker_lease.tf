@@ -0,0 +1,80 @@
+locals {
+  worker_lease_table_name = "${local.name}-worker-lease"
+}
+
+resource "aws_dynamodb_table" "worker_lease" {
+  count        = var.mesh_worker_leases ? 1 : 0
+  name         = local.worker_lease_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "mailbox_id"
+
+  attribute {
+    name = "mailbox_id"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = aws_kms_key.mesh.arn
+  }
+
+  point_in_time_recovery {
+    enabled = false # transient lease state only
+  }
+}
+
+resource "aws_iam_policy" "worker_lease" {
+  count       = var.mesh_worker_leases ? 1 : 0
+  name        = "${local.worker_lease_table_name}-policy"
+  description = "${local.worker_lease_table_name}-policy"
+  policy      = data.aws_iam_policy_document.worker_lease[0].json
+}
+
+data "aws_iam_policy_document" "worker_lease" {
+  count = var.mesh_worker_leases ? 1 : 0
+  statement {
+    sid    = "DynamoDBAllow"
+    effect = "Allow"
+
+    # the poll lambda only checks leases, they are taken by the mesh workers
+    actions = [
+      "dynamodb:GetItem",
+    ]
+
+    resources = [
+      aws_dynamodb_table.worker_lease[0].arn
+    ]
+  }
+
+  statement {
+    sid    = "KMSAllow"
+    effect = "Allow"
+
+    actions = [
+      "kms:Decrypt",
+    ]
+
+    resources = [
+      aws_kms_alias.mesh.target_key_arn
+    ]
+  }
+}
+
+resource "aws_iam_role_policy_attachment" "worker_lease" {
+  count      = var.mesh_worker_leases ? 1 : 0
+  role       = aws_iam_role.poll_mailbox.name
+  policy_arn = aws_iam_policy.worker_lease[0].arn
+}
+
+resource "aws_security_group_rule" "worker_lease_dynamodb" {
+  # the rate limit table already opens the same egress for the poll lambda
+  count             = local.vpc_enabled && var.mesh_worker_leases && !local.rate_limit_enabled ? 1 : 0
+  type              = "egress"
+  security_group_id = aws_security_group.poll_mailbox[0].id
+
+  from_port       = 443
+  to_port         = 443
+  protocol        = "tcp"
+  prefix_list_ids = [var.aws_dynamodb_endpoint_prefix_list_id]
+  description     = "to dynamodb"
+}
@@ -1,3 +1,12 @@
+locals {
+  # a single target polling all mailboxes concurrently, or a target ( and execution ) per mailbox
+  get_messages_mailbox_groups = (
+    var.poll_mailboxes_together ?
+    { for group in ["All"] : group => sort(tolist(var.mailbox_ids)) } :
+    { for mailbox_id in var.mailbox_ids : mailbox_id => tolist([mailbox_id]) }
+  )
+}
+
 resource "aws_cloudwatch_event_rule" "get_messages" {
   name                = "${local.name}-get-messages"
   description         = "${local.name}-get-messages"
@@ -6,16 +15,18 @@ resource "aws_cloudwatch_event_rule" "get_messages" {
 }
 
 resource "aws_cloudwatch_event_target" "get_messages" {
-  for_each = var.mailbox_ids
+  for_each = local.get_messages_mailbox_groups
 
   rule      = aws_cloudwatch_event_rule.get_messages.name
   target_id = "GetMessages${each.key}"
   arn       = aws_sfn_state_machine.get_messages.arn
   role_arn  = aws_iam_role.get_messages_event.arn
 
-  input = jsonencode({
-    mailbox = each.value
-  })
+  input = (
+    var.poll_mailboxes_together ?
+    jsonencode({ mailboxes = each.value }) :
+    jsonencode({ mailbox = each.value[0] })
+  )
 
   depends_on = [
     data.aws_ssm_parameter.ca_cert,
@@ -5,17 +5,18 @@ resource "aws_cloudwatch_event_rule" "get_messages_handshake" {
 }
 
 resource "aws_cloudwatch_event_target" "get_messages_handshake" {
-  for_each = var.mailbox_ids
+  for_each = local.get_messages_mailbox_groups
 
   rule      = aws_cloudwatch_event_rule.get_messages_handshake.name
   target_id = "GetMessages${each.key}"
   arn       = aws_sfn_state_machine.get_messages.arn
   role_arn  = aws_iam_role.get_messages_handshake_event.arn
 
-  input = jsonencode({
-    mailbox   = each.value
-    handshake = "true"
-  })
+  input = (
+    var.poll_mailboxes_together ?
+    jsonencode({ mailboxes = each.value, handshake = "true" }) :
+    jsonencode({ mailbox = each.value[0], handshake = "true" })
+  )
 
   depends_on = [
     data.aws_ssm_parameter.ca_cert,
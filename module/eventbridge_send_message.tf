@@ -41,12 +41,20 @@ resource "aws_cloudwatch_event_rule" "send_message_event" {
 }
 
 resource "aws_cloudwatch_event_target" "send_message_event" {
+  count     = var.send_via_queue ? 0 : 1
   rule      = aws_cloudwatch_event_rule.send_message_event.name
   target_id = "SendMessage"
   arn       = aws_sfn_state_machine.send_message.arn
   role_arn  = aws_iam_role.send_message_event.arn
 }
 
+resource "aws_cloudwatch_event_target" "send_message_queue" {
+  count     = var.send_via_queue ? 1 : 0
+  rule      = aws_cloudwatch_event_rule.send_message_event.name
+  target_id = "SendMessageQueue"
+  arn       = aws_sqs_queue.send_message[0].arn
+}
+
 resource "aws_iam_role" "send_message_event" {
   name               = "${local.name}-send-message-event"
   description        = "${local.name}-send-message-event"
@@ -93,4 +93,21 @@ data "aws_iam_policy_document" "mesh" {
     ]
     sid = "Mesh Allow CloudTrail to describe key"
   }
+
+  statement {
+    actions = [
+      "kms:Decrypt",
+      "kms:GenerateDataKey*",
+    ]
+    principals {
+      identifiers = [
+        "events.amazonaws.com",
+      ]
+      type = "Service"
+    }
+    resources = [
+      "*",
+    ]
+    sid = "Mesh Allow EventBridge to send to the encrypted send message queue"
+  }
 }
@@ -0,0 +1,293 @@
+locals {
+  dispatch_send_messages_name = "${local.name}-dispatch-send-messages"
+}
+
+resource "aws_sqs_queue" "send_message" {
+  count                      = var.send_via_queue ? 1 : 0
+  name                       = "${local.name}-send-message"
+  kms_master_key_id          = aws_kms_key.mesh.arn
+  visibility_timeout_seconds = local.lambda_timeout * 2
+  message_retention_seconds  = 1209600
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.send_message_dlq[0].arn
+    maxReceiveCount     = 10
+  })
+}
+
+resource "aws_sqs_queue" "send_message_dlq" {
+  count                     = var.send_via_queue ? 1 : 0
+  name                      = "${local.name}-send-message-dlq"
+  kms_master_key_id         = aws_kms_key.mesh.arn
+  message_retention_seconds = 1209600
+}
+
+resource "aws_sqs_queue_policy" "send_message" {
+  count     = var.send_via_queue ? 1 : 0
+  queue_url = aws_sqs_queue.send_message[0].id
+  policy    = data.aws_iam_policy_document.send_message_queue[0].json
+}
+
+data "aws_iam_policy_document" "send_message_queue" {
+  count = var.send_via_queue ? 1 : 0
+  statement {
+    sid    = "EventBridgeSend"
+    effect = "Allow"
+
+    actions = [
+      "sqs:SendMessage"
+    ]
+
+    principals {
+      type = "Service"
+
+      identifiers = [
+        "events.amazonaws.com",
+      ]
+    }
+
+    resources = [
+      aws_sqs_queue.send_message[0].arn
+    ]
+
+    condition {
+      test     = "ArnEquals"
+      variable = "aws:SourceArn"
+      values = [
+        aws_cloudwatch_event_rule.send_message_event.arn
+      ]
+    }
+  }
+}
+
+#tfsec:ignore:aws-lambda-enable-tracing
+resource "aws_lambda_function" "dispatch_send_messages" {
+  count            = var.send_via_queue ? 1 : 0
+  function_name    = local.dispatch_send_messages_name
+  filename         = data.archive_file.app.output_path
+  handler          = "mesh_dispatch_send_messages_application.lambda_handler"
+  runtime          = local.python_runtime
+  timeout          = local.lambda_timeout
+  source_code_hash = data.archive_file.app.output_base64sha256
+  role             = aws_iam_role.dispatch_send_messages[0].arn
+  layers           = [aws_lambda_layer_version.mesh_aws_client_dependencies.arn]
+
+  publish = true
+
+  environment {
+    variables = local.common_env_vars
+  }
+
+  dynamic "vpc_config" {
+    for_each = local.vpc_enabled ? [local.vpc_enabled] : []
+    content {
+      subnet_ids = var.subnet_ids
+      # the same s3, ssm and step function access as check send parameters
+      security_group_ids = [aws_security_group.check_send_parameters[0].id]
+    }
+  }
+
+  depends_on = [
+    aws_cloudwatch_log_group.dispatch_send_messages,
+    aws_iam_role_policy_attachment.dispatch_send_messages
+  ]
+}
+
+resource "aws_lambda_event_source_mapping" "dispatch_send_messages" {
+  count                              = var.send_via_queue ? 1 : 0
+  event_source_arn                   = aws_sqs_queue.send_message[0].arn
+  function_name                      = aws_lambda_function.dispatch_send_messages[0].arn
+  batch_size                         = var.send_dispatch_batch_size
+  maximum_batching_window_in_seconds = var.send_dispatch_batching_window
+  function_response_types            = ["ReportBatchItemFailures"]
+
+  scaling_config {
+    maximum_concurrency = var.send_dispatch_max_concurrency
+  }
+}
+
+resource "aws_cloudwatch_log_group" "dispatch_send_messages" {
+  count             = var.send_via_queue ? 1 : 0
+  name              = "/aws/lambda/${local.dispatch_send_messages_name}"
+  retention_in_days = var.cloudwatch_retention_in_days
+  kms_key_id        = aws_kms_key.mesh.arn
+  lifecycle {
+    ignore_changes = [
+      log_group_class, # localstack not currently returning this
+    ]
+  }
+}
+
+resource "aws_iam_role" "dispatch_send_messages" {
+  count              = var.send_via_queue ? 1 : 0
+  name               = "${local.dispatch_send_messages_name}-role"
+  description        = "${local.dispatch_send_messages_name}-role"
+  assume_role_policy = data.aws_iam_policy_document.check_send_parameters_assume.json
+}
+
+resource "aws_iam_role_policy_attachment" "dispatch_send_messages" {
+  count      = var.send_via_queue ? 1 : 0
+  role       = aws_iam_role.dispatch_send_messages[0].name
+  policy_arn = aws_iam_policy.dispatch_send_messages[0].arn
+}
+
+resource "aws_iam_policy" "dispatch_send_messages" {
+  count       = var.send_via_queue ? 1 : 0
+  name        = "${local.dispatch_send_messages_name}-policy"
+  description = "${local.dispatch_send_messages_name}-policy"
+  policy      = data.aws_iam_policy_document.dispatch_send_messages[0].json
+}
+
+#tfsec:ignore:aws-iam-no-policy-wildcards
+data "aws_iam_policy_document" "dispatch_send_messages" {
+  count = var.send_via_queue ? 1 : 0
+  statement {
+    sid    = "CloudWatchAllow"
+    effect = "Allow"
+
+    actions = [
+      "logs:CreateLogGroup",
+      "logs:CreateLogStream",
+      "logs:PutLogEvents"
+    ]
+
+    resources = [
+      aws_cloudwatch_log_group.dispatch_send_messages[0].arn,
+      "${aws_cloudwatch_log_group.dispatch_send_messages[0].arn}:*"
+    ]
+  }
+
+  statement {
+    sid    = "SQSAllow"
+    effect = "Allow"
+
+    actions = [
+      "sqs:ReceiveMessage",
+      "sqs:DeleteMessage",
+      "sqs:GetQueueAttributes",
+      "sqs:ChangeMessageVisibility"
+    ]
+
+    resources = [
+      aws_sqs_queue.send_message[0].arn
+    ]
+  }
+
+  statement {
+    sid    = "SSMDescribe"
+    effect = "Allow"
+
+    actions = [
+      "ssm:DescribeParameters"
+    ]
+
+    resources = ["*"]
+  }
+
+  statement {
+    sid    = "SSMAllow"
+    effect = "Allow"
+
+    actions = [
+      "ssm:GetParameter",
+      "ssm:GetParameters",
+      "ssm:GetParametersByPath"
+    ]
+
+    resources = [
+      "arn:aws:ssm:eu-west-2:${var.account_id}:parameter/${local.name}/*",
+      "arn:aws:ssm:eu-west-2:${var.account_id}:parameter/${local.name}"
+    ]
+  }
+
+  statement {
+    sid    = "KMSDecrypt"
+    effect = "Allow"
+
+    actions = [
+      "kms:Decrypt"
+    ]
+
+    resources = [
+      aws_kms_alias.mesh.target_key_arn
+    ]
+  }
+
+  statement {
+    sid    = "S3Allow"
+    effect = "Allow"
+
+    actions = [
+      "s3:GetObject",
+      "s3:ListBucket",
+    ]
+
+    resources = [
+      aws_s3_bucket.mesh.arn,
+      "${aws_s3_bucket.mesh.arn}/*"
+    ]
+  }
+
+  statement {
+    sid    = "SFNList"
+    effect = "Allow"
+
+    actions = [
+      "states:ListExecutions",
+    ]
+
+    resources = [
+      aws_sfn_state_machine.send_message.arn
+    ]
+  }
+
+  statement {
+    sid    = "SFNAllow"
+    effect = "Allow"
+
+    actions = [
+      "states:DescribeExecution",
+    ]
+
+    resources = [
+      "${replace(aws_sfn_state_machine.send_message.arn, "stateMachine", "execution")}*"
+    ]
+  }
+
+  statement {
+    sid    = "SFNStart"
+    effect = "Allow"
+
+    actions = [
+      "states:StartExecution",
+    ]
+
+    resources = [
+      aws_sfn_state_machine.send_message.arn
+    ]
+  }
+
+  dynamic "statement" {
+    for_each = local.vpc_enabled ? [true] : []
+    content {
+
+      sid    = "EC2Interfaces"
+      effect = "Allow"
+
+      actions = [
+        "ec2:CreateNetworkInterface",
+        "ec2:DescribeNetworkInterfaces",
+        "ec2:DeleteNetworkInterface",
+        "ec2:AssignPrivateIpAddresses",
+        "ec2:UnassignPrivateIpAddresses"
+      ]
+
+      resources = ["*"]
+    }
+  }
+}
+
+resource "aws_iam_role_policy_attachment" "dispatch_send_messages_lambda_insights" {
+  count      = var.send_via_queue ? 1 : 0
+  role       = aws_iam_role.dispatch_send_messages[0].name
+  policy_arn = "arn:aws:iam::aws:policy/CloudWatchLambdaInsightsExecutionRolePolicy"
+}
@@ -9,6 +9,7 @@ resource "aws_lambda_function" "fetch_message_chunk" {
   handler          = "mesh_fetch_message_chunk_application.lambda_handler"
   runtime          = local.python_runtime
   timeout          = local.lambda_timeout
+  memory_size      = var.fetch_message_chunk_memory_size
   source_code_hash = data.archive_file.app.output_base64sha256
   role             = aws_iam_role.fetch_message_chunk.arn
   layers           = [aws_lambda_layer_version.mesh_aws_client_dependencies.arn]
@@ -161,6 +162,8 @@ data "aws_iam_policy_document" "fetch_message_chunk" {
     actions = [
       "s3:PutObject",
       "s3:AbortMultipartUpload",
+      "s3:ListBucketMultipartUploads",
+      "s3:ListMultipartUploadParts",
       "s3:GetObject",
       "s3:DeleteObject",
     ]
@@ -185,6 +188,19 @@ data "aws_iam_policy_document" "fetch_message_chunk" {
     }
   }
 
+  dynamic "statement" {
+    for_each = var.use_secrets_manager && var.bulk_load_mailbox_params ? [true] : []
+    content {
+      sid    = "SecretsBatch"
+      effect = "Allow"
+      # does not support resource level permissions, GetSecretValue is still required for each secret
+      actions = [
+        "secretsmanager:BatchGetSecretValue",
+      ]
+      resources = ["*"]
+    }
+  }
+
   dynamic "statement" {
     for_each = local.vpc_enabled ? [true] : []
     content {
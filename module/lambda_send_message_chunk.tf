@@ -9,6 +9,7 @@ resource "aws_lambda_function" "send_message_chunk" {
   handler          = "mesh_send_message_chunk_application.lambda_handler"
   runtime          = local.python_runtime
   timeout          = 15 * 60 // 15 minutes
+  memory_size      = var.send_message_chunk_memory_size
   source_code_hash = data.archive_file.app.output_base64sha256
   role             = aws_iam_role.send_message_chunk.arn
   layers           = [aws_lambda_layer_version.mesh_aws_client_dependencies.arn]
@@ -169,6 +170,19 @@ data "aws_iam_policy_document" "send_message_chunk" {
     }
   }
 
+  dynamic "statement" {
+    for_each = var.use_secrets_manager && var.bulk_load_mailbox_params ? [true] : []
+    content {
+      sid    = "SecretsBatch"
+      effect = "Allow"
+      # does not support resource level permissions, GetSecretValue is still required for each secret
+      actions = [
+        "secretsmanager:BatchGetSecretValue",
+      ]
+      resources = ["*"]
+    }
+  }
+
   dynamic "statement" {
     for_each = local.vpc_enabled ? [true] : []
     content {
@@ -21,26 +21,52 @@ locals {
     MESH_URL    = local.mesh_url[var.mesh_env]
     MESH_BUCKET = aws_s3_bucket.mesh.bucket
 
-    CHUNK_SIZE         = var.chunk_size
-    CRUMB_SIZE         = var.crumb_size == null ? var.chunk_size : var.crumb_size
-    NEVER_COMPRESS     = var.never_compress
-    COMPRESS_THRESHOLD = var.compress_threshold
+    CHUNK_SIZE           = var.chunk_size
+    CRUMB_SIZE           = var.crumb_size == null ? var.chunk_size : var.crumb_size
+    NEVER_COMPRESS       = var.never_compress
+    COMPRESS_THRESHOLD   = var.compress_threshold
+    TRANSPARENT_COMPRESS = var.transparent_compress
+    SEND_STAGING_PREFIX  = var.send_staging_prefix
+    AUTO_TUNE_SIZES      = var.auto_tune_sizes
+
+    FETCH_PART_SIZE                = var.fetch_part_size
+    FETCH_UPLOAD_CONCURRENCY       = var.fetch_upload_concurrency
+    FETCH_ABANDONED_UPLOAD_SECONDS = var.fetch_abandoned_upload_seconds
 
     CA_CERT_CONFIG_KEY        = data.aws_ssm_parameter.ca_cert.name
     CLIENT_CERT_CONFIG_KEY    = data.aws_ssm_parameter.client_cert.name
     CLIENT_KEY_CONFIG_KEY     = data.aws_ssm_parameter.client_key[0].name
     SHARED_KEY_CONFIG_KEY     = data.aws_ssm_parameter.shared_key[0].name
     MAILBOXES_BASE_CONFIG_KEY = "/${local.name}/mesh/mailboxes"
+    MESH_MAILBOX_IDS          = join(",", sort(var.mailbox_ids))
+    WARM_UP_ON_INIT           = var.warm_up_on_init
+    BULK_LOAD_MAILBOX_PARAMS  = var.bulk_load_mailbox_params
 
     SEND_MESSAGE_STEP_FUNCTION_ARN = "arn:aws:states:${var.region}:${var.account_id}:stateMachine:${local.send_message_name}"
     GET_MESSAGES_STEP_FUNCTION_ARN = "arn:aws:states:${var.region}:${var.account_id}:stateMachine:${local.get_messages_name}"
 
     GET_MESSAGES_PAGE_LIMIT = var.get_messages_page_limit
+    POLL_WAIT_SECONDS       = var.poll_wait_seconds
+
+    DISPATCH_MAX_STARTS_PER_SECOND = var.send_dispatch_max_starts_per_second
+
+    MESH_RATE_LIMIT       = var.mesh_rate_limit
+    MESH_RATE_LIMIT_BURST = var.mesh_rate_limit_burst == null ? var.mesh_rate_limit : var.mesh_rate_limit_burst
+    RATE_LIMIT_TABLE      = local.rate_limit_table_enabled ? local.rate_limit_table_name : ""
+    WORKER_LEASE_TABLE    = var.mesh_worker_leases ? local.worker_lease_table_name : ""
 
     USE_SENDER_FILENAME         = var.use_sender_filename
     USE_LEGACY_INBOUND_LOCATION = var.use_legacy_inbound_location
+    INBOUND_KEY_SCHEME          = var.inbound_key_scheme
     USE_S3_KEY_FOR_MEX_FILENAME = var.use_s3_key_for_mex_filename
 
+    EMIT_METRICS      = var.emit_metrics
+    HTTP_TIMING       = var.http_timing
+    METRICS_NAMESPACE = var.metrics_namespace
+
+    PROFILE_SAMPLE_RATE = var.profile_sample_rate
+    PROFILE_S3_PREFIX   = var.profile_s3_prefix
+
   }
 
   mesh_ips = {
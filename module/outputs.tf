@@ -53,3 +53,11 @@ output "lambda_poll_mailbox_log_group_name" {
 output "lambda_send_message_chunk_log_group_name" {
   value = aws_cloudwatch_log_group.send_message_chunk.name
 }
+
+output "send_message_queue_url" {
+  value = var.send_via_queue ? aws_sqs_queue.send_message[0].id : ""
+}
+
+output "worker_lease_table_name" {
+  value = var.mesh_worker_leases ? aws_dynamodb_table.worker_lease[0].name : ""
+}
@@ -27,6 +27,26 @@ resource "aws_s3_bucket_lifecycle_configuration" "mesh" {
 
   }
 
+  dynamic "rule" {
+    for_each = var.send_staging_prefix == "" ? [] : [trim(var.send_staging_prefix, "/")]
+    content {
+      id     = "ExpireSendStaging"
+      status = "Enabled"
+
+      abort_incomplete_multipart_upload {
+        days_after_initiation = 1
+      }
+
+      expiration {
+        days = 1
+      }
+
+      filter {
+        prefix = "${rule.value}/"
+      }
+    }
+  }
+
 }
 
 resource "aws_s3_bucket_server_side_encryption_configuration" "mesh" {
@@ -0,0 +1,54 @@
+locals {
+  profiles_to_s3 = var.profile_s3_prefix != ""
+}
+
+resource "aws_iam_policy" "profiles" {
+  count       = local.profiles_to_s3 ? 1 : 0
+  name        = "${local.name}-profiles-policy"
+  description = "${local.name}-profiles-policy"
+  policy      = data.aws_iam_policy_document.profiles[0].json
+}
+
+data "aws_iam_policy_document" "profiles" {
+  count = local.profiles_to_s3 ? 1 : 0
+  statement {
+    sid    = "S3Allow"
+    effect = "Allow"
+
+    actions = [
+      "s3:PutObject",
+    ]
+
+    resources = [
+      "${aws_s3_bucket.mesh.arn}/${trim(var.profile_s3_prefix, "/")}/*"
+    ]
+  }
+
+  statement {
+    sid    = "KMSAllow"
+    effect = "Allow"
+
+    actions = [
+      "kms:Encrypt",
+      "kms:GenerateDataKey*",
+    ]
+
+    resources = [
+      aws_kms_alias.mesh.target_key_arn
+    ]
+  }
+}
+
+resource "aws_iam_role_policy_attachment" "profiles" {
+  for_each = local.profiles_to_s3 ? merge(
+    {
+      poll_mailbox          = aws_iam_role.poll_mailbox.name
+      fetch_message_chunk   = aws_iam_role.fetch_message_chunk.name
+      send_message_chunk    = aws_iam_role.send_message_chunk.name
+      check_send_parameters = aws_iam_role.check_send_parameters.name
+    },
+    var.send_via_queue ? { dispatch_send_messages = aws_iam_role.dispatch_send_messages[0].name } : {}
+  ) : {}
+  role       = each.value
+  policy_arn = aws_iam_policy.profiles[0].arn
+}
@@ -0,0 +1,50 @@
+locals {
+  stage_sends = var.send_staging_prefix != ""
+}
+
+resource "aws_iam_policy" "send_staging" {
+  count       = local.stage_sends ? 1 : 0
+  name        = "${local.name}-send-staging-policy"
+  description = "${local.name}-send-staging-policy"
+  policy      = data.aws_iam_policy_document.send_staging[0].json
+}
+
+data "aws_iam_policy_document" "send_staging" {
+  count = local.stage_sends ? 1 : 0
+  statement {
+    sid    = "S3Allow"
+    effect = "Allow"
+
+    actions = [
+      "s3:PutObject",
+      "s3:GetObject",
+      "s3:DeleteObject",
+      "s3:AbortMultipartUpload",
+    ]
+
+    resources = [
+      "${aws_s3_bucket.mesh.arn}/${trim(var.send_staging_prefix, "/")}/*"
+    ]
+  }
+
+  statement {
+    sid    = "KMSAllow"
+    effect = "Allow"
+
+    actions = [
+      "kms:Encrypt",
+      "kms:GenerateDataKey*",
+      "kms:Decrypt",
+    ]
+
+    resources = [
+      aws_kms_alias.mesh.target_key_arn
+    ]
+  }
+}
+
+resource "aws_iam_role_policy_attachment" "send_staging" {
+  count      = local.stage_sends ? 1 : 0
+  role       = aws_iam_role.send_message_chunk.name
+  policy_arn = aws_iam_policy.send_staging[0].arn
+}
@@ -67,6 +67,16 @@ resource "aws_sfn_state_machine" "get_messages" {
                   IntervalSeconds = 2
                   MaxAttempts     = 3
                 },
+                {
+                  # MESH is rate limiting the mailbox, back off until the limit clears
+                  BackoffRate = 2
+                  ErrorEquals = [
+                    "MeshRateLimited",
+                  ]
+                  IntervalSeconds = 10
+                  JitterStrategy  = "FULL"
+                  MaxAttempts     = 6
+                },
               ]
               Type = "Task"
             }
@@ -87,7 +97,7 @@ resource "aws_sfn_state_machine" "get_messages" {
           }
         }
         MaxConcurrency = var.get_message_max_concurrency
-        Next           = "Were there exactly ${var.get_messages_page_limit} messages?"
+        Next           = "More messages waiting?"
         ResultPath     = null
         Type           = "Map"
       }
@@ -113,6 +123,16 @@ resource "aws_sfn_state_machine" "get_messages" {
             IntervalSeconds = 2
             MaxAttempts     = 3
           },
+          {
+            # MESH is rate limiting the mailbox, back off until the limit clears
+            BackoffRate = 2
+            ErrorEquals = [
+              "MeshRateLimited",
+            ]
+            IntervalSeconds = 10
+            JitterStrategy  = "FULL"
+            MaxAttempts     = 6
+          },
           {
             ErrorEquals = [
               "States.TaskFailed"
@@ -124,12 +144,20 @@ resource "aws_sfn_state_machine" "get_messages" {
         ]
         Type = "Task"
       }
-      "Were there exactly ${var.get_messages_page_limit} messages?" = {
+      "More messages waiting?" = {
         Choices = [
           {
-            Next          = "Poll for messages"
-            NumericEquals = var.get_messages_page_limit
-            Variable      = "$.body.message_count"
+            And = [
+              {
+                IsPresent = true
+                Variable  = "$.more_messages"
+              },
+              {
+                BooleanEquals = true
+                Variable      = "$.more_messages"
+              },
+            ]
+            Next = "Poll for messages"
           },
         ]
         Default = "Poll complete"
@@ -90,6 +90,16 @@ resource "aws_sfn_state_machine" "send_message" {
             IntervalSeconds = 2
             MaxAttempts     = 6
           },
+          {
+            # MESH is rate limiting the mailbox, back off until the limit clears
+            BackoffRate = 2
+            ErrorEquals = [
+              "MeshRateLimited",
+            ]
+            IntervalSeconds = 10
+            JitterStrategy  = "FULL"
+            MaxAttempts     = 6
+          },
         ]
         Type = "Task"
       }
@@ -59,11 +59,22 @@ variable "use_legacy_inbound_location" {
   description = "if true the INBOUND_BUCKET/INBOUND_FOLDER locations from SSM will be used rather than a default of s3://{mesh-bucket}/inbound/{mailbox_id}/{filename}"
 }
 
+variable "inbound_key_scheme" {
+  type        = string
+  default     = "mailbox"
+  description = "layout of received files under the inbound folder, mailbox: {folder}/{filename}, date: {folder}/{yyyy}/{mm}/{dd}/{filename} ( from the message id ), hash: {folder}/{2 hex digit shard of the message id}/{filename}, date or hash spread busy mailboxes across s3 prefixes to avoid SlowDown errors"
+
+  validation {
+    condition     = contains(["mailbox", "date", "hash"], var.inbound_key_scheme)
+    error_message = "inbound_key_scheme must be one of mailbox/date/hash"
+  }
+}
+
 
 variable "chunk_size" {
   type        = number
   default     = 20 * 1024 * 1024
-  description = "defines chunk_size used to partition send files when sending to MESH, applied before compression if your files are large and very compressible you may want to increase this"
+  description = "defines chunk_size used to partition send files when sending to MESH, applied before compression, chunks are balanced and may be up to 10% larger where that saves a chunk, if your files are large and very compressible you may want to increase this"
 
   validation {
     condition     = 0 < var.chunk_size
@@ -82,12 +93,54 @@ variable "crumb_size" {
   }
 }
 
+variable "auto_tune_sizes" {
+  type        = bool
+  default     = false
+  description = "advanced, if set true, chunk and crumb sizes will be chosen from the lambda memory size and the S3 / MESH throughput observed by each lambda instance ( chunk_size and crumb_size are used until throughput has been observed )"
+}
+
+variable "send_message_chunk_memory_size" {
+  type        = number
+  default     = 128
+  description = "memory ( MiB ) for the send message chunk lambda, chunks are buffered in memory so this bounds the chunk size when auto_tune_sizes is set"
+}
+
+variable "fetch_part_size" {
+  type        = number
+  default     = 0
+  description = "advanced, if set, inbound MESH chunks are cut into s3 parts of about this size ( min 5MiB ) and uploaded concurrently while the chunk downloads, 0 uploads each chunk as a single part"
+}
+
+variable "fetch_upload_concurrency" {
+  type        = number
+  default     = 4
+  description = "advanced, s3 parts uploaded at once by the fetch message chunk lambda when fetch_part_size is set"
+}
+
+variable "fetch_abandoned_upload_seconds" {
+  type        = number
+  default     = 86400
+  description = "a retried fetch resumes the message's in-progress multipart upload, other incomplete uploads to the same s3 key started longer ago than this are aborted, keep below the 3 day abort_incomplete_multipart_upload lifecycle rule"
+}
+
+variable "fetch_message_chunk_memory_size" {
+  type        = number
+  default     = 128
+  description = "memory ( MiB ) for the fetch message chunk lambda, with fetch_part_size set up to fetch_upload_concurrency + 1 parts are held in memory at once"
+}
+
 variable "never_compress" {
   type        = bool
   default     = false
   description = "advanced, if set true, we will never attempt to compress chunks before sending to MESH, if you data is always pre-compressed you may want to set this, but preferably set the content-encoding on the file when storing in s3"
 }
 
+variable "transparent_compress" {
+  type        = bool
+  default     = false
+  description = "if set true, compress all outbound chunks on the wire ( Content-Encoding gzip ) regardless of compress_threshold, unless the file is already compressed, recipients download them compressed, which can cut transfer time several-fold for text such as csv and json"
+}
+
 variable "compress_threshold" {
   type        = number
   default     = 20 * 1024 * 1024
@@ -99,6 +152,12 @@ variable "compress_threshold" {
   }
 }
 
+variable "send_staging_prefix" {
+  type        = string
+  default     = ""
+  description = "advanced, if set, large chunked sends that are compressed are compressed once, into the mesh bucket under this prefix, and chunked by compressed size, reducing the number of chunks sent, staged objects are deleted once sent and expire after a day"
+}
+
 variable "vpc_id" {
   type        = string
   default     = ""
@@ -131,6 +190,18 @@ variable "mailbox_ids" {
   description = "list of your MESH mailbox_ids to poll for new messages"
 }
 
+variable "warm_up_on_init" {
+  type        = bool
+  default     = false
+  description = "if set to true, lambdas fetch credentials, write certs and build MESH clients for the mailbox_ids ( or load the outbound mappings ) during the lambda init phase, rather than in their first invocation"
+}
+
+variable "bulk_load_mailbox_params" {
+  type        = bool
+  default     = false
+  description = "if set to true, lambdas load the params ( and secrets ) of all mailboxes at once, with one paginated get parameters by path, rather than each mailbox as it is first used, recommended where a lambda handles many mailboxes e.g. with poll_mailboxes_together"
+}
+
 variable "cloudwatch_retention_in_days" {
   description = "How many days to retain CloudWatch logs for"
   type        = number
@@ -194,12 +265,107 @@ variable "get_messages_schedule" {
   description = "schedule on which to check for new messages, it's recommended this is quite frequent, but it can be tweaked."
 }
 
+variable "poll_wait_seconds" {
+  type        = number
+  default     = 0
+  description = "adaptive polling, when a poll finds messages the get messages execution keeps re-polling the mailbox on a short backoff for up to this many seconds from its start, ending early once the mailbox goes quiet, keep below the poll schedule interval ( 60 ), 0 polls once per schedule ( not used with poll_mailboxes_together )"
+}
+
+variable "poll_mailboxes_together" {
+  type        = bool
+  default     = false
+  description = "if set to true, all mailbox_ids are polled concurrently by a single scheduled get messages execution, rather than an execution per mailbox, only mailboxes with messages waiting are fetched"
+}
+
 variable "get_messages_page_limit" {
   type        = number
   default     = 500
   description = "the number of message ids to pull back in a call to list messages for a mailbox"
 }
 
+variable "mesh_rate_limit" {
+  type        = number
+  default     = 0
+  description = "maximum MESH requests per second for each mailbox, shared by all lambdas through a dynamodb table, MESH 429 responses are backed off for their Retry-After, 0 disables client side rate limiting"
+}
+
+variable "mesh_rate_limit_burst" {
+  type        = number
+  default     = null
+  description = "requests a mailbox can make at once before being limited to mesh_rate_limit per second, defaults to mesh_rate_limit"
+}
+
+variable "mesh_worker_leases" {
+  type        = bool
+  default     = false
+  description = "if set to true a dynamodb table of mailboxes leased to mesh workers ( see Worker Mode ) is created, and the get messages step function does not poll a leased mailbox"
+}
+
+variable "send_via_queue" {
+  type        = bool
+  default     = false
+  description = "if set to true outbound s3 events are queued and dispatched to the send message step function in batches, with repeated events for the same file de-duplicated, rather than an execution per event ( recommended if you drop large numbers of files at once )"
+}
+
+variable "send_dispatch_batch_size" {
+  type        = number
+  default     = 100
+  description = "maximum number of queued outbound s3 events handled by each invocation of the send dispatcher lambda"
+}
+
+variable "send_dispatch_batching_window" {
+  type        = number
+  default     = 5
+  description = "maximum seconds to wait to fill a batch of queued outbound s3 events before invoking the send dispatcher lambda"
+}
+
+variable "send_dispatch_max_concurrency" {
+  type        = number
+  default     = 2
+  description = "maximum concurrent invocations of the send dispatcher lambda"
+}
+
+variable "send_dispatch_max_starts_per_second" {
+  type        = number
+  default     = 20
+  description = "maximum send message step function executions started per second, shared by all send dispatcher lambdas through a dynamodb table"
+}
+
+variable "emit_metrics" {
+  type        = bool
+  default     = false
+  description = "if set to true the lambdas will emit per-phase timing metrics ( durations, bytes and throughput by mailbox and workflow ) as CloudWatch embedded metric format records, note: each mailbox/workflow combination creates additional custom metrics"
+}
+
+variable "http_timing" {
+  type        = bool
+  default     = false
+  description = "if set to true the connect, tls, send, time to first byte and transfer time and bytes of each MESH request are logged, and added to the metrics by MESH endpoint ( send_chunk, retrieve_chunk, list, ack ) when emit_metrics is set"
+}
+
+variable "profile_sample_rate" {
+  type        = number
+  default     = 0
+  description = "fraction ( 0 to 1 ) of lambda invocations to profile with cProfile and tracemalloc, the top functions and allocations are logged, invocations can also be profiled individually with \"profile\": true in the event, note: profiled invocations run considerably slower"
+
+  validation {
+    condition     = 0 <= var.profile_sample_rate && var.profile_sample_rate <= 1
+    error_message = "profile_sample_rate must be between 0 and 1"
+  }
+}
+
+variable "profile_s3_prefix" {
+  type        = string
+  default     = ""
+  description = "if set, profiled invocations also write their cProfile stats ( loadable with pstats, snakeviz etc. ) and allocations to the mesh bucket under this prefix"
+}
+
+variable "metrics_namespace" {
+  type        = string
+  default     = "MESH"
+  description = "CloudWatch namespace for the metrics emitted when emit_metrics is true"
+}
+
 variable "handshake_schedule" {
   # https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-create-rule-schedule.html
   type        = string
@@ -218,6 +384,12 @@ variable "aws_s3_endpoint_prefix_list_id" {
   default = ""
 }
 
+variable "aws_dynamodb_endpoint_prefix_list_id" {
+  type        = string
+  default     = ""
+  description = "dynamodb gateway endpoint prefix list, required for vpc lambdas when mesh_rate_limit, send_via_queue or mesh_worker_leases is set"
+}
+
 variable "aws_ssm_endpoint_sg_id" {
   type    = string
   default = ""
@@ -0,0 +1,253 @@
+"""
+Bulk sender, sends every file under an S3 prefix to MESH, for backfilling a newly onboarded
+workflow without an event bridge trigger and step function execution per file.
+
+Files are sent concurrently through the same send message chunk application as the lambdas,
+so send parameters ( mappings, metadata, compression, chunking ) are identical. Each sent key is
+appended to a checkpoint file, re-running with the same checkpoint skips the keys already sent.
+
+    python mesh_bulk_send.py --bucket my-bucket --prefix X26ABC1/outbound/ --concurrency 8 \
+        --checkpoint backfill.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Any
+from uuid import uuid4
+
+from mesh_worker import ApplicationPool, _failed, _is_complete
+from nhs_aws_helpers import s3_resource, ssm_client
+from shared.config import EnvConfig
+from shared.send_parameters import (
+    OutboundMappingIndex,
+    get_send_parameters,
+    send_message_input,
+)
+from shared.tuning import SizeTuner
+from spine_aws_common.utilities import human_readable_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PROGRESS_INTERVAL = 30.0
+
+
+@dataclass
+class BulkSendReport:
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    bytes_sent: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.sent / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_sent / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            **asdict(self),
+            "seconds": round(self.seconds, 3),
+            "files_per_second": round(self.files_per_second, 3),
+            "bytes_per_second": round(self.bytes_per_second, 3),
+        }
+
+
+class Checkpoint:
+    """keys already sent, appended to a json lines file as each send completes"""
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.sent: dict[str, str] = {}
+        if not path or not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a partial line from an interrupted run, the key will be re-sent
+                    continue
+                self.sent[record["key"]] = record["message_id"]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sent
+
+    def record(self, key: str, message_id: str):
+        with self._lock:
+            self.sent[key] = message_id
+            if not self.path:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "message_id": message_id}) + "\n")
+                f.flush()
+
+
+class BulkSender:
+    """sends every object under an s3 prefix, up to `concurrency` files at a time"""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        concurrency: int = DEFAULT_CONCURRENCY,
+        checkpoint_path: str | None = None,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+    ):
+        # deferred so the module level lambda app is created with the sender's environment
+        from mesh_send_message_chunk_application import (
+            MeshSendMessageChunkApplication,
+        )
+
+        self.config = EnvConfig()
+        self.bucket = bucket
+        self.prefix = prefix
+        self.concurrency = max(concurrency, 1)
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.progress_interval = progress_interval
+
+        self.s3 = s3_resource()
+        self.ssm = ssm_client()
+        self.tuner = SizeTuner(self.config)
+        self.outbound_mappings = OutboundMappingIndex(self.config, self.ssm)
+        self.send_pool = ApplicationPool(MeshSendMessageChunkApplication)
+
+        self._lock = threading.Lock()
+        self.report = BulkSendReport()
+
+    def keys(self) -> Iterator[str]:
+        paginator = self.s3.meta.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for s3_object in page.get("Contents", []):
+                key = s3_object["Key"]
+                if key.endswith("/"):
+                    continue
+                yield key
+
+    def send(self, key: str) -> dict[str, Any]:
+        """send a single file, equivalent to the send message step function"""
+        s3_object = self.s3.Object(self.bucket, key)
+        send_params = get_send_parameters(
+            s3_object,
+            self.config,
+            self.ssm,
+            chunk_size=self.tuner.chunk_size(s3_object.content_length),
+            mappings=self.outbound_mappings,
+        )
+        response = send_message_input(
+            send_params, uuid4().hex, self.tuner.crumb_size(send_params.chunk_size)
+        )
+        while not _is_complete(response):
+            response = self.send_pool.invoke(response)
+            if _failed(response):
+                break
+        return response
+
+    def _send_and_record(self, key: str):
+        try:
+            response = self.send(key)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("send failed for %s", key)
+            response = None
+
+        if response is None or _failed(response):
+            if response is not None:
+                logger.error(
+                    "send failed for %s with status %s", key, response["statusCode"]
+                )
+            # not checkpointed, so the file is retried when resumed
+            with self._lock:
+                self.report.failed += 1
+            return
+
+        body = response["body"]
+        self.checkpoint.record(key, body["message_id"])
+        with self._lock:
+            self.report.sent += 1
+            self.report.bytes_sent += body["send_params"]["file_size"]
+
+    def _log_progress(self, started: float):
+        with self._lock:
+            self.report.seconds = perf_counter() - started
+            report = self.report
+            logger.info(
+                "sent %s files, %s failed, %s skipped, %.1f files/s, %s/s",
+                report.sent,
+                report.failed,
+                report.skipped,
+                report.files_per_second,
+                human_readable_bytes(report.bytes_per_second),
+            )
+
+    def run(self) -> BulkSendReport:
+        started = perf_counter()
+        last_progress = started
+        in_flight: set[Future] = set()
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="mesh-bulk-send"
+        ) as executor:
+            for key in self.keys():
+                if key in self.checkpoint:
+                    self.report.skipped += 1
+                    continue
+
+                # bound the keys queued, so listing a large prefix does not run ahead of the sends
+                if len(in_flight) >= self.concurrency:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                in_flight.add(executor.submit(self._send_and_record, key))
+
+                if perf_counter() - last_progress >= self.progress_interval:
+                    self._log_progress(started)
+                    last_progress = perf_counter()
+
+            wait(in_flight)
+
+        self._log_progress(started)
+        return self.report
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bucket", required=True, help="bucket holding the files")
+    parser.add_argument("--prefix", default="", help="send only keys with the prefix")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument(
+        "--checkpoint",
+        help="file recording the keys sent, re-run with the same file to resume",
+    )
+    parser.add_argument(
+        "--progress-interval", type=float, default=DEFAULT_PROGRESS_INTERVAL
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = BulkSender(
+        bucket=args.bucket,
+        prefix=args.prefix,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint,
+        progress_interval=args.progress_interval,
+    ).run()
+    print(json.dumps(report.as_dict()))
+    if report.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
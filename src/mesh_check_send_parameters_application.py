@@ -1,11 +1,11 @@
-from dataclasses import asdict
+from collections.abc import Callable
 from functools import partial
 from http import HTTPStatus
 from typing import Any
 
 from shared.application import MESHLambdaApplication
 from shared.common import SingletonCheckFailure, return_failure, singleton_check
-from shared.send_parameters import get_send_parameters
+from shared.send_parameters import get_send_parameters, send_message_input
 from spine_aws_common.utilities import human_readable_bytes
 
 
@@ -17,6 +17,10 @@ class MeshCheckSendParametersApplication(MESHLambdaApplication):
         super().__init__(additional_log_config, load_ssm_params)
         self.response: dict[str, Any] = {}
 
+    def _warm_up_targets(self) -> dict[str, Callable[[], Any]]:
+        """no mesh client is needed, just the outbound mappings"""
+        return {"outbound_mappings": self.outbound_mappings.load}
+
     def _get_internal_id(self):
         """Override to stop crashing when getting from non-dict event"""
         return self._create_new_internal_id()
@@ -25,6 +29,12 @@ class MeshCheckSendParametersApplication(MESHLambdaApplication):
         # in case of crash, set to internal server error so next stage fails
         self.response = {"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)}
 
+        if self.event.get("body", {}).get("send_params"):
+            # started by the send dispatcher, with the send parameters already resolved and
+            # duplicate sends prevented by the execution name
+            self.response = self.event.raw_event
+            return
+
         bucket = self.event["detail"]["requestParameters"]["bucketName"]
         key = self.event["detail"]["requestParameters"]["key"]
 
@@ -32,7 +42,18 @@ class MeshCheckSendParametersApplication(MESHLambdaApplication):
 
         s3_object = self.s3.Object(bucket, key)
 
-        send_params = get_send_parameters(s3_object, self.config, self.ssm)
+        with self.metrics.timer("parameters"):
+            send_params = get_send_parameters(
+                s3_object,
+                self.config,
+                self.ssm,
+                chunk_size=self.tuner.chunk_size(s3_object.content_length),
+                mappings=self.outbound_mappings,
+            )
+        crumb_size = self.tuner.crumb_size(send_params.chunk_size)
+        self.metrics.set_dimensions(
+            mailbox=send_params.sender, workflow_id=send_params.workflow_id
+        )
 
         self.log_object.write_log(
             "MESHSEND0004a",
@@ -82,33 +103,18 @@ class MeshCheckSendParametersApplication(MESHLambdaApplication):
                 "file": key,
                 "file_size": human_readable_bytes(send_params.file_size),
                 "chunks": send_params.total_chunks,
-                "chunk_size": human_readable_bytes(self.config.chunk_size),
+                "chunk_size": human_readable_bytes(send_params.chunk_size),
             },
         )
 
-        # todo: in v3 send_params can replace most of these params but keep in v2 to support in-flight step functions
-        self.response = {
-            "statusCode": int(HTTPStatus.OK),
-            "headers": {"Content-Type": "application/json"},
-            "body": {
-                "internal_id": self.log_object.internal_id,
-                "src_mailbox": send_params.sender,
-                "dest_mailbox": send_params.recipient,
-                "workflow_id": send_params.workflow_id,
-                "bucket": bucket,
-                "key": key,
-                "chunked": send_params.chunked,
-                "chunk_number": 1,
-                "total_chunks": send_params.total_chunks,
-                "chunk_size": self.config.chunk_size,
-                "message_id": None,
-                "current_byte_position": 0,
-                "send_params": asdict(send_params),
-            },
-        }
+        self.response = send_message_input(
+            send_params, self.log_object.internal_id, crumb_size
+        )
 
 
 app = MeshCheckSendParametersApplication()
+# optionally fetch params and build clients during init, rather than in the first invocation
+app.warm_up()
 
 
 def lambda_handler(event, context):
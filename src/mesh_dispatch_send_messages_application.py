@@ -0,0 +1,158 @@
+import json
+from collections.abc import Callable
+from hashlib import sha256
+from typing import Any
+
+from botocore.exceptions import ClientError
+from shared.application import MESHLambdaApplication
+from shared.common import send_input_bucket_key
+from shared.rate_limit import DISPATCH_STARTS_KEY, dispatch_limiter_from_config
+from shared.send_parameters import get_send_parameters, send_message_input
+from spine_aws_common.utilities import human_readable_bytes
+
+
+def send_execution_name(bucket: str, key: str, version: str) -> str:
+    """
+    execution name for a version of an s3 object, so every event for the same upload ( including
+    redelivered queue messages ) names the same execution and step functions starts it once
+    """
+    digest = sha256(f"{bucket}/{key}/{version}".encode()).hexdigest()
+    return f"send-{digest}"
+
+
+class MeshDispatchSendMessagesApplication(MESHLambdaApplication):
+    """
+    MESH API Lambda for starting sends for a batch of outbound s3 events received from an SQS queue,
+    the send parameters are resolved here so the send message step function starts at the first chunk
+    """
+
+    def __init__(self, additional_log_config=None, load_ssm_params=False):
+        """Initialise variables"""
+        super().__init__(additional_log_config, load_ssm_params)
+        self.response: dict[str, Any] = {}
+        self.start_limiter = dispatch_limiter_from_config(self.config)
+
+    def _get_internal_id(self):
+        """Override to stop crashing when getting from non-dict event"""
+        return self._create_new_internal_id()
+
+    def _warm_up_targets(self) -> dict[str, Callable[[], Any]]:
+        """no mesh client is needed, just the outbound mappings"""
+        return {"outbound_mappings": self.outbound_mappings.load}
+
+    def _wait_for_start_slot(self):
+        """keep step function starts within dispatch_max_starts_per_second"""
+        if self.start_limiter:
+            self.start_limiter.acquire(DISPATCH_STARTS_KEY)
+
+    def _pending_sends(
+        self, records: list[dict[str, Any]]
+    ) -> dict[tuple[str, str], list[dict[str, Any]]]:
+        """queue records grouped by the s3 file, so repeated events for the same file start one send"""
+        pending: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for record in records:
+            event = json.loads(record["body"])
+            bucket, key = send_input_bucket_key(event)
+            if not bucket or not key:
+                # nothing to retry
+                self.log_object.write_log(
+                    "MESHDISPATCH0002", None, {"message_id": record["messageId"]}
+                )
+                continue
+            pending.setdefault((bucket, key), []).append(record)
+        return pending
+
+    def start(self):
+        records = self.event.get("Records", [])
+        pending = self._pending_sends(records)
+
+        self.log_object.write_log(
+            "MESHDISPATCH0001",
+            None,
+            {"record_count": len(records), "file_count": len(pending)},
+        )
+
+        failed: list[dict[str, Any]] = []
+        for (bucket, key), file_records in pending.items():
+            try:
+                self.start_send(bucket, key)
+            except Exception as e:  # pylint: disable=broad-except
+                self.log_object.write_log(
+                    "MESHDISPATCH0004",
+                    None,
+                    {"bucket": bucket, "key": key, "error": e},
+                )
+                failed.extend(file_records)
+
+        # report partial batch failures, so only the failed records are retried
+        self.response = {
+            "batchItemFailures": [
+                {"itemIdentifier": record["messageId"]} for record in failed
+            ]
+        }
+
+    def start_send(self, bucket: str, key: str):
+        s3_object = self.s3.Object(bucket, key)
+        version = s3_object.version_id
+        if not version or version == "null":
+            # a re-upload of the same content has the same etag, but not the same last modified
+            version = f"{s3_object.e_tag}/{s3_object.last_modified}"
+        name = send_execution_name(bucket, key, version)
+
+        with self.metrics.timer("parameters"):
+            send_params = get_send_parameters(
+                s3_object,
+                self.config,
+                self.ssm,
+                chunk_size=self.tuner.chunk_size(s3_object.content_length),
+                mappings=self.outbound_mappings,
+            )
+        crumb_size = self.tuner.crumb_size(send_params.chunk_size)
+
+        self.log_object.write_log(
+            "MESHSEND0004",
+            None,
+            {
+                "src_mailbox": send_params.sender,
+                "dest_mailbox": send_params.recipient,
+                "workflow_id": send_params.workflow_id,
+                "bucket": bucket,
+                "file": key,
+                "file_size": human_readable_bytes(send_params.file_size),
+                "chunks": send_params.total_chunks,
+                "chunk_size": human_readable_bytes(send_params.chunk_size),
+            },
+        )
+
+        self._wait_for_start_slot()
+        try:
+            # named for the object version, so a repeated event does not send the file twice
+            self.sfn.start_execution(
+                stateMachineArn=self.config.send_message_step_function_arn,
+                name=name,
+                input=json.dumps(
+                    send_message_input(
+                        send_params, self.log_object.internal_id, crumb_size
+                    )
+                ),
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ExecutionAlreadyExists":
+                raise
+            self.log_object.write_log(
+                "MESHDISPATCH0003",
+                None,
+                {"bucket": bucket, "key": key, "execution_name": name},
+            )
+
+
+# create instance of class in global space
+# this ensures initial setup of logging/config is only done on cold start
+app = MeshDispatchSendMessagesApplication()
+# optionally fetch params and build clients during init, rather than in the first invocation
+app.warm_up()
+
+
+def lambda_handler(event, context):
+    """Standard lambda_handler"""
+    return app.main(event, context)
@@ -0,0 +1,614 @@
+"""
+Discrete event simulation of the get messages and send message step functions draining a backlog,
+predicting the drain time and cost of a configuration before changing it in production.
+
+Modelled:
+
+* the get messages schedule, one execution per mailbox at a time ( a scheduled execution which
+  finds another running fails its singleton check ), polls of up to the page limit, re-polling
+  while pages are full, and the Map over each page, at most `map_concurrency` messages at once
+* send message executions, started as files land ( or at a limited rate, as by the dispatcher ),
+  checking the parameters then sending each chunk in turn
+* lambda invocations, each taking a fixed overhead plus the chunk bytes over the per invocation
+  transfer rate, with the rate shared when the MESH or S3 aggregate bandwidth is exceeded, and
+  waiting for a slot once the lambda concurrency cap is reached ( in production the invocation
+  would be throttled and retried )
+
+The overheads and transfer rates can be calibrated from `mesh_log_analyser.py --json` output,
+from production logs or from a local benchmark with `mesh_state_machine.py`.
+
+    python mesh_drain_simulator.py --inbound 5000 --inbound-sizes 100KiB:90,50MiB:10 \
+        --map-concurrency 10 --calibrate analysis.json
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import random
+import re
+from collections import Counter, deque
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field, fields
+from functools import partial
+from typing import Any
+
+from mesh_log_analyser import percentile_row
+from shared.chunk_plan import plan_chunks
+
+MiB = 1024 * 1024
+
+# step functions runs at most 40 iterations of an inline Map at once
+INLINE_MAP_MAX_CONCURRENCY = 40
+
+POLL = "poll_mailbox"
+FETCH = "fetch_message_chunk"
+CHECK = "check_send_parameters"
+SEND = "send_message_chunk"
+
+_SIZE_UNITS = {
+    "": 1,
+    "b": 1,
+    "kb": 1000,
+    "mb": 1000**2,
+    "gb": 1000**3,
+    "kib": 1024,
+    "mib": 1024**2,
+    "gib": 1024**3,
+}
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*$", re.IGNORECASE)
+
+
+@dataclass
+class SimulationConfig:
+    # get messages
+    poll_interval_seconds: float = 60.0
+    page_limit: int = 500
+    map_concurrency: int = 1
+    # the chunk size MESH delivers inbound messages in, as sent
+    inbound_chunk_size: int = 20 * MiB
+    # send message
+    chunk_size: int = 20 * MiB
+    send_starts_per_second: float = 0.0
+    # lambdas, seconds per invocation, excluding chunk transfers
+    lambda_concurrency: int = 1000
+    poll_seconds: float = 0.5
+    check_seconds: float = 0.3
+    fetch_overhead_seconds: float = 0.3
+    send_overhead_seconds: float = 0.3
+    # bytes / second, per invocation, and shared by all invocations ( 0 is unlimited )
+    fetch_bytes_per_second: float = 10.0 * MiB
+    send_bytes_per_second: float = 10.0 * MiB
+    mesh_bandwidth_bytes_per_second: float = 0.0
+    s3_bandwidth_bytes_per_second: float = 0.0
+    # between the states of an execution
+    transition_seconds: float = 0.05
+    poll_memory_mb: int = 128
+    fetch_memory_mb: int = 128
+    check_memory_mb: int = 128
+    send_memory_mb: int = 128
+    # usd, standard workflows and x86 lambdas
+    lambda_gb_second_price: float = 0.0000166667
+    lambda_request_price: float = 0.0000002
+    state_transition_price: float = 0.000025
+
+    def memory_mb(self, function: str) -> int:
+        return {
+            POLL: self.poll_memory_mb,
+            FETCH: self.fetch_memory_mb,
+            CHECK: self.check_memory_mb,
+            SEND: self.send_memory_mb,
+        }[function]
+
+
+@dataclass
+class Workload:
+    # sizes of the messages waiting in the mailbox at the start
+    inbound_sizes: list[int] = field(default_factory=list)
+    # sizes of the files landing in the outbound bucket at the start
+    outbound_sizes: list[int] = field(default_factory=list)
+    # further inbound messages arriving at ( on average ) a steady rate
+    inbound_arrivals: list[tuple[float, int]] = field(default_factory=list)
+
+
+@dataclass
+class SimulationResult:
+    drain_seconds: float
+    inbound_messages: int
+    outbound_messages: int
+    inbound_bytes: int
+    outbound_bytes: int
+    executions: dict[str, int]
+    state_transitions: int
+    invocations: dict[str, int]
+    lambda_gb_seconds: float
+    peak_concurrency: int
+    throttled_invocations: int
+    cost: dict[str, float]
+    inbound_latency_seconds: dict[str, float | int] | None
+    outbound_latency_seconds: dict[str, float | int] | None
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def parse_size(size: str) -> int:
+    match = _SIZE_RE.match(size)
+    if not match or match.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f"invalid size: {size}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_size_distribution(distribution: str) -> list[tuple[int, float]]:
+    """sizes with relative weights, e.g. 100KiB:90,50MiB:10, a size without a weight has weight 1"""
+    weighted = []
+    for item in distribution.split(","):
+        size, _, weight = item.partition(":")
+        weighted.append((parse_size(size), float(weight or 1)))
+    return weighted
+
+
+def sample_sizes(
+    distribution: list[tuple[int, float]], count: int, rng: random.Random
+) -> list[int]:
+    if not count:
+        return []
+    sizes, weights = zip(*distribution, strict=True)
+    return rng.choices(sizes, weights=weights, k=count)
+
+
+def _chunks(size: int, chunk_size: int) -> list[int]:
+    """the bytes in each chunk as delivered by MESH, an empty message is still one chunk"""
+    if size <= 0:
+        return [0]
+    return [min(chunk_size, size - start) for start in range(0, size, chunk_size)]
+
+
+class _Simulation:
+    def __init__(self, config: SimulationConfig, workload: Workload):
+        self.config = config
+        self.workload = workload
+        self.now = 0.0
+        self._events: list[tuple[float, int, Callable[[], None]]] = []
+        self._sequence = itertools.count()
+
+        self.running = 0
+        self.peak_concurrency = 0
+        self.throttled = 0
+        self._waiting: deque[tuple[str, Callable[[], float], Callable[[], None]]] = (
+            deque()
+        )
+        self.transfers = 0
+
+        self.invocations: Counter[str] = Counter()
+        self.executions: Counter[str] = Counter()
+        self.transitions = 0
+        self.gb_seconds = 0.0
+
+        # arrival times of the messages in the mailbox
+        self.inbox: deque[tuple[float, int]] = deque()
+        self.arrivals_pending = len(workload.inbound_arrivals)
+        self.get_messages_running = False
+        self.fetching = 0
+        self.inbound_latencies: list[float] = []
+        self.outbound_latencies: list[float] = []
+        self.finished = 0.0
+
+    def at(self, time: float, action: Callable[[], None]):
+        heapq.heappush(self._events, (time, next(self._sequence), action))
+
+    def run(self) -> SimulationResult:
+        for size in self.workload.inbound_sizes:
+            self.inbox.append((0.0, size))
+        for arrival, size in self.workload.inbound_arrivals:
+            self.at(arrival, partial(self._arrive, size))
+        if self.inbox or self.arrivals_pending:
+            self.at(0.0, self._scheduled_get_messages)
+
+        for i, size in enumerate(self.workload.outbound_sizes):
+            started = (
+                i / self.config.send_starts_per_second
+                if self.config.send_starts_per_second > 0
+                else 0.0
+            )
+            self.at(started, partial(self._send_message, size))
+
+        while self._events:
+            self.now, _, action = heapq.heappop(self._events)
+            action()
+
+        return self._result()
+
+    # lambdas
+
+    def invoke(
+        self, function: str, seconds: Callable[[], float], then: Callable[[], None]
+    ):
+        """invoke once under the concurrency cap, the duration is worked out as it starts"""
+        if self.running >= self.config.lambda_concurrency:
+            self.throttled += 1
+            self._waiting.append((function, seconds, then))
+            return
+        self._start(function, seconds, then)
+
+    def _start(
+        self, function: str, seconds: Callable[[], float], then: Callable[[], None]
+    ):
+        self.running += 1
+        self.peak_concurrency = max(self.peak_concurrency, self.running)
+        duration = seconds()
+        self.invocations[function] += 1
+        self.gb_seconds += duration * self.config.memory_mb(function) / 1024
+        self.at(self.now + duration, lambda: self._finish(then))
+
+    def _finish(self, then: Callable[[], None]):
+        self.running -= 1
+        if self._waiting:
+            self._start(*self._waiting.popleft())
+        then()
+
+    def _transfer_seconds(self, num_bytes: int, per_invocation: float) -> float:
+        """
+        transfer time for a chunk, the aggregate bandwidth is shared between the transfers
+        in progress as this one starts
+        """
+        rate = per_invocation
+        sharing = self.transfers + 1
+        for aggregate in (
+            self.config.mesh_bandwidth_bytes_per_second,
+            self.config.s3_bandwidth_bytes_per_second,
+        ):
+            if aggregate > 0:
+                rate = min(rate, aggregate / sharing)
+        return num_bytes / rate if rate > 0 else 0.0
+
+    def _chunk_task(
+        self,
+        function: str,
+        overhead: float,
+        per_invocation: float,
+        num_bytes: int,
+        then: Callable[[], None],
+    ):
+        def _seconds() -> float:
+            seconds = overhead + self._transfer_seconds(num_bytes, per_invocation)
+            self.transfers += 1
+            return seconds
+
+        def _then():
+            self.transfers -= 1
+            then()
+
+        self.invoke(function, _seconds, _then)
+
+    # get messages
+
+    def _arrive(self, size: int):
+        self.arrivals_pending -= 1
+        self.inbox.append((self.now, size))
+
+    def _work_remaining(self) -> bool:
+        return bool(
+            self.inbox
+            or self.arrivals_pending
+            or self.fetching
+            or self.get_messages_running
+        )
+
+    def _scheduled_get_messages(self):
+        if not self._work_remaining():
+            # drained, later scheduled executions would find the mailbox empty
+            return
+
+        self.executions["get_messages"] += 1
+        if self.get_messages_running:
+            # poll, failed? ( the singleton check ), fail
+            self.transitions += 3
+            self.invoke(POLL, lambda: self.config.poll_seconds, lambda: None)
+        else:
+            self.get_messages_running = True
+            self._poll()
+
+        self.at(
+            self.now + self.config.poll_interval_seconds, self._scheduled_get_messages
+        )
+
+    def _poll(self):
+        # poll, failed?
+        self.transitions += 2
+        self.invoke(POLL, lambda: self.config.poll_seconds, self._polled)
+
+    def _polled(self):
+        page = [
+            self.inbox.popleft()
+            for _ in range(min(self.config.page_limit, len(self.inbox)))
+        ]
+        if not page:
+            # poll complete
+            self.transitions += 1
+            self.get_messages_running = False
+            return
+
+        # map
+        self.transitions += 1
+        self.fetching += len(page)
+        concurrency = self.config.map_concurrency or INLINE_MAP_MAX_CONCURRENCY
+        concurrency = min(concurrency, INLINE_MAP_MAX_CONCURRENCY)
+        waiting = deque(page)
+        remaining = [len(page)]
+        more = len(page) == self.config.page_limit
+
+        def _fetched(arrived: float):
+            self.fetching -= 1
+            self.inbound_latencies.append(self.now - arrived)
+            self.finished = max(self.finished, self.now)
+            remaining[0] -= 1
+            if waiting:
+                _fetch(*waiting.popleft())
+            elif not remaining[0]:
+                # more messages waiting?
+                self.transitions += 1
+                if more:
+                    self.at(self.now + self.config.transition_seconds, self._poll)
+                else:
+                    # poll complete
+                    self.transitions += 1
+                    self.get_messages_running = False
+
+        def _fetch(arrived: float, size: int):
+            self._fetch_chunks(
+                deque(_chunks(size, self.config.inbound_chunk_size)),
+                lambda: _fetched(arrived),
+            )
+
+        for _ in range(min(concurrency, len(waiting))):
+            _fetch(*waiting.popleft())
+
+    def _fetch_chunks(self, chunks: deque[int], then: Callable[[], None]):
+        # fetch message chunk, is this the last chunk?
+        self.transitions += 2
+
+        def _fetched():
+            if chunks:
+                self.at(
+                    self.now + self.config.transition_seconds,
+                    lambda: self._fetch_chunks(chunks, then),
+                )
+            else:
+                # file complete
+                self.transitions += 1
+                then()
+
+        self._chunk_task(
+            FETCH,
+            self.config.fetch_overhead_seconds,
+            self.config.fetch_bytes_per_second,
+            chunks.popleft(),
+            _fetched,
+        )
+
+    # send message
+
+    def _send_message(self, size: int):
+        self.executions["send_message"] += 1
+        started = self.now
+        # as planned by the check send parameters lambda
+        chunks = deque(plan_chunks(size, self.config.chunk_size).sizes())
+
+        def _sent():
+            # success
+            self.transitions += 1
+            self.outbound_latencies.append(self.now - started)
+            self.finished = max(self.finished, self.now)
+
+        # parameters checked?, check send parameters, failed?
+        self.transitions += 3
+        self.invoke(
+            CHECK,
+            lambda: self.config.check_seconds,
+            lambda: self.at(
+                self.now + self.config.transition_seconds,
+                lambda: self._send_chunks(chunks, _sent),
+            ),
+        )
+
+    def _send_chunks(self, chunks: deque[int], then: Callable[[], None]):
+        # send message chunk, completed sending?
+        self.transitions += 2
+
+        def _chunk_sent():
+            if chunks:
+                self.at(
+                    self.now + self.config.transition_seconds,
+                    lambda: self._send_chunks(chunks, then),
+                )
+            else:
+                then()
+
+        self._chunk_task(
+            SEND,
+            self.config.send_overhead_seconds,
+            self.config.send_bytes_per_second,
+            chunks.popleft(),
+            _chunk_sent,
+        )
+
+    def _result(self) -> SimulationResult:
+        requests = sum(self.invocations.values())
+        lambda_cost = (
+            self.gb_seconds * self.config.lambda_gb_second_price
+            + requests * self.config.lambda_request_price
+        )
+        step_functions_cost = self.transitions * self.config.state_transition_price
+        inbound_sizes = [
+            *self.workload.inbound_sizes,
+            *(size for _, size in self.workload.inbound_arrivals),
+        ]
+        return SimulationResult(
+            drain_seconds=round(self.finished, 3),
+            inbound_messages=len(inbound_sizes),
+            outbound_messages=len(self.workload.outbound_sizes),
+            inbound_bytes=sum(inbound_sizes),
+            outbound_bytes=sum(self.workload.outbound_sizes),
+            executions=dict(self.executions),
+            state_transitions=self.transitions,
+            invocations=dict(self.invocations),
+            lambda_gb_seconds=round(self.gb_seconds, 3),
+            peak_concurrency=self.peak_concurrency,
+            throttled_invocations=self.throttled,
+            cost={
+                "lambda": round(lambda_cost, 6),
+                "step_functions": round(step_functions_cost, 6),
+                "total": round(lambda_cost + step_functions_cost, 6),
+            },
+            inbound_latency_seconds=percentile_row(self.inbound_latencies),
+            outbound_latency_seconds=percentile_row(self.outbound_latencies),
+        )
+
+
+def simulate(config: SimulationConfig, workload: Workload) -> SimulationResult:
+    return _Simulation(config, workload).run()
+
+
+def steady_arrivals(
+    per_second: float,
+    seconds: float,
+    distribution: list[tuple[int, float]],
+    rng: random.Random,
+) -> list[tuple[float, int]]:
+    """poisson arrivals at the average rate, for the given seconds"""
+    arrivals: list[tuple[float, int]] = []
+    if per_second <= 0:
+        return arrivals
+    arrived = rng.expovariate(per_second)
+    while arrived < seconds:
+        arrivals.append((arrived, sample_sizes(distribution, 1, rng)[0]))
+        arrived += rng.expovariate(per_second)
+    return arrivals
+
+
+def _fit_overhead_and_rate(
+    points: list[tuple[int, float]], overhead: float, rate: float
+) -> tuple[float, float]:
+    """
+    least squares fit of seconds = overhead + bytes / rate, if the chunks are too alike to fit
+    the overhead is kept, and the rate taken from the time beyond it
+    """
+    if not points:
+        return overhead, rate
+
+    count = len(points)
+    mean_bytes = sum(num_bytes for num_bytes, _ in points) / count
+    mean_seconds = sum(seconds for _, seconds in points) / count
+    variance = sum((num_bytes - mean_bytes) ** 2 for num_bytes, _ in points)
+    if variance > 0:
+        slope = (
+            sum(
+                (num_bytes - mean_bytes) * (seconds - mean_seconds)
+                for num_bytes, seconds in points
+            )
+            / variance
+        )
+        intercept = mean_seconds - slope * mean_bytes
+        if slope > 0 and intercept >= 0:
+            return intercept, 1 / slope
+
+    transfer_seconds = sum(max(seconds - overhead, 0.0) for _, seconds in points)
+    total_bytes = sum(num_bytes for num_bytes, _ in points)
+    if transfer_seconds > 0 and total_bytes > 0:
+        rate = total_bytes / transfer_seconds
+    return overhead, rate
+
+
+def calibrate(config: SimulationConfig, analysis: dict[str, Any]) -> SimulationConfig:
+    """
+    fit the overheads and per invocation transfer rates to `mesh_log_analyser.py --json` output,
+    the poll and check durations are taken from the median of their lambda's invocations
+    """
+    values = asdict(config)
+
+    for direction, overhead, rate in (
+        ("fetch", "fetch_overhead_seconds", "fetch_bytes_per_second"),
+        ("send", "send_overhead_seconds", "send_bytes_per_second"),
+    ):
+        points = [
+            (chunk["num_bytes"], chunk["seconds"])
+            for chunk in analysis.get("chunks", [])
+            if chunk["direction"] == direction
+        ]
+        values[overhead], values[rate] = _fit_overhead_and_rate(
+            points, values[overhead], values[rate]
+        )
+
+    for name, row in analysis.get("percentiles", {}).items():
+        if "poll-mailbox" in name:
+            values["poll_seconds"] = row["p50"]
+        elif "check-send-parameters" in name:
+            values["check_seconds"] = row["p50"]
+
+    return SimulationConfig(**values)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--inbound", type=int, default=0, help="messages waiting")
+    parser.add_argument(
+        "--inbound-sizes",
+        default="1MiB",
+        help="size distribution of inbound messages, e.g. 100KiB:90,50MiB:10",
+    )
+    parser.add_argument(
+        "--inbound-per-second",
+        type=float,
+        default=0.0,
+        help="further inbound messages arriving per second, for --arrival-seconds",
+    )
+    parser.add_argument("--arrival-seconds", type=float, default=0.0)
+    parser.add_argument("--outbound", type=int, default=0, help="files to send")
+    parser.add_argument(
+        "--outbound-sizes", default="1MiB", help="size distribution of outbound files"
+    )
+    parser.add_argument(
+        "--calibrate",
+        help="mesh_log_analyser.py --json output to fit the lambda overheads and transfer rates to",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    for config_field in fields(SimulationConfig):
+        parser.add_argument(
+            f"--{config_field.name.replace('_', '-')}",
+            type=type(config_field.default),
+            default=None,
+        )
+    args = parser.parse_args(argv)
+
+    config = SimulationConfig()
+    if args.calibrate:
+        with open(args.calibrate, encoding="utf-8") as f:
+            config = calibrate(config, json.load(f))
+    overrides = {
+        config_field.name: getattr(args, config_field.name)
+        for config_field in fields(SimulationConfig)
+        if getattr(args, config_field.name) is not None
+    }
+    config = SimulationConfig(**{**asdict(config), **overrides})
+
+    rng = random.Random(args.seed)
+    inbound_sizes = parse_size_distribution(args.inbound_sizes)
+    workload = Workload(
+        inbound_sizes=sample_sizes(inbound_sizes, args.inbound, rng),
+        outbound_sizes=sample_sizes(
+            parse_size_distribution(args.outbound_sizes), args.outbound, rng
+        ),
+        inbound_arrivals=steady_arrivals(
+            args.inbound_per_second, args.arrival_seconds, inbound_sizes, rng
+        ),
+    )
+
+    result = simulate(config, workload)
+    print(json.dumps({"config": asdict(config), "result": result.as_dict()}))
+
+
+if __name__ == "__main__":
+    main()
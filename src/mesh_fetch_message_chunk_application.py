@@ -1,16 +1,26 @@
 import json
 import os
 import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
 from http import HTTPStatus
 from io import BytesIO
-from typing import cast
+from itertools import pairwise
+from typing import IO, TYPE_CHECKING, Any, cast
 
 from botocore.exceptions import ClientError
 from requests import Response
 from requests.structures import CaseInsensitiveDict
 from shared.application import INBOUND_BUCKET, INBOUND_FOLDER, MESHLambdaApplication
-from shared.common import nullsafe_quote
+from shared.common import body_buffer, inbound_s3_key, nullsafe_quote
 from shared.config import MiB
+from shared.content_encoding import DecodedContent, is_gzip_encoded
+from shared.metrics import InvocationMetrics
+from shared.tuning import MESH_MAX_CHUNK_SIZE, S3_MAX_PARTS
+
+if TYPE_CHECKING:
+    from shared.mesh import MeshClient
 
 _METADATA_HEADERS = {
     "mex-messageid",
@@ -46,6 +56,95 @@ def get_content_type(response: Response) -> str:
 AWS_MIN_MULTIPART_SIZE = 5 * MiB
 
 
+def _discard_head(buffer: IO[bytes], length: int, block_size: int):
+    """
+    drop the first `length` bytes of the file, moving the rest to the start a block at a time,
+    so the remainder is never read into memory in one go
+    """
+    end = buffer.seek(0, os.SEEK_END)
+    read_pos, write_pos = length, 0
+    while read_pos < end:
+        buffer.seek(read_pos)
+        block = buffer.read(block_size)
+        read_pos += len(block)
+        buffer.seek(write_pos)
+        buffer.write(block)
+        write_pos += len(block)
+    buffer.truncate(write_pos)
+    buffer.seek(write_pos)
+
+
+@dataclass
+class FetchContext:
+    """
+    the state of fetching one message, as passed between invocations by the step function,
+    kept apart from the application so an invocation can fetch many messages at once
+    """
+
+    message_id: str
+    mailbox_id: str
+    # the event, updated in place to be the invocation's response
+    response: dict[str, Any]
+    internal_id: str = "Not Provided"
+    aws_upload_id: str = "Not Provided"
+    aws_current_part_id: int = 1
+    aws_part_etags: list[Any] = field(default_factory=list)
+    chunked: bool = False
+    number_of_chunks: int = 0
+    current_chunk: int = 1
+    # empty until chosen on the first chunk
+    s3_bucket: str = ""
+    s3_key: str = ""
+    crumb_size: int = 0
+    client: "MeshClient" = field(default=None, repr=False)  # type: ignore[assignment]
+    _http_response: Response | None = field(default=None, repr=False)
+    # phases and dimensions of this fetch, apart from other fetches in the same invocation
+    metrics: InvocationMetrics = field(
+        default_factory=lambda: InvocationMetrics(namespace="", enabled=False),
+        repr=False,
+    )
+
+    @classmethod
+    def from_event(
+        cls, event: dict[str, Any], crumb_size: int, metrics: InvocationMetrics
+    ) -> "FetchContext":
+        body = event["body"]
+        return cls(
+            message_id=body["message_id"],
+            mailbox_id=body["dest_mailbox"],
+            response=event,
+            internal_id=body.get("internal_id", "Not Provided"),
+            aws_upload_id=body.get("aws_upload_id", "Not Provided"),
+            aws_current_part_id=body.get("aws_current_part_id", 1),
+            aws_part_etags=body.get("aws_part_etags", []),
+            chunked=bool(body.get("chunked", False)),
+            current_chunk=body.get("chunk_num", 1),
+            s3_bucket=body.get("s3_bucket", ""),
+            s3_key=body.get("s3_key", ""),
+            crumb_size=crumb_size,
+            metrics=metrics,
+        )
+
+    @property
+    def http_response(self) -> Response:
+        assert (
+            self._http_response is not None
+        ), "http_response not initialised, call fetch"
+        return self._http_response
+
+    @property
+    def parts_per_chunk(self) -> int:
+        """part numbers reserved for each chunk, keeping within the s3 part limit"""
+        return max(S3_MAX_PARTS // self.number_of_chunks, 1)
+
+    def first_part_id(self, chunk_num: int) -> int:
+        """
+        each chunk has a block of part numbers, the parts uploaded by an invocation are numbered
+        from the block of the chunk it started at, so ListParts shows which chunks were uploaded
+        """
+        return (chunk_num - 1) * self.parts_per_chunk + 1
+
+
 class MeshFetchMessageChunkApplication(MESHLambdaApplication):
     """
     MESH API Lambda for sending a message
@@ -56,88 +155,78 @@ class MeshFetchMessageChunkApplication(MESHLambdaApplication):
         Init variables
         """
         super().__init__(additional_log_config, load_ssm_params)
-        self.input = {}
-
-        self._http_response: Response | None = None
         self.response = {}
-        self.internal_id = None
-        self.aws_upload_id: str = ""
-        self.aws_current_part_id = 0
-        self.aws_part_etags = []
-        self.chunked = False
-        self.number_of_chunks = 0
-        self.current_chunk = 0
-        self.message_id = None
-
-        self.s3_bucket = ""
-        self.s3_key = ""
 
     def initialise(self):
         """decode input event"""
-        self._http_response = None
-        self.input = self.event.get("body")
-        self.internal_id = self.input.get("internal_id", "Not Provided")
-        self.aws_upload_id = self.input.get("aws_upload_id", "Not Provided")
-        self.aws_current_part_id = self.input.get("aws_current_part_id", 1)
-        self.aws_part_etags = self.input.get("aws_part_etags", [])
-        self.chunked = bool(self.input.get("chunked", False))
-        self.current_chunk = self.input.get("chunk_num", 1)
-        self.message_id = self.input["message_id"]
         self.response = self.event.raw_event
-        self.log_object.internal_id = self.internal_id
-        self.s3_bucket = self.input.get("s3_bucket", "")  # will be empty on first chunk
-        self.s3_key = self.input.get("s3_key", "")  # will be empty on first chunk
-
-    @property
-    def http_response(self) -> Response:
-        assert (
-            self._http_response is not None
-        ), "http_response not initialised, call start"
-        return self._http_response
+        self.log_object.internal_id = self.event.get("body").get(
+            "internal_id", "Not Provided"
+        )
 
     def start(self):
+        self.fetch(self.new_context(self.response, self.metrics))
+
+    def new_context(
+        self, event: dict[str, Any], metrics: InvocationMetrics | None = None
+    ) -> FetchContext:
+        """context for fetching the message, with new metrics ( for the caller to flush ) if none are given"""
+        return FetchContext.from_event(
+            event,
+            self.tuner.crumb_size(MESH_MAX_CHUNK_SIZE, inbound=True),
+            metrics or self.new_metrics(),
+        )
+
+    def fetch(self, ctx: FetchContext) -> dict[str, Any]:
+        """
+        fetch the next chunk(s) of the message, returning the response for the step function,
+        the application holds no state for the message, so this can be called concurrently
+        """
         self.log_object.write_log(
             "MESHFETCH0001",
             None,
             {
-                "message_id": self.message_id,
+                "message_id": ctx.message_id,
             },
         )
 
-        self.mailbox_id = self.input["dest_mailbox"]
-
-        with self:
+        with self.borrow_client(ctx.mailbox_id, ctx.metrics) as ctx.client:
             # get stream for this chunk
 
-            self._retrieve_current_chunk()
-            self.chunked = self.http_response.status_code == int(
+            self._retrieve_current_chunk(ctx)
+            ctx.metrics.set_dimensions(
+                mailbox=ctx.mailbox_id,
+                workflow_id=ctx.http_response.headers.get("Mex-WorkflowID"),
+            )
+            ctx.chunked = ctx.http_response.status_code == int(
                 HTTPStatus.PARTIAL_CONTENT
             )
-            is_report = self.http_response.headers.get("Mex-MessageType") == "REPORT"
-            self._ensure_s3_bucket_and_key(is_report)
-            if is_report or self.number_of_chunks < 2:
-                self._handle_un_chunked_message(is_report)
-                return
-
-            self._handle_multiple_chunk_message()
-
-    def _retrieve_current_chunk(self):
-        self._http_response = self.get_chunk(
-            self.message_id, chunk_num=self.current_chunk
+            is_report = ctx.http_response.headers.get("Mex-MessageType") == "REPORT"
+            self._ensure_s3_bucket_and_key(ctx, is_report)
+            if is_report or ctx.number_of_chunks < 2:
+                self._handle_un_chunked_message(ctx, is_report)
+            else:
+                self._handle_multiple_chunk_message(ctx)
+
+        return ctx.response
+
+    def _retrieve_current_chunk(self, ctx: FetchContext):
+        ctx._http_response = self.get_chunk(
+            ctx.client, ctx.message_id, chunk_num=ctx.current_chunk, metrics=ctx.metrics
         )
-        self.number_of_chunks = int(
-            self._http_response.headers.get("Mex-Total-Chunks", "0")
+        ctx.number_of_chunks = int(
+            ctx.http_response.headers.get("Mex-Total-Chunks", "0")
         )
 
-        if self.number_of_chunks < 2:
+        if ctx.number_of_chunks < 2:
             self.log_object.write_log(
                 "MESHFETCH0001a",
                 None,
                 {
-                    "content_length": self._http_response.headers.get(
+                    "content_length": ctx.http_response.headers.get(
                         "content-length", 0
                     ),
-                    "message_id": self.message_id,
+                    "message_id": ctx.message_id,
                 },
             )
             return
@@ -145,317 +234,595 @@ class MeshFetchMessageChunkApplication(MESHLambdaApplication):
             "MESHFETCH0001b",
             None,
             {
-                "content_length": self._http_response.headers.get("content-length", 0),
-                "message_id": self.message_id,
-                "chunk_num": self.current_chunk,
-                "max_chunk": self.number_of_chunks,
+                "content_length": ctx.http_response.headers.get("content-length", 0),
+                "message_id": ctx.message_id,
+                "chunk_num": ctx.current_chunk,
+                "max_chunk": ctx.number_of_chunks,
             },
         )
 
-    def _handle_multiple_chunk_message(self):
-        self.log_object.write_log(
-            "MESHFETCH0013", None, {"message_id": self.message_id}
+    def _handle_multiple_chunk_message(self, ctx: FetchContext):
+        self.log_object.write_log("MESHFETCH0013", None, {"message_id": ctx.message_id})
+        if ctx.current_chunk == 1 and not self._resume_multipart_upload(ctx):
+            self._create_multipart_upload(ctx)
+
+        # max, as executions started before parts were numbered by chunk numbered them sequentially
+        ctx.aws_current_part_id = max(
+            ctx.aws_current_part_id, ctx.first_part_id(ctx.current_chunk)
         )
-        if self.current_chunk == 1:
-            self._create_multipart_upload()
 
-        while self.current_chunk <= self.number_of_chunks:
-            with tempfile.NamedTemporaryFile() as buffer:
-                response = self.http_response
+        if self.config.fetch_part_size:
+            self._stream_chunks_to_s3_parts(ctx)
+        else:
+            self._buffer_chunks_to_s3_part(ctx)
+
+        if ctx.current_chunk == ctx.number_of_chunks:
+            with ctx.metrics.timer("s3_upload"):
+                self._finish_multipart_upload(ctx)
+            self.acknowledge_message(ctx.client, ctx.message_id, ctx.metrics)
+            self.log_object.write_log(
+                "MESHFETCH0004", None, {"message_id": ctx.message_id}
+            )
+            self._update_response(ctx, complete=True)
+            # fully complete
+            return
+
+        # move to next chunk and return
+        ctx.current_chunk += 1
+        self.log_object.write_log(
+            "MESHFETCH0003",
+            None,
+            {"chunk": ctx.current_chunk, "message_id": ctx.message_id},
+        )
+        self._update_response(ctx, complete=False)
+
+    def _buffer_chunks_to_s3_part(self, ctx: FetchContext):
+        """download whole chunks, coalescing small ones, and upload them as a single s3 part"""
+        # one buffer for all the chunks coalesced into the part
+        with tempfile.NamedTemporaryFile() as buffer:
+            while ctx.current_chunk <= ctx.number_of_chunks:
+                response = ctx.http_response
                 # we never want to create more chunks than total_chunks ( as that is limited to 10k )
-                for crumb in response.iter_content(chunk_size=self.config.crumb_size):
-                    buffer.write(crumb)
+                content = DecodedContent(response, ctx.crumb_size)
+                with ctx.metrics.timer("mesh_download") as timer:
+                    for crumb in content:
+                        timer.add_bytes(len(crumb))
+                        buffer.write(crumb)
+                self._log_decoded(ctx, content)
                 buffer.flush()
                 length = buffer.tell()
                 if (
-                    self.current_chunk == self.number_of_chunks
+                    ctx.current_chunk == ctx.number_of_chunks
                     or length > AWS_MIN_MULTIPART_SIZE
                 ):
                     buffer.seek(0)
-                    self._upload_part_to_s3(cast(BytesIO, buffer), length)
+                    self._upload_part_to_s3(ctx, cast(BytesIO, buffer), length)
                     # break here so next chunk will be handed by a separate lambda invocation to avoid timeout
                     break
 
-                self.current_chunk += 1
-                self._retrieve_current_chunk()
+                ctx.current_chunk += 1
+                self._retrieve_current_chunk(ctx)
+
+    def _stream_chunks_to_s3_parts(self, ctx: FetchContext):
+        """
+        download chunks, cutting them into s3 parts of fetch_part_size which are uploaded
+        concurrently while the download continues.
+        a part is only cut once the buffer holds more than a minimum part beyond it, so the
+        remainder uploaded at the end of the chunk is never too small to be an s3 part
+        """
+        part_size = self.config.fetch_part_size
+        # keep within the part numbers reserved for the chunk
+        max_parts = ctx.parts_per_chunk
+        concurrency = self.config.fetch_upload_concurrency
+        uploads: list[Future[dict[str, Any]]] = []
+
+        with ThreadPoolExecutor(
+            max_workers=concurrency
+        ) as executor, tempfile.TemporaryFile() as buffer:
+
+            def _submit_part(body: bytes):
+                # bound the parts held in memory awaiting upload
+                in_flight = [upload for upload in uploads if not upload.done()]
+                if len(in_flight) >= concurrency:
+                    in_flight[0].result()
+                uploads.append(
+                    executor.submit(
+                        self._upload_part, ctx, ctx.aws_current_part_id, body
+                    )
+                )
+                ctx.aws_current_part_id += 1
+
+            while ctx.current_chunk <= ctx.number_of_chunks:
+                content = DecodedContent(ctx.http_response, ctx.crumb_size)
+                with ctx.metrics.timer("mesh_download") as timer:
+                    for crumb in content:
+                        timer.add_bytes(len(crumb))
+                        buffer.write(crumb)
+                        if (
+                            len(uploads) + 1 < max_parts
+                            and buffer.tell() > part_size + AWS_MIN_MULTIPART_SIZE
+                        ):
+                            buffer.seek(0)
+                            _submit_part(buffer.read(part_size))
+                            _discard_head(buffer, part_size, ctx.crumb_size)
+                self._log_decoded(ctx, content)
+
+                if (
+                    ctx.current_chunk == ctx.number_of_chunks
+                    or buffer.tell() > AWS_MIN_MULTIPART_SIZE
+                ):
+                    buffer.seek(0)
+                    _submit_part(buffer.read())
+                    # break here so next chunk will be handed by a separate lambda invocation to avoid timeout
+                    break
+
+                ctx.current_chunk += 1
+                self._retrieve_current_chunk(ctx)
+
+            # parts must be listed in order to complete the upload
+            ctx.aws_part_etags.extend(upload.result() for upload in uploads)
 
-        if self.current_chunk == self.number_of_chunks:
-            self._finish_multipart_upload()
-            self.acknowledge_message(self.message_id)
+    def _resume_multipart_upload(self, ctx: FetchContext) -> bool:
+        """
+        continue this message's multipart upload left by an earlier ( failed ) execution,
+        from the first chunk not known to be uploaded, returns False if there is none
+        """
+        upload_id = self._find_resumable_upload(ctx)
+        if not upload_id:
+            return False
+
+        with ctx.metrics.timer("s3_upload"):
+            parts = [
+                part
+                for page in self.s3.meta.client.get_paginator("list_parts").paginate(
+                    Bucket=ctx.s3_bucket, Key=ctx.s3_key, UploadId=upload_id
+                )
+                for part in page.get("Parts", [])
+            ]
+        resume_chunk, ctx.aws_part_etags = self._reconcile_parts(ctx, parts)
+        ctx.aws_upload_id = upload_id
+
+        self.log_object.write_log(
+            "MESHFETCH0015",
+            None,
+            {
+                "message_id": ctx.message_id,
+                "key": ctx.s3_key,
+                "bucket": ctx.s3_bucket,
+                "upload_id": upload_id,
+                "chunk": resume_chunk,
+                "parts": len(ctx.aws_part_etags),
+            },
+        )
+
+        if resume_chunk != ctx.current_chunk:
+            ctx.http_response.close()
+            ctx.current_chunk = resume_chunk
+            self._retrieve_current_chunk(ctx)
+        return True
+
+    def _find_resumable_upload(self, ctx: FetchContext) -> str | None:
+        """
+        the most recent in-progress upload of this message, aborting any abandoned uploads
+        to the key, uploads are only resumed when the key is unique to the message
+        """
+        try:
+            with ctx.metrics.timer("s3_upload"):
+                uploads = [
+                    upload
+                    for page in self.s3.meta.client.get_paginator(
+                        "list_multipart_uploads"
+                    ).paginate(Bucket=ctx.s3_bucket, Prefix=ctx.s3_key)
+                    for upload in page.get("Uploads", [])
+                    if upload["Key"] == ctx.s3_key
+                ]
+        except ClientError as e:
+            # e.g. not permitted on a legacy inbound bucket, so always start a new upload
             self.log_object.write_log(
-                "MESHFETCH0004", None, {"message_id": self.message_id}
+                "MESHFETCH0016",
+                None,
+                {"key": ctx.s3_key, "bucket": ctx.s3_bucket, "error": e},
             )
-            self._update_response(complete=True)
-            # fully complete
-            return
+            return None
 
-        # move to next chunk and return
-        self.current_chunk += 1
+        assert ctx.message_id
+        resumable = ctx.message_id in ctx.s3_key
+        abandoned_before = datetime.now(UTC) - timedelta(
+            seconds=self.config.fetch_abandoned_upload_seconds
+        )
+        upload_id = None
+        for upload in sorted(uploads, key=lambda u: u["Initiated"], reverse=True):
+            if upload["Initiated"] < abandoned_before:
+                self._abort_multipart_upload(
+                    ctx, upload["UploadId"], upload["Initiated"]
+                )
+                continue
+            if resumable and not upload_id:
+                upload_id = upload["UploadId"]
+        return upload_id
+
+    def _reconcile_parts(
+        self, ctx: FetchContext, parts: list[Any]
+    ) -> tuple[int, list[dict[str, Any]]]:
+        """
+        the chunk to continue from and the parts to keep, parts are grouped by the block they are
+        in, each group being the parts uploaded by one invocation.
+        a group is kept if its parts are contiguous from the start of its block and a later group
+        follows it, the last group is always fetched again as that invocation may have failed
+        """
+        groups: dict[int, list[dict[str, Any]]] = {}
+        for part in sorted(parts, key=lambda part: part["PartNumber"]):
+            chunk_num = (part["PartNumber"] - 1) // ctx.parts_per_chunk + 1
+            groups.setdefault(chunk_num, []).append(
+                {"ETag": part["ETag"], "PartNumber": part["PartNumber"]}
+            )
+
+        chunk_nums = sorted(groups)
+        resume_chunk = 1
+        kept: list[dict[str, Any]] = []
+        for chunk_num, next_chunk_num in pairwise(chunk_nums):
+            first_part_id = ctx.first_part_id(chunk_num)
+            part_ids = [part["PartNumber"] for part in groups[chunk_num]]
+            if chunk_num != resume_chunk or part_ids != list(
+                range(first_part_id, first_part_id + len(part_ids))
+            ):
+                break
+            kept.extend(groups[chunk_num])
+            resume_chunk = next_chunk_num
+
+        return resume_chunk, kept
+
+    def _abort_multipart_upload(
+        self, ctx: FetchContext, upload_id: str, initiated: datetime
+    ):
         self.log_object.write_log(
-            "MESHFETCH0003",
+            "MESHFETCH0014",
             None,
-            {"chunk": self.current_chunk, "message_id": self.message_id},
+            {
+                "key": ctx.s3_key,
+                "bucket": ctx.s3_bucket,
+                "upload_id": upload_id,
+                "initiated": initiated.isoformat(),
+            },
         )
-        self._update_response(complete=False)
+        try:
+            self.s3.MultipartUpload(ctx.s3_bucket, ctx.s3_key, upload_id).abort()
+        except ClientError as e:
+            # not fatal, the bucket lifecycle rule will abort it eventually
+            self.log_object.write_log(
+                "MESHFETCH0016",
+                None,
+                {"key": ctx.s3_key, "bucket": ctx.s3_bucket, "error": e},
+            )
 
-    def _handle_un_chunked_message(self, is_report: bool):
+    def _handle_un_chunked_message(self, ctx: FetchContext, is_report: bool):
         self.log_object.write_log(
             "MESHFETCH0010" if is_report else "MESHFETCH0011",
             None,
-            {"message_id": self.message_id},
+            {"message_id": ctx.message_id},
         )
 
-        chunk_data = (
-            json.dumps(dict(self.http_response.headers)).encode("utf-8")
-            if is_report
-            else self.http_response.raw.read(decode_content=True)
-        )
         content_type = (
-            "application/json" if is_report else get_content_type(self.http_response)
-        )
-
-        self._upload_to_s3(
-            chunk_data,
-            content_type=content_type,
-            metadata=metadata_from_headers(self.http_response.headers),
+            "application/json" if is_report else get_content_type(ctx.http_response)
         )
-
-        self.acknowledge_message(self.message_id)
-        self._update_response(complete=True)
-        self.log_object.write_log(
-            "MESHFETCH0012", None, {"message_id": self.message_id}
-        )
-
-    def _get_filename(self, is_report: bool):
+        metadata = metadata_from_headers(ctx.http_response.headers)
+
+        # only a crumb of a larger message is held in memory while downloading,
+        # the length of an encoded message is its compressed size, so its size is unknown
+        content_length = ctx.http_response.headers.get("Content-Length")
+        encoded = is_gzip_encoded(ctx.http_response)
+        size = int(content_length) if content_length and not encoded else None
+        with body_buffer(0 if is_report else size, ctx.crumb_size) as buffer:
+            if is_report:
+                buffer.write(
+                    json.dumps(dict(ctx.http_response.headers)).encode("utf-8")
+                )
+            else:
+                content = DecodedContent(ctx.http_response, ctx.crumb_size)
+                with ctx.metrics.timer("mesh_download") as timer:
+                    for crumb in content:
+                        timer.add_bytes(len(crumb))
+                        buffer.write(crumb)
+                self._log_decoded(ctx, content)
+
+            length = buffer.tell()
+            buffer.seek(0)
+            with ctx.metrics.timer("s3_upload") as timer:
+                timer.add_bytes(length)
+                self._upload_to_s3(
+                    ctx,
+                    buffer,
+                    length,
+                    content_type=content_type,
+                    metadata=metadata,
+                )
+
+        self.acknowledge_message(ctx.client, ctx.message_id, ctx.metrics)
+        self._update_response(ctx, complete=True)
+        self.log_object.write_log("MESHFETCH0012", None, {"message_id": ctx.message_id})
+
+    def _get_filename(self, ctx: FetchContext, is_report: bool):
         extension = "ctl" if is_report else "dat"
-        default_filename = f"{self.message_id}.{extension}"
+        default_filename = f"{ctx.message_id}.{extension}"
         if not self.config.use_sender_filename:
             return default_filename
 
         file_name_header = (
-            self.http_response.headers.get("Mex-FileName", "") or ""
+            ctx.http_response.headers.get("Mex-FileName", "") or ""
         ).strip()
         if file_name_header:
             return file_name_header
         return default_filename
 
-    def _ensure_s3_bucket_and_key(self, is_report: bool):
+    def _ensure_s3_bucket_and_key(self, ctx: FetchContext, is_report: bool):
         # must be called after ensure_params
-        if self.current_chunk > 1:
+        if ctx.current_chunk > 1:
             # should not change once selected on first chunk
-            assert self.s3_bucket
-            assert self.s3_key
+            assert ctx.s3_bucket
+            assert ctx.s3_key
             return
 
-        assert self.mailbox_id
-        filename = self._get_filename(is_report)
+        assert ctx.mailbox_id
+        assert ctx.message_id
+        filename = self._get_filename(ctx, is_report)
 
-        s3_folder = f"inbound/{self.mailbox_id}"
+        s3_folder = f"inbound/{ctx.mailbox_id}"
 
         if self.config.use_legacy_inbound_location:
-            self.s3_bucket = self.mailbox_params[self.mailbox_id]["params"][
+            ctx.s3_bucket = self.mailbox_params[ctx.mailbox_id]["params"][
                 INBOUND_BUCKET
             ].strip()
             s3_folder = (
-                self.mailbox_params[self.mailbox_id]["params"][INBOUND_FOLDER]
+                self.mailbox_params[ctx.mailbox_id]["params"][INBOUND_FOLDER]
                 .strip()
                 .strip("/")
             )
         else:
-            self.s3_bucket = self.config.mesh_bucket
+            ctx.s3_bucket = self.config.mesh_bucket
 
-        self.s3_key = f"{s3_folder}/{filename}"
+        ctx.s3_key = inbound_s3_key(
+            s3_folder, filename, ctx.message_id, self.config.inbound_key_scheme
+        )
 
         self.log_object.write_log(
             "MESHFETCH0001c",
             None,
             {
-                "message_id": self.message_id,
-                "chunk_num": self.current_chunk,
-                "s3_key": self.s3_key,
-                "s3_bucket": self.s3_bucket,
+                "message_id": ctx.message_id,
+                "chunk_num": ctx.current_chunk,
+                "s3_key": ctx.s3_key,
+                "s3_bucket": ctx.s3_bucket,
                 "s3_folder": s3_folder,
             },
         )
 
-    def _upload_part_to_s3(self, buffer: BytesIO, content_length: int):
+    def _upload_part_to_s3(
+        self, ctx: FetchContext, buffer: BytesIO, content_length: int
+    ):
+        etag = self._upload_part(ctx, ctx.aws_current_part_id, buffer, content_length)
+        ctx.aws_part_etags.append(etag)
+        ctx.aws_current_part_id += 1
+        return etag["ETag"]
+
+    def _upload_part(
+        self,
+        ctx: FetchContext,
+        part_id: int,
+        body: IO[bytes] | bytes,
+        content_length: int | None = None,
+    ) -> dict[str, Any]:
+        """upload a single part of the multipart upload, safe to call from other threads"""
+        if content_length is None:
+            content_length = len(cast(bytes, body))
         try:
-            response = self.s3.MultipartUploadPart(
-                self.s3_bucket,
-                self.s3_key,
-                self.aws_upload_id,
-                self.aws_current_part_id,  # type: ignore[arg-type]
-            ).upload(Body=buffer, ContentLength=content_length)
+            with ctx.metrics.timer("s3_upload") as timer:
+                timer.add_bytes(content_length)
+                response = self.s3.MultipartUploadPart(
+                    ctx.s3_bucket,
+                    ctx.s3_key,
+                    ctx.aws_upload_id,
+                    part_id,  # type: ignore[arg-type]
+                ).upload(Body=body, ContentLength=content_length)
         except ClientError as e:
-            self.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
+            ctx.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
             self.log_object.write_log(
                 "MESHFETCH0006",
                 None,
                 {
-                    "key": self.s3_key,
-                    "bucket": self.s3_bucket,
+                    "key": ctx.s3_key,
+                    "bucket": ctx.s3_bucket,
                     "content_length": content_length,
-                    "aws_upload_id": self.aws_upload_id,
+                    "aws_upload_id": ctx.aws_upload_id,
                     "error": e,
                 },
             )
             raise e
 
         etag = response["ETag"]
-        self.aws_part_etags.append(
-            {
-                "ETag": etag,
-                "PartNumber": self.aws_current_part_id,
-            }
-        )
-        self.aws_current_part_id += 1
         self.log_object.write_log(
             "MESHFETCH0002",
             None,
             {
-                "number_of_chunks": self.number_of_chunks,
-                "aws_part_id": self.aws_current_part_id,
+                "number_of_chunks": ctx.number_of_chunks,
+                "aws_part_id": part_id,
                 "aws_part_size": content_length,
-                "aws_upload_id": self.aws_upload_id,
+                "aws_upload_id": ctx.aws_upload_id,
                 "etag": etag,
             },
         )
-        return etag
+        return {
+            "ETag": etag,
+            "PartNumber": part_id,
+        }
 
     def _upload_to_s3(
         self,
-        buffer,
+        ctx: FetchContext,
+        buffer: IO[bytes],
+        content_length: int,
         content_type: str | None = None,
         metadata: dict[str, str] | None = None,
     ):
         metadata = metadata or {}
         content_type = content_type or "application/octet-stream"
-        self.s3.Object(self.s3_bucket, self.s3_key).put(
-            Body=buffer, ContentType=content_type, Metadata=metadata
+        self.s3.Object(ctx.s3_bucket, ctx.s3_key).put(
+            Body=buffer,
+            ContentLength=content_length,
+            ContentType=content_type,
+            Metadata=metadata,
         )
 
         self.log_object.write_log(
             "MESHFETCH0002a",
             None,
             {
-                "HEADERS": self.http_response.headers,
-                "RESPONSE": self.http_response,
-                "aws_part_size": len(buffer),
-                "aws_upload_id": self.aws_upload_id,
+                "HEADERS": ctx.http_response.headers,
+                "RESPONSE": ctx.http_response,
+                "aws_part_size": content_length,
+                "aws_upload_id": ctx.aws_upload_id,
             },
         )
 
-    def _create_multipart_upload(self):
+    def _create_multipart_upload(self, ctx: FetchContext):
         """Create an S3 multipart upload"""
         try:
             self.log_object.write_log(
                 "MESHFETCH0009",
                 None,
                 {
-                    "CHUNKS": self.number_of_chunks,
-                    "key": self.s3_key,
-                    "bucket": self.s3_bucket,
+                    "CHUNKS": ctx.number_of_chunks,
+                    "key": ctx.s3_key,
+                    "bucket": ctx.s3_bucket,
                 },
             )
-            multipart_upload = self.s3.Object(
-                self.s3_bucket, self.s3_key
-            ).initiate_multipart_upload(
-                Metadata=metadata_from_headers(self.http_response.headers),
-                ContentType=get_content_type(self.http_response),
-            )
-
-            self.aws_upload_id = multipart_upload.id
+            with ctx.metrics.timer("s3_upload"):
+                multipart_upload = self.s3.Object(
+                    ctx.s3_bucket, ctx.s3_key
+                ).initiate_multipart_upload(
+                    Metadata=metadata_from_headers(ctx.http_response.headers),
+                    ContentType=get_content_type(ctx.http_response),
+                )
+
+            ctx.aws_upload_id = multipart_upload.id
             self.log_object.write_log(
                 "MESHFETCH0005a",
                 None,
                 {
-                    "key": self.s3_key,
-                    "bucket": self.s3_bucket,
-                    "upload_id": self.aws_upload_id,
+                    "key": ctx.s3_key,
+                    "bucket": ctx.s3_bucket,
+                    "upload_id": ctx.aws_upload_id,
                 },
             )
         except ClientError as e:
-            self.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
+            ctx.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
             self.log_object.write_log(
                 "MESHFETCH0005b",
                 None,
                 {
-                    "key": self.s3_key,
-                    "bucket": self.s3_bucket,
+                    "key": ctx.s3_key,
+                    "bucket": ctx.s3_bucket,
                     "error": e,
                 },
             )
             raise e
 
-    def _finish_multipart_upload(self):
+    def _finish_multipart_upload(self, ctx: FetchContext):
         """Complete the s3 multipart upload"""
         try:
             self.log_object.write_log(
                 "MESHFETCH0008",
                 None,
                 {
-                    "mesh_msg_id": self.message_id,
-                    "key": self.s3_key,
-                    "bucket": self.s3_bucket,
-                    "aws_upload_id": self.aws_upload_id,
+                    "mesh_msg_id": ctx.message_id,
+                    "key": ctx.s3_key,
+                    "bucket": ctx.s3_bucket,
+                    "aws_upload_id": ctx.aws_upload_id,
                     "PARTS": {
-                        "Parts": self.aws_part_etags[:200]
+                        "Parts": ctx.aws_part_etags[:200]
                     },  # this could be 10,000 ... slice for logs
                 },
             )
             self.s3.MultipartUpload(
-                self.s3_bucket, self.s3_key, self.aws_upload_id
-            ).complete(MultipartUpload={"Parts": self.aws_part_etags})
+                ctx.s3_bucket, ctx.s3_key, ctx.aws_upload_id
+            ).complete(MultipartUpload={"Parts": ctx.aws_part_etags})
 
         except ClientError as e:
-            self.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
+            ctx.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
             self.log_object.write_log(
                 "MESHFETCH0007",
                 None,
                 {
-                    "number_of_chunks": self.number_of_chunks,
-                    "mesh_msg_id": self.message_id,
-                    "key": self.s3_key,
-                    "bucket": self.s3_bucket,
-                    "aws_upload_id": self.aws_upload_id,
+                    "number_of_chunks": ctx.number_of_chunks,
+                    "mesh_msg_id": ctx.message_id,
+                    "key": ctx.s3_key,
+                    "bucket": ctx.s3_bucket,
+                    "aws_upload_id": ctx.aws_upload_id,
                     "error": e,
                 },
             )
             raise e
 
-    def _update_response(self, complete: bool):
-        self.response.update({"statusCode": self.http_response.status_code})
-        self.response["body"].update(
+    def _update_response(self, ctx: FetchContext, complete: bool):
+        ctx.response.update({"statusCode": ctx.http_response.status_code})
+        ctx.response["body"].update(
             {
                 "complete": complete,
-                "chunk_num": self.current_chunk,
-                "aws_upload_id": self.aws_upload_id,
-                "aws_current_part_id": self.aws_current_part_id,
-                "aws_part_etags": self.aws_part_etags,
-                "internal_id": self.internal_id,
-                "file_name": os.path.basename(self.s3_key),
-                "s3_bucket": self.s3_bucket,
-                "s3_key": self.s3_key,
+                "chunk_num": ctx.current_chunk,
+                "aws_upload_id": ctx.aws_upload_id,
+                "aws_current_part_id": ctx.aws_current_part_id,
+                "aws_part_etags": ctx.aws_part_etags,
+                "internal_id": ctx.internal_id,
+                "file_name": os.path.basename(ctx.s3_key),
+                "s3_bucket": ctx.s3_bucket,
+                "s3_key": ctx.s3_key,
+                "crumb_size": ctx.crumb_size,
             }
         )
 
-    def get_chunk(self, message_id, chunk_num=1) -> Response:
+    def get_chunk(
+        self,
+        client: "MeshClient",
+        message_id,
+        chunk_num=1,
+        metrics: InvocationMetrics | None = None,
+    ) -> Response:
         """Return a response object for a MESH chunk"""
 
-        response = self.mesh_client.retrieve_message_chunk(
-            message_id=message_id, chunk_num=chunk_num
-        )
+        with (metrics or self.metrics).timer("mesh_download"):
+            response = client.retrieve_message_chunk(
+                message_id=message_id, chunk_num=chunk_num
+            )
 
         response.raw.decode_content = True
 
         return response
 
-    def acknowledge_message(self, message_id):
+    def _log_decoded(self, ctx: FetchContext, content: DecodedContent):
+        if not content.compressed:
+            return
+        self.log_object.write_log(
+            "MESHFETCH0017",
+            None,
+            {
+                "chunk": ctx.current_chunk,
+                "message_id": ctx.message_id,
+                "wire_bytes": content.wire_bytes,
+                "content_bytes": content.content_bytes,
+            },
+        )
+
+    def acknowledge_message(
+        self,
+        client: "MeshClient",
+        message_id,
+        metrics: InvocationMetrics | None = None,
+    ):
         """
         Acknowledge receipt of the last message from the mailbox.
         """
 
-        self.mesh_client.acknowledge_message(message_id)
+        with (metrics or self.metrics).timer("acknowledge"):
+            client.acknowledge_message(message_id)
         self.log_object.write_log(
             "MESHMBOX0006",
             None,
@@ -466,6 +833,8 @@ class MeshFetchMessageChunkApplication(MESHLambdaApplication):
 # create instance of class in global space
 # this ensures initial setup of logging/config is only done on cold start
 app = MeshFetchMessageChunkApplication()
+# optionally fetch params and build clients during init, rather than in the first invocation
+app.warm_up()
 
 
 def lambda_handler(event, context):
@@ -0,0 +1,422 @@
+"""
+Throughput and latency analysis of exported lambda logs, giving performance baselines from
+production without changes to the lambdas.
+
+Log lines are read as printed by the lambdas, or as json log events ( one per line, as exported by
+`aws logs filter-log-events` or a subscription ) with the line in `message`. Lines are attributed
+to the invocation between the `LAMBDA0002` and `LAMBDA0003` lines in the same log stream ( or the
+same lambda function, if the stream is not known ), then correlated into messages:
+
+* sends by the bucket and key of the file ( `MESHSEND0001` to the final chunk `MESHSEND0008` )
+* fetches by message id, from the poll which listed them ( the fetch shares the poll's
+  internal id ) to the message being uploaded and acknowledged ( `MESHFETCH0012` / `MESHFETCH0004` )
+
+Chunk throughput is the bytes read from s3 ( send ) or the MESH content length ( fetch ) over the
+duration of the invocation which sent or fetched the chunk.
+
+    python mesh_log_analyser.py exported.log [more.log ...] [--json]
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from typing import Any, TextIO
+
+PERCENTILES = (50, 90, 95, 99)
+
+kv_log_re = re.compile(r'(?:\s|^)(\w+=(?:\'[^\']+\'|"[^"]+"|[^ ]+))')
+
+_LOG_TIMESTAMP_RE = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}\.\d+")
+_LOG_TIMESTAMP_FORMAT = "%d/%m/%Y %H:%M:%S.%f"
+
+INVOKED = "LAMBDA0002"
+COMPLETED = "LAMBDA0003"
+SEND_TRIGGERED = "MESHSEND0001"
+SEND_CHUNK_STARTED = "MESHSEND0005"
+SEND_S3_READ = "MESHSEND0006"
+SEND_CHUNK_SENT = "MESHSEND0007"
+SEND_COMPLETE = "MESHSEND0008"
+POLLED = "MESHPOLL0001"
+FETCH_STARTED = "MESHFETCH0001"
+FETCH_LENGTHS = ("MESHFETCH0001a", "MESHFETCH0001b")
+FETCH_COMPLETE = ("MESHFETCH0012", "MESHFETCH0004")
+
+
+def parse_kv_log(line: str) -> dict[str, str]:
+    return {
+        k: v.strip("\"'")
+        for k, v in (match.split("=", maxsplit=1) for match in kv_log_re.findall(line))
+    }
+
+
+@dataclass
+class LogRecord:
+    timestamp: float
+    reference: str
+    internal_id: str
+    stream: str
+    fields: dict[str, str]
+
+    @property
+    def message_id(self) -> str | None:
+        return self.fields.get("message_id") or self.fields.get("messageId")
+
+
+def _parse_timestamp(line: str) -> float | None:
+    match = _LOG_TIMESTAMP_RE.search(line)
+    if not match:
+        return None
+    return (
+        datetime.strptime(match.group(0), _LOG_TIMESTAMP_FORMAT)
+        .replace(tzinfo=UTC)
+        .timestamp()
+    )
+
+
+def parse_log_line(line: str) -> LogRecord | None:
+    """a logpoint line, or json log event with the line as the message, None for anything else"""
+    line = line.strip()
+    stream = ""
+    timestamp = None
+    if line.startswith("{"):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(event, dict) or not isinstance(event.get("message"), str):
+            # e.g. embedded metric format records
+            return None
+        line = event["message"]
+        stream = event.get("logStreamName", "")
+        if event.get("timestamp"):
+            timestamp = event["timestamp"] / 1000
+
+    fields = parse_kv_log(line)
+    reference = fields.get("logReference")
+    if not reference:
+        return None
+
+    timestamp = _parse_timestamp(line) or timestamp
+    if timestamp is None:
+        return None
+
+    return LogRecord(
+        timestamp=timestamp,
+        reference=reference,
+        internal_id=fields.get("internalID", ""),
+        stream=stream or fields.get("Process", ""),
+        fields=fields,
+    )
+
+
+@dataclass
+class Invocation:
+    stream: str
+    function: str
+    request_id: str
+    started: float
+    duration: float | None = None
+    records: list[LogRecord] = field(default_factory=list)
+
+    def first(self, *references: str) -> LogRecord | None:
+        return next(
+            (record for record in self.records if record.reference in references),
+            None,
+        )
+
+
+@dataclass
+class MessageTiming:
+    direction: str
+    key: str
+    message_id: str | None = None
+    started: float | None = None
+    completed: float | None = None
+    num_bytes: int = 0
+    chunks: int = 0
+
+    @property
+    def latency(self) -> float | None:
+        if self.started is None or self.completed is None:
+            return None
+        return self.completed - self.started
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "latency": self.latency}
+
+
+@dataclass
+class ChunkTiming:
+    direction: str
+    key: str
+    chunk: int
+    num_bytes: int
+    seconds: float
+
+    @property
+    def bytes_per_second(self) -> float | None:
+        return self.num_bytes / self.seconds if self.seconds > 0 else None
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """linearly interpolated percentile of already sorted values"""
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (
+        position - lower
+    )
+
+
+def percentile_row(values: Iterable[float]) -> dict[str, float | int] | None:
+    sorted_values = sorted(values)
+    if not sorted_values:
+        return None
+    return {
+        "count": len(sorted_values),
+        **{f"p{pct}": round(percentile(sorted_values, pct), 3) for pct in PERCENTILES},
+        "max": round(sorted_values[-1], 3),
+    }
+
+
+def _int_field(record: LogRecord | None, name: str) -> int:
+    if not record:
+        return 0
+    try:
+        return int(record.fields.get(name, 0))
+    except ValueError:
+        return 0
+
+
+class LogAnalyser:
+    def __init__(self):
+        self.invocations: list[Invocation] = []
+        self._current: dict[str, Invocation] = {}
+
+    def add_lines(self, lines: Iterable[str]):
+        for line in lines:
+            record = parse_log_line(line)
+            if record:
+                self.add_record(record)
+
+    def add_record(self, record: LogRecord):
+        if record.reference == INVOKED:
+            invocation = Invocation(
+                stream=record.stream,
+                function=record.fields.get("Process", ""),
+                request_id=record.fields.get("aws_request_id", ""),
+                started=record.timestamp,
+            )
+            self.invocations.append(invocation)
+            self._current[record.stream] = invocation
+
+        current = self._current.get(record.stream)
+        if not current:
+            # e.g. cold start lines, logged before the invocation
+            return
+        current.records.append(record)
+
+        if record.reference == COMPLETED:
+            duration = record.fields.get("duration")
+            current.duration = float(duration) if duration else None
+            del self._current[record.stream]
+
+    def _sorted_invocations(self) -> list[Invocation]:
+        return sorted(self.invocations, key=lambda invocation: invocation.started)
+
+    def sends(self) -> tuple[list[MessageTiming], list[ChunkTiming]]:
+        messages: list[MessageTiming] = []
+        in_flight: dict[str, MessageTiming] = {}
+        chunks: list[ChunkTiming] = []
+
+        for invocation in self._sorted_invocations():
+            triggered = invocation.first(SEND_TRIGGERED)
+            if triggered:
+                key = f"{triggered.fields.get('bucket')}/{triggered.fields.get('file')}"
+                in_flight[key] = MessageTiming("send", key, started=invocation.started)
+                messages.append(in_flight[key])
+                continue
+
+            started = invocation.first(SEND_CHUNK_STARTED)
+            if not started:
+                continue
+
+            key = f"{started.fields.get('bucket')}/{started.fields.get('file')}"
+            message = in_flight.get(key)
+            if not message:
+                # triggered before the logs exported, there is no start time
+                message = in_flight[key] = MessageTiming("send", key)
+                messages.append(message)
+
+            num_bytes = sum(
+                _int_field(record, "bytes")
+                for record in invocation.records
+                if record.reference == SEND_S3_READ
+            )
+            message.num_bytes += num_bytes
+            message.chunks += 1
+            sent = invocation.first(SEND_CHUNK_SENT)
+            if sent and sent.message_id:
+                message.message_id = sent.message_id
+            if invocation.duration is not None:
+                chunks.append(
+                    ChunkTiming(
+                        "send",
+                        key,
+                        _int_field(started, "chunk"),
+                        num_bytes,
+                        invocation.duration,
+                    )
+                )
+
+            complete = invocation.first(SEND_COMPLETE)
+            if complete:
+                message.completed = complete.timestamp
+                del in_flight[key]
+
+        return messages, chunks
+
+    def fetches(self) -> tuple[list[MessageTiming], list[ChunkTiming]]:
+        messages: dict[str, MessageTiming] = {}
+        polled: dict[str, float] = {}
+        chunks: list[ChunkTiming] = []
+
+        for invocation in self._sorted_invocations():
+            poll = invocation.first(POLLED)
+            if poll:
+                polled[poll.internal_id] = poll.timestamp
+                continue
+
+            started = invocation.first(FETCH_STARTED)
+            if not started or not started.message_id:
+                continue
+
+            message_id = started.message_id
+            message = messages.get(message_id)
+            if not message:
+                message = messages[message_id] = MessageTiming(
+                    "fetch",
+                    message_id,
+                    message_id=message_id,
+                    started=polled.get(started.internal_id, invocation.started),
+                )
+
+            length = invocation.first(*FETCH_LENGTHS)
+            num_bytes = _int_field(length, "content_length")
+            message.num_bytes += num_bytes
+            message.chunks += 1
+            if invocation.duration is not None:
+                chunks.append(
+                    ChunkTiming(
+                        "fetch",
+                        message_id,
+                        _int_field(length, "chunk_num") or 1,
+                        num_bytes,
+                        invocation.duration,
+                    )
+                )
+
+            complete = invocation.first(*FETCH_COMPLETE)
+            if complete:
+                message.completed = complete.timestamp
+
+        return list(messages.values()), chunks
+
+    def report(self) -> dict[str, Any]:
+        send_messages, send_chunks = self.sends()
+        fetch_messages, fetch_chunks = self.fetches()
+
+        durations: dict[str, list[float]] = defaultdict(list)
+        for invocation in self.invocations:
+            if invocation.duration is not None:
+                durations[invocation.function].append(invocation.duration)
+
+        tables = {
+            "send_latency_seconds": percentile_row(
+                message.latency
+                for message in send_messages
+                if message.latency is not None
+            ),
+            "fetch_latency_seconds": percentile_row(
+                message.latency
+                for message in fetch_messages
+                if message.latency is not None
+            ),
+            "send_chunk_bytes_per_second": percentile_row(
+                chunk.bytes_per_second
+                for chunk in send_chunks
+                if chunk.bytes_per_second is not None
+            ),
+            "fetch_chunk_bytes_per_second": percentile_row(
+                chunk.bytes_per_second
+                for chunk in fetch_chunks
+                if chunk.bytes_per_second is not None
+            ),
+            **{
+                f"invocation_seconds[{function}]": percentile_row(values)
+                for function, values in sorted(durations.items())
+            },
+        }
+
+        return {
+            "invocations": len(self.invocations),
+            "percentiles": {name: row for name, row in tables.items() if row},
+            "messages": [
+                message.as_dict() for message in (*send_messages, *fetch_messages)
+            ],
+            "chunks": [asdict(chunk) for chunk in (*send_chunks, *fetch_chunks)],
+        }
+
+
+def format_percentiles(percentiles: dict[str, dict[str, float | int]]) -> str:
+    columns = ["count", *(f"p{pct}" for pct in PERCENTILES), "max"]
+    width = max([len(name) for name in percentiles] + [6])
+    lines = [f"{'metric':<{width}} " + " ".join(f"{col:>14}" for col in columns)]
+    for name, row in percentiles.items():
+        lines.append(
+            f"{name:<{width}} " + " ".join(f"{row[col]:>14}" for col in columns)
+        )
+    return "\n".join(lines)
+
+
+def _read_lines(paths: list[str], stdin: TextIO) -> Iterable[str]:
+    if not paths:
+        yield from stdin
+        return
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            yield from f
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "paths", nargs="*", help="exported log files, stdin if none are given"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the percentiles and each message's and chunk's timings as json",
+    )
+    args = parser.parse_args(argv)
+
+    analyser = LogAnalyser()
+    analyser.add_lines(_read_lines(args.paths, sys.stdin))
+    report = analyser.report()
+    if args.json:
+        print(json.dumps(report))
+        return
+
+    print(f"invocations: {report['invocations']}")
+    print(format_percentiles(report["percentiles"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,36 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from typing import Any
+from time import monotonic, sleep, time
+from typing import TYPE_CHECKING, Any, TypeVar
 
-from aws_lambda_powertools.shared.functions import strtobool
 from requests import HTTPError
 from shared.application import MESHLambdaApplication
-from shared.common import SingletonCheckFailure, return_failure, singleton_check
+from shared.common import (
+    SingletonCheckFailure,
+    return_failure,
+    singleton_check,
+    strtobool,
+)
+from shared.lease import MailboxLease, mailbox_lease_from_config
+
+if TYPE_CHECKING:
+    from mesh_client import MeshClient
+
+T = TypeVar("T")
+
+POLL_MAX_WORKERS = 16
+
+# adaptive polling, re-polls of a busy mailbox back off from the min to the max interval
+POLL_MIN_BACKOFF_SECONDS = 1.0
+POLL_MAX_BACKOFF_SECONDS = 8.0
+# a busy mailbox found empty on this many re-polls in a row ( the last after the max backoff )
+# is treated as quiet, rather than holding the lambda open until the deadline
+POLL_QUIET_POLLS = 4
+# a mailbox which had messages this recently ( on this instance ) is treated as busy
+POLL_RECENTLY_BUSY_SECONDS = 120.0
+# leave time for the lambda to respond before it times out
+POLL_TIMEOUT_MARGIN_SECONDS = 10.0
 
 
 class HandshakeFailure(Exception):
@@ -28,26 +54,44 @@ class MeshPollMailboxApplication(MESHLambdaApplication):
 
         self.handshake: bool = False
         self.response: dict[str, Any] = {}
+        self.mailbox_id: str = ""
+        self.mailbox_ids: list[str] = []
+        # when messages were last found for each mailbox polled by this instance
+        self._last_busy: dict[str, float] = {}
+        self.poll_until = 0.0
+        # a mesh worker replaces this with the lease it holds, so it can poll its own mailboxes
+        self.mailbox_lease: MailboxLease | None = mailbox_lease_from_config(self.config)
 
     def initialise(self):
         # initialise
-        self.mailbox_id = self.event["mailbox"]
-        self.handshake = bool(strtobool(self.event.get("handshake", "false")))
+        mailboxes = self.event.get("mailboxes")
+        self.mailbox_ids = list(mailboxes) if mailboxes else []
+        self.mailbox_id = "" if self.mailbox_ids else self.event["mailbox"]
+        self.handshake = bool(
+            strtobool(self.event.get("handshake", "false"), raise_exc=True)
+        )
+        # set on re-polls after finding messages, when adaptive polling is enabled
+        self.poll_until = float(self.event.get("poll_until") or 0)
         self.response = {}
 
     def start(self):
         # in case of crash
         self.response = {"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)}
 
+        if self.mailbox_ids:
+            self.poll_mailboxes()
+            return
+
         if self.handshake:
-            with self:
-                self.perform_handshake()
+            with self.borrow_client(self.mailbox_id) as client:
+                self.perform_handshake(client)
                 # 204 No Content is raised so the step function
                 # ends without looking for messages
                 self.response = {"statusCode": int(HTTPStatus.NO_CONTENT), "body": {}}
                 return
 
         try:
+            self._check_not_leased(self.mailbox_id)
             singleton_check(
                 self.config.get_messages_step_function_arn,
                 self.is_same_mailbox_check,
@@ -64,8 +108,10 @@ class MeshPollMailboxApplication(MESHLambdaApplication):
             )
             return
 
-        with self:
-            message_list = self.list_messages()
+        with self.borrow_client(self.mailbox_id) as client:
+            message_list = self.list_messages(client)
+            if not message_list and self._is_busy():
+                message_list = self._wait_for_messages(client)
 
         message_count = len(message_list)
 
@@ -108,30 +154,253 @@ class MeshPollMailboxApplication(MESHLambdaApplication):
             # Parameters for a follow-up iteration through the messages in this execution
             "mailbox": self.mailbox_id,
             "handshake": "false",  # No need to handshake again for this execution
+            "more_messages": message_count == self.config.get_messages_page_limit,
         }
 
-    def perform_handshake(self) -> int:
+        if self.config.poll_wait_seconds <= 0:
+            return
+
+        self._last_busy[self.mailbox_id] = time()
+        poll_until = self.poll_until or (time() + self.config.poll_wait_seconds)
+        if poll_until > time():
+            # keep polling the busy mailbox once these messages are fetched
+            self.response["more_messages"] = True
+            self.response["poll_until"] = poll_until
+
+    def _is_busy(self) -> bool:
+        """whether recent polls of the mailbox found messages"""
+        if self.config.poll_wait_seconds <= 0:
+            return False
+        if self.poll_until:
+            return True
+        last_busy = self._last_busy.get(self.mailbox_id, 0.0)
+        return time() - last_busy < POLL_RECENTLY_BUSY_SECONDS
+
+    def _poll_deadline(self) -> float:
+        """monotonic time to stop re-polling, the earlier of the poll window and the lambda timeout"""
+        poll_until = self.poll_until or (time() + self.config.poll_wait_seconds)
+        wait = poll_until - time()
+
+        get_remaining_time = getattr(self.context, "get_remaining_time_in_millis", None)
+        if get_remaining_time:
+            wait = min(wait, get_remaining_time() / 1000 - POLL_TIMEOUT_MARGIN_SECONDS)
+
+        return monotonic() + wait
+
+    def _wait_for_messages(self, client: "MeshClient") -> list[str]:
+        """
+        re-poll a busy mailbox on a short backoff, returning as soon as messages arrive,
+        or nothing once the mailbox has gone quiet or the deadline has passed
+        """
+        deadline = self._poll_deadline()
+        backoff = POLL_MIN_BACKOFF_SECONDS
+        polls = 0
+        message_list: list[str] = []
+        while True:
+            wait = min(backoff, deadline - monotonic())
+            if wait <= 0:
+                break
+            sleep(wait)
+            polls += 1
+            message_list = self.list_messages(client)
+            if message_list:
+                break
+            if polls >= POLL_QUIET_POLLS:
+                # no longer busy, so the next poll returns straight away
+                self._last_busy.pop(self.mailbox_id, None)
+                break
+            backoff = min(backoff * 2, POLL_MAX_BACKOFF_SECONDS)
+
+        self.log_object.write_log(
+            "MESHPOLL0005",
+            None,
+            {
+                "mailbox": self.mailbox_id,
+                "polls": polls,
+                "message_count": len(message_list),
+            },
+        )
+        return message_list
+
+    def _check_not_leased(self, mailbox_id: str):
+        """a mailbox leased to a mesh worker is left to the worker"""
+        if self.mailbox_lease and self.mailbox_lease.held_elsewhere(mailbox_id):
+            raise SingletonCheckFailure(
+                f"mailbox {mailbox_id} is leased to a mesh worker"
+            )
+
+    def _unleased_mailboxes(self) -> list[str]:
+        unleased = []
+        for mailbox_id in self.mailbox_ids:
+            try:
+                self._check_not_leased(mailbox_id)
+            except SingletonCheckFailure as e:
+                self.log_object.write_log(
+                    "MESHPOLL0006", None, {"mailbox": mailbox_id, "error": e.msg}
+                )
+                continue
+            unleased.append(mailbox_id)
+        return unleased
+
+    def is_same_mailbox_check(self, sf_input: dict[str, Any]) -> bool:
+        sf_mailbox = sf_input.get("mailbox")
+        sf_mailboxes = sf_input.get("mailboxes")
+
+        if sf_mailboxes and self.mailbox_id:
+            # an execution polling many mailboxes, including this one
+            return self.mailbox_id in sf_mailboxes
+
+        if not sf_mailbox or not self.mailbox_id:
+            self.log_object.write_log(
+                "MESHPOLL0002a",
+                None,
+                {"mailbox": self.mailbox_id, "sf_mailbox": sf_mailbox},
+            )
+            return False
+
+        return bool(sf_mailbox == self.mailbox_id)
+
+    def is_same_mailboxes_check(self, sf_input: dict[str, Any]) -> bool:
+        sf_mailboxes = sf_input.get("mailboxes") or [sf_input.get("mailbox")]
+        return bool(set(sf_mailboxes).intersection(self.mailbox_ids))
+
+    def _with_client(
+        self, func: Callable[[str, "MeshClient"], T]
+    ) -> Callable[[str], T]:
+        """func called with a client borrowed from the pool for the mailbox"""
+
+        def _run(mailbox_id: str) -> T:
+            with self.borrow_client(mailbox_id) as client:
+                return func(mailbox_id, client)
+
+        return _run
+
+    def _for_each_mailbox(self, func: Callable[[str], T]) -> dict[str, T]:
+        """run func concurrently for each mailbox, a failing mailbox is logged and left out of the results"""
+
+        def _run(mailbox_id: str) -> tuple[str, T | None, Exception | None]:
+            try:
+                return mailbox_id, func(mailbox_id), None
+            except Exception as e:  # pylint: disable=broad-except
+                return mailbox_id, None, e
+
+        results: dict[str, T] = {}
+        max_workers = min(POLL_MAX_WORKERS, len(self.mailbox_ids))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for mailbox_id, result, error in executor.map(_run, self.mailbox_ids):
+                if error is not None:
+                    self.log_object.write_log(
+                        "MESHPOLL0003", None, {"mailbox": mailbox_id, "error": error}
+                    )
+                    continue
+                results[mailbox_id] = result  # type: ignore[assignment]
+
+        return results
+
+    def poll_mailboxes(self):
+        """poll many mailboxes concurrently, only mailboxes with messages are fanned out"""
+        if self.handshake:
+            self._for_each_mailbox(self._with_client(self._handshake))
+            self.response = {"statusCode": int(HTTPStatus.NO_CONTENT), "body": {}}
+            return
+
+        try:
+            singleton_check(
+                self.config.get_messages_step_function_arn,
+                self.is_same_mailboxes_check,
+                self.sfn,
+            )
+
+        except SingletonCheckFailure as e:
+            self.response = return_failure(
+                self.log_object,
+                int(HTTPStatus.TOO_MANY_REQUESTS),
+                "MESHPOLL0002",
+                ",".join(self.mailbox_ids),
+                message=e.msg,
+            )
+            return
+
+        self.mailbox_ids = self._unleased_mailboxes()
+        if not self.mailbox_ids:
+            self.response = {"statusCode": int(HTTPStatus.NO_CONTENT), "body": {}}
+            return
+
+        polled = self._for_each_mailbox(self._with_client(self._list_messages))
+
+        output_list = [
+            {
+                "headers": {"Content-Type": "application/json"},
+                "body": {
+                    "complete": False,
+                    "internal_id": self.log_object.internal_id,
+                    "message_id": message,
+                    "dest_mailbox": mailbox_id,
+                },
+            }
+            for mailbox_id, message_ids in polled.items()
+            for message in message_ids
+        ]
+        # only re-poll mailboxes which returned a full page
+        more_mailboxes = [
+            mailbox_id
+            for mailbox_id, message_ids in polled.items()
+            if len(message_ids) >= self.config.get_messages_page_limit
+        ]
+
+        message_count = len(output_list)
+        self.log_object.write_log(
+            "MESHPOLL0004",
+            None,
+            {
+                "mailbox_count": len(self.mailbox_ids),
+                "mailboxes_with_messages": sum(1 for ids in polled.values() if ids),
+                "message_count": message_count,
+            },
+        )
+
+        if message_count == 0:
+            self.response = {"statusCode": int(HTTPStatus.NO_CONTENT), "body": {}}
+            return
+
+        self.response = {
+            "statusCode": int(HTTPStatus.OK),
+            "headers": {"Content-Type": "application/json"},
+            "body": {
+                "internal_id": self.log_object.internal_id,
+                "message_count": message_count,
+                "message_list": output_list,
+            },
+            "mailboxes": more_mailboxes,
+            "handshake": "false",
+            "more_messages": bool(more_mailboxes),
+        }
+
+    def perform_handshake(self, client: "MeshClient") -> int:
         """
         Do an authenticated handshake with the MESH server
         """
 
+        return self._handshake(self.mailbox_id, client)
+
+    def _handshake(self, mailbox_id: str, client: "MeshClient") -> int:
         try:
-            self.mesh_client.handshake()
+            client.handshake()
         except HTTPError as ex:
             self.log_object.write_log(
                 "MESHMBOX0004",
                 None,
-                {"mailbox": self.mailbox_id, "http_status": ex.response.status_code},
+                {"mailbox": mailbox_id, "http_status": ex.response.status_code},
             )
             raise HandshakeFailure from ex
 
         self.log_object.write_log(
-            "MESHMBOX0004", None, {"mailbox": self.mailbox_id, "http_status": 200}
+            "MESHMBOX0004", None, {"mailbox": mailbox_id, "http_status": 200}
         )
 
         return 200
 
-    def list_messages(self) -> list[str]:
+    def list_messages(self, client: "MeshClient") -> list[str]:
         """Return a list of messages in the mailbox in the form:
         [
             '20220610195418651944_2202CC',
@@ -139,14 +408,19 @@ class MeshPollMailboxApplication(MESHLambdaApplication):
         ]
         """
 
-        message_ids = self.mesh_client.list_messages(
-            max_results=self.config.get_messages_page_limit
-        )
+        self.metrics.set_dimensions(mailbox=self.mailbox_id)
+        return self._list_messages(self.mailbox_id, client)
+
+    def _list_messages(self, mailbox_id: str, client: "MeshClient") -> list[str]:
+        with self.metrics.timer("mesh_list"):
+            message_ids = client.list_messages(
+                max_results=self.config.get_messages_page_limit
+            )
         self.log_object.write_log(
             "MESHMBOX0005",
             None,
             {
-                "mailbox": self.mailbox_id,
+                "mailbox": mailbox_id,
                 "message_count": len(message_ids),
             },
         )
@@ -156,6 +430,8 @@ class MeshPollMailboxApplication(MESHLambdaApplication):
 # create instance of class in global space
 # this ensures initial setup of logging/config is only done on cold start
 app = MeshPollMailboxApplication()
+# optionally fetch params and build clients during init, rather than in the first invocation
+app.warm_up()
 
 
 def lambda_handler(event, context):
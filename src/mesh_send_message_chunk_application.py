@@ -1,14 +1,30 @@
+import gzip
 from collections.abc import Generator
-from dataclasses import asdict
+from dataclasses import asdict, dataclass, field
 from functools import partial
 from http import HTTPStatus
-from io import BytesIO
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from mypy_boto3_s3.service_resource import Object
+from botocore.exceptions import ClientError
 from shared.application import MESHLambdaApplication
-from shared.common import SingletonCheckFailure, return_failure, singleton_check
-from shared.send_parameters import SendParameters, get_send_parameters
+from shared.chunk_plan import ChunkPlan
+from shared.common import (
+    SingletonCheckFailure,
+    body_buffer,
+    return_failure,
+    singleton_check,
+)
+from shared.metrics import InvocationMetrics
+from shared.send_parameters import (
+    SendParameters,
+    calculate_chunks,
+    get_send_parameters,
+)
+from shared.staging import StagedObject, stage_compressed, staging_key
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import Object
+    from shared.mesh import MeshClient
 
 
 class MaxByteExceededException(Exception):
@@ -19,6 +35,52 @@ class MaxByteExceededException(Exception):
         self.msg = msg
 
 
+@dataclass
+class SendContext:
+    """
+    the state of sending one file, as passed between invocations by the step function,
+    kept apart from the application so an invocation can send many files at once
+    """
+
+    # the event, updated in place to be the invocation's response
+    response: dict[str, Any]
+    input: dict[str, Any] = field(default_factory=dict)
+    from_event_bridge: bool = False
+    send_params: SendParameters = None  # type: ignore[assignment]
+    s3_object: "Object" = None  # type: ignore[assignment]
+    current_byte: int = 0
+    current_chunk: int = 1
+    chunk_size: int = 0
+    crumb_size: int = 0
+    client: "MeshClient" = field(default=None, repr=False)  # type: ignore[assignment]
+    staged: StagedObject | None = None
+    # phases and dimensions of this send, apart from other sends in the same invocation
+    metrics: InvocationMetrics = field(
+        default_factory=lambda: InvocationMetrics(namespace="", enabled=False),
+        repr=False,
+    )
+
+    @property
+    def send_size(self) -> int:
+        """bytes to be read and sent, the compressed size once staged"""
+        return self.staged.size if self.staged else self.send_params.file_size
+
+    @property
+    def plan(self) -> ChunkPlan:
+        return ChunkPlan(self.send_params.file_size, self.send_params.total_chunks)
+
+    def chunk_end(self) -> int:
+        """
+        the end of the current chunk in the object read, a staged chunk ends with its gzip member,
+        reading resumes from current_byte, so sends planned with full chunks and a remainder
+        finish within the same number of chunks
+        """
+        if self.staged:
+            return self.staged.offsets[self.current_chunk]
+        _, end = self.plan.byte_range(self.current_chunk)
+        return end
+
+
 class MeshSendMessageChunkApplication(MESHLambdaApplication):
     """
     MESH API Lambda for sending a message / message chunk
@@ -34,26 +96,30 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
         super().__init__(additional_log_config, load_ssm_params)
 
         self.environment = self.config.environment
-        self.input = {}
-        self.body = None
-        self.from_event_bridge = False
-
-        self.current_byte = 0
-        self.current_chunk = 1
-
-        self.s3_object: Object = None  # type: ignore[assignment]
-        self.send_params: SendParameters = None  # type: ignore[assignment]
-
-    def initialise(self):
-        """Setup class variables"""
-        super().initialise()
-        self.s3_object = None  # type: ignore[assignment]
-        self.from_event_bridge = self.event.get("source") == "aws.s3"
-        self.input = {} if self.from_event_bridge else self.event.get("body", {})
-        self.current_byte = self.input.get("current_byte_position", 0)
-        self.current_chunk = self.input.get("chunk_number", 1)
-        self.send_params = self._get_send_params()
-        self.response: dict[str, Any] = (
+        self.response: dict[str, Any] = {}
+
+    def start(self):
+        """Main body of lambda"""
+        self.response = self.send(self.new_context(self.event.raw_event, self.metrics))
+
+    def new_context(
+        self, event: dict[str, Any], metrics: InvocationMetrics | None = None
+    ) -> SendContext:
+        """context for sending the file, with new metrics ( for the caller to flush ) if none are given"""
+        from_event_bridge = event.get("source") == "aws.s3"
+        ctx = SendContext(
+            response={},
+            input={} if from_event_bridge else event.get("body", {}),
+            from_event_bridge=from_event_bridge,
+            metrics=metrics or self.new_metrics(),
+        )
+        ctx.current_byte = ctx.input.get("current_byte_position", 0)
+        ctx.current_chunk = ctx.input.get("chunk_number", 1)
+        ctx.send_params = self._get_send_params(ctx, event)
+        staged = ctx.input.get("staged")
+        ctx.staged = StagedObject(**staged) if staged else None
+        self._plan_sizes(ctx)
+        ctx.response = (
             {
                 "statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR),
                 "headers": {"Content-Type": "application/json"},
@@ -61,71 +127,188 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
                     "internal_id": self.log_object.internal_id,
                 },
             }
-            if self.from_event_bridge
-            else self.event.raw_event
+            if from_event_bridge
+            else event
         )
 
-        self.response["body"]["send_params"] = asdict(self.send_params)
+        ctx.response["body"]["send_params"] = asdict(ctx.send_params)
+        ctx.response["body"].update(
+            {
+                "chunk_size": ctx.chunk_size,
+                "crumb_size": ctx.crumb_size,
+                "total_chunks": ctx.send_params.total_chunks,
+            }
+        )
+        return ctx
+
+    def _plan_sizes(self, ctx: SendContext):
+        send_params = ctx.send_params
+        if ctx.current_chunk == 1 and self.config.auto_tune_sizes:
+            # nothing sent yet, so re-plan with the throughput observed on this instance
+            send_params.chunk_size = self.tuner.chunk_size(send_params.file_size)
+            send_params.chunked, send_params.total_chunks = calculate_chunks(
+                send_params.file_size, send_params.chunk_size
+            )
+
+        # sends planned before chunk_size was recorded carry on with the configured size
+        send_params.chunk_size = send_params.chunk_size or self.config.chunk_size
+        ctx.chunk_size = send_params.chunk_size
+        ctx.crumb_size = self.tuner.crumb_size(ctx.chunk_size)
 
-    def _get_send_params(self) -> SendParameters:
+    def _get_send_params(
+        self, ctx: SendContext, event: dict[str, Any]
+    ) -> SendParameters:
         # invoked from most recent check send params or from another send message chunk
-        from_input = self.input.get("send_params")
+        from_input = ctx.input.get("send_params")
         if from_input:
             return SendParameters(**from_input)
 
         # invoked directly from event bridge trigger or from a previous function version
-        detail = self.event.get("detail", {})
-        bucket = self.input.get(
+        detail = event.get("detail", {})
+        bucket = ctx.input.get(
             "bucket", detail.get("requestParameters", {}).get("bucketName")
         )
-        key = self.input.get("key", detail.get("requestParameters", {}).get("key"))
-        self.s3_object = self.s3.Object(bucket, key)
-
-        return get_send_parameters(self.s3_object, self.config, self.ssm)
+        key = ctx.input.get("key", detail.get("requestParameters", {}).get("key"))
+        ctx.s3_object = self.s3.Object(bucket, key)
+
+        with ctx.metrics.timer("parameters"):
+            return get_send_parameters(
+                ctx.s3_object,
+                self.config,
+                self.ssm,
+                chunk_size=self.tuner.chunk_size(ctx.s3_object.content_length),
+                mappings=self.outbound_mappings,
+            )
 
-    def _get_chunk_from_s3(self) -> Generator[bytes, None, None]:
+    def _get_chunk_from_s3(self, ctx: SendContext) -> Generator[bytes, None, None]:
         """Get a file or chunk of a file from S3"""
-        start_byte = self.current_byte
-        end_byte = start_byte + self.config.chunk_size
-        if end_byte > self.s3_object.content_length:
-            end_byte = self.s3_object.content_length
-        while self.current_byte < end_byte:
-            bytes_to_end = end_byte - self.current_byte
-            if bytes_to_end > self.config.crumb_size:
-                range_spec = f"bytes={self.current_byte}-{self.current_byte + self.config.crumb_size - 1}"
-                self.current_byte = self.current_byte + self.config.crumb_size
+        end_byte = ctx.chunk_end()
+        while ctx.current_byte < end_byte:
+            bytes_to_end = end_byte - ctx.current_byte
+            if bytes_to_end > ctx.crumb_size:
+                range_spec = (
+                    f"bytes={ctx.current_byte}-{ctx.current_byte + ctx.crumb_size - 1}"
+                )
+                ctx.current_byte = ctx.current_byte + ctx.crumb_size
             else:
-                range_spec = f"bytes={self.current_byte}-{end_byte-1}"
-                self.current_byte = end_byte
+                range_spec = f"bytes={ctx.current_byte}-{end_byte-1}"
+                ctx.current_byte = end_byte
 
-            response = self.s3_object.get(Range=range_spec)
+            with ctx.metrics.timer("s3_read") as timer:
+                response = ctx.s3_object.get(Range=range_spec)
 
-            body = response.get("Body")
-            assert body
+                body = response.get("Body")
+                assert body
 
-            file_content = body.read()
+                file_content = body.read()
+                timer.add_bytes(len(file_content))
 
             self.log_object.write_log(
                 "MESHSEND0006",
                 None,
                 {
-                    "file": self.s3_object.key,
-                    "bucket": self.s3_object.bucket_name,
+                    "file": ctx.s3_object.key,
+                    "bucket": ctx.s3_object.bucket_name,
                     "num_bytes": len(file_content),
                     "byte_range": range_spec,
                 },
             )
             yield file_content
 
-    def start(self):
-        """Main body of lambda"""
+    def _open_object(self, ctx: SendContext):
+        """the object the chunks are read from, the staged object once it is compressed"""
+        send_params = ctx.send_params
+        if self._should_stage(ctx):
+            self._stage_compressed(ctx)
+        elif ctx.staged:
+            ctx.s3_object = self.s3.Object(ctx.staged.bucket, ctx.staged.key)
+        if not ctx.s3_object:
+            ctx.s3_object = self.s3.Object(send_params.s3_bucket, send_params.s3_key)
+
+        _ = ctx.s3_object.content_length  # trigger a 'head-object' request
+
+    def _should_stage(self, ctx: SendContext) -> bool:
+        send_params = ctx.send_params
+        return bool(
+            self.config.send_staging_prefix
+            and ctx.current_chunk == 1
+            and send_params.compress
+            and send_params.chunked
+            and not ctx.staged
+        )
 
-        complete = self.input.get("complete", False)
+    def _stage_compressed(self, ctx: SendContext):
+        """
+        compress the file once into the staging prefix, and re-plan the chunks from the
+        compressed size, the rest of the send reads from the staged object
+        """
+        send_params = ctx.send_params
+        source = ctx.s3_object or self.s3.Object(
+            send_params.s3_bucket, send_params.s3_key
+        )
+        staged = self.s3.Object(
+            self.config.mesh_bucket,
+            staging_key(
+                self.config.send_staging_prefix,
+                self.log_object.internal_id,
+                send_params.s3_key,
+            ),
+        )
+        offsets = stage_compressed(
+            source, staged, ctx.chunk_size, ctx.crumb_size, ctx.metrics
+        )
+
+        ctx.staged = StagedObject(staged.bucket_name, staged.key, offsets)
+        send_params.total_chunks = ctx.staged.total_chunks
+        send_params.chunked = send_params.total_chunks > 1
+        ctx.s3_object = staged
+        ctx.response["body"]["staged"] = asdict(ctx.staged)
+        ctx.response["body"]["send_params"] = asdict(send_params)
+        ctx.response["body"]["total_chunks"] = send_params.total_chunks
+
+        self.log_object.write_log(
+            "MESHSEND0009",
+            None,
+            {
+                "file": send_params.s3_key,
+                "bucket": send_params.s3_bucket,
+                "file_size": send_params.file_size,
+                "staged_key": ctx.staged.key,
+                "compressed_size": ctx.staged.size,
+                "chunks": send_params.total_chunks,
+            },
+        )
+
+    def _delete_staged(self, staged: StagedObject):
+        try:
+            self.s3.Object(staged.bucket, staged.key).delete()
+        except ClientError as e:
+            # not fatal, the bucket lifecycle rule will expire it
+            self.log_object.write_log(
+                "MESHSEND0010",
+                None,
+                {
+                    "staged_key": staged.key,
+                    "bucket": staged.bucket,
+                    "error": e,
+                },
+            )
+
+    def send(self, ctx: SendContext) -> dict[str, Any]:
+        """
+        send the next chunk of the file, returning the response for the step function,
+        the application holds no state for the file, so this can be called concurrently
+        """
+
+        complete = ctx.input.get("complete", False)
         if complete:
-            self.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
+            ctx.response.update({"statusCode": int(HTTPStatus.INTERNAL_SERVER_ERROR)})
             raise SystemError("Already completed upload to MESH")
 
-        send_params = self.send_params
+        send_params = ctx.send_params
+        ctx.metrics.set_dimensions(
+            mailbox=send_params.sender, workflow_id=send_params.workflow_id
+        )
 
         self.log_object.write_log(
             "MESHSEND0004a",
@@ -137,7 +320,7 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
             },
         )
 
-        if self.from_event_bridge:
+        if ctx.from_event_bridge:
             self.log_object.write_log(
                 "MESHSEND0002",
                 None,
@@ -156,21 +339,18 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
                 )
 
             except SingletonCheckFailure as e:
-                self.response = return_failure(
+                ctx.response = return_failure(
                     self.log_object,
                     int(HTTPStatus.TOO_MANY_REQUESTS),
                     "MESHSEND0003",
                     send_params.sender,
                     message=e.msg,
                 )
-                return
+                return ctx.response
 
-        if not self.s3_object:
-            self.s3_object = self.s3.Object(send_params.s3_bucket, send_params.s3_key)
+        self._open_object(ctx)
 
-        _ = self.s3_object.content_length  # trigger a 'head-object' request
-
-        message_id = self.input.get("message_id", "")
+        message_id = ctx.input.get("message_id", "")
         total_chunks = send_params.total_chunks
 
         self.log_object.write_log(
@@ -179,39 +359,38 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
             {
                 "file": send_params.s3_key,
                 "bucket": send_params.s3_bucket,
-                "chunk_num": self.current_chunk,
+                "chunk_num": ctx.current_chunk,
                 "max_chunk": send_params.total_chunks,
             },
         )
 
-        self.mailbox_id = send_params.sender
-
         if send_params.file_size < 1:
-            self.response.update({"statusCode": int(HTTPStatus.NOT_FOUND)})
+            ctx.response.update({"statusCode": int(HTTPStatus.NOT_FOUND)})
             raise FileNotFoundError
 
-        with self:
+        with self.borrow_client(send_params.sender, ctx.metrics) as ctx.client:
             mailbox_response = self.send_chunk(
+                ctx,
                 message_id=message_id,
-                content=self._get_chunk_from_s3(),
+                content=self._get_chunk_from_s3(ctx),
                 send_params=send_params,
-                chunk_num=self.current_chunk,
+                chunk_num=ctx.current_chunk,
             )
 
-            if self.current_chunk == 1:
+            if ctx.current_chunk == 1:
                 message_id = mailbox_response.json()["message_id"]
 
-        self.response.update({"statusCode": int(HTTPStatus.OK)})
+        ctx.response.update({"statusCode": int(HTTPStatus.OK)})
 
         complete = bool(
-            self.current_chunk >= total_chunks if send_params.chunked else True
+            ctx.current_chunk >= total_chunks if send_params.chunked else True
         )
 
-        if self.current_byte >= send_params.file_size and not complete:
+        if ctx.current_byte >= ctx.send_size and not complete:
             raise MaxByteExceededException
 
         if send_params.chunked and not complete:
-            self.current_chunk += 1
+            ctx.current_chunk += 1
 
         if complete:
             # check mailbox for any reports
@@ -221,22 +400,26 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
                 {
                     "file": send_params.s3_key,
                     "bucket": send_params.s3_bucket,
-                    "chunk_num": self.current_chunk,
+                    "chunk_num": ctx.current_chunk,
                     "max_chunk": total_chunks,
                 },
             )
+            if ctx.staged:
+                self._delete_staged(ctx.staged)
 
-        self.response["body"].update(
+        ctx.response["body"].update(
             {
                 "complete": complete,
                 "message_id": message_id,
-                "chunk_number": self.current_chunk,
-                "current_byte_position": self.current_byte,
+                "chunk_number": ctx.current_chunk,
+                "current_byte_position": ctx.current_byte,
             }
         )
+        return ctx.response
 
     def send_chunk(
         self,
+        ctx: SendContext,
         message_id: str,
         content: Generator[bytes, None, None],
         send_params: SendParameters,
@@ -248,13 +431,34 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
         if chunk_num > 1:
             kwargs["message_id"] = message_id
 
-        chunk = BytesIO(b"".join(chunk for chunk in content))
-
-        response = self.mesh_client.send_chunk(
-            chunk=chunk,
-            chunk_num=chunk_num,
-            **kwargs,
-        )
+        # only a crumb of a larger chunk is held in memory while reading from s3
+        chunk_bytes = ctx.chunk_end() - ctx.current_byte
+        with body_buffer(chunk_bytes, ctx.crumb_size) as body:
+            if kwargs.get("compress") and not ctx.staged:
+                # compress here rather than inline in the client, so upload time excludes compression
+                with gzip.GzipFile(
+                    filename="", mode="wb", fileobj=body, compresslevel=9, mtime=0
+                ) as compressed:
+                    for crumb in content:
+                        with ctx.metrics.timer("compress") as timer:
+                            timer.add_bytes(len(crumb))
+                            compressed.write(crumb)
+                kwargs["precompressed"] = True
+            else:
+                for crumb in content:
+                    body.write(crumb)
+                # a staged chunk is a gzip member already
+                kwargs["precompressed"] = bool(ctx.staged)
+
+            body_size = body.tell()
+            body.seek(0)
+            with ctx.metrics.timer("mesh_upload") as timer:
+                timer.add_bytes(body_size)
+                response = ctx.client.send_chunk(
+                    chunk=body,
+                    chunk_num=chunk_num,
+                    **kwargs,
+                )
         response.raw.decode_content = True
 
         if chunk_num == 1:
@@ -277,6 +481,8 @@ class MeshSendMessageChunkApplication(MESHLambdaApplication):
 # create instance of class in global space
 # this ensures initial setup of logging/config is only done on cold start
 app = MeshSendMessageChunkApplication()
+# optionally fetch params and build clients during init, rather than in the first invocation
+app.warm_up()
 
 
 def lambda_handler(event, context):
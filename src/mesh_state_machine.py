@@ -0,0 +1,531 @@
+"""
+Local, in-process driver for the get messages and send message step functions, for benchmarking
+the whole pipeline without localstack or docker.
+
+The state machine definitions are read from `module/stepfunctions_*.tf` and interpreted state by
+state ( Task, Choice, Map, Succeed and Fail, with Retry ), so the flow is exactly the deployed one.
+Lambda tasks call the handler module's application in-process, each concurrent invocation borrows
+its own application instance, as a concurrent invocation would get its own lambda execution environment.
+
+State transitions ( which step functions bills ) and lambda invocations are counted per execution.
+
+    python mesh_state_machine.py get-messages --mailbox X26ABC1 --map-concurrency 10
+    python mesh_state_machine.py send-message --bucket my-bucket --key X26ABC1/outbound/file.dat
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+from typing import Any, cast
+
+from mesh_worker import ApplicationPool
+
+logger = logging.getLogger(__name__)
+
+MODULE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "module")
+
+GET_MESSAGES = "get_messages"
+SEND_MESSAGE = "send_message"
+
+_HCL_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+|\#[^\n]*|//[^\n]*)
+    |(?P<string>"(?:[^"\\]|\\.)*")
+    |(?P<number>-?\d+(?:\.\d+)?)
+    |(?P<name>[A-Za-z_][\w.\-]*)
+    |(?P<punct>[{}\[\]=:,])
+    """,
+    re.VERBOSE,
+)
+_LAMBDA_RESOURCE = re.compile(r"aws_lambda_function\.(\w+)\.")
+_LAMBDA_HANDLER = re.compile(
+    r'resource\s+"aws_lambda_function"\s+"(\w+)"\s*\{.*?\bhandler\s*=\s*"([\w.]+)"',
+    re.DOTALL,
+)
+
+
+class StateMachineError(Exception):
+    """a Fail state was reached, or a task error was not retried"""
+
+    def __init__(self, error: str, cause: str | None = None):
+        super().__init__(f"{error}: {cause}" if cause else error)
+        self.error = error
+        self.cause = cause
+
+
+def _hcl_tokens(text: str) -> Iterator[tuple[str, str]]:
+    pos = 0
+    while pos < len(text):
+        match = _HCL_TOKEN.match(text, pos)
+        if not match:
+            raise ValueError(
+                f"unexpected {text[pos:pos + 20]!r} in state machine definition"
+            )
+        pos = match.end()
+        kind = match.lastgroup or ""
+        if kind != "space":
+            yield kind, match.group()
+
+
+class _HclParser:
+    """
+    parses the hcl object expression passed to jsonencode, references are resolved from `variables`
+    or kept as written ( e.g. the Comment, which is only used by step functions )
+    """
+
+    def __init__(self, text: str, variables: dict[str, Any]):
+        # tokenised lazily, as the rest of the file is not an object expression
+        self._tokens = _hcl_tokens(text)
+        self._peeked: tuple[str, str] | None = None
+        self._variables = variables
+
+    def _next(self) -> tuple[str, str]:
+        token = self._peeked or next(self._tokens)
+        self._peeked = None
+        return token
+
+    def _peek(self) -> str:
+        self._peeked = self._peeked or next(self._tokens)
+        return self._peeked[1]
+
+    def parse(self) -> Any:
+        kind, value = self._next()
+        if value == "{":
+            return self._object()
+        if value == "[":
+            return self._list()
+        if kind in ("string", "number"):
+            return json.loads(value)
+        if kind == "name":
+            literals = {"true": True, "false": False, "null": None}
+            if value in literals:
+                return literals[value]
+            return self._variables.get(value, value)
+        raise ValueError(f"unexpected {value!r} in state machine definition")
+
+    def _object(self) -> dict[str, Any]:
+        result: dict[str, Any] = {}
+        while self._peek() != "}":
+            kind, key = self._next()
+            if self._next()[1] not in ("=", ":"):
+                raise ValueError(f"expected = after {key} in state machine definition")
+            result[json.loads(key) if kind == "string" else key] = self.parse()
+            if self._peek() == ",":
+                self._next()
+        self._next()
+        return result
+
+    def _list(self) -> list[Any]:
+        result: list[Any] = []
+        while self._peek() != "]":
+            result.append(self.parse())
+            if self._peek() == ",":
+                self._next()
+        self._next()
+        return result
+
+
+def load_definition(
+    name: str, variables: dict[str, Any] | None = None, module_dir: str = MODULE_DIR
+) -> dict[str, Any]:
+    """the ASL definition of a state machine in `module/stepfunctions_{name}.tf`"""
+    with open(
+        os.path.join(module_dir, f"stepfunctions_{name}.tf"), encoding="utf-8"
+    ) as f:
+        text = f.read()
+    match = re.search(r"\bdefinition\s*=\s*jsonencode\(", text)
+    if not match:
+        raise ValueError(f"no state machine definition in stepfunctions_{name}.tf")
+    definition = _HclParser(text[match.end() :], variables or {}).parse()
+    return cast(dict[str, Any], definition)
+
+
+def lambda_handlers(module_dir: str = MODULE_DIR) -> dict[str, str]:
+    """handler module of each aws_lambda_function resource, e.g. fetch_message_chunk -> mesh_fetch..."""
+    handlers = {}
+    for file_name in sorted(os.listdir(module_dir)):
+        if not file_name.endswith(".tf"):
+            continue
+        with open(os.path.join(module_dir, file_name), encoding="utf-8") as f:
+            for resource, handler in _LAMBDA_HANDLER.findall(f.read()):
+                handlers[resource] = handler.rsplit(".", 1)[0]
+    return handlers
+
+
+def _path_parts(path: str) -> list[str]:
+    if path == "$":
+        return []
+    if not path.startswith("$."):
+        raise ValueError(f"unsupported path {path}")
+    return path[2:].split(".")
+
+
+_MISSING = object()
+
+
+def get_path(data: Any, path: str) -> Any:
+    for part in _path_parts(path):
+        if not isinstance(data, dict) or part not in data:
+            return _MISSING
+        data = data[part]
+    return data
+
+
+def set_path(data: Any, path: str, value: Any) -> Any:
+    parts = _path_parts(path)
+    if not parts:
+        return value
+    result = dict(data)
+    target = result
+    for part in parts[:-1]:
+        target[part] = dict(target.get(part) or {})
+        target = target[part]
+    target[parts[-1]] = value
+    return result
+
+
+def _parameters(parameters: Any, data: Any) -> Any:
+    if isinstance(parameters, dict):
+        return {
+            key[:-2] if key.endswith(".$") else key: (
+                get_path(data, value)
+                if key.endswith(".$")
+                else _parameters(value, data)
+            )
+            for key, value in parameters.items()
+        }
+    if isinstance(parameters, list):
+        return [_parameters(value, data) for value in parameters]
+    return parameters
+
+
+def _matches(rule: dict[str, Any], data: Any) -> bool:
+    if "And" in rule:
+        return all(_matches(sub_rule, data) for sub_rule in rule["And"])
+    if "Or" in rule:
+        return any(_matches(sub_rule, data) for sub_rule in rule["Or"])
+    if "Not" in rule:
+        return not _matches(rule["Not"], data)
+
+    value = get_path(data, rule["Variable"])
+    if "IsPresent" in rule:
+        return (value is not _MISSING) is bool(rule["IsPresent"])
+    if value is _MISSING:
+        # step functions fails the execution here, the definitions guard with IsPresent where needed
+        raise StateMachineError("States.Runtime", f"{rule['Variable']} not present")
+
+    for comparison, expected in rule.items():
+        if comparison not in ("Variable", "Next"):
+            return _compare(comparison, value, expected)
+    raise ValueError(f"unsupported choice rule {rule}")
+
+
+def _compare(comparison: str, value: Any, expected: Any) -> bool:
+    if comparison == "BooleanEquals":
+        return isinstance(value, bool) and value is expected
+    if comparison == "StringEquals":
+        return isinstance(value, str) and value == expected
+    if not comparison.startswith("Numeric"):
+        raise ValueError(f"unsupported choice comparison {comparison}")
+    if isinstance(value, bool) or not isinstance(value, int | float):
+        return False
+    operator = comparison[len("Numeric") :]
+    return bool(
+        {
+            "Equals": value == expected,
+            "LessThan": value < expected,
+            "LessThanEquals": value <= expected,
+            "GreaterThan": value > expected,
+            "GreaterThanEquals": value >= expected,
+        }[operator]
+    )
+
+
+@dataclass
+class Execution:
+    """result of a local execution"""
+
+    status: str = "RUNNING"
+    output: Any = None
+    error: str | None = None
+    cause: str | None = None
+    seconds: float = 0.0
+    state_transitions: int = 0
+    states: Counter = field(default_factory=Counter)
+    invocations: Counter = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_transition(self, state_name: str):
+        with self._lock:
+            self.state_transitions += 1
+            self.states[state_name] += 1
+
+    def record_invocation(self, function: str):
+        with self._lock:
+            self.invocations[function] += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "cause": self.cause,
+            "seconds": round(self.seconds, 3),
+            "state_transitions": self.state_transitions,
+            "states": dict(self.states),
+            "invocations": dict(self.invocations),
+        }
+
+
+def _lambda_function(function_name: str) -> str:
+    """the aws_lambda_function resource name from a task's FunctionName"""
+    match = _LAMBDA_RESOURCE.search(function_name)
+    return match.group(1) if match else function_name
+
+
+class LocalLambdas:
+    """invokes lambda handlers in-process, with an application instance per concurrent invocation"""
+
+    def __init__(self, handlers: dict[str, str] | None = None):
+        self.handlers = handlers or lambda_handlers()
+        self._pools: dict[str, ApplicationPool] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, function: str) -> ApplicationPool:
+        with self._lock:
+            pool = self._pools.get(function)
+            if not pool:
+                # deferred so the module level lambda app is created with the caller's environment
+                module = importlib.import_module(self.handlers[function])
+                pool = ApplicationPool(type(module.app))
+                self._pools[function] = pool
+            return pool
+
+    def invoke(self, function_name: str, payload: Any) -> Any:
+        return self._pool(_lambda_function(function_name)).invoke(payload)
+
+
+class LocalStateMachine:
+    """interprets an ASL definition, invoking lambda tasks with `lambdas`"""
+
+    def __init__(
+        self,
+        definition: dict[str, Any],
+        lambdas: LocalLambdas,
+        retry_delay_scale: float = 1.0,
+    ):
+        self.definition = definition
+        self.lambdas = lambdas
+        self.retry_delay_scale = retry_delay_scale
+
+    def run(self, execution_input: Any) -> Execution:
+        execution = Execution()
+        started = perf_counter()
+        try:
+            execution.output = self._run_states(
+                self.definition, execution_input, execution
+            )
+            execution.status = "SUCCEEDED"
+        except StateMachineError as err:
+            execution.status = "FAILED"
+            execution.error = err.error
+            execution.cause = err.cause
+        execution.seconds = perf_counter() - started
+        return execution
+
+    def _run_states(
+        self,
+        states_definition: dict[str, Any],
+        data: Any,
+        execution: Execution,
+    ) -> Any:
+        state_name = states_definition["StartAt"]
+        while True:
+            state = states_definition["States"][state_name]
+            execution.record_transition(state_name)
+            state_type = state["Type"]
+
+            if state_type == "Succeed":
+                return data
+            if state_type == "Fail":
+                raise StateMachineError(
+                    state.get("Error", "States.Fail"), state.get("Cause")
+                )
+            if state_type == "Choice":
+                state_name = next(
+                    (
+                        rule["Next"]
+                        for rule in state.get("Choices", [])
+                        if _matches(rule, data)
+                    ),
+                    state.get("Default"),
+                )
+                if not state_name:
+                    raise StateMachineError("States.NoChoiceMatched")
+                continue
+            if state_type == "Task":
+                result = self._task(state_name, state, data, execution)
+            elif state_type == "Map":
+                result = self._map(state, data, execution)
+            elif state_type == "Pass":
+                result = state.get("Result", data)
+            else:
+                raise ValueError(f"unsupported state type {state_type}")
+
+            data = self._apply_result(state, data, result)
+            if state.get("End"):
+                return data
+            state_name = state["Next"]
+
+    @staticmethod
+    def _apply_result(state: dict[str, Any], data: Any, result: Any) -> Any:
+        if "ResultPath" in state:
+            result_path = state["ResultPath"]
+            result = (
+                data if result_path is None else set_path(data, result_path, result)
+            )
+        output_path = state.get("OutputPath", "$")
+        return None if output_path is None else get_path(result, output_path)
+
+    def _task(
+        self,
+        state_name: str,
+        state: dict[str, Any],
+        data: Any,
+        execution: Execution,
+    ) -> Any:
+        if state["Resource"] != "arn:aws:states:::lambda:invoke":
+            raise ValueError(f"unsupported task resource {state['Resource']}")
+        parameters = _parameters(state.get("Parameters", {"Payload.$": "$"}), data)
+        function_name = parameters["FunctionName"]
+        attempts: Counter = Counter()
+        while True:
+            execution.record_invocation(_lambda_function(function_name))
+            try:
+                payload = self.lambdas.invoke(function_name, parameters.get("Payload"))
+                return {"Payload": payload, "StatusCode": 200}
+            except Exception as err:  # pylint: disable=broad-except
+                error = type(err).__name__
+                # the first retrier matching the error applies, with its own attempt count
+                key, retrier = next(
+                    (
+                        (index, retrier)
+                        for index, retrier in enumerate(state.get("Retry", []))
+                        if {error, "States.ALL", "States.TaskFailed"}.intersection(
+                            retrier["ErrorEquals"]
+                        )
+                    ),
+                    (-1, None),
+                )
+                if retrier is None or attempts[key] >= retrier.get("MaxAttempts", 3):
+                    raise StateMachineError(error, str(err)) from err
+                delay = (
+                    retrier.get("IntervalSeconds", 1)
+                    * retrier.get("BackoffRate", 2.0) ** attempts[key]
+                )
+                if retrier.get("JitterStrategy") == "FULL":
+                    delay = random.uniform(0, delay)
+                attempts[key] += 1
+                logger.info(
+                    "%s failed with %s, retrying in %.1fs", state_name, error, delay
+                )
+                # a retry is billed as a state transition
+                execution.record_transition(state_name)
+                sleep(delay * self.retry_delay_scale)
+
+    def _map(
+        self,
+        state: dict[str, Any],
+        data: Any,
+        execution: Execution,
+    ) -> list[Any]:
+        items = get_path(data, state.get("ItemsPath", "$"))
+        if items is _MISSING or not isinstance(items, list):
+            raise StateMachineError(
+                "States.Runtime", f"{state.get('ItemsPath')} is not a list"
+            )
+        if not items:
+            return []
+        iterator = state.get("ItemProcessor") or state["Iterator"]
+        max_concurrency = state.get("MaxConcurrency") or len(items)
+
+        with ThreadPoolExecutor(
+            max_workers=min(max_concurrency, len(items)), thread_name_prefix="mesh-map"
+        ) as executor:
+            futures = [
+                executor.submit(self._run_states, iterator, item, execution)
+                for item in items
+            ]
+            return [future.result() for future in futures]
+
+
+def state_machine(
+    name: str,
+    lambdas: LocalLambdas | None = None,
+    map_concurrency: int = 0,
+    retry_delay_scale: float = 1.0,
+) -> LocalStateMachine:
+    """
+    the local state machine for `module/stepfunctions_{name}.tf`, map_concurrency replaces
+    var.get_message_max_concurrency ( 0 is unlimited, as in step functions )
+    """
+    definition = load_definition(
+        name, {"var.get_message_max_concurrency": map_concurrency}
+    )
+    return LocalStateMachine(definition, lambdas or LocalLambdas(), retry_delay_scale)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--map-concurrency",
+        type=int,
+        default=0,
+        help="max concurrent fetches, 0 is unlimited",
+    )
+    parser.add_argument(
+        "--retry-delay-scale", type=float, default=1.0, help="scale the retry back off"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    get_messages = subparsers.add_parser("get-messages")
+    get_messages.add_argument("--mailbox", required=True)
+    send_message = subparsers.add_parser("send-message")
+    send_message.add_argument("--bucket", required=True)
+    send_message.add_argument("--key", required=True)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "get-messages":
+        execution_input: dict[str, Any] = {"mailbox": args.mailbox}
+    else:
+        # the fields of the event bridge s3 event read by check send parameters
+        execution_input = {
+            "source": "aws.s3",
+            "detail": {
+                "requestParameters": {"bucketName": args.bucket, "key": args.key}
+            },
+        }
+
+    execution = state_machine(
+        GET_MESSAGES if args.command == "get-messages" else SEND_MESSAGE,
+        map_concurrency=args.map_concurrency,
+        retry_delay_scale=args.retry_delay_scale,
+    ).run(execution_input)
+    print(json.dumps(execution.as_dict()))
+    if execution.status != "SUCCEEDED":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
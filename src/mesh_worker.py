@@ -0,0 +1,402 @@
+"""
+Long-running MESH worker, an alternative to the scheduled lambda / step function deployment
+for high volume mailboxes.
+
+The worker drives the same application classes as the lambdas, passing the same payloads
+the step functions would, so a mailbox can move between the two deployments and the
+outputs ( s3 locations, metadata, send parameters ) are identical.
+
+    python mesh_worker.py --mailbox X26ABC1 --mailbox X26ABC2 --send-queue-url https://...
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import signal
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Coroutine, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from time import monotonic
+from typing import Any, Generic, TypeVar, cast
+from uuid import uuid4
+
+from nhs_aws_helpers import sqs_client
+from shared.application import MESHLambdaApplication
+from shared.common import SingletonCheckFailure, singleton_check
+from shared.config import EnvConfig
+from shared.lease import mailbox_lease_from_config
+
+logger = logging.getLogger(__name__)
+
+TApp = TypeVar("TApp", bound=MESHLambdaApplication)
+
+DEFAULT_MAILBOX_CONCURRENCY = 4
+DEFAULT_MAX_SENDS = 10
+DEFAULT_POLL_INTERVAL = 60.0
+DEFAULT_HANDSHAKE_INTERVAL = 3600.0
+DEFAULT_SHUTDOWN_TIMEOUT = 300.0
+
+
+class ApplicationPool(Generic[TApp]):
+    """
+    applications hold per-invocation state, so each concurrent invocation borrows its own instance,
+    idle instances are kept to reuse their clients and parameter caches
+    """
+
+    def __init__(self, factory: Callable[[], TApp]):
+        self._factory = factory
+        self._idle: list[TApp] = []
+        self._lock = threading.Lock()
+
+    def invoke(self, event: dict[str, Any]) -> dict[str, Any]:
+        with self._lock:
+            app = self._idle.pop() if self._idle else None
+
+        app = app or self._factory()
+        try:
+            response = app.main(event, {"aws_request_id": uuid4().hex})
+            return cast(dict[str, Any], response)
+        finally:
+            with self._lock:
+                self._idle.append(app)
+
+
+def _is_complete(response: dict[str, Any]) -> bool:
+    return bool(response.get("body", {}).get("complete"))
+
+
+def _failed(response: dict[str, Any]) -> bool:
+    return int(response.get("statusCode", HTTPStatus.INTERNAL_SERVER_ERROR)) >= 300
+
+
+class MeshWorker:
+    """
+    Continuously polls mailboxes and fetches waiting messages, and sends files for S3 events
+    received from an SQS queue ( or passed to `send` ), with a concurrency limit per mailbox
+    """
+
+    def __init__(
+        self,
+        mailbox_ids: list[str],
+        send_queue_url: str | None = None,
+        mailbox_concurrency: int = DEFAULT_MAILBOX_CONCURRENCY,
+        max_sends: int = DEFAULT_MAX_SENDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        handshake_interval: float = DEFAULT_HANDSHAKE_INTERVAL,
+        shutdown_timeout: float = DEFAULT_SHUTDOWN_TIMEOUT,
+    ):
+        # deferred so the module level lambda apps are created with the worker's environment
+        from mesh_check_send_parameters_application import (
+            MeshCheckSendParametersApplication,
+        )
+        from mesh_fetch_message_chunk_application import (
+            MeshFetchMessageChunkApplication,
+        )
+        from mesh_poll_mailbox_application import MeshPollMailboxApplication
+        from mesh_send_message_chunk_application import (
+            MeshSendMessageChunkApplication,
+        )
+
+        self.config = EnvConfig()
+        self.mailbox_ids = mailbox_ids
+        self.send_queue_url = send_queue_url
+        self.mailbox_concurrency = mailbox_concurrency
+        self.max_sends = max_sends
+        self.poll_interval = poll_interval
+        self.handshake_interval = handshake_interval
+        self.shutdown_timeout = shutdown_timeout
+
+        # held for each polled mailbox, so the get messages step function leaves them to the worker
+        self.lease = mailbox_lease_from_config(self.config)
+        if not self.lease:
+            logger.warning(
+                "WORKER_LEASE_TABLE is not set, get messages step functions will not defer to this worker"
+            )
+        self._lease_renewed: dict[str, float] = {}
+
+        def _poll_app() -> MeshPollMailboxApplication:
+            app = MeshPollMailboxApplication()
+            app.mailbox_lease = self.lease
+            return app
+
+        self.poll_pool = ApplicationPool(_poll_app)
+        self.fetch_pool = ApplicationPool(MeshFetchMessageChunkApplication)
+        self.check_pool = ApplicationPool(MeshCheckSendParametersApplication)
+        self.send_pool = ApplicationPool(MeshSendMessageChunkApplication)
+
+        self._stopping = asyncio.Event()
+        self._mailbox_limits: dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.mailbox_concurrency)
+        )
+        self._send_slots = asyncio.Semaphore(self.max_sends)
+        self._sends: set[asyncio.Task] = set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self):
+        """stop polling for new work, in-flight messages are allowed to complete"""
+        if not self.stopping:
+            logger.info("stopping mesh worker")
+        self._stopping.set()
+
+    async def _invoke(
+        self, pool: ApplicationPool, event: dict[str, Any]
+    ) -> dict[str, Any]:
+        return await asyncio.to_thread(pool.invoke, event)
+
+    async def _sleep(self, seconds: float):
+        """sleep, waking early if the worker is stopped"""
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+
+    def _hold_lease(self, mailbox_id: str) -> bool:
+        """take the mailbox lease, or renew it if a third of it has passed, False if held elsewhere"""
+        if not self.lease:
+            return True
+        renewed = self._lease_renewed.get(mailbox_id)
+        if renewed is not None and monotonic() - renewed < self.lease.duration / 3:
+            return True
+        if not self.lease.acquire(mailbox_id):
+            self._lease_renewed.pop(mailbox_id, None)
+            return False
+        self._lease_renewed[mailbox_id] = monotonic()
+        return True
+
+    def _release_leases(self):
+        if not self.lease:
+            return
+        for mailbox_id in list(self._lease_renewed):
+            try:
+                self.lease.release(mailbox_id)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("failed to release lease of %s", mailbox_id)
+        self._lease_renewed.clear()
+
+    def _step_function_running(self, mailbox_id: str) -> bool:
+        def _polls_mailbox(sf_input: dict[str, Any]) -> bool:
+            # executions poll either a single mailbox or a list of them ( poll_mailboxes_together )
+            return sf_input.get("mailbox") == mailbox_id or mailbox_id in (
+                sf_input.get("mailboxes") or []
+            )
+
+        try:
+            singleton_check(
+                self.config.get_messages_step_function_arn,
+                _polls_mailbox,
+                max_running=0,
+            )
+        except SingletonCheckFailure:
+            return True
+        return False
+
+    async def handshake(self, mailbox_id: str) -> dict[str, Any]:
+        return await self._invoke(
+            self.poll_pool, {"mailbox": mailbox_id, "handshake": "true"}
+        )
+
+    async def poll(self, mailbox_id: str) -> bool:
+        """
+        poll the mailbox once and fetch all the waiting messages,
+        returns True if there may be more messages waiting
+        """
+        if not await asyncio.to_thread(self._hold_lease, mailbox_id):
+            logger.info("mailbox %s is leased to another worker", mailbox_id)
+            return False
+
+        # checked once the lease is held, a step function which started polling before the lease
+        # was taken is still running, one starting after it will find the lease and not poll
+        if await asyncio.to_thread(self._step_function_running, mailbox_id):
+            # leave the mailbox to the step function while it is running
+            logger.info("get messages step function running for %s", mailbox_id)
+            return False
+
+        response = await self._invoke(
+            self.poll_pool, {"mailbox": mailbox_id, "handshake": "false"}
+        )
+        if int(response["statusCode"]) != HTTPStatus.OK:
+            return False
+
+        body = response["body"]
+        await asyncio.gather(
+            *(self.fetch(message) for message in body["message_list"]),
+            return_exceptions=True,
+        )
+        return bool(body["message_count"] == self.config.get_messages_page_limit)
+
+    async def fetch(self, message: dict[str, Any]) -> dict[str, Any]:
+        """fetch all chunks of a message, equivalent to the get messages map iterator"""
+        mailbox_id = message["body"]["dest_mailbox"]
+        async with self._mailbox_limits[mailbox_id]:
+            response = message
+            while True:
+                # keep the lease through long fetches
+                if not await asyncio.to_thread(self._hold_lease, mailbox_id):
+                    logger.warning("lost lease of %s, leaving the fetch", mailbox_id)
+                    return response
+                response = await self._invoke(self.fetch_pool, response)
+                if _failed(response) or _is_complete(response):
+                    return response
+
+    async def send(self, event: dict[str, Any]) -> dict[str, Any]:
+        """send a file for an s3 event, equivalent to the send message step function"""
+        response = await self._invoke(self.check_pool, event)
+        if _failed(response):
+            return response
+
+        mailbox_id = response["body"]["send_params"]["sender"]
+        async with self._mailbox_limits[mailbox_id]:
+            while not _is_complete(response):
+                response = await self._invoke(self.send_pool, response)
+                if _failed(response):
+                    break
+        return response
+
+    async def _poll_mailbox(self, mailbox_id: str):
+        last_handshake = 0.0
+        while not self.stopping:
+            more_messages = False
+            try:
+                if monotonic() - last_handshake >= self.handshake_interval:
+                    await self.handshake(mailbox_id)
+                    last_handshake = monotonic()
+                more_messages = await self.poll(mailbox_id)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("poll failed for %s", mailbox_id)
+
+            if not more_messages:
+                await self._sleep(self.poll_interval)
+
+    async def _send_from_queue_message(self, message: Mapping[str, Any]):
+        sqs = sqs_client()
+        try:
+            response = await self.send(json.loads(message["Body"]))
+            status = int(response["statusCode"])
+            if _failed(response) and status != HTTPStatus.TOO_MANY_REQUESTS:
+                # leave on the queue to be retried after the visibility timeout
+                logger.error("send failed with status %s", status)
+                return
+            await asyncio.to_thread(
+                sqs.delete_message,
+                QueueUrl=cast(str, self.send_queue_url),
+                ReceiptHandle=message["ReceiptHandle"],
+            )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("send failed")
+        finally:
+            self._send_slots.release()
+
+    async def _consume_send_queue(self):
+        sqs = sqs_client()
+        while not self.stopping:
+            # wait for a free send slot before receiving any more messages
+            await self._send_slots.acquire()
+            self._send_slots.release()
+            try:
+                received = await asyncio.to_thread(
+                    sqs.receive_message,
+                    QueueUrl=cast(str, self.send_queue_url),
+                    MaxNumberOfMessages=min(10, self.max_sends),
+                    WaitTimeSeconds=20,
+                )
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("receive failed")
+                await self._sleep(self.poll_interval)
+                continue
+
+            for message in received.get("Messages", []):
+                await self._send_slots.acquire()
+                self._spawn(self._send_from_queue_message(message))
+
+    def _spawn(self, coro: Coroutine):
+        task = asyncio.create_task(coro)
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            ThreadPoolExecutor(
+                max_workers=len(self.mailbox_ids) * (self.mailbox_concurrency + 1)
+                + self.max_sends
+                + 2,
+                thread_name_prefix="mesh-worker",
+            )
+        )
+        workers = [self._poll_mailbox(mailbox_id) for mailbox_id in self.mailbox_ids]
+        if self.send_queue_url:
+            workers.append(self._consume_send_queue())
+
+        logger.info("starting mesh worker for %s", ",".join(self.mailbox_ids))
+        polling = asyncio.gather(*workers)
+        await self._stopping.wait()
+
+        # let in-flight fetches and sends finish, a fetch not completed is picked up on the next poll
+        # and in-flight sends on the queue will be redelivered
+        _, pending = await asyncio.wait(
+            [polling, *self._sends], timeout=self.shutdown_timeout
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.to_thread(self._release_leases)
+        logger.info("mesh worker stopped")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--mailbox",
+        dest="mailbox_ids",
+        action="append",
+        help="mailbox id to poll, may be repeated ( default: MESH_MAILBOX_IDS )",
+    )
+    parser.add_argument(
+        "--send-queue-url",
+        default=os.environ.get("MESH_SEND_QUEUE_URL"),
+        help="sqs queue receiving s3 object created events for files to send",
+    )
+    parser.add_argument(
+        "--mailbox-concurrency", type=int, default=DEFAULT_MAILBOX_CONCURRENCY
+    )
+    parser.add_argument("--max-sends", type=int, default=DEFAULT_MAX_SENDS)
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument(
+        "--handshake-interval", type=float, default=DEFAULT_HANDSHAKE_INTERVAL
+    )
+    parser.add_argument(
+        "--shutdown-timeout", type=float, default=DEFAULT_SHUTDOWN_TIMEOUT
+    )
+    args = parser.parse_args(argv)
+    # the environment is only used if no mailboxes are given, rather than added to
+    mailbox_ids = args.mailbox_ids or [
+        mailbox_id.strip()
+        for mailbox_id in os.environ.get("MESH_MAILBOX_IDS", "").split(",")
+        if mailbox_id.strip()
+    ]
+
+    async def _run():
+        worker = MeshWorker(
+            mailbox_ids=mailbox_ids,
+            send_queue_url=args.send_queue_url,
+            mailbox_concurrency=args.mailbox_concurrency,
+            max_sends=args.max_sends,
+            poll_interval=args.poll_interval,
+            handshake_interval=args.handshake_interval,
+            shutdown_timeout=args.shutdown_timeout,
+        )
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,39 @@
+import atexit
+import json
 import os
-from time import time
-from typing import Any, TypedDict
+import threading
+from collections.abc import Callable, Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import cached_property, partial
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Any, TypedDict
 
-from mesh_client import MeshClient, optional_header_map
-from nhs_aws_helpers import s3_resource, secrets_client, ssm_client, stepfunctions
 from spine_aws_common import LambdaApplication
 
-from shared.common import get_params
+from shared.aws import s3_resource, secrets_client, ssm_client, stepfunctions
+from shared.client_pool import MeshClientPool
+from shared.common import (
+    get_params,
+    get_params_by_path,
+    get_secrets,
+    send_input_bucket_key,
+)
 from shared.config import EnvConfig
-from shared.send_parameters import SendParameters
+from shared.metrics import InvocationMetrics
+from shared.profiling import InvocationProfile, Profiler
+from shared.rate_limit import rate_limiter_from_config
+from shared.send_parameters import OutboundMappingIndex, SendParameters
+from shared.tuning import SizeTuner
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import S3ServiceResource
+    from mypy_boto3_secretsmanager import SecretsManagerClient
+    from mypy_boto3_ssm import SSMClient
+    from mypy_boto3_stepfunctions import SFNClient
+
+    from shared.http_timing import HttpTiming
+    from shared.mesh import MeshClient
 
 
 class MailboxParams(TypedDict):
@@ -18,6 +43,8 @@ class MailboxParams(TypedDict):
 
 MAILBOX_PARAMS_CACHE_TIME = 60
 
+WARM_UP_MAX_WORKERS = 8
+
 MAILBOX_PASSWORD = "MAILBOX_PASSWORD"
 INBOUND_BUCKET = "INBOUND_BUCKET"
 INBOUND_FOLDER = "INBOUND_FOLDER"
@@ -25,20 +52,35 @@ INBOUND_FOLDER = "INBOUND_FOLDER"
 VERSION = "2.1.4"
 
 
-_OPTIONAL_SEND_ARGS = {v.lower(): k for k, v in optional_header_map().items()}
+def _write_atomic(path: str, content: str):
+    """
+    replace the file in one step, other app instances in the process ( e.g. the worker pools )
+    may be loading the certs from the same path
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
 
 
 class MESHLambdaApplication(LambdaApplication):
     def __init__(self, additional_log_config=None, load_ssm_params=False):
         super().__init__(additional_log_config, load_ssm_params)
-        self.s3 = s3_resource()
-        self.ssm = ssm_client()
-        self.sfn = stepfunctions()
-        self.secrets = secrets_client()
         self.config = EnvConfig()
         self.environment = self.config.environment
+        # the invocation's metrics, each message worked on concurrently has its own
+        self.metrics = self.new_metrics()
+        # metrics of the message the calling thread has borrowed a client for
+        self._borrowed = threading.local()
+        self.profiler = Profiler(
+            self.config.profile_sample_rate, self.config.profile_top_n
+        )
+        self.tuner = SizeTuner(self.config)
+        self.rate_limiter = rate_limiter_from_config(self.config)
         self.mailbox_params: dict[str, MailboxParams] = {}
         self._common_params_retrieved = False
+        self._common_params_lock = threading.Lock()
+        self._bulk_params_lock = threading.Lock()
         _base_certs_dir = f"/tmp/{self.config.environment}/certs"
         self._base_certs_dir = _base_certs_dir
         self.ca_cert_path: str = f"{_base_certs_dir}/ca_cert.pem"
@@ -46,8 +88,100 @@ class MESHLambdaApplication(LambdaApplication):
         self.client_key_path: str = f"{_base_certs_dir}/client_key.pem"
         self.shared_key: str = ""
         self.verify: str | bool = self.ca_cert_path if self.config.verify_ssl else False
-        self.mailbox_id: str = ""
-        self._mesh_client: MeshClient | None = None
+        # each client is lent to one thread at a time, so an invocation can work on many messages at once
+        self.clients = MeshClientPool(self._create_mesh_client)
+        # pooled clients outlive invocations, so are closed as the interpreter exits
+        atexit.register(self.close)
+
+    # aws clients are created on first use, so the handler module imports and inits quickly
+
+    @cached_property
+    def s3(self) -> "S3ServiceResource":
+        return s3_resource()
+
+    @cached_property
+    def ssm(self) -> "SSMClient":
+        return ssm_client()
+
+    @cached_property
+    def sfn(self) -> "SFNClient":
+        return stepfunctions()
+
+    @cached_property
+    def secrets(self) -> "SecretsManagerClient":
+        return secrets_client()
+
+    @cached_property
+    def outbound_mappings(self) -> OutboundMappingIndex:
+        return OutboundMappingIndex(self.config, self.ssm)
+
+    def main(self, event, context):
+        self.metrics.reset()
+        try:
+            if self.profiler.sampled(event):
+                return self._profiled_main(event, context)
+            return super().main(event, context)
+        finally:
+            self.tuner.observe(self.metrics)
+            self.metrics.set_property("application", type(self).__name__)
+            self.metrics.set_property("internal_id", self.log_object.internal_id)
+            self.metrics.flush()
+
+    def _profiled_main(self, event, context):
+        profile = self.profiler.start()
+        try:
+            return super().main(event, context)
+        finally:
+            profile.stop()
+            self._write_profile(profile)
+
+    def _write_profile(self, profile: InvocationProfile):
+        """
+        log the top functions and allocations, and write the stats ( loadable with pstats, snakeviz
+        etc. ) and allocations to s3 if PROFILE_S3_PREFIX is set
+        """
+        application = type(self).__name__
+        stats_key = ""
+        if self.config.profile_s3_prefix:
+            key_prefix = "/".join(
+                (
+                    self.config.profile_s3_prefix,
+                    application,
+                    self.log_object.internal_id,
+                    self._get_aws_request_id(),
+                )
+            )
+            try:
+                self.s3.Object(self.config.mesh_bucket, f"{key_prefix}.prof").put(
+                    Body=profile.stats
+                )
+                self.s3.Object(
+                    self.config.mesh_bucket, f"{key_prefix}.allocations.json"
+                ).put(
+                    Body=profile.allocations_json().encode("utf-8"),
+                    ContentType="application/json",
+                )
+                stats_key = f"{key_prefix}.prof"
+            except Exception as e:  # pylint: disable=broad-except
+                # not fatal, the profile is still logged
+                self.log_object.write_log(
+                    "MESHPROF0002",
+                    None,
+                    {"bucket": self.config.mesh_bucket, "key": key_prefix, "error": e},
+                )
+
+        self.log_object.write_log(
+            "MESHPROF0001",
+            None,
+            {
+                "application": application,
+                "duration": round(profile.duration, 3),
+                "peak_memory": profile.peak_memory,
+                "stats_key": stats_key,
+                "top_functions": json.dumps(profile.top_functions),
+                "top_allocations": json.dumps(profile.top_allocations),
+            },
+        )
 
     def start(self):
         raise NotImplementedError("this should be implemented in the derived class")
@@ -84,26 +218,40 @@ class MESHLambdaApplication(LambdaApplication):
             self.shared_key = params[self.config.shared_key_config_key]
 
         if self.config.ca_cert_config_key in params:
-            with open(self.ca_cert_path, "w", encoding="utf-8") as f:
-                f.write(params[self.config.ca_cert_config_key])
+            _write_atomic(self.ca_cert_path, params[self.config.ca_cert_config_key])
 
         if self.config.client_cert_config_key in params:
-            with open(self.client_cert_path, "w", encoding="utf-8") as f:
-                f.write(params[self.config.client_cert_config_key])
+            _write_atomic(
+                self.client_cert_path, params[self.config.client_cert_config_key]
+            )
 
         if self.config.client_key_config_key in params:
-            with open(self.client_key_path, "w", encoding="utf-8") as f:
-                f.write(params[self.config.client_key_config_key])
+            _write_atomic(
+                self.client_key_path, params[self.config.client_key_config_key]
+            )
 
         self._common_params_retrieved = True
 
-    def ensure_params(self, mailbox_id: str):
+    def _has_fresh_params(self, mailbox_id: str) -> bool:
         mailbox_params = self.mailbox_params.get(mailbox_id)
-        if mailbox_params and time() < (
-            mailbox_params["retrieved"] + MAILBOX_PARAMS_CACHE_TIME
-        ):
+        return bool(
+            mailbox_params
+            and time() < mailbox_params["retrieved"] + MAILBOX_PARAMS_CACHE_TIME
+        )
+
+    def ensure_params(self, mailbox_id: str):
+        if self._has_fresh_params(mailbox_id):
             return
 
+        if self.config.bulk_load_mailbox_params:
+            with self._bulk_params_lock:
+                # loaded by another thread while this one waited
+                if not self._has_fresh_params(mailbox_id):
+                    self.load_all_mailbox_params()
+            if self._has_fresh_params(mailbox_id):
+                return
+            # not found under the mailboxes path, fall back to fetching its params by name
+
         required_params, required_secrets = self._required_common_params()
         mailbox_base_path = f"{self.config.mailboxes_base_config_key}/{mailbox_id}/"
         password_path = f"{mailbox_base_path}{MAILBOX_PASSWORD}"
@@ -120,12 +268,13 @@ class MESHLambdaApplication(LambdaApplication):
                 ]
             )
 
-        params = get_params(
-            parameter_names=set(required_params),
-            secret_ids=set(required_secrets),
-            ssm=self.ssm,
-            secrets=self.secrets,
-        )
+        with self.metrics.timer("parameters"):
+            params = get_params(
+                parameter_names=set(required_params),
+                secret_ids=set(required_secrets),
+                ssm=self.ssm,
+                secrets=self.secrets,
+            )
 
         self.mailbox_params[mailbox_id] = MailboxParams(
             params={
@@ -136,79 +285,221 @@ class MESHLambdaApplication(LambdaApplication):
             retrieved=time(),
         )
 
-        self._save_common_params(params)
+        with self._common_params_lock:
+            self._save_common_params(params)
+
+    def load_all_mailbox_params(self):
+        """
+        fetch the params of every mailbox under MAILBOXES_BASE_CONFIG_KEY ( and in MESH_MAILBOX_IDS )
+        at once, with one paginated get_parameters_by_path and batches of secrets,
+        rather than a get_parameters call per mailbox
+        """
+        started = perf_counter()
+        base_path = f"{self.config.mailboxes_base_config_key.rstrip('/')}/"
+        required_params, required_secrets = self._required_common_params()
+
+        with self.metrics.timer("parameters"):
+            params = get_params_by_path(base_path.rstrip("/"), ssm=self.ssm)
+            # named {base_path}{mailbox_id}/{param}
+            mailbox_ids = {
+                name.removeprefix(base_path).split("/", 1)[0]
+                for name in params
+                if "/" in name.removeprefix(base_path)
+            }
+            mailbox_ids.update(self.config.mesh_mailbox_ids)
+            if self.config.use_secrets_manager:
+                required_secrets.extend(
+                    f"{base_path}{mailbox_id}/{MAILBOX_PASSWORD}"
+                    for mailbox_id in mailbox_ids
+                )
+            if required_params:
+                params.update(
+                    get_params(
+                        parameter_names=set(required_params),
+                        secret_ids=set(),
+                        ssm=self.ssm,
+                    )
+                )
+            secret_values: dict[str, str] = {}
+            secret_errors: dict[str, str] = {}
+            if required_secrets:
+                secret_values, secret_errors = get_secrets(
+                    set(required_secrets), secrets=self.secrets
+                )
+                params.update(secret_values)
+
+        # mailboxes missing a secret are left unloaded, and fetched by name in ensure_params
+        failed_secrets = set(required_secrets).difference(secret_values)
+        for secret_id in sorted(failed_secrets):
+            self.log_object.write_log(
+                "MESHINIT0004",
+                None,
+                {"secret": secret_id, "error": secret_errors.get(secret_id, "")},
+            )
+        passwords = {
+            mailbox_id: f"{base_path}{mailbox_id}/{MAILBOX_PASSWORD}"
+            for mailbox_id in mailbox_ids
+        }
+        if failed_secrets.difference(passwords.values()):
+            # a common secret failed, so every mailbox falls back
+            mailbox_ids = set()
+        mailbox_ids = {
+            mailbox_id
+            for mailbox_id in mailbox_ids
+            if passwords[mailbox_id] not in failed_secrets
+        }
+
+        retrieved = time()
+        for mailbox_id in mailbox_ids:
+            mailbox_path = f"{base_path}{mailbox_id}/"
+            self.mailbox_params[mailbox_id] = MailboxParams(
+                params={
+                    k.removeprefix(mailbox_path): v
+                    for k, v in params.items()
+                    if k.startswith(mailbox_path)
+                },
+                retrieved=retrieved,
+            )
 
-    def __enter__(self):
-        assert self.mailbox_id
+        if mailbox_ids:
+            with self._common_params_lock:
+                self._save_common_params(params)
+
+        self.log_object.write_log(
+            "MESHINIT0003",
+            None,
+            {
+                "mailboxes": len(mailbox_ids),
+                "path": base_path,
+                "duration": round(perf_counter() - started, 3),
+            },
+        )
 
-        self.ensure_params(self.mailbox_id)
-        password = self.mailbox_params[self.mailbox_id]["params"].get(MAILBOX_PASSWORD)
+    def mailbox_password(self, mailbox_id: str) -> str:
+        self.ensure_params(mailbox_id)
+        password = self.mailbox_params[mailbox_id]["params"].get(MAILBOX_PASSWORD)
         if password is None:
-            raise AssertionError(f"password not found for {self.mailbox_id}")
+            raise AssertionError(f"password not found for {mailbox_id}")
+        return password
+
+    def warm_up(self):
+        """
+        with WARM_UP_ON_INIT, called as the module is loaded during the ( cpu boosted ) lambda init phase,
+        so the first invocation does not pay for fetching params, writing certs and building clients
+        """
+        if not self.config.warm_up_on_init:
+            return
+
+        targets = self._warm_up_targets()
+        if not targets:
+            return
+
+        started = perf_counter()
+        with ThreadPoolExecutor(
+            max_workers=min(WARM_UP_MAX_WORKERS, len(targets))
+        ) as executor:
+            warmed = sum(
+                executor.map(self._try_warm_up, targets.keys(), targets.values())
+            )
+
+        self.log_object.write_log(
+            "MESHINIT0002",
+            None,
+            {
+                "warmed": warmed,
+                "count": len(targets),
+                "duration": round(perf_counter() - started, 3),
+            },
+        )
+
+    def _warm_up_targets(self) -> dict[str, Callable[[], Any]]:
+        """
+        fetch the common and mailbox params, write the certs and build a mesh client
+        ( with its ssl context ) for each known mailbox
+        """
+        return {
+            mailbox_id: partial(self._warm_up_client, mailbox_id)
+            for mailbox_id in self.config.mesh_mailbox_ids
+        }
+
+    def _try_warm_up(self, target: str, func: Callable[[], Any]) -> bool:
+        try:
+            func()
+        except Exception as e:  # pylint: disable=broad-except
+            # not fatal, the invocation will try again
+            self.log_object.write_log(
+                "MESHINIT0001", None, {"target": target, "error": e}
+            )
+            return False
+        return True
 
-        self._mesh_client = MeshClient(
+    def _warm_up_client(self, mailbox_id: str):
+        # fetching the password also ensures the common params / certs are in place
+        password = self.mailbox_password(mailbox_id)
+        self.clients.add(
+            mailbox_id, password, self._create_mesh_client(mailbox_id, password)
+        )
+
+    def _create_mesh_client(self, mailbox_id: str, password: str) -> "MeshClient":
+        # deferred, mesh_client is only imported once a client is needed
+        from shared.mesh import MeshClient
+
+        client = MeshClient(
             url=self.config.mesh_url,
-            mailbox=self.mailbox_id,
+            mailbox=mailbox_id,
             password=password,
             shared_key=self.shared_key.encode(encoding="utf-8"),
             cert=(self.client_cert_path, self.client_key_path),
             verify=self.verify,
             hostname_checks_common_name=self.config.verify_checks_common_name,
-            transparent_compress=False,
+            transparent_compress=self.config.transparent_compress
+            and not self.config.never_compress,
             application_name=f"AWS Serverless=={VERSION}",
-        ).__enter__()
-        return self
+            rate_limiter=self.rate_limiter,
+            on_timing=self._record_http_timing if self.config.http_timing else None,
+        )
+        client.__enter__()
+        return client
+
+    def close(self):
+        """close the pooled mesh clients, and their connections"""
+        atexit.unregister(self.close)
+        self.clients.close()
+
+    def new_metrics(self) -> InvocationMetrics:
+        return InvocationMetrics(
+            namespace=self.config.metrics_namespace,
+            enabled=self.config.emit_metrics,
+        )
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if self._mesh_client:
+    def _record_http_timing(self, timing: "HttpTiming"):
+        """log the phases of each MESH request, and add them to the metrics by endpoint"""
+        self.log_object.write_log("MESHHTTP0001", None, timing.log_args())
+        metrics = getattr(self._borrowed, "metrics", None) or self.metrics
+        for phase, seconds, num_bytes in timing.phases():
+            metrics.record(f"mesh_{timing.endpoint}_{phase}", seconds, num_bytes)
+
+    @contextmanager
+    def borrow_client(
+        self, mailbox_id: str, metrics: InvocationMetrics | None = None
+    ) -> Generator["MeshClient", None, None]:
+        """
+        a pooled client for the mailbox, for the sole use of the calling thread until returned,
+        its requests are timed into the given metrics, or the invocation's
+        """
+        with self.clients.borrow(
+            mailbox_id, self.mailbox_password(mailbox_id)
+        ) as client:
+            self._borrowed.metrics = metrics
             try:
-                self._mesh_client.close()
+                yield client
             finally:
-                self._mesh_client = None
-
-    @property
-    def mesh_client(self) -> MeshClient:
-        if not self._mesh_client:
-            raise ValueError("MeshClient has not been initialised")
-        return self._mesh_client
-
-    def is_same_mailbox_check(self, sf_input: dict[str, Any]) -> bool:
-        sf_mailbox = sf_input.get("mailbox")
-
-        if not sf_mailbox or not self.mailbox_id:
-            self.log_object.write_log(
-                "MESHPOLL0002a",
-                None,
-                {"mailbox": self.mailbox_id, "sf_mailbox": sf_mailbox},
-            )
-            return False
-
-        return bool(sf_mailbox == self.mailbox_id)
+                self._borrowed.metrics = None
 
     def is_send_for_same_file(
         self, sf_input: dict[str, Any], send_params: SendParameters
     ) -> bool:
-        def _get_input_bucket_key() -> tuple[str | None, str | None]:
-            body = sf_input.get("body")
-            if body:
-                input_params = body.get("send_params")
-                if input_params:
-                    return input_params.get("s3_bucket"), input_params.get("s3_key")
-
-                bucket = body.get("bucket")
-                if bucket:
-                    return bucket, body.get("key")
-
-            if sf_input.get("source") != "aws.s3":
-                return None, None
-
-            request_params = sf_input.get("detail", {}).get("requestParameters")
-            if not request_params:
-                return None, None
-
-            return request_params.get("bucketName"), request_params.get("key")
-
-        s3_bucket, s3_key = _get_input_bucket_key()
+        s3_bucket, s3_key = send_input_bucket_key(sf_input)
 
         if not s3_bucket or not s3_key:
             self.log_object.write_log(
@@ -0,0 +1,43 @@
+"""
+aws clients for the lambdas, created with nhs_aws_helpers, which is only imported as the first
+client is created, as it imports boto3 and the boto3 type stub packages
+"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+    from mypy_boto3_s3.service_resource import S3ServiceResource
+    from mypy_boto3_secretsmanager import SecretsManagerClient
+    from mypy_boto3_ssm import SSMClient
+    from mypy_boto3_stepfunctions import SFNClient
+
+
+def s3_resource() -> "S3ServiceResource":
+    from nhs_aws_helpers import s3_resource as _s3_resource
+
+    return _s3_resource()
+
+
+def ssm_client() -> "SSMClient":
+    from nhs_aws_helpers import ssm_client as _ssm_client
+
+    return _ssm_client()
+
+
+def secrets_client() -> "SecretsManagerClient":
+    from nhs_aws_helpers import secrets_client as _secrets_client
+
+    return _secrets_client()
+
+
+def stepfunctions() -> "SFNClient":
+    from nhs_aws_helpers import stepfunctions as _stepfunctions
+
+    return _stepfunctions()
+
+
+def dynamodb_client() -> "DynamoDBClient":
+    from nhs_aws_helpers import dynamodb_client as _dynamodb_client
+
+    return _dynamodb_client()
@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+
+# mesh_client's default max_chunk_size, so a tuned chunk is no larger than other senders' chunks
+MESH_MAX_CHUNK_SIZE = 75 * 1024 * 1024
+
+# a chunk may be this much over chunk_size where that saves sending a chunk
+CHUNK_SIZE_TOLERANCE = 0.1
+
+
+@dataclass(frozen=True)
+class ChunkPlan:
+    """
+    the byte ranges of the chunks of a send, balanced so chunk sizes differ by at most a byte,
+    a plan is described by its size and number of chunks alone, so is carried between
+    invocations as the send parameters' file_size and total_chunks
+    """
+
+    size: int
+    chunks: int
+
+    @property
+    def chunked(self) -> bool:
+        return self.chunks > 1
+
+    def byte_range(self, chunk_number: int) -> tuple[int, int]:
+        """the start and end ( exclusive ) of a chunk, chunks are numbered from one"""
+        if not 1 <= chunk_number <= self.chunks:
+            raise ValueError(f"chunk {chunk_number} is not one of {self.chunks} chunks")
+        return (
+            (chunk_number - 1) * self.size // self.chunks,
+            chunk_number * self.size // self.chunks,
+        )
+
+    def ranges(self) -> list[tuple[int, int]]:
+        return [self.byte_range(chunk) for chunk in range(1, self.chunks + 1)]
+
+    def sizes(self) -> list[int]:
+        return [end - start for start, end in self.ranges()]
+
+
+def plan_chunks(
+    size: int,
+    chunk_size: int,
+    tolerance: float = CHUNK_SIZE_TOLERANCE,
+    max_chunk_size: int = MESH_MAX_CHUNK_SIZE,
+) -> ChunkPlan:
+    """
+    the fewest balanced chunks of at most chunk_size, stretched by up to the tolerance where
+    that saves a chunk, so a file just over chunk_size is sent as one chunk rather than a
+    full chunk and a small tail, no chunk exceeds max_chunk_size
+    """
+    chunk_size = max(min(chunk_size, max_chunk_size), 1)
+    stretched = max(min(int(chunk_size * (1 + tolerance)), max_chunk_size), chunk_size)
+    # an empty file is still sent as one chunk
+    chunks = max(-(-size // stretched), 1)
+    return ChunkPlan(size, chunks)
@@ -0,0 +1,63 @@
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from shared.mesh import MeshClient
+
+
+class MeshClientPool:
+    """
+    mesh clients by mailbox, kept between invocations to reuse their connections and ssl context.
+    a requests session is not thread safe, so each client is lent to one thread at a time and
+    concurrent work for a mailbox gets a client each
+    """
+
+    def __init__(self, create: Callable[[str, str], "MeshClient"]):
+        self._create = create
+        # idle clients by mailbox, with the password each was built with
+        self._idle: dict[str, list[tuple[str, MeshClient]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, mailbox_id: str, password: str, client: "MeshClient"):
+        with self._lock:
+            self._idle[mailbox_id].append((password, client))
+
+    def idle(self, mailbox_id: str) -> list["MeshClient"]:
+        with self._lock:
+            return [client for _, client in self._idle.get(mailbox_id, [])]
+
+    def _take(self, mailbox_id: str, password: str) -> "MeshClient | None":
+        with self._lock:
+            idle = self._idle.get(mailbox_id, [])
+            # clients built before the password was rotated are dropped
+            stale = [client for pooled, client in idle if pooled != password]
+            current = [client for pooled, client in idle if pooled == password]
+            client = current.pop() if current else None
+            self._idle[mailbox_id] = [(password, other) for other in current]
+
+        for other in stale:
+            other.close()
+        return client
+
+    @contextmanager
+    def borrow(
+        self, mailbox_id: str, password: str
+    ) -> Generator["MeshClient", None, None]:
+        client = self._take(mailbox_id, password) or self._create(mailbox_id, password)
+        try:
+            yield client
+        except BaseException:
+            # a failure may leave a response part read, so the client is not reused
+            client.close()
+            raise
+        self.add(mailbox_id, password, client)
+
+    def close(self):
+        with self._lock:
+            idle = [client for clients in self._idle.values() for _, client in clients]
+            self._idle.clear()
+        for client in idle:
+            client.close()
@@ -1,16 +1,29 @@
+import hashlib
 import json
 import os
-from collections.abc import Callable
+import re
+import tempfile
+from collections.abc import Callable, Generator
+from io import BytesIO
+from typing import IO, TYPE_CHECKING, Any
 from urllib.parse import quote_plus
 
-from mypy_boto3_secretsmanager import SecretsManagerClient
-from mypy_boto3_ssm import SSMClient
-from mypy_boto3_stepfunctions import SFNClient
-from nhs_aws_helpers import secrets_client, ssm_client, stepfunctions
+from shared.aws import secrets_client, ssm_client, stepfunctions
+
+if TYPE_CHECKING:
+    from mypy_boto3_secretsmanager import SecretsManagerClient
+    from mypy_boto3_ssm import SSMClient
+    from mypy_boto3_stepfunctions import SFNClient
 
 BOOL_TRUE_VALUES = ["yes", "true", "t", "y", "1"]
 BOOL_FALSE_VALUES = ["no", "false", "f", "n", "0"]
 
+INBOUND_KEY_SCHEMES = ("mailbox", "date", "hash")
+# the most secrets batch_get_secret_value returns by id
+SECRETS_BATCH_SIZE = 20
+# mesh message ids start with the time they were created e.g. 20220610195418651944_2202CC
+_MESSAGE_ID_DATE = re.compile(r"^(\d{4})(\d{2})(\d{2})\d{6}")
+
 
 class SingletonCheckFailure(Exception):
     """Singleton check failed"""
@@ -35,6 +48,17 @@ def nullsafe_quote(value: str | None) -> str:
     return quote_plus(value, encoding="utf-8")
 
 
+def body_buffer(size: int | None, max_memory: int) -> IO[bytes]:
+    """
+    buffer for a request / response body of `size` bytes, in memory if it fits within max_memory,
+    otherwise a temporary file ( rather than a SpooledTemporaryFile, which copies what it holds
+    in memory when it rolls over to disk )
+    """
+    if size is not None and size <= max_memory:
+        return BytesIO()
+    return tempfile.TemporaryFile()
+
+
 def strtobool(value, raise_exc=False):
     if isinstance(value, str):
         value = value.lower()
@@ -49,19 +73,12 @@ def strtobool(value, raise_exc=False):
     return None
 
 
-def singleton_check(
-    step_function_arn: str,
-    predicate: Callable[[dict], bool],
-    sfn: SFNClient | None = None,
-):
-    """Find out whether there is another step function running for the same condition"""
+def running_execution_inputs(
+    step_function_arn: str, sfn: "SFNClient | None" = None
+) -> Generator[dict[str, Any], None, None]:
+    """inputs of the running executions of a step function"""
     sfn = sfn or stepfunctions()
 
-    if not step_function_arn or not step_function_arn.startswith("arn:aws:states:"):
-        raise SingletonCheckFailure(
-            f"No step function  for step_function_arn={step_function_arn}"
-        )
-
     running_execution_arns: list[str] = []
 
     args = {"stateMachineArn": step_function_arn, "statusFilter": "RUNNING"}
@@ -79,20 +96,88 @@ def singleton_check(
             break
         args["nextToken"] = next_token
 
-    exec_count = 0
     for execution_arn in running_execution_arns:
         ex_response = sfn.describe_execution(executionArn=execution_arn)
-        step_function_input = json.loads(ex_response.get("input", "{}"))
+        yield json.loads(ex_response.get("input", "{}"))
+
 
+def singleton_check(
+    step_function_arn: str,
+    predicate: Callable[[dict], bool],
+    sfn: "SFNClient | None" = None,
+    max_running: int = 1,
+):
+    """
+    Find out whether there is another step function running for the same condition,
+    max_running defaults to 1 as the caller is usually running within one of the executions
+    """
+    if not step_function_arn or not step_function_arn.startswith("arn:aws:states:"):
+        raise SingletonCheckFailure(
+            f"No step function  for step_function_arn={step_function_arn}"
+        )
+
+    exec_count = 0
+    for step_function_input in running_execution_inputs(step_function_arn, sfn):
         if predicate(step_function_input):
             exec_count = exec_count + 1
 
-        if exec_count > 1:
+        if exec_count > max_running:
             raise SingletonCheckFailure("Process already running for this mailbox")
 
     return True
 
 
+def send_input_bucket_key(sf_input: dict[str, Any]) -> tuple[str | None, str | None]:
+    """the s3 bucket and key being sent by a send message execution / lambda input"""
+    body = sf_input.get("body")
+    if body:
+        input_params = body.get("send_params")
+        if input_params:
+            return input_params.get("s3_bucket"), input_params.get("s3_key")
+
+        bucket = body.get("bucket")
+        if bucket:
+            return bucket, body.get("key")
+
+    if sf_input.get("source") != "aws.s3":
+        return None, None
+
+    request_params = sf_input.get("detail", {}).get("requestParameters")
+    if not request_params:
+        return None, None
+
+    return request_params.get("bucketName"), request_params.get("key")
+
+
+def inbound_key_partition(scheme: str, message_id: str) -> str:
+    """
+    prefix, derived from the message id alone, spreading inbound objects for a mailbox across s3 prefixes
+    date: yyyy/mm/dd the message was created ( falling back to hash for unrecognised message ids )
+    hash: two hex digits of the message id hash ( 256 shards )
+    """
+    if scheme == "mailbox":
+        return ""
+
+    if scheme == "date":
+        match = _MESSAGE_ID_DATE.match(message_id)
+        if match:
+            return "/".join(match.groups())
+        scheme = "hash"
+
+    if scheme == "hash":
+        return hashlib.sha256(message_id.encode()).hexdigest()[:2]
+
+    raise ValueError(f"unknown inbound key scheme: {scheme}")
+
+
+def inbound_s3_key(s3_folder: str, filename: str, message_id: str, scheme: str) -> str:
+    """s3 key of a received message or report"""
+    partition = inbound_key_partition(scheme, message_id)
+    if not partition:
+        return f"{s3_folder}/{filename}"
+    return f"{s3_folder}/{partition}/{filename}"
+
+
 def convert_params_to_dict(params):
     """Convert ssm parameter dict to key:value dict"""
     new_dict = {}
@@ -120,12 +205,56 @@ def return_failure(log_object, status, logpoint, mailbox, message=""):
     }
 
 
+def get_params_by_path(
+    path: str, decryption=True, recursive=True, ssm: "SSMClient | None" = None
+) -> dict[str, str]:
+    """
+    Get all the parameters under a path from SSM, keyed by full parameter name
+    """
+    ssm = ssm or ssm_client()
+    result = {}
+    paginator = ssm.get_paginator("get_parameters_by_path")
+    for page in paginator.paginate(
+        Path=path, Recursive=recursive, WithDecryption=decryption
+    ):
+        for param in page.get("Parameters", []):
+            result[param["Name"]] = param["Value"]
+    return result
+
+
+def get_secrets(
+    secret_ids: set[str], secrets: "SecretsManagerClient | None" = None
+) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Get secrets from secrets manager in batches, returns the secret values and the error codes
+    of the secrets which could not be retrieved ( e.g. not found or access denied ), by secret id
+    """
+    secrets = secrets or secrets_client()
+    result: dict[str, str] = {}
+    errors: dict[str, str] = {}
+    ids = sorted(secret_ids)
+    for start in range(0, len(ids), SECRETS_BATCH_SIZE):
+        kwargs: dict[str, Any] = {
+            "SecretIdList": ids[start : start + SECRETS_BATCH_SIZE]
+        }
+        while True:
+            res = secrets.batch_get_secret_value(**kwargs)
+            for secret in res.get("SecretValues", []):
+                result[secret["Name"]] = secret["SecretString"]
+            for error in res.get("Errors", []):
+                errors[error["SecretId"]] = error.get("ErrorCode", "")
+            if not res.get("NextToken"):
+                break
+            kwargs["NextToken"] = res["NextToken"]
+    return result, errors
+
+
 def get_params(
     parameter_names: set[str],
     secret_ids: set[str],
     decryption=True,
-    ssm: SSMClient | None = None,
-    secrets: SecretsManagerClient | None = None,
+    ssm: "SSMClient | None" = None,
+    secrets: "SecretsManagerClient | None" = None,
 ) -> dict[str, str]:
     """
     Get parameters from SSM and secrets manager
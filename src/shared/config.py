@@ -1,6 +1,6 @@
 import os
 
-from aws_lambda_powertools.shared.functions import strtobool
+from shared.common import strtobool
 
 MiB = 1024 * 1024
 DEFAULT_CRUMB_SIZE = (
@@ -10,6 +10,17 @@ DEFAULT_CHUNK_SIZE = 20 * MiB
 MIN_MULTIPART_SIZE = 5 * MiB
 
 
+def _env_flag(name: str, default: str) -> bool:
+    """
+    boolean env var, raising ValueError if it is not a strtobool value,
+    on / off are accepted too, as they were by the powertools strtobool these flags used
+    """
+    value = os.environ.get(name, default)
+    if value.lower() in ("on", "off"):
+        return value.lower() == "on"
+    return bool(strtobool(value, raise_exc=True))
+
+
 class EnvConfig:
     def __init__(self):
         self.environment = os.environ.get(
@@ -17,23 +28,19 @@ class EnvConfig:
         )  # e.g. local-mesh (local.name in modue)
         self.mesh_url = os.environ.get("MESH_URL", "https://mesh_sandbox")
         self.mesh_bucket = os.environ.get("MESH_BUCKET", "")
-        self.verify_ssl = bool(strtobool(os.environ.get("VERIFY_SSL", "true")))
-        self.verify_checks_common_name = bool(
-            strtobool(os.environ.get("VERIFY_CHECKS_COMMON_NAME", "true"))
-        )
-        self.use_secrets_manager = bool(
-            strtobool(os.environ.get("USE_SECRETS_MANAGER", "false"))
-        )
-        self.use_sender_filename = bool(
-            strtobool(os.environ.get("USE_SENDER_FILENAME", "false"))
+        self.verify_ssl = _env_flag("VERIFY_SSL", "true")
+        self.verify_checks_common_name = _env_flag("VERIFY_CHECKS_COMMON_NAME", "true")
+        self.use_secrets_manager = _env_flag("USE_SECRETS_MANAGER", "false")
+        self.use_sender_filename = _env_flag("USE_SENDER_FILENAME", "false")
+        self.use_s3_key_for_mex_filename = _env_flag(
+            "USE_S3_KEY_FOR_MEX_FILENAME", "false"
         )
-        self.use_s3_key_for_mex_filename = bool(
-            strtobool(os.environ.get("USE_S3_KEY_FOR_MEX_FILENAME", "false"))
+        self.use_legacy_inbound_location = _env_flag(
+            "USE_LEGACY_INBOUND_LOCATION", "false"
         )
-        self.use_legacy_inbound_location = bool(
-            strtobool(os.environ.get("USE_LEGACY_INBOUND_LOCATION", "false"))
-        )
-        self.never_compress = bool(strtobool(os.environ.get("NEVER_COMPRESS", "false")))
+        # mailbox: inbound/{mailbox}/{file}, date / hash spread each mailbox across prefixes
+        self.inbound_key_scheme = os.environ.get("INBOUND_KEY_SCHEME", "mailbox")
+        self.never_compress = _env_flag("NEVER_COMPRESS", "false")
 
         self.chunk_size = max(int(os.environ.get("CHUNK_SIZE", DEFAULT_CHUNK_SIZE)), 10)
 
@@ -42,9 +49,34 @@ class EnvConfig:
             1,
         )
 
+        self.auto_tune_sizes = _env_flag("AUTO_TUNE_SIZES", "false")
+        # set by the lambda runtime, in MiB
+        self.memory_size = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "0"))
+
         self.compress_threshold = max(
             int(os.environ.get("COMPRESS_THRESHOLD", self.chunk_size)), 0
         )
+        # compress everything sent on the wire, whatever its size, unless already compressed
+        self.transparent_compress = _env_flag("TRANSPARENT_COMPRESS", "false")
+        # if set, compressed sends of more than one chunk are compressed once into the mesh bucket
+        # under this prefix, and the chunks planned from the compressed size, rather than
+        # compressing each chunk as it is sent
+        self.send_staging_prefix = os.environ.get("SEND_STAGING_PREFIX", "").strip("/")
+
+        # cut inbound MESH chunks into s3 parts of about this size, uploaded while the chunk
+        # is still downloading, 0 uploads each chunk ( or coalesced small chunks ) as one part
+        fetch_part_size = int(os.environ.get("FETCH_PART_SIZE", "0"))
+        self.fetch_part_size = (
+            max(fetch_part_size, MIN_MULTIPART_SIZE) if fetch_part_size > 0 else 0
+        )
+        self.fetch_upload_concurrency = max(
+            int(os.environ.get("FETCH_UPLOAD_CONCURRENCY", "4")), 1
+        )
+        # a retried fetch resumes the message's existing multipart upload, other uploads
+        # to the same key started longer ago than this are aborted as abandoned
+        self.fetch_abandoned_upload_seconds = float(
+            os.environ.get("FETCH_ABANDONED_UPLOAD_SECONDS", "86400")
+        )
 
         self.send_message_step_function_arn = os.environ.get(
             "SEND_MESSAGE_STEP_FUNCTION_ARN", "default"
@@ -61,6 +93,43 @@ class EnvConfig:
         self.mailboxes_base_config_key = os.environ.get(
             "MAILBOXES_BASE_CONFIG_KEY", "not-set"
         )
+        # mailboxes handled by this deployment, used to warm up lambdas during the init phase
+        self.mesh_mailbox_ids = [
+            mailbox_id.strip()
+            for mailbox_id in os.environ.get("MESH_MAILBOX_IDS", "").split(",")
+            if mailbox_id.strip()
+        ]
+        self.warm_up_on_init = _env_flag("WARM_UP_ON_INIT", "false")
+        # load the params of all mailboxes together, rather than each as it is first used
+        self.bulk_load_mailbox_params = _env_flag("BULK_LOAD_MAILBOX_PARAMS", "false")
         self.get_messages_page_limit = int(
             os.environ.get("GET_MESSAGES_PAGE_LIMIT", "500")
         )
+        # adaptive polling, seconds from the first poll of an execution to keep re-polling a busy
+        # mailbox, 0 polls once per scheduled execution
+        self.poll_wait_seconds = float(os.environ.get("POLL_WAIT_SECONDS", "0"))
+        self.dispatch_max_starts_per_second = float(
+            os.environ.get("DISPATCH_MAX_STARTS_PER_SECOND", "20")
+        )
+        # requests / second per mailbox, 0 disables client side rate limiting
+        self.mesh_rate_limit = float(os.environ.get("MESH_RATE_LIMIT", "0"))
+        self.mesh_rate_limit_burst = float(
+            os.environ.get("MESH_RATE_LIMIT_BURST", self.mesh_rate_limit)
+        )
+        # dynamodb table sharing rate limit state between lambdas, otherwise per lambda instance
+        self.rate_limit_table = os.environ.get("RATE_LIMIT_TABLE", "")
+        # dynamodb table of the mailboxes leased to mesh workers, which the get messages step function
+        # leaves to the worker
+        self.worker_lease_table = os.environ.get("WORKER_LEASE_TABLE", "")
+        # log ( and add to metrics ) the connect, tls, send, ttfb and transfer time of each MESH request
+        self.http_timing = _env_flag("HTTP_TIMING", "false")
+        self.emit_metrics = _env_flag("EMIT_METRICS", "false")
+        # fraction of invocations profiled ( cProfile and tracemalloc ), also enabled per invocation
+        # with "profile": true in the event, profiles are logged, and written to the mesh bucket
+        # under PROFILE_S3_PREFIX if set
+        self.profile_sample_rate = min(
+            max(float(os.environ.get("PROFILE_SAMPLE_RATE", "0")), 0.0), 1.0
+        )
+        self.profile_s3_prefix = os.environ.get("PROFILE_S3_PREFIX", "").strip("/")
+        self.profile_top_n = max(int(os.environ.get("PROFILE_TOP_N", "25")), 1)
+        self.metrics_namespace = os.environ.get("METRICS_NAMESPACE", "MESH")
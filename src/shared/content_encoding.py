@@ -0,0 +1,58 @@
+import zlib
+from collections.abc import Iterator
+
+from requests import Response
+
+# wbits, detect a gzip ( or zlib ) header, maximum window
+_GZIP_AUTO_WBITS = 47
+
+
+def is_gzip_encoded(response: Response) -> bool:
+    return (response.headers.get("Content-Encoding") or "").lower() == "gzip"
+
+
+class DecodedContent:
+    """
+    the content of a streamed MESH response, in crumbs of at most crumb_size.
+    a gzip encoded response is decompressed here rather than by urllib3, whose decoders
+    ( before urllib3 2.6 ) expand each read in full, so a crumb of a very compressible
+    message could be decompressed into many times the crumb size at once
+    """
+
+    def __init__(self, response: Response, crumb_size: int):
+        self._response = response
+        self._crumb_size = crumb_size
+        self.compressed = is_gzip_encoded(response)
+        # bytes as transferred, and as decoded
+        self.wire_bytes = 0
+        self.content_bytes = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        if not self.compressed:
+            for crumb in self._response.iter_content(chunk_size=self._crumb_size):
+                self.wire_bytes += len(crumb)
+                self.content_bytes += len(crumb)
+                yield crumb
+            return
+
+        self._response.raw.decode_content = False
+        decompressor = zlib.decompressobj(_GZIP_AUTO_WBITS)
+        for block in self._response.raw.stream(self._crumb_size, decode_content=False):
+            self.wire_bytes += len(block)
+            data = block
+            while data:
+                crumb = decompressor.decompress(data, self._crumb_size)
+                if decompressor.eof:
+                    # concatenated gzip members are one stream
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(_GZIP_AUTO_WBITS)
+                else:
+                    data = decompressor.unconsumed_tail
+                if crumb:
+                    self.content_bytes += len(crumb)
+                    yield crumb
+
+        crumb = decompressor.flush()
+        if crumb:
+            self.content_bytes += len(crumb)
+            yield crumb
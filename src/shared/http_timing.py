@@ -0,0 +1,226 @@
+import re
+import socket
+import threading
+from collections.abc import Callable, Iterator
+from time import perf_counter
+from typing import Any
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# connect: tcp connection, tls: tls handshake, send: request headers and body,
+# ttfb: waiting for the response headers, transfer: reading the response body
+HTTP_PHASES = ("connect", "tls", "send", "ttfb", "transfer")
+
+_MESH_ENDPOINTS = (
+    ("POST", re.compile(r"/outbox(/[^/]+/\d+)?$"), "send_chunk"),
+    ("GET", re.compile(r"/inbox$"), "list"),
+    ("GET", re.compile(r"/inbox/[^/]+(/\d+)?$"), "retrieve_chunk"),
+    ("PUT", re.compile(r"/inbox/[^/]+/status/acknowledged$"), "ack"),
+    ("GET", re.compile(r"/messageexchange/[^/]+$"), "handshake"),
+)
+
+
+def mesh_endpoint(method: str | None, url: str | None) -> str:
+    """the MESH api endpoint a request was made to, e.g. send_chunk"""
+    path = (url or "").split("?", 1)[0].rstrip("/")
+    for endpoint_method, pattern, endpoint in _MESH_ENDPOINTS:
+        if method == endpoint_method and pattern.search(path):
+            return endpoint
+    return "other"
+
+
+class HttpTiming:
+    """time spent in each phase of a single http request, and the bytes sent and received"""
+
+    def __init__(self, endpoint: str, method: str, status: int = 0):
+        self.endpoint = endpoint
+        self.method = method
+        self.status = status
+        self.connections = 0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.send = 0.0
+        self.ttfb = 0.0
+        self.transfer = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def phases(self) -> Iterator[tuple[str, float, int]]:
+        """( phase, seconds, bytes ) for each phase"""
+        for phase in HTTP_PHASES:
+            num_bytes = 0
+            if phase == "send":
+                num_bytes = self.bytes_sent
+            elif phase == "transfer":
+                num_bytes = self.bytes_received
+            yield phase, getattr(self, phase), num_bytes
+
+    def log_args(self) -> dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "method": self.method,
+            "status": self.status,
+            "connections": self.connections,
+            **{
+                f"{phase}_ms": round(seconds * 1000, 3)
+                for phase, seconds, _ in self.phases()
+            },
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class _PendingTimings(threading.local):
+    """connection level timings of the request being made on this thread, until the response arrives"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.send = 0.0
+        self.ttfb = 0.0
+        self.bytes_sent = 0
+
+
+_pending = _PendingTimings()
+
+
+class _TimedConnectionMixin:
+    """times the connect, tls, send and ttfb phases into the pending timings of the thread"""
+
+    _tcp_seconds = 0.0
+
+    def _new_conn(self) -> socket.socket:
+        started = perf_counter()
+        sock = super()._new_conn()  # type: ignore[misc]
+        self._tcp_seconds = perf_counter() - started
+        return sock  # type: ignore[no-any-return]
+
+    def connect(self):
+        self._tcp_seconds = 0.0
+        started = perf_counter()
+        super().connect()  # type: ignore[misc]
+        total = perf_counter() - started
+        _pending.connections += 1
+        _pending.connect += self._tcp_seconds
+        # anything beyond the tcp connection is the tls handshake
+        _pending.tls += max(total - self._tcp_seconds, 0.0)
+
+    def request(self, *args, **kwargs):
+        started = perf_counter()
+        connecting = _pending.connect + _pending.tls
+        try:
+            return super().request(*args, **kwargs)  # type: ignore[misc]
+        finally:
+            # plain http connections are opened lazily by the request
+            connected = _pending.connect + _pending.tls - connecting
+            _pending.send += perf_counter() - started - connected
+
+    def send(self, data):
+        _pending.bytes_sent += len(data) if hasattr(data, "__len__") else 0
+        return super().send(data)  # type: ignore[misc]
+
+    def getresponse(self, *args, **kwargs):
+        started = perf_counter()
+        try:
+            return super().getresponse(*args, **kwargs)  # type: ignore[misc]
+        finally:
+            _pending.ttfb += perf_counter() - started
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def _time_response_body(
+    response: Response, timing: HttpTiming, on_timing: Callable[[HttpTiming], None]
+):
+    """time the reads of the response body, reporting the timing once it has all been read"""
+    raw = response.raw
+    finished = False
+
+    def _finish():
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        timing.bytes_received = raw.tell()
+        on_timing(timing)
+
+    read = raw.read
+
+    def _timed_read(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return read(*args, **kwargs)
+        finally:
+            timing.transfer += perf_counter() - started
+            if raw.closed:
+                _finish()
+
+    close = response.close
+
+    def _close():
+        try:
+            close()
+        finally:
+            _finish()
+
+    raw.read = _timed_read
+    response.close = _close  # type: ignore[method-assign]
+    if raw.closed:
+        _finish()
+
+
+def install_http_timing(session: Session, on_timing: Callable[[HttpTiming], None]):
+    """
+    time each request made by the session, on_timing is called with the timing once each
+    response body has been read ( which may be after the request returns, for streamed responses )
+    """
+    for adapter in session.adapters.values():
+        if isinstance(adapter, HTTPAdapter):
+            adapter.poolmanager.pool_classes_by_scheme = {
+                "http": TimedHTTPConnectionPool,
+                "https": TimedHTTPSConnectionPool,
+            }
+
+    session_request = session.request
+
+    def _request(*args, **kwargs) -> Response:
+        # discard anything left by a request which failed before a response
+        _pending.reset()
+        return session_request(*args, **kwargs)
+
+    def _on_response(response: Response, *args, **kwargs) -> Response:
+        method = response.request.method or ""
+        timing = HttpTiming(
+            endpoint=mesh_endpoint(method, response.request.url),
+            method=method,
+            status=response.status_code,
+        )
+        for phase in ("connections", "connect", "tls", "send", "ttfb", "bytes_sent"):
+            setattr(timing, phase, getattr(_pending, phase))
+        _pending.reset()
+        _time_response_body(response, timing, on_timing)
+        return response
+
+    session.request = _request  # type: ignore[method-assign]
+    session.hooks["response"].append(_on_response)
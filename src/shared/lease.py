@@ -0,0 +1,104 @@
+from collections.abc import Callable
+from time import time
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+from shared.aws import dynamodb_client
+from shared.config import EnvConfig
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+
+# a lease not renewed for this long is free to be taken by another worker or step function
+DEFAULT_LEASE_SECONDS = 300.0
+
+
+class MailboxLease:
+    """
+    Time limited leases of mailboxes, held by a mesh worker for the mailboxes it polls, the get messages
+    step function does not poll a mailbox leased to a worker.
+    Stored in a dynamodb table ( hash key `mailbox_id` ), taken and renewed with conditional writes
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        owner: str | None = None,
+        duration: float = DEFAULT_LEASE_SECONDS,
+        ddb: "DynamoDBClient | None" = None,
+        clock: Callable[[], float] = time,
+    ):
+        self.table_name = table_name
+        self.owner = owner or uuid4().hex
+        self.duration = duration
+        self._ddb = ddb
+        self._clock = clock
+
+    @property
+    def ddb(self) -> "DynamoDBClient":
+        if not self._ddb:
+            self._ddb = dynamodb_client()
+        return self._ddb
+
+    def acquire(self, mailbox_id: str) -> bool:
+        """take or renew the lease, False if the mailbox is leased to another owner"""
+        now = self._clock()
+        try:
+            self.ddb.put_item(
+                TableName=self.table_name,
+                Item={
+                    "mailbox_id": {"S": mailbox_id},
+                    "owner": {"S": self.owner},
+                    "expires": {"N": repr(now + self.duration)},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(mailbox_id) OR #owner = :owner OR expires < :now"
+                ),
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={
+                    ":owner": {"S": self.owner},
+                    ":now": {"N": repr(now)},
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def release(self, mailbox_id: str):
+        """give up the lease, if still held"""
+        try:
+            self.ddb.delete_item(
+                TableName=self.table_name,
+                Key={"mailbox_id": {"S": mailbox_id}},
+                ConditionExpression="#owner = :owner",
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={":owner": {"S": self.owner}},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    def holder(self, mailbox_id: str) -> str | None:
+        """owner of the unexpired lease of the mailbox, if any"""
+        item: dict[str, Any] | None = self.ddb.get_item(
+            TableName=self.table_name,
+            Key={"mailbox_id": {"S": mailbox_id}},
+            ConsistentRead=True,
+        ).get("Item")
+        if not item or float(item["expires"]["N"]) < self._clock():
+            return None
+        return str(item["owner"]["S"])
+
+    def held_elsewhere(self, mailbox_id: str) -> bool:
+        holder = self.holder(mailbox_id)
+        return holder is not None and holder != self.owner
+
+
+def mailbox_lease_from_config(config: EnvConfig) -> MailboxLease | None:
+    if not config.worker_lease_table:
+        return None
+    return MailboxLease(config.worker_lease_table)
@@ -0,0 +1,120 @@
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from mesh_client import MeshClient as _MeshClient
+from requests import Response
+
+from shared.http_timing import HttpTiming, install_http_timing
+from shared.rate_limit import MeshRateLimited, TokenBucket, parse_retry_after
+
+# as the mesh_client defaults, without 429 which is retried by the rate limiter
+RATE_LIMITED_RETRY_STATUSES = (425, 502, 503, 504)
+MAX_RATE_LIMITED_ATTEMPTS = 5
+
+
+def _is_first_chunk(method: str, url: str) -> bool:
+    """
+    the first chunk creates the message, so is never resent ( as mesh_client's MeshRetry ),
+    a resent first chunk could create a duplicate message
+    """
+    return method.upper() == "POST" and url.rstrip("/").endswith("/outbox")
+
+
+class MeshClient(_MeshClient):
+    """
+    MeshClient which can also send chunk data that has already been gzip compressed,
+    allowing compression to happen ( and be measured ) outside the upload,
+    can limit the rate of requests made for the mailbox
+    and can report the timings of each http request
+    """
+
+    def __init__(
+        self,
+        *args,
+        rate_limiter: TokenBucket | None = None,
+        on_timing: Callable[[HttpTiming], None] | None = None,
+        **kwargs,
+    ):
+        if rate_limiter:
+            kwargs.setdefault("retry_status_force_list", RATE_LIMITED_RETRY_STATUSES)
+        super().__init__(*args, **kwargs)
+        if on_timing:
+            install_http_timing(self._session, on_timing)
+        self._rate_limiter = rate_limiter
+        # headers added to the requests of the current send_chunk call, on this thread
+        self._chunk_headers = threading.local()
+        self._session_request = self._session.request
+        self._session.request = self._request  # type: ignore[method-assign,assignment]
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> Response:
+        chunk_headers = getattr(self._chunk_headers, "headers", None)
+        if chunk_headers:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **chunk_headers}
+        if self._rate_limiter:
+            return self._rate_limited_request(method, url, **kwargs)
+        return self._session_request(method, url, **kwargs)
+
+    def _rate_limited_request(self, method: str, url: str, **kwargs: Any) -> Response:
+        assert self._rate_limiter
+        data = kwargs.get("data")
+        start = data.tell() if data is not None and hasattr(data, "seek") else None
+        # a streamed body cannot be resent
+        resendable = not _is_first_chunk(method, url) and (
+            start is not None or data is None or isinstance(data, bytes | str)
+        )
+
+        retry_after = 0.0
+        for _ in range(MAX_RATE_LIMITED_ATTEMPTS):
+            self._rate_limiter.acquire(self._mailbox)
+            response = self._session_request(method, url, **kwargs)
+            if response.status_code != 429:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self._rate_limiter.block(self._mailbox, retry_after)
+
+            if not resendable:
+                # let the step function retry the chunk
+                break
+            if start is not None:
+                data.seek(start)  # type: ignore[union-attr]
+
+        raise MeshRateLimited(retry_after)
+
+    def send_chunk(  # type: ignore[override]
+        self,
+        recipient: str,
+        chunk,
+        chunk_num: int,
+        total_chunks: int,
+        compress: bool | None = None,
+        message_id: str | None = None,
+        precompressed: bool = False,
+        **kwargs,
+    ) -> Response:
+        if not precompressed:
+            return super().send_chunk(
+                recipient=recipient,
+                chunk=chunk,
+                chunk_num=chunk_num,
+                total_chunks=total_chunks,
+                compress=compress,
+                message_id=message_id,
+                **kwargs,
+            )
+
+        # sent as is, with the header mesh_client adds to the chunks it compresses
+        self._chunk_headers.headers = {"Content-Encoding": "gzip"}
+        try:
+            return super().send_chunk(
+                recipient=recipient,
+                chunk=chunk,
+                chunk_num=chunk_num,
+                total_chunks=total_chunks,
+                compress=False,
+                message_id=message_id,
+                **kwargs,
+            )
+        finally:
+            self._chunk_headers.headers = None
@@ -0,0 +1,130 @@
+import json
+import threading
+from collections.abc import Generator
+from contextlib import contextmanager
+from time import perf_counter, time
+from typing import Any
+
+_DIMENSION_NAMES = ("Mailbox", "WorkflowId")
+
+
+class PhaseTimer:
+    """Handle yielded by InvocationMetrics.timer, allows bytes to be attributed to the phase"""
+
+    def __init__(self):
+        self.num_bytes = 0
+
+    def add_bytes(self, num_bytes: int):
+        self.num_bytes += num_bytes
+
+
+class InvocationMetrics:
+    """
+    Accumulates per-phase durations and byte counts for a single invocation and emits them
+    as a CloudWatch Embedded Metric Format (EMF) record
+    https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+    """
+
+    def __init__(self, namespace: str, enabled: bool = True):
+        self.namespace = namespace
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._dimensions: dict[str, str] = {}
+        self._properties: dict[str, Any] = {}
+        self._durations: dict[str, float] = {}
+        self._bytes: dict[str, int] = {}
+
+    def reset(self):
+        with self._lock:
+            self._dimensions = {}
+            self._properties = {}
+            self._durations = {}
+            self._bytes = {}
+
+    def set_dimensions(
+        self, mailbox: str | None = None, workflow_id: str | None = None
+    ):
+        with self._lock:
+            if mailbox:
+                self._dimensions["Mailbox"] = mailbox
+            if workflow_id:
+                self._dimensions["WorkflowId"] = workflow_id
+
+    def set_property(self, name: str, value: Any):
+        with self._lock:
+            self._properties[name] = value
+
+    def record(self, phase: str, seconds: float, num_bytes: int = 0):
+        with self._lock:
+            self._durations[phase] = self._durations.get(phase, 0.0) + seconds
+            if num_bytes:
+                self._bytes[phase] = self._bytes.get(phase, 0) + num_bytes
+
+    def duration(self, phase: str) -> float:
+        with self._lock:
+            return self._durations.get(phase, 0.0)
+
+    def bytes(self, phase: str) -> int:
+        with self._lock:
+            return self._bytes.get(phase, 0)
+
+    @contextmanager
+    def timer(self, phase: str) -> Generator[PhaseTimer, None, None]:
+        """time the enclosed block and add the duration ( and any bytes ) to the phase"""
+        timer = PhaseTimer()
+        start = perf_counter()
+        try:
+            yield timer
+        finally:
+            self.record(phase, perf_counter() - start, timer.num_bytes)
+
+    def to_emf(self) -> dict[str, Any] | None:
+        with self._lock:
+            if not self._durations:
+                return None
+
+            metrics: list[dict[str, str]] = []
+            values: dict[str, float | int] = {}
+            for phase, seconds in sorted(self._durations.items()):
+                metrics.append({"Name": f"{phase}_duration", "Unit": "Milliseconds"})
+                values[f"{phase}_duration"] = round(seconds * 1000, 3)
+
+                num_bytes = self._bytes.get(phase)
+                if not num_bytes:
+                    continue
+
+                metrics.append({"Name": f"{phase}_bytes", "Unit": "Bytes"})
+                values[f"{phase}_bytes"] = num_bytes
+                if seconds > 0:
+                    metrics.append(
+                        {"Name": f"{phase}_throughput", "Unit": "Bytes/Second"}
+                    )
+                    values[f"{phase}_throughput"] = round(num_bytes / seconds, 3)
+
+            dimension_names = [
+                name for name in _DIMENSION_NAMES if name in self._dimensions
+            ]
+
+            return {
+                "_aws": {
+                    "Timestamp": int(time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": self.namespace,
+                            "Dimensions": [dimension_names],
+                            "Metrics": metrics,
+                        }
+                    ],
+                },
+                **self._properties,
+                **self._dimensions,
+                **values,
+            }
+
+    def flush(self):
+        """write the EMF record to stdout ( picked up by the lambda log group ) and reset"""
+        record = self.to_emf() if self.enabled else None
+        self.reset()
+        if not record:
+            return
+        print(json.dumps(record, default=str), flush=True)
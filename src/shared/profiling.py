@@ -0,0 +1,111 @@
+"""
+opt-in profiling of lambda invocations, for a sampled fraction of invocations ( PROFILE_SAMPLE_RATE )
+or for a single invocation with "profile": true at the top level of the lambda event
+
+cProfile and tracemalloc are only imported once an invocation is profiled, so an invocation which
+is not sampled pays for the sampling check alone
+"""
+
+import json
+import random
+from time import perf_counter
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from cProfile import Profile
+
+PROFILE_EVENT_FLAG = "profile"
+
+DEFAULT_TOP_N = 25
+
+
+class InvocationProfile:
+    """
+    cProfile stats and tracemalloc allocations for one invocation, cProfile only profiles the
+    invoking thread, allocations are traced across all threads
+    """
+
+    def __init__(self, top_n: int = DEFAULT_TOP_N):
+        self.top_n = top_n
+        self.duration = 0.0
+        self.peak_memory = 0
+        # pstats ( marshal ) format, as written by cProfile.Profile.dump_stats
+        self.stats = b""
+        self.top_functions: list[dict[str, Any]] = []
+        self.top_allocations: list[dict[str, Any]] = []
+        self._profiler: Profile | None = None
+        self._started_tracing = False
+        self._started = 0.0
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        self._profiler = cProfile.Profile()
+        self._started = perf_counter()
+        self._profiler.enable()
+
+    def stop(self):
+        import marshal
+        import pstats
+        import tracemalloc
+
+        assert self._profiler
+        self._profiler.disable()
+        self.duration = perf_counter() - self._started
+
+        snapshot = tracemalloc.take_snapshot()
+        _, self.peak_memory = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        self._profiler.create_stats()
+        self.stats = marshal.dumps(self._profiler.stats)  # type: ignore[attr-defined]
+
+        stats = pstats.Stats(self._profiler)
+        top_functions = sorted(
+            stats.stats.items(),  # type: ignore[attr-defined]
+            key=lambda item: item[1][3],
+            reverse=True,
+        )[: self.top_n]
+        self.top_functions = [
+            {
+                "function": pstats.func_std_string(func),  # type: ignore[attr-defined]
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            }
+            for func, (_, calls, tottime, cumtime, _) in top_functions
+        ]
+
+        self.top_allocations = [
+            {"location": str(stat.traceback), "size": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[: self.top_n]
+        ]
+        self._profiler = None
+
+    def allocations_json(self) -> str:
+        return json.dumps(
+            {"peak_memory": self.peak_memory, "top_allocations": self.top_allocations}
+        )
+
+
+class Profiler:
+    def __init__(self, sample_rate: float, top_n: int = DEFAULT_TOP_N):
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+
+    def sampled(self, event: Any) -> bool:
+        if isinstance(event, dict) and event.get(PROFILE_EVENT_FLAG):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self) -> InvocationProfile:
+        profile = InvocationProfile(self.top_n)
+        profile.start()
+        return profile
@@ -0,0 +1,256 @@
+import random
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
+from time import sleep, time
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from botocore.exceptions import ClientError
+
+from shared.aws import dynamodb_client
+from shared.config import EnvConfig
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+
+# wait this long before retrying a 429 without a ( valid ) Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+# longest a lambda will wait for a token before failing back to the step function to retry
+DEFAULT_MAX_WAIT = 30.0
+# key of the step function start rate shared by all send dispatchers, alongside the mailbox keys
+DISPATCH_STARTS_KEY = "#dispatch-starts"
+# compare-and-set races a caller may lose before giving up, backing off ( with jitter ) after each
+MAX_CONFLICTS = 8
+CONFLICT_BACKOFF = 0.02
+
+
+class MeshRateLimited(Exception):
+    """MESH requests for the mailbox are being rate limited, retry after retry_after seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float:
+    """seconds to wait from a Retry-After header, in either delay-seconds or http-date form"""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+    return max(retry_at - (time() if now is None else now), 0.0)
+
+
+class BucketState(NamedTuple):
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+
+
+class TokenBucket(ABC):
+    """
+    Per mailbox token bucket, refilling at `rate` tokens a second up to `burst`, a 429 from MESH
+    empties the bucket and blocks the mailbox until the Retry-After has passed.
+    State changes are compare-and-set, so the state can be shared by concurrent lambdas
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        clock: Callable[[], float] = time,
+        wait: Callable[[float], None] = sleep,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_wait = max_wait
+        self._clock = clock
+        self._wait = wait
+
+    @abstractmethod
+    def _load(self, key: str) -> tuple[BucketState | None, str | None]:
+        """current state and a version to compare and set against, None if there is no state yet"""
+
+    @abstractmethod
+    def _store(self, key: str, state: BucketState, version: str | None) -> bool:
+        """store the state if unchanged since loaded at version, False if it was changed"""
+
+    def _backoff(self, conflicts: int) -> float:
+        """seconds to wait after losing a race, raising MeshRateLimited once there have been too many"""
+        backoff = random.uniform(0, CONFLICT_BACKOFF * 2**conflicts)
+        if conflicts >= MAX_CONFLICTS:
+            raise MeshRateLimited(backoff)
+        return backoff
+
+    def _try_acquire(self, key: str) -> float | None:
+        """take a token, returning 0, or the seconds to wait before trying again, None if we lost a race"""
+        now = self._clock()
+        state, version = self._load(key)
+        if state is None:
+            state = BucketState(tokens=self.burst, updated=now)
+
+        if state.blocked_until > now:
+            return state.blocked_until - now
+
+        tokens = min(self.burst, state.tokens + max(now - state.updated, 0) * self.rate)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+
+        if not self._store(key, BucketState(tokens - 1, now), version):
+            return None
+        return 0
+
+    def acquire(self, key: str):
+        """
+        wait for a token, raising MeshRateLimited if it would take longer than max_wait,
+        or after losing MAX_CONFLICTS races for the token
+        """
+        deadline = self._clock() + self.max_wait
+        conflicts = 0
+        while True:
+            wait = self._try_acquire(key)
+            if wait is None:
+                conflicts += 1
+                self._wait(self._backoff(conflicts))
+                continue
+            if wait <= 0:
+                return
+            if self._clock() + wait > deadline:
+                raise MeshRateLimited(wait)
+            self._wait(wait)
+
+    def block(self, key: str, seconds: float):
+        """MESH has rate limited the mailbox, take no more tokens for `seconds`"""
+        blocked_until = self._clock() + seconds
+        conflicts = 0
+        while True:
+            state, version = self._load(key)
+            if state and state.blocked_until >= blocked_until:
+                return
+            if self._store(key, BucketState(0, blocked_until, blocked_until), version):
+                return
+            conflicts += 1
+            self._wait(self._backoff(conflicts))
+
+
+class InMemoryTokenBucket(TokenBucket):
+    """token bucket shared by the threads of this process only"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._states: dict[str, tuple[BucketState, str]] = {}
+        self._versions = 0
+
+    def _load(self, key: str) -> tuple[BucketState | None, str | None]:
+        with self._lock:
+            state, version = self._states.get(key, (None, None))
+            return state, version
+
+    def _store(self, key: str, state: BucketState, version: str | None) -> bool:
+        with self._lock:
+            _, current = self._states.get(key, (None, None))
+            if current != version:
+                return False
+            self._versions += 1
+            self._states[key] = (state, str(self._versions))
+            return True
+
+
+class DynamoDBTokenBucket(TokenBucket):
+    """token bucket stored in a dynamodb table ( hash key `mailbox_id` ), shared by all lambdas"""
+
+    def __init__(
+        self, table_name: str, *args, ddb: "DynamoDBClient | None" = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.table_name = table_name
+        self._ddb = ddb
+
+    @property
+    def ddb(self) -> "DynamoDBClient":
+        if not self._ddb:
+            self._ddb = dynamodb_client()
+        return self._ddb
+
+    def _load(self, key: str) -> tuple[BucketState | None, str | None]:
+        item = self.ddb.get_item(
+            TableName=self.table_name,
+            Key={"mailbox_id": {"S": key}},
+            ConsistentRead=True,
+        ).get("Item")
+        if not item:
+            return None, None
+
+        version = item["version"]["N"]
+        return (
+            BucketState(
+                tokens=float(item["tokens"]["N"]),
+                updated=float(item["updated"]["N"]),
+                blocked_until=float(item["blocked_until"]["N"]),
+            ),
+            version,
+        )
+
+    def _store(self, key: str, state: BucketState, version: str | None) -> bool:
+        condition: dict[str, Any] = {
+            "ConditionExpression": "attribute_not_exists(mailbox_id)"
+        }
+        if version is not None:
+            condition = {
+                "ConditionExpression": "version = :version",
+                "ExpressionAttributeValues": {":version": {"N": version}},
+            }
+        try:
+            self.ddb.put_item(
+                TableName=self.table_name,
+                Item={
+                    "mailbox_id": {"S": key},
+                    "tokens": {"N": repr(state.tokens)},
+                    "updated": {"N": repr(state.updated)},
+                    "blocked_until": {"N": repr(state.blocked_until)},
+                    "version": {"N": str(int(version or 0) + 1)},
+                },
+                **condition,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+
+def rate_limiter_from_config(config: EnvConfig) -> TokenBucket | None:
+    if config.mesh_rate_limit <= 0:
+        return None
+
+    if config.rate_limit_table:
+        return DynamoDBTokenBucket(
+            config.rate_limit_table,
+            rate=config.mesh_rate_limit,
+            burst=config.mesh_rate_limit_burst,
+        )
+
+    return InMemoryTokenBucket(
+        rate=config.mesh_rate_limit, burst=config.mesh_rate_limit_burst
+    )
+
+
+def dispatch_limiter_from_config(config: EnvConfig) -> TokenBucket | None:
+    rate = config.dispatch_max_starts_per_second
+    if rate <= 0:
+        return None
+
+    if config.rate_limit_table:
+        return DynamoDBTokenBucket(config.rate_limit_table, rate=rate, burst=1)
+
+    # without the shared table, starts are only limited per dispatcher instance
+    return InMemoryTokenBucket(rate=rate, burst=1)
@@ -1,23 +1,32 @@
 import os
-from dataclasses import dataclass
-from math import ceil
-from typing import Any
+import threading
+from dataclasses import asdict, dataclass
+from functools import cache
+from http import HTTPStatus
+from time import time
+from typing import TYPE_CHECKING, Any
 from urllib.parse import unquote_plus
 
-from mesh_client import optional_header_map
-from mypy_boto3_s3.service_resource import Object
-from mypy_boto3_ssm import SSMClient
-from nhs_aws_helpers import ssm_client
-
-from shared.common import convert_params_to_dict, strtobool
+from shared.aws import ssm_client
+from shared.chunk_plan import plan_chunks
+from shared.common import get_params_by_path, strtobool
 from shared.config import EnvConfig
 
-_MESH_SEND_KWARGS = {
-    "recipient",
-    "total_chunks",
-    "compress",
-    *optional_header_map().keys(),
-}
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import Object
+    from mypy_boto3_ssm import SSMClient
+
+OUTBOUND_MAPPING_CACHE_TIME = 300
+# folders without a mapping are re-checked more often, so a newly added mapping is picked up quickly
+OUTBOUND_MAPPING_NEGATIVE_CACHE_TIME = 60
+
+
+@cache
+def _mesh_send_kwargs() -> set[str]:
+    # deferred, mesh_client is not needed to plan a send
+    from mesh_client import optional_header_map
+
+    return {"recipient", "total_chunks", "compress", *optional_header_map().keys()}
 
 
 @dataclass
@@ -40,6 +49,7 @@ class SendParameters:
     partner_id: str | None = None
     chunked: bool = False
     total_chunks: int = 1
+    chunk_size: int = 0  # zero for sends planned before chunk_size was recorded
 
     def to_client_kwargs(self) -> dict[str, Any]:
         return {
@@ -58,29 +68,108 @@ class SendParameters:
                 ("partner_id", self.partner_id),
                 ("content_type", self.content_type),
             )
-            if v is not None and k in _MESH_SEND_KWARGS
+            if v is not None and k in _mesh_send_kwargs()
         }
 
 
+def _get_folder_mapping(ssm: "SSMClient", path: str) -> dict[str, str]:
+    params = get_params_by_path(path, recursive=False, ssm=ssm)
+    return {os.path.basename(name): value for name, value in params.items()}
+
+
+def _mapping_folder(key: str) -> str:
+    folder = os.path.dirname(key)
+    if len(folder) > 0:
+        folder += "/"
+    return folder
+
+
+class OutboundMappingIndex:
+    """
+    In memory index of the outbound bucket/folder to mailbox mappings, the full mapping tree
+    is loaded on first use and reloaded when older than the cache time, folders found to have no
+    mapping are cached too, so a mapped send makes no SSM calls on a warm lambda
+    """
+
+    def __init__(
+        self,
+        config: EnvConfig,
+        ssm: "SSMClient | None" = None,
+        cache_time: float = OUTBOUND_MAPPING_CACHE_TIME,
+        negative_cache_time: float = OUTBOUND_MAPPING_NEGATIVE_CACHE_TIME,
+    ):
+        self.config = config
+        self._ssm = ssm
+        self.cache_time = cache_time
+        self.negative_cache_time = negative_cache_time
+        self._lock = threading.Lock()
+        self._mappings: dict[str, dict[str, str]] = {}
+        self._loaded = 0.0
+        self._missing: dict[str, float] = {}
+
+    @property
+    def base_path(self) -> str:
+        return f"/{self.config.environment}/mesh/mapping/"
+
+    @property
+    def ssm(self) -> "SSMClient":
+        if not self._ssm:
+            self._ssm = ssm_client()
+        return self._ssm
+
+    def load(self):
+        """(re)load the full mapping tree"""
+        params = get_params_by_path(self.base_path, ssm=self.ssm)
+
+        mappings: dict[str, dict[str, str]] = {}
+        for name, value in params.items():
+            bucket_and_folder = _mapping_folder(name[len(self.base_path) :])
+            mappings.setdefault(bucket_and_folder, {})[os.path.basename(name)] = value
+
+        with self._lock:
+            self._mappings = mappings
+            self._loaded = time()
+            self._missing = {}
+
+    def get(self, bucket: str, key: str) -> dict[str, str]:
+        """mapping for the folder containing the s3 key, empty if the folder is not mapped"""
+        if time() >= self._loaded + self.cache_time:
+            self.load()
+
+        bucket_and_folder = f"{bucket}/{_mapping_folder(key)}"
+        with self._lock:
+            mapping = self._mappings.get(bucket_and_folder)
+            if mapping is not None:
+                return mapping
+            missing = self._missing.get(bucket_and_folder)
+            if missing and time() < missing + self.negative_cache_time:
+                return {}
+
+        # not in the index, check in case it was added since the last load
+        mapping = _get_folder_mapping(self.ssm, f"{self.base_path}{bucket_and_folder}")
+        with self._lock:
+            if mapping:
+                self._mappings[bucket_and_folder] = mapping
+                self._missing.pop(bucket_and_folder, None)
+            else:
+                self._missing[bucket_and_folder] = time()
+        return mapping
+
+
 def get_send_parameters_from_mapping(
-    s3_object: Object, config: EnvConfig, ssm: SSMClient | None = None
+    s3_object: "Object",
+    config: EnvConfig,
+    ssm: "SSMClient | None" = None,
+    mappings: OutboundMappingIndex | None = None,
 ) -> SendParameters:
     bucket = s3_object.bucket_name
     key = s3_object.key
-    folder = os.path.dirname(key)
-    if len(folder) > 0:
-        folder += "/"
 
-    path = f"/{config.environment}/mesh/mapping/{bucket}/{folder}"
-    ssm = ssm or ssm_client()
-    mailbox_mapping_params = ssm.get_parameters_by_path(
-        Path=path,
-        Recursive=False,
-        WithDecryption=True,
-    )
-    mailbox_mapping = convert_params_to_dict(
-        mailbox_mapping_params.get("Parameters", {})
-    )
+    if mappings:
+        mailbox_mapping = mappings.get(bucket, key)
+    else:
+        path = f"/{config.environment}/mesh/mapping/{bucket}/{_mapping_folder(key)}"
+        mailbox_mapping = _get_folder_mapping(ssm or ssm_client(), path)
 
     sender = mailbox_mapping["src_mailbox"]
     recipient = mailbox_mapping["dest_mailbox"]
@@ -96,12 +185,18 @@ def get_send_parameters_from_mapping(
 
 
 def get_send_parameters(
-    s3_object: Object, config: EnvConfig, ssm: SSMClient | None = None
+    s3_object: "Object",
+    config: EnvConfig,
+    ssm: "SSMClient | None" = None,
+    chunk_size: int | None = None,
+    mappings: OutboundMappingIndex | None = None,
 ) -> SendParameters:
     metadata = {k.lower(): unquote_plus(v) for k, v in s3_object.metadata.items()}
 
     params = (
-        get_send_parameters_from_mapping(s3_object=s3_object, config=config, ssm=ssm)
+        get_send_parameters_from_mapping(
+            s3_object=s3_object, config=config, ssm=ssm, mappings=mappings
+        )
         if not metadata or "mex-from" not in metadata
         else SendParameters(
             s3_bucket=s3_object.bucket_name,
@@ -121,8 +216,9 @@ def get_send_parameters(
     params.content_type = s3_object.content_type
     params.content_encoding = s3_object.content_encoding
 
+    params.chunk_size = chunk_size or config.chunk_size
     params.chunked, params.total_chunks = calculate_chunks(
-        params.file_size, config.chunk_size
+        params.file_size, params.chunk_size
     )
 
     if "mex-content-compressed" in metadata:
@@ -134,7 +230,7 @@ def get_send_parameters(
     if config.never_compress or params.compressed:
         params.compress = False
     else:
-        if params.file_size >= config.compress_threshold:
+        if config.transparent_compress or params.file_size >= config.compress_threshold:
             params.compress = True
 
         encoding = params.content_encoding or ""
@@ -154,8 +250,34 @@ def get_send_parameters(
     return params
 
 
+def send_message_input(
+    send_params: SendParameters, internal_id: str, crumb_size: int
+) -> dict[str, Any]:
+    """input for the first send message chunk, as output by the check send parameters lambda"""
+    # todo: in v3 send_params can replace most of these params but keep in v2 to support in-flight step functions
+    return {
+        "statusCode": int(HTTPStatus.OK),
+        "headers": {"Content-Type": "application/json"},
+        "body": {
+            "internal_id": internal_id,
+            "src_mailbox": send_params.sender,
+            "dest_mailbox": send_params.recipient,
+            "workflow_id": send_params.workflow_id,
+            "bucket": send_params.s3_bucket,
+            "key": send_params.s3_key,
+            "chunked": send_params.chunked,
+            "chunk_number": 1,
+            "total_chunks": send_params.total_chunks,
+            "chunk_size": send_params.chunk_size,
+            "crumb_size": crumb_size,
+            "message_id": None,
+            "current_byte_position": 0,
+            "send_params": asdict(send_params),
+        },
+    }
+
+
 def calculate_chunks(file_size, chunk_size) -> tuple[bool, int]:
-    """Helper for number of chunks"""
-    chunks = ceil(file_size / chunk_size)
-    do_chunking = bool(chunks > 1)
-    return do_chunking, chunks
+    """Helper for number of chunks, as balanced by plan_chunks"""
+    plan = plan_chunks(file_size, chunk_size)
+    return plan.chunked, plan.chunks
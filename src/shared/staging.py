@@ -0,0 +1,185 @@
+"""
+compress-once staging of chunked sends, the source object is compressed in a single pass into a
+staging object, and the chunks are planned from the compressed size and sent from the staged object.
+
+each MESH chunk is sent with Content-Encoding gzip and is decompressed on its own by the recipient
+( mesh_client only reads the first gzip member of a chunk ), so rather than cutting one gzip stream,
+a new gzip member is started whenever the next block might not fit within the chunk size,
+and each member is sent as one chunk
+"""
+
+import os
+import zlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from shared.config import MiB
+from shared.metrics import InvocationMetrics
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import MultipartUpload, Object
+
+# input is compressed ( and flushed ) a block at a time, so a member can be ended at any block
+STAGING_BLOCK_SIZE = 256 * 1024
+STAGING_PART_SIZE = 16 * MiB
+# gzip header and trailer, and the marker written by each sync flush
+GZIP_OVERHEAD = 10 + 8 + 5
+
+
+def deflate_bound(size: int) -> int:
+    """the most a block of this size can deflate to, as zlib's deflateBound"""
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
+
+@dataclass
+class StagedObject:
+    """a send compressed into the staging prefix, as passed between invocations"""
+
+    bucket: str
+    key: str
+    # the offset of each chunk in the object, then its size
+    offsets: list[int]
+
+    @property
+    def size(self) -> int:
+        return self.offsets[-1]
+
+    @property
+    def total_chunks(self) -> int:
+        return len(self.offsets) - 1
+
+
+def staging_key(prefix: str, internal_id: str, key: str) -> str:
+    return f"{prefix}/{internal_id}/{os.path.basename(key)}.gz"
+
+
+class GzipChunker:
+    """
+    compress a stream into gzip members of at most chunk_size bytes each, a member always
+    holds at least one block, so a chunk size smaller than a compressed block is exceeded
+    """
+
+    def __init__(self, chunk_size: int, compresslevel: int = 9):
+        self.chunk_size = chunk_size
+        self.compresslevel = compresslevel
+        self.block_size = max(min(STAGING_BLOCK_SIZE, chunk_size // 2), 1)
+        # the start of each member, and finally the end of the last
+        self.offsets: list[int] = []
+        self.size = 0
+        self._compressor: Any = None
+        self._member_size = 0
+
+    def compress(self, data: bytes) -> bytes:
+        output = [
+            self._compress_block(data[start : start + self.block_size])
+            for start in range(0, len(data), self.block_size)
+        ]
+        return b"".join(output)
+
+    def _compress_block(self, block: bytes) -> bytes:
+        output = b""
+        if (
+            self._compressor
+            and self._member_size + deflate_bound(len(block)) + GZIP_OVERHEAD
+            > self.chunk_size
+        ):
+            output = self._finish_member()
+
+        if not self._compressor:
+            self.offsets.append(self.size)
+            # wbits 31, a gzip header and trailer ( with a zero mtime )
+            self._compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+        compressed: bytes = self._compressor.compress(block)
+        compressed += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._member_size += len(compressed)
+        self.size += len(compressed)
+        return output + compressed
+
+    def _finish_member(self) -> bytes:
+        output: bytes = self._compressor.flush(zlib.Z_FINISH)
+        self.size += len(output)
+        self._compressor = None
+        self._member_size = 0
+        return output
+
+    def finish(self) -> bytes:
+        output = self._finish_member() if self._compressor else b""
+        self.offsets.append(self.size)
+        return output
+
+
+class _StagingUpload:
+    """buffer the compressed output, uploading it as parts of a multipart upload as it fills"""
+
+    def __init__(
+        self,
+        upload: "MultipartUpload",
+        metrics: InvocationMetrics,
+        part_size: int = STAGING_PART_SIZE,
+    ):
+        self._upload = upload
+        self._metrics = metrics
+        self._part_size = part_size
+        self._buffer = bytearray()
+        self.parts: list[dict[str, Any]] = []
+
+    def write(self, data: bytes):
+        self._buffer += data
+
+    def upload_full_parts(self):
+        while len(self._buffer) >= self._part_size:
+            self._upload_part(bytes(self._buffer[: self._part_size]))
+            del self._buffer[: self._part_size]
+
+    def _upload_part(self, body: bytes):
+        part_id = len(self.parts) + 1
+        with self._metrics.timer("s3_upload") as timer:
+            timer.add_bytes(len(body))
+            response = self._upload.Part(part_id).upload(  # type: ignore[arg-type]
+                Body=body, ContentLength=len(body)
+            )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_id})
+
+    def complete(self):
+        if self._buffer or not self.parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        with self._metrics.timer("s3_upload"):
+            self._upload.complete(MultipartUpload={"Parts": self.parts})  # type: ignore[typeddict-item]
+
+
+def stage_compressed(
+    source: "Object",
+    target: "Object",
+    chunk_size: int,
+    crumb_size: int,
+    metrics: InvocationMetrics,
+) -> list[int]:
+    """
+    compress the source into the target, returning the offset of each chunk in the target,
+    followed by its size, only a crumb and a part of the output are held in memory
+    """
+    chunker = GzipChunker(chunk_size)
+    with metrics.timer("s3_upload"):
+        upload = target.initiate_multipart_upload(ContentType="application/gzip")
+    staging = _StagingUpload(upload, metrics)
+    try:
+        body = source.get()["Body"]
+        while True:
+            with metrics.timer("s3_read") as timer:
+                crumb = body.read(crumb_size)
+                timer.add_bytes(len(crumb))
+            if not crumb:
+                break
+            with metrics.timer("compress") as timer:
+                timer.add_bytes(len(crumb))
+                staging.write(chunker.compress(crumb))
+            staging.upload_full_parts()
+
+        staging.write(chunker.finish())
+        staging.complete()
+    except BaseException:
+        upload.abort()
+        raise
+
+    return chunker.offsets
@@ -0,0 +1,111 @@
+import threading
+from math import ceil
+
+from shared.chunk_plan import MESH_MAX_CHUNK_SIZE
+from shared.config import MIN_MULTIPART_SIZE, EnvConfig, MiB
+from shared.metrics import InvocationMetrics
+
+S3_MAX_PARTS = 10000
+MIN_CRUMB_SIZE = 1 * MiB
+
+# headroom for the python runtime, boto3 etc. before sizing buffers from lambda memory
+LAMBDA_RESERVED_MEMORY = 64 * MiB
+# at worst a send holds a crumb read from s3, the chunk buffer ( in memory where the chunk fits
+# in a crumb ) and mesh_client's copy of the chunk ( read back to rewind it on retry ) at once
+SEND_MEMORY_MULTIPLIER = 3
+
+# aim for each ranged read / streamed crumb to take roughly this long
+TARGET_CRUMB_SECONDS = 0.5
+# aim for each chunk upload to complete well within the send lambda timeout
+TARGET_CHUNK_SECONDS = 120.0
+
+EWMA_WEIGHT = 0.3
+
+# metric phases contributing to each throughput estimate
+_S3_PHASES = ("s3_read", "s3_upload")
+_MESH_PHASES = ("mesh_upload", "mesh_download")
+
+
+class ThroughputTracker:
+    """Exponentially weighted moving average of observed bytes / second"""
+
+    def __init__(self, weight: float = EWMA_WEIGHT):
+        self.weight = weight
+        self._lock = threading.Lock()
+        self._rate: float | None = None
+
+    def observe(self, num_bytes: int, seconds: float):
+        if num_bytes < 1 or seconds <= 0:
+            return
+        rate = num_bytes / seconds
+        with self._lock:
+            if self._rate is None:
+                self._rate = rate
+                return
+            self._rate = self.weight * rate + (1 - self.weight) * self._rate
+
+    @property
+    def rate(self) -> float | None:
+        with self._lock:
+            return self._rate
+
+
+class SizeTuner:
+    """
+    Picks crumb and chunk sizes from the lambda memory size and the S3 / MESH throughput
+    observed on this ( warm ) instance, falling back to the static config where nothing
+    is known yet
+    """
+
+    def __init__(self, config: EnvConfig):
+        self.config = config
+        self.s3 = ThroughputTracker()
+        self.mesh = ThroughputTracker()
+
+    def observe(self, metrics: InvocationMetrics):
+        for tracker, phases in ((self.s3, _S3_PHASES), (self.mesh, _MESH_PHASES)):
+            for phase in phases:
+                tracker.observe(metrics.bytes(phase), metrics.duration(phase))
+
+    @property
+    def memory_budget(self) -> int:
+        """bytes available for a single chunk buffer, or 0 if the memory size is not known"""
+        memory_size = self.config.memory_size * MiB
+        if memory_size < 1:
+            return 0
+        return max(
+            (memory_size - LAMBDA_RESERVED_MEMORY) // SEND_MEMORY_MULTIPLIER,
+            MIN_MULTIPART_SIZE,
+        )
+
+    def chunk_size(self, file_size: int) -> int:
+        if not self.config.auto_tune_sizes:
+            return self.config.chunk_size
+
+        upper = MESH_MAX_CHUNK_SIZE
+        if self.memory_budget:
+            upper = min(upper, self.memory_budget)
+
+        rate = self.mesh.rate
+        if rate:
+            upper = min(upper, int(rate * TARGET_CHUNK_SECONDS))
+
+        # every chunk may become an s3 part on receipt, so keep to the s3 part limits
+        lower = max(MIN_MULTIPART_SIZE, ceil(file_size / S3_MAX_PARTS))
+
+        return max(lower, upper)
+
+    def crumb_size(self, chunk_size: int, inbound: bool = False) -> int:
+        if not self.config.auto_tune_sizes:
+            return min(self.config.crumb_size, chunk_size)
+
+        upper = chunk_size
+        if self.memory_budget:
+            upper = min(upper, self.memory_budget)
+
+        rate = self.mesh.rate if inbound else self.s3.rate
+        if not rate:
+            return max(min(self.config.crumb_size, upper), 1)
+
+        crumb_size = int(rate * TARGET_CRUMB_SECONDS)
+        return max(min(crumb_size, upper), min(MIN_CRUMB_SIZE, upper), 1)
@@ -14,6 +14,7 @@ from typing import cast
 
 import requests
 from botocore.exceptions import ClientError
+from mesh_log_analyser import parse_kv_log
 from mypy_boto3_lambda.type_defs import InvocationResponseTypeDef
 from mypy_boto3_logs.type_defs import LogStreamTypeDef, OutputLogEventTypeDef
 from mypy_boto3_s3.service_resource import Object
@@ -30,13 +31,6 @@ def try_parse_json(message: str) -> dict | None:
         return None
 
 
-def parse_kv_log(line: str) -> dict[str, str]:
-    return {
-        k: v.strip("\"'")
-        for k, v in (match.split("=", maxsplit=1) for match in kv_log_re.findall(line))
-    }
-
-
 def try_parse_log_line(line: str) -> dict[str, str] | None:
     if not line:
         return None
@@ -70,9 +64,6 @@ def useful_lambda_logs(res: InvocationResponseTypeDef) -> list[str]:
     ]
 
 
-kv_log_re = re.compile(r'(?:\s|^)(\w+=(?:\'[^\']+\'|"[^"]+"|[^ ]+))')
-
-
 def parse_lambda_logs(
     res: InvocationResponseTypeDef, predicate: Callable[[dict], bool] | None = None
 ) -> list[dict]:
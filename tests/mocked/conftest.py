@@ -34,6 +34,24 @@ def _mock_aws():
         yield
 
 
+@pytest.fixture(autouse=True)
+def _close_mesh_clients(monkeypatch) -> Generator[None, None, None]:
+    """close the clients pooled by each app a test creates, rather than leaving them to exit"""
+    from shared.application import MESHLambdaApplication
+
+    apps: list[MESHLambdaApplication] = []
+    init = MESHLambdaApplication.__init__
+
+    def _init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        apps.append(self)
+
+    monkeypatch.setattr(MESHLambdaApplication, "__init__", _init)
+    yield
+    for app in apps:
+        app.close()
+
+
 @pytest.fixture(name="s3_client")
 def s3_client(_mock_aws) -> S3Client:
     return _s3_client()
@@ -0,0 +1,104 @@
+import json
+from unittest import mock
+
+from mesh_client import MeshClient
+from mypy_boto3_s3 import S3Client
+
+from .mesh_testing_common import reset_sandbox_mailbox
+
+
+def _put_outbound_files(
+    s3_client: S3Client, bucket: str, count: int, folder: str = "X26ABC2/outbound"
+) -> dict[str, bytes]:
+    files = {f"{folder}/file{i}.dat": f"backfill {i}".encode() for i in range(count)}
+    for key, body in files.items():
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+    return files
+
+
+def test_bulk_send_prefix(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+    mesh_client_one: MeshClient,
+    tmp_path,
+):
+    from mesh_bulk_send import BulkSender
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    files = _put_outbound_files(s3_client, mesh_s3_bucket, 6)
+    # the bucket fixture's X26ABC2/outbound/testfile.json is outside the prefix
+
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    sender = BulkSender(
+        mesh_s3_bucket,
+        prefix="X26ABC2/outbound/file",
+        concurrency=3,
+        checkpoint_path=str(checkpoint),
+    )
+    report = sender.run()
+
+    assert report.sent == len(files)
+    assert report.failed == report.skipped == 0
+    assert report.bytes_sent == sum(len(body) for body in files.values())
+    assert report.as_dict()["files_per_second"] > 0
+
+    records = [json.loads(line) for line in checkpoint.read_text().splitlines()]
+    assert sorted(record["key"] for record in records) == sorted(files)
+
+    inbox = mesh_client_one.list_messages()
+    for record in records:
+        assert record["message_id"] in inbox
+        message = mesh_client_one.retrieve_message(record["message_id"])
+        assert message.read() == files[record["key"]]
+
+
+def test_bulk_send_resumes_from_checkpoint(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+    mesh_client_one: MeshClient,
+    tmp_path,
+):
+    from mesh_bulk_send import BulkSender
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    files = _put_outbound_files(s3_client, mesh_s3_bucket, 4)
+    keys = sorted(files)
+    failing_key = keys[1]
+
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    sender = BulkSender(
+        mesh_s3_bucket, prefix="X26ABC2/outbound/file", checkpoint_path=str(checkpoint)
+    )
+    send = sender.send
+
+    def _fail_one(key: str):
+        if key == failing_key:
+            raise ConnectionError("interrupted")
+        return send(key)
+
+    with mock.patch.object(sender, "send", side_effect=_fail_one):
+        report = sender.run()
+
+    assert report.sent == 3
+    assert report.failed == 1
+    assert len(mesh_client_one.list_messages()) == 3
+
+    # a fresh run only sends the file which failed
+    resumed = BulkSender(
+        mesh_s3_bucket, prefix="X26ABC2/outbound/file", checkpoint_path=str(checkpoint)
+    )
+    with mock.patch.object(resumed, "send", wraps=resumed.send) as resumed_send:
+        report = resumed.run()
+
+    resumed_send.assert_called_once_with(failing_key)
+    assert report.sent == 1
+    assert report.skipped == 3
+    assert report.failed == 0
+    assert len(mesh_client_one.list_messages()) == 4
+
+    records = [json.loads(line) for line in checkpoint.read_text().splitlines()]
+    assert sorted(record["key"] for record in records) == keys
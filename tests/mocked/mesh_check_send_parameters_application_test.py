@@ -28,8 +28,10 @@ def test_mesh_check_send_parameters_happy_path_chunked(
             "key": "X26ABC2/outbound/testfile.json",
             "chunked": True,
             "chunk_number": 1,
-            "total_chunks": 4,
+            # 33 bytes in 3 chunks of 11, rather than 3 of 10 and one of 3
+            "total_chunks": 3,
             "chunk_size": 10,
+            "crumb_size": 10,
             "message_id": None,
             "current_byte_position": 0,
             "send_params": {
@@ -49,7 +51,8 @@ def test_mesh_check_send_parameters_happy_path_chunked(
                 "s3_key": "X26ABC2/outbound/testfile.json",
                 "sender": "X26ABC2",
                 "subject": "Custom Subject",
-                "total_chunks": 4,
+                "total_chunks": 3,
+                "chunk_size": 10,
                 "workflow_id": "TESTWORKFLOW",
             },
         },
@@ -109,6 +112,7 @@ def test_mesh_check_send_parameters_happy_path_unchunked(
             "chunk_number": 1,
             "total_chunks": 1,
             "chunk_size": sys.maxsize,
+            "crumb_size": sys.maxsize,
             "message_id": None,
             "current_byte_position": 0,
             "send_params": {
@@ -129,6 +133,7 @@ def test_mesh_check_send_parameters_happy_path_unchunked(
                 "sender": "X26ABC2",
                 "subject": "Custom Subject",
                 "total_chunks": 1,
+                "chunk_size": sys.maxsize,
                 "workflow_id": "TESTWORKFLOW",
             },
         },
@@ -251,6 +256,35 @@ def test_running_as_singleton(
     assert was_value_logged(logs.out, "MESHSEND0004a", "Log_Level", "INFO")
 
 
+def test_dispatched_send_parameters_are_passed_through(
+    mesh_s3_bucket: str,
+    environment: str,
+    send_message_sfn_arn: str,
+    capsys,
+):
+    from mesh_check_send_parameters_application import (
+        MeshCheckSendParametersApplication,
+    )
+
+    app = MeshCheckSendParametersApplication()
+    dispatched = app.main(event=sample_trigger_event(mesh_s3_bucket), context=CONTEXT)
+    assert dispatched["body"]["send_params"]
+
+    # the dispatcher prevents duplicate sends by execution name, so no singleton check
+    for _ in range(2):
+        stepfunctions().start_execution(
+            stateMachineArn=send_message_sfn_arn, input=json.dumps(dispatched)
+        )
+    capsys.readouterr()
+
+    response = app.main(event=dispatched, context=CONTEXT)
+    assert response == dispatched
+
+    logs = capsys.readouterr()
+    assert not was_value_logged(logs.out, "MESHSEND0003", "Log_Level", "ERROR")
+    assert not was_value_logged(logs.out, "MESHSEND0001", "Log_Level", "INFO")
+
+
 def sample_trigger_event(
     bucket: str, key: str = "X26ABC2/outbound/testfile.json"
 ) -> dict:
@@ -0,0 +1,79 @@
+from itertools import pairwise
+
+import pytest
+from shared.chunk_plan import MESH_MAX_CHUNK_SIZE, ChunkPlan, plan_chunks
+from shared.send_parameters import calculate_chunks
+
+MiB = 1024 * 1024
+
+
+@pytest.mark.parametrize(
+    ("size", "chunk_size", "expected_sizes"),
+    [
+        (0, 10, [0]),
+        (10, 10, [10]),
+        # just over, stretched rather than sending a one byte tail
+        (11, 10, [11]),
+        (12, 10, [6, 6]),
+        (33, 10, [11, 11, 11]),
+        (35, 10, [8, 9, 9, 9]),
+        (20 * MiB + 1, 20 * MiB, [20 * MiB + 1]),
+        (41 * MiB, 20 * MiB, [int(20.5 * MiB)] * 2),
+    ],
+)
+def test_plan_chunks(size: int, chunk_size: int, expected_sizes: list[int]):
+    plan = plan_chunks(size, chunk_size)
+    assert plan.sizes() == expected_sizes
+    assert plan.chunked == (len(expected_sizes) > 1)
+    assert calculate_chunks(size, chunk_size) == (plan.chunked, plan.chunks)
+
+    ranges = plan.ranges()
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == size
+    # contiguous
+    assert all(end == start for (_, end), (start, _) in pairwise(ranges))
+
+
+def test_plan_chunks_respects_the_mesh_chunk_limit():
+    plan = plan_chunks(MESH_MAX_CHUNK_SIZE + 1, MESH_MAX_CHUNK_SIZE)
+    assert plan.chunks == 2
+    assert max(plan.sizes()) <= MESH_MAX_CHUNK_SIZE
+
+    # configured beyond the limit
+    plan = plan_chunks(250 * MiB, 200 * MiB)
+    assert plan.chunks == 4
+    assert max(plan.sizes()) <= MESH_MAX_CHUNK_SIZE
+
+    # stretching is capped too
+    plan = plan_chunks(MESH_MAX_CHUNK_SIZE + MiB, MESH_MAX_CHUNK_SIZE - MiB)
+    assert plan.chunks == 2
+
+
+def test_plan_chunks_tolerance():
+    assert plan_chunks(11, 10, tolerance=0).sizes() == [5, 6]
+    assert plan_chunks(15, 10, tolerance=0.5).sizes() == [15]
+
+
+def test_byte_range():
+    plan = ChunkPlan(33, 4)
+    assert plan.byte_range(1) == (0, 8)
+    assert plan.byte_range(4) == (24, 33)
+    with pytest.raises(ValueError, match="chunk 5 is not one of 4 chunks"):
+        plan.byte_range(5)
+    with pytest.raises(ValueError, match="chunk 0 is not one of 4 chunks"):
+        plan.byte_range(0)
+
+
+@pytest.mark.parametrize(("size", "chunk_size"), [(33, 10), (31, 10), (100, 7)])
+def test_sends_planned_with_a_remainder_finish_within_their_chunks(
+    size: int, chunk_size: int
+):
+    # sends in flight when balancing was introduced resume from full chunks
+    chunks = -(-size // chunk_size)
+    plan = ChunkPlan(size, chunks)
+    for chunk_number in range(1, chunks + 1):
+        resumed_from = (chunk_number - 1) * chunk_size
+        _, end = plan.byte_range(chunk_number)
+        assert resumed_from < end
+        assert end - resumed_from <= chunk_size
+    assert end == size
@@ -0,0 +1,165 @@
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import TYPE_CHECKING, cast
+from unittest import mock
+
+import pytest
+from mesh_client import MeshClient
+from mypy_boto3_s3 import S3Client
+from shared.client_pool import MeshClientPool
+
+from .mesh_send_message_chunk_application_test import _sample_single_chunk_input_event
+from .mesh_testing_common import KNOWN_INTERNAL_ID1, reset_sandbox_mailbox
+
+if TYPE_CHECKING:
+    from shared.mesh import MeshClient as SharedMeshClient
+
+
+class _FakeClient:
+    def __init__(self, mailbox_id: str, password: str):
+        self.mailbox_id = mailbox_id
+        self.password = password
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _fake_client(mailbox_id: str, password: str) -> "SharedMeshClient":
+    return cast("SharedMeshClient", _FakeClient(mailbox_id, password))
+
+
+def _closed(client: "SharedMeshClient") -> bool:
+    return cast(_FakeClient, client).closed
+
+
+def test_pool_lends_a_client_to_one_borrower_at_a_time():
+    pool = MeshClientPool(_fake_client)
+
+    with (
+        pool.borrow("X26ABC1", "pwd") as first,
+        pool.borrow("X26ABC1", "pwd") as second,
+    ):
+        assert first is not second
+        assert not pool.idle("X26ABC1")
+
+    assert pool.idle("X26ABC1") == [second, first]
+
+    with (
+        pool.borrow("X26ABC1", "pwd") as reused,
+        pool.borrow("X26ABC2", "pwd") as other,
+    ):
+        assert reused is first
+        assert other not in (first, second)
+
+    # clients built with an old password are closed rather than reused
+    with pool.borrow("X26ABC1", "rotated") as rotated:
+        assert rotated not in (first, second)
+    assert _closed(first)
+    assert _closed(second)
+    assert pool.idle("X26ABC1") == [rotated]
+
+    with (
+        pytest.raises(ValueError, match="broken"),
+        pool.borrow("X26ABC1", "rotated") as failed,
+    ):
+        raise ValueError("broken")
+    assert failed is rotated
+    assert _closed(failed)
+    assert not pool.idle("X26ABC1")
+
+    pool.close()
+    assert _closed(other)
+    assert not pool.idle("X26ABC2")
+
+
+def test_app_close_closes_pooled_clients(environment: str):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    app = MeshFetchMessageChunkApplication()
+    app.clients.add("X26ABC1", "pwd", _fake_client("X26ABC1", "pwd"))
+    (client,) = app.clients.idle("X26ABC1")
+
+    with mock.patch("shared.application.atexit.unregister") as unregister:
+        app.close()
+
+    assert _closed(client)
+    assert not app.clients.idle("X26ABC1")
+    # closed now, rather than again as the interpreter exits
+    unregister.assert_called_once_with(app.close)
+
+
+def test_concurrent_fetches_in_one_invocation(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    contents = {
+        mesh_client_two.send_message(
+            recipient=mesh_client_one._mailbox,
+            data=f"message {i}".encode() * 100,
+            workflow_id="TESTWORKFLOW",
+        ): f"message {i}".encode()
+        * 100
+        for i in range(4)
+    }
+
+    app = MeshFetchMessageChunkApplication()
+    events = [
+        {
+            "statusCode": HTTPStatus.OK.value,
+            "headers": {"Content-Type": "application/json"},
+            "body": {
+                "complete": False,
+                "internal_id": KNOWN_INTERNAL_ID1,
+                "message_id": message_id,
+                "dest_mailbox": mesh_client_one._mailbox,
+            },
+        }
+        for message_id in contents
+    ]
+    with ThreadPoolExecutor(max_workers=len(events)) as executor:
+        responses = list(
+            executor.map(lambda event: app.fetch(app.new_context(event)), events)
+        )
+
+    for message_id, response in zip(contents, responses, strict=True):
+        body = response["body"]
+        assert body["complete"] is True
+        assert message_id in body["s3_key"]
+        s3_object = s3_client.get_object(Bucket=body["s3_bucket"], Key=body["s3_key"])
+        assert s3_object["Body"].read() == contents[message_id]
+
+    assert not mesh_client_one.list_messages()
+    # each concurrent fetch borrowed its own client, all returned to the pool
+    assert 1 <= len(app.clients.idle(mesh_client_one._mailbox)) <= len(events)
+
+
+def test_concurrent_sends_in_one_invocation(
+    environment: str,
+    mesh_s3_bucket: str,
+    mesh_client_one: MeshClient,
+):
+    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+
+    app = MeshSendMessageChunkApplication()
+    events = [_sample_single_chunk_input_event(mesh_s3_bucket) for _ in range(3)]
+    with ThreadPoolExecutor(max_workers=len(events)) as executor:
+        responses = list(
+            executor.map(lambda event: app.send(app.new_context(event)), events)
+        )
+
+    message_ids = {response["body"]["message_id"] for response in responses}
+    assert len(message_ids) == len(events)
+    assert all(response["body"]["complete"] is True for response in responses)
+    assert all(
+        response["body"]["current_byte_position"] == 33 for response in responses
+    )
+    assert set(mesh_client_one.list_messages()) == message_ids
@@ -2,11 +2,13 @@
 
 import re
 from collections.abc import Generator
+from unittest import mock
 from uuid import uuid4
 
 import pytest
 from nhs_aws_helpers import secrets_client, ssm_client
-from shared.common import get_params, strtobool
+from shared.common import get_params, inbound_s3_key, strtobool
+from shared.config import EnvConfig
 
 
 def find_log_entries(logs: str, log_reference) -> Generator[dict[str, str], None, None]:
@@ -123,3 +125,42 @@ def test_strtobool_exception_raised(input_val):
 @pytest.mark.parametrize("input_val", ["HELLO", True, [], "YESH", 3, None])
 def test_strtobool_exception_swallowed(input_val):
     assert strtobool(input_val, False) is None
+
+
+def test_env_config_flags():
+    with mock.patch.dict("os.environ", {"VERIFY_SSL": "No", "NEVER_COMPRESS": "Y"}):
+        config = EnvConfig()
+    assert config.verify_ssl is False
+    assert config.never_compress is True
+
+    # as accepted by the powertools strtobool the flags were parsed with
+    with mock.patch.dict("os.environ", {"VERIFY_SSL": "Off", "NEVER_COMPRESS": "on"}):
+        config = EnvConfig()
+    assert config.verify_ssl is False
+    assert config.never_compress is True
+
+
+def test_env_config_rejects_invalid_flag():
+    with mock.patch.dict("os.environ", {"VERIFY_SSL": "maybe"}), pytest.raises(
+        ValueError, match="Expected"
+    ):
+        EnvConfig()
+
+
+@pytest.mark.parametrize(
+    ("scheme", "message_id", "expected"),
+    [
+        ("mailbox", "20220610195418651944_2202CC", "inbound/X26ABC1/a.dat"),
+        ("date", "20220610195418651944_2202CC", "inbound/X26ABC1/2022/06/10/a.dat"),
+        ("hash", "20220610195418651944_2202CC", "inbound/X26ABC1/e5/a.dat"),
+        # not a mesh generated message id, falls back to hash
+        ("date", "C9309D514E894162A7587C46DE51F967", "inbound/X26ABC1/18/a.dat"),
+    ],
+)
+def test_inbound_s3_key(scheme: str, message_id: str, expected: str):
+    assert inbound_s3_key("inbound/X26ABC1", "a.dat", message_id, scheme) == expected
+
+
+def test_inbound_s3_key_unknown_scheme():
+    with pytest.raises(ValueError, match="unknown inbound key scheme"):
+        inbound_s3_key("inbound/X26ABC1", "a.dat", uuid4().hex, "unknown")
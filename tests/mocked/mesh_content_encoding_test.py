@@ -0,0 +1,124 @@
+import gzip
+from io import BytesIO
+
+import pytest
+from mesh_client import MeshClient
+from mypy_boto3_s3 import S3Client
+from requests import Response
+from shared.content_encoding import DecodedContent
+from urllib3 import HTTPResponse
+
+from .mesh_fetch_message_chunk_application_test import _fetch_all_chunks
+from .mesh_testing_common import MB, reset_sandbox_mailbox
+
+
+def _response(body: bytes, headers: dict[str, str]) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.headers.update(headers)
+    response.raw = HTTPResponse(
+        body=BytesIO(body), headers=headers, preload_content=False
+    )
+    return response
+
+
+def test_gzip_content_is_decompressed_a_crumb_at_a_time():
+    content = b"0" * (64 * MB)
+    compressed = gzip.compress(content)
+    crumb_size = MB
+
+    decoded = DecodedContent(
+        _response(compressed, {"Content-Encoding": "gzip"}), crumb_size
+    )
+    crumbs = list(decoded)
+
+    # a single compressed read holds far more than a crumb once decompressed
+    assert len(compressed) < crumb_size
+    assert max(len(crumb) for crumb in crumbs) <= crumb_size
+    assert b"".join(crumbs) == content
+    assert decoded.compressed
+    assert decoded.wire_bytes == len(compressed)
+    assert decoded.content_bytes == len(content)
+
+
+def test_concatenated_gzip_members():
+    members = [b"first " * 1000, b"second " * 1000]
+    compressed = b"".join(gzip.compress(member) for member in members)
+
+    decoded = DecodedContent(_response(compressed, {"Content-Encoding": "GZIP"}), 1000)
+    assert b"".join(decoded) == b"".join(members)
+
+
+def test_unencoded_content_is_passed_through():
+    content = b"plain text" * 100
+    decoded = DecodedContent(_response(content, {}), 64)
+    crumbs = list(decoded)
+
+    assert not decoded.compressed
+    assert b"".join(crumbs) == content
+    assert max(len(crumb) for crumb in crumbs) <= 64
+    assert decoded.wire_bytes == decoded.content_bytes == len(content)
+
+
+@pytest.mark.parametrize(
+    ("transparent_compress", "never_compress", "expected"),
+    [(False, False, None), (True, False, True), (True, True, False)],
+)
+def test_transparent_compress_send_parameters(
+    environment: str,
+    mesh_s3_bucket: str,
+    transparent_compress: bool,
+    never_compress: bool,
+    expected: bool | None,
+):
+    from nhs_aws_helpers import s3_resource
+    from shared.config import EnvConfig
+    from shared.send_parameters import get_send_parameters
+
+    config = EnvConfig()
+    config.transparent_compress = transparent_compress
+    config.never_compress = never_compress
+    s3_object = s3_resource().Object(mesh_s3_bucket, "X26ABC2/outbound/testfile.json")
+
+    # smaller than the compress threshold, so only compressed when transparent
+    assert s3_object.content_length < config.compress_threshold
+    send_params = get_send_parameters(s3_object, config)
+    assert send_params.compress is expected
+
+
+# 4 MiB chunks are coalesced into 5 MiB s3 parts
+@pytest.mark.parametrize("max_chunk_size", [10 * MB, 4 * MB])
+def test_fetch_gzip_encoded_message(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    max_chunk_size: int,
+    capsys,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    content = b"id,name,value\n" + b"1234,some text,56.78\n" * (400 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=content,
+        compress=True,
+        max_chunk_size=max_chunk_size,
+        workflow_id="TESTWORKFLOW",
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.crumb_size = 256 * 1024
+    response = _fetch_all_chunks(app, message_id)
+
+    body = response["body"]
+    assert body["complete"] is True
+    s3_object = s3_client.get_object(Bucket=body["s3_bucket"], Key=body["s3_key"])
+    assert s3_object["Body"].read() == content
+    # stored decompressed
+    assert not s3_object.get("ContentEncoding")
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHFETCH0017 " in logs.out
@@ -0,0 +1,269 @@
+import json
+import os
+from time import perf_counter
+from typing import Any
+from unittest import mock
+
+from mypy_boto3_s3 import S3Client
+from nhs_aws_helpers import sqs_client, stepfunctions
+
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import CONTEXT
+
+
+def _queue_events(environment: str, events: list[dict[str, Any]]) -> dict[str, Any]:
+    """send the events via an sqs queue and receive them as the lambda event source would"""
+    sqs = sqs_client()
+    queue_url = sqs.create_queue(QueueName=f"{environment}-send-message")["QueueUrl"]
+    for event in events:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(event))
+
+    records: list[dict[str, Any]] = []
+    while len(records) < len(events):
+        received = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)
+        records.extend(
+            {
+                "messageId": message["MessageId"],
+                "receiptHandle": message["ReceiptHandle"],
+                "body": message["Body"],
+                "eventSource": "aws:sqs",
+            }
+            for message in received["Messages"]
+        )
+    return {"Records": records}
+
+
+def _put_outbound_files(
+    s3_client: S3Client, bucket: str, count: int, folder: str = "X26ABC2/outbound"
+) -> list[str]:
+    keys = [f"{folder}/file{i}.dat" for i in range(count)]
+    for key in keys:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=b"hello")
+    return keys
+
+
+def _started_inputs(send_message_sfn_arn: str) -> list[dict[str, Any]]:
+    sfn = stepfunctions()
+    return [
+        json.loads(
+            sfn.describe_execution(executionArn=execution["executionArn"])["input"]
+        )
+        for execution in sfn.list_executions(stateMachineArn=send_message_sfn_arn)[
+            "executions"
+        ]
+    ]
+
+
+def test_dispatch_starts_deduplicated_sends(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+):
+    from mesh_dispatch_send_messages_application import (
+        MeshDispatchSendMessagesApplication,
+    )
+
+    keys = _put_outbound_files(s3_client, mesh_s3_bucket, 5)
+    # the first file has three events queued
+    events = [
+        sample_trigger_event(mesh_s3_bucket, key) for key in [*keys, *keys[:1] * 2]
+    ]
+
+    app = MeshDispatchSendMessagesApplication()
+    response = app.main(event=_queue_events(environment, events), context=CONTEXT)
+
+    assert response == {"batchItemFailures": []}
+
+    started = _started_inputs(send_message_sfn_arn)
+    assert sorted(
+        sf_input["body"]["send_params"]["s3_key"] for sf_input in started
+    ) == sorted(keys)
+    for sf_input in started:
+        body = sf_input["body"]
+        assert sf_input["statusCode"] == 200
+        assert body["src_mailbox"] == "X26ABC2"
+        assert body["dest_mailbox"] == "X26ABC1"
+        assert body["workflow_id"] == "TESTWORKFLOW"
+        assert body["chunk_number"] == 1
+        assert body["send_params"]["file_size"] == 5
+        assert body["message_id"] is None
+
+
+def test_dispatch_resolves_mappings_once(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+):
+    from mesh_dispatch_send_messages_application import (
+        MeshDispatchSendMessagesApplication,
+    )
+
+    keys = _put_outbound_files(s3_client, mesh_s3_bucket, 10)
+    app = MeshDispatchSendMessagesApplication()
+
+    with mock.patch.object(
+        app.ssm, "get_parameters_by_path", wraps=app.ssm.get_parameters_by_path
+    ) as get_parameters_by_path:
+        response = app.main(
+            event=_queue_events(
+                environment,
+                [sample_trigger_event(mesh_s3_bucket, key) for key in keys],
+            ),
+            context=CONTEXT,
+        )
+
+    assert response == {"batchItemFailures": []}
+    assert len(_started_inputs(send_message_sfn_arn)) == len(keys)
+    # the mapping index is loaded once for the whole batch
+    assert get_parameters_by_path.call_count == 1
+
+
+def test_dispatch_discards_started_and_retries_failed_sends(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+    capsys,
+):
+    from mesh_dispatch_send_messages_application import (
+        MeshDispatchSendMessagesApplication,
+    )
+
+    started_key, new_key = _put_outbound_files(s3_client, mesh_s3_bucket, 2)
+    (unmapped_key,) = _put_outbound_files(s3_client, mesh_s3_bucket, 1, "unmapped")
+
+    app = MeshDispatchSendMessagesApplication()
+    app.main(
+        event=_queue_events(
+            environment, [sample_trigger_event(mesh_s3_bucket, started_key)]
+        ),
+        context=CONTEXT,
+    )
+
+    event = _queue_events(
+        environment,
+        [
+            sample_trigger_event(mesh_s3_bucket, key)
+            for key in (started_key, new_key, unmapped_key)
+        ]
+        + [{"not": "an s3 event"}],
+    )
+    message_ids = {
+        json.loads(record["body"])
+        .get("detail", {})
+        .get("requestParameters", {})
+        .get("key"): record["messageId"]
+        for record in event["Records"]
+    }
+
+    with mock.patch.object(
+        app.sfn, "describe_execution", wraps=app.sfn.describe_execution
+    ) as describe_execution:
+        response = app.main(event=event, context=CONTEXT)
+
+    # running sends are found by name, not by describing every execution
+    describe_execution.assert_not_called()
+
+    # the unparseable message and the repeated event are dropped, the unmapped file is retried
+    assert [failure["itemIdentifier"] for failure in response["batchItemFailures"]] == [
+        message_ids[unmapped_key]
+    ]
+
+    started_keys = [
+        sf_input["body"]["send_params"]["s3_key"]
+        for sf_input in _started_inputs(send_message_sfn_arn)
+    ]
+    assert sorted(started_keys) == sorted([started_key, new_key])
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHDISPATCH0003 " in logs.out
+
+
+def test_dispatch_names_executions_by_object_version(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+):
+    from mesh_dispatch_send_messages_application import (
+        MeshDispatchSendMessagesApplication,
+        send_execution_name,
+    )
+
+    s3_client.put_bucket_versioning(
+        Bucket=mesh_s3_bucket, VersioningConfiguration={"Status": "Enabled"}
+    )
+    (key,) = _put_outbound_files(s3_client, mesh_s3_bucket, 1)
+    trigger = sample_trigger_event(mesh_s3_bucket, key)
+
+    app = MeshDispatchSendMessagesApplication()
+    app.main(event=_queue_events(environment, [trigger]), context=CONTEXT)
+
+    # re-uploaded, so a new send
+    (key,) = _put_outbound_files(s3_client, mesh_s3_bucket, 1)
+    app.main(event=_queue_events(environment, [trigger]), context=CONTEXT)
+
+    versions = s3_client.list_object_versions(Bucket=mesh_s3_bucket, Prefix=key)
+    executions = stepfunctions().list_executions(stateMachineArn=send_message_sfn_arn)
+    assert sorted(
+        execution["name"] for execution in executions["executions"]
+    ) == sorted(
+        send_execution_name(mesh_s3_bucket, key, version["VersionId"])
+        for version in versions["Versions"]
+    )
+    assert all(len(execution["name"]) <= 80 for execution in executions["executions"])
+
+
+def test_dispatch_redelivered_message_starts_once(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+):
+    from mesh_dispatch_send_messages_application import (
+        MeshDispatchSendMessagesApplication,
+    )
+
+    (key,) = _put_outbound_files(s3_client, mesh_s3_bucket, 1)
+    event = _queue_events(environment, [sample_trigger_event(mesh_s3_bucket, key)])
+
+    app = MeshDispatchSendMessagesApplication()
+    app.main(event=event, context=CONTEXT)
+
+    # complete the send, the name still prevents a second send
+    sfn = stepfunctions()
+    for execution in sfn.list_executions(stateMachineArn=send_message_sfn_arn)[
+        "executions"
+    ]:
+        sfn.stop_execution(executionArn=execution["executionArn"])
+
+    response = app.main(event=event, context=CONTEXT)
+    assert response == {"batchItemFailures": []}
+    assert len(_started_inputs(send_message_sfn_arn)) == 1
+
+
+def test_dispatch_limits_start_rate(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+):
+    from mesh_dispatch_send_messages_application import (
+        MeshDispatchSendMessagesApplication,
+    )
+
+    keys = _put_outbound_files(s3_client, mesh_s3_bucket, 4)
+    event = _queue_events(
+        environment, [sample_trigger_event(mesh_s3_bucket, key) for key in keys]
+    )
+
+    with mock.patch.dict(os.environ, {"DISPATCH_MAX_STARTS_PER_SECOND": "10"}):
+        app = MeshDispatchSendMessagesApplication()
+
+    started = perf_counter()
+    app.main(event=event, context=CONTEXT)
+
+    assert perf_counter() - started >= (len(keys) - 1) / 10
+    assert len(_started_inputs(send_message_sfn_arn)) == len(keys)
@@ -0,0 +1,152 @@
+import random
+
+import pytest
+from mesh_drain_simulator import (
+    SimulationConfig,
+    Workload,
+    calibrate,
+    parse_size,
+    parse_size_distribution,
+    sample_sizes,
+    simulate,
+)
+
+MiB = 1024 * 1024
+
+
+def test_parse_sizes():
+    assert parse_size("1024") == 1024
+    assert parse_size("100KiB") == 100 * 1024
+    assert parse_size("1.5 MB") == 1_500_000
+    with pytest.raises(ValueError, match="invalid size"):
+        parse_size("10 parsecs")
+
+    distribution = parse_size_distribution("100KiB:90,50MiB:10,1GiB")
+    assert distribution == [(100 * 1024, 90.0), (50 * MiB, 10.0), (1024 * MiB, 1.0)]
+
+    sizes = sample_sizes(distribution, 1000, random.Random(1))
+    assert len(sizes) == 1000
+    assert set(sizes) <= {100 * 1024, 50 * MiB, 1024 * MiB}
+
+
+def test_state_transitions_match_the_definitions():
+    # as counted by the local state machine, see mesh_state_machine_test
+    send = simulate(SimulationConfig(), Workload(outbound_sizes=[33]))
+    assert send.state_transitions == 6
+    assert send.invocations == {"check_send_parameters": 1, "send_message_chunk": 1}
+
+    get = simulate(SimulationConfig(), Workload(inbound_sizes=[7, 7, 33]))
+    assert get.state_transitions == 14
+    assert get.invocations == {"poll_mailbox": 1, "fetch_message_chunk": 3}
+
+    chunked = simulate(SimulationConfig(chunk_size=10), Workload(outbound_sizes=[35]))
+    assert chunked.invocations["send_message_chunk"] == 4
+    assert chunked.state_transitions == 4 + 2 * 4
+
+
+@pytest.mark.parametrize(
+    ("map_concurrency", "expected_drain_seconds"), [(1, 13.0), (2, 9.0)]
+)
+def test_page_limit_and_map_concurrency(
+    map_concurrency: int, expected_drain_seconds: float
+):
+    config = SimulationConfig(
+        page_limit=2,
+        map_concurrency=map_concurrency,
+        poll_seconds=1,
+        fetch_overhead_seconds=2,
+        transition_seconds=0,
+    )
+    result = simulate(config, Workload(inbound_sizes=[0] * 5))
+
+    # pages of 2, 2 then 1, the last page is not full so the execution completes
+    assert result.invocations == {"poll_mailbox": 3, "fetch_message_chunk": 5}
+    assert result.executions == {"get_messages": 1}
+    assert result.drain_seconds == expected_drain_seconds
+
+
+def test_scheduled_executions_while_draining():
+    config = SimulationConfig(
+        poll_interval_seconds=10, fetch_overhead_seconds=1, transition_seconds=0
+    )
+    result = simulate(config, Workload(inbound_sizes=[0] * 25))
+
+    # one execution drains the mailbox, the two scheduled while it runs fail the singleton check
+    assert result.executions == {"get_messages": 3}
+    assert result.invocations["poll_mailbox"] == 3
+    assert result.inbound_latency_seconds
+    assert result.inbound_latency_seconds["max"] == result.drain_seconds
+
+
+def test_arrivals_wait_for_the_schedule():
+    config = SimulationConfig(poll_interval_seconds=60, transition_seconds=0)
+    result = simulate(config, Workload(inbound_arrivals=[(1.0, 0), (70.0, 0)]))
+
+    assert result.inbound_messages == 2
+    # the execution at 0 seconds finds the mailbox empty, the messages are fetched by the
+    # executions scheduled at 60 and 120 seconds
+    assert result.executions == {"get_messages": 3}
+    assert result.drain_seconds == pytest.approx(120 + 0.5 + 0.3)
+
+
+def test_lambda_concurrency_and_bandwidth_limits():
+    workload = Workload(outbound_sizes=[10 * MiB] * 10)
+    unlimited = simulate(SimulationConfig(), workload)
+    assert unlimited.peak_concurrency == 10
+    assert not unlimited.throttled_invocations
+
+    capped = simulate(SimulationConfig(lambda_concurrency=2), workload)
+    assert capped.peak_concurrency == 2
+    assert capped.throttled_invocations
+    assert capped.drain_seconds > unlimited.drain_seconds
+
+    shared = simulate(
+        SimulationConfig(mesh_bandwidth_bytes_per_second=20 * MiB), workload
+    )
+    assert shared.drain_seconds > unlimited.drain_seconds
+    assert shared.lambda_gb_seconds > unlimited.lambda_gb_seconds
+
+
+def test_cost():
+    config = SimulationConfig(
+        send_memory_mb=1024,
+        check_memory_mb=1024,
+        check_seconds=1,
+        send_overhead_seconds=1,
+        send_bytes_per_second=MiB,
+    )
+    result = simulate(config, Workload(outbound_sizes=[MiB]))
+
+    assert result.lambda_gb_seconds == 3.0
+    assert result.cost["lambda"] == pytest.approx(
+        3 * config.lambda_gb_second_price + 2 * config.lambda_request_price, abs=1e-6
+    )
+    assert result.cost["step_functions"] == pytest.approx(
+        6 * config.state_transition_price
+    )
+
+
+def test_calibrate():
+    analysis = {
+        "percentiles": {
+            "invocation_seconds[env-mesh-poll-mailbox]": {"p50": 0.75},
+            "invocation_seconds[env-mesh-check-send-parameters]": {"p50": 0.25},
+        },
+        "chunks": [
+            # 0.5 seconds overhead, 2 MiB/s
+            {"direction": "fetch", "num_bytes": 0, "seconds": 0.5},
+            {"direction": "fetch", "num_bytes": 2 * MiB, "seconds": 1.5},
+            {"direction": "fetch", "num_bytes": 8 * MiB, "seconds": 4.5},
+            # all alike, the overhead is kept
+            {"direction": "send", "num_bytes": 3 * MiB, "seconds": 1.3},
+            {"direction": "send", "num_bytes": 3 * MiB, "seconds": 1.3},
+        ],
+    }
+    config = calibrate(SimulationConfig(send_overhead_seconds=0.3), analysis)
+
+    assert config.poll_seconds == 0.75
+    assert config.check_seconds == 0.25
+    assert config.fetch_overhead_seconds == pytest.approx(0.5)
+    assert config.fetch_bytes_per_second == pytest.approx(2 * MiB)
+    assert config.send_overhead_seconds == 0.3
+    assert config.send_bytes_per_second == pytest.approx(3 * MiB)
@@ -260,6 +260,159 @@ def test_mesh_fetch_file_chunk_app_2_chunks_using_temp_file(
     assert was_value_logged(logs.out, "LAMBDA0003", "Log_Level", "INFO")
 
 
+def _fetch_all_chunks(app, message_id: str) -> dict:
+    response: dict = app.main(
+        event=_sample_first_input_event(
+            internal_id=KNOWN_INTERNAL_ID1, message_id=message_id
+        ),
+        context=CONTEXT,
+    )
+    while not response["body"]["complete"]:
+        response = app.main(event=response, context=CONTEXT)
+    return response
+
+
+def test_mesh_fetch_file_chunk_app_coalesces_small_chunks_into_one_part(
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    mesh_s3_bucket: str,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    # chunks smaller than the minimum s3 part are buffered together into a single part
+    data = random.randbytes(6 * 1024 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=data,
+        max_chunk_size=2 * 1024 * 1024,
+        workflow_id=uuid4().hex,
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.fetch_part_size = 0
+
+    response = _fetch_all_chunks(app, message_id)
+
+    assert response["statusCode"] == HTTPStatus.OK.value
+    assert response["body"]["chunk_num"] == 3
+    assert len(response["body"]["aws_part_etags"]) == 1
+    s3_object = s3_client.get_object(
+        Bucket=response["body"]["s3_bucket"], Key=response["body"]["s3_key"]
+    )
+    assert s3_object["Body"].read() == data
+
+
+def test_mesh_fetch_file_chunk_app_splits_chunks_into_concurrent_parts(
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    mesh_s3_bucket: str,
+):
+    from mesh_fetch_message_chunk_application import (
+        AWS_MIN_MULTIPART_SIZE,
+        S3_MAX_PARTS,
+        MeshFetchMessageChunkApplication,
+    )
+
+    data = random.randbytes(36 * 1024 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=data,
+        max_chunk_size=18 * 1024 * 1024,
+        workflow_id=uuid4().hex,
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.fetch_part_size = AWS_MIN_MULTIPART_SIZE
+    app.config.fetch_upload_concurrency = 2
+
+    response = _fetch_all_chunks(app, message_id)
+
+    assert response["statusCode"] == HTTPStatus.OK.value
+    assert response["body"]["chunk_num"] == 2
+    parts = response["body"]["aws_part_etags"]
+    # each chunk is cut into several parts
+    assert len(parts) > 2
+    # numbered from the block of part numbers of each chunk
+    part_ids = [part["PartNumber"] for part in parts]
+    chunk_two_start = S3_MAX_PARTS // 2 + 1
+    chunk_one_ids = [part_id for part_id in part_ids if part_id < chunk_two_start]
+    chunk_two_ids = part_ids[len(chunk_one_ids) :]
+    assert chunk_one_ids == list(range(1, len(chunk_one_ids) + 1))
+    assert chunk_two_ids == list(
+        range(chunk_two_start, chunk_two_start + len(chunk_two_ids))
+    )
+
+    s3_object = s3_client.get_object(
+        Bucket=response["body"]["s3_bucket"], Key=response["body"]["s3_key"]
+    )
+    assert s3_object["Body"].read() == data
+
+
+def test_mesh_fetch_file_chunk_app_split_parts_within_part_limit(
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    mesh_s3_bucket: str,
+    monkeypatch,
+):
+    import mesh_fetch_message_chunk_application
+    from mesh_fetch_message_chunk_application import (
+        AWS_MIN_MULTIPART_SIZE,
+        MeshFetchMessageChunkApplication,
+    )
+
+    # only room for 2 parts per chunk
+    monkeypatch.setattr(mesh_fetch_message_chunk_application, "S3_MAX_PARTS", 4)
+
+    data = random.randbytes(36 * 1024 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=data,
+        max_chunk_size=18 * 1024 * 1024,
+        workflow_id=uuid4().hex,
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.fetch_part_size = AWS_MIN_MULTIPART_SIZE
+
+    response = _fetch_all_chunks(app, message_id)
+
+    assert len(response["body"]["aws_part_etags"]) == 4
+    s3_object = s3_client.get_object(
+        Bucket=response["body"]["s3_bucket"], Key=response["body"]["s3_key"]
+    )
+    assert s3_object["Body"].read() == data
+
+
+def test_mesh_fetch_file_chunk_app_hash_key_scheme(
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    mesh_s3_bucket: str,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+    from shared.common import inbound_key_partition
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.inbound_key_scheme = "hash"
+
+    # chunked, so the key is carried between invocations
+    data = random.randbytes(12 * 1024 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox, data=data, workflow_id=uuid4().hex
+    )
+
+    response = _fetch_all_chunks(app, message_id)
+
+    shard = inbound_key_partition("hash", message_id)
+    expected_key = f"inbound/{mesh_client_one._mailbox}/{shard}/{message_id}.dat"
+    assert response["body"]["s3_key"] == expected_key
+    s3_object = s3_client.get_object(Bucket=mesh_s3_bucket, Key=expected_key)
+    assert s3_object["Body"].read() == data
+
+
 def test_mesh_fetch_file_chunk_app_report(
     s3_client: S3Client,
     mesh_client_one: MeshClient,
@@ -342,3 +495,150 @@ def _sample_first_input_event(internal_id: str, message_id: str):
             "dest_mailbox": "X26ABC1",
         },
     }
+
+
+def _multipart_uploads(s3_client: S3Client, bucket: str) -> list:
+    return s3_client.list_multipart_uploads(Bucket=bucket).get("Uploads", [])
+
+
+def test_mesh_fetch_file_chunk_app_resumes_multipart_upload(
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    mesh_s3_bucket: str,
+    capsys,
+):
+    from mesh_fetch_message_chunk_application import (
+        S3_MAX_PARTS,
+        MeshFetchMessageChunkApplication,
+    )
+
+    data = random.randbytes(16 * 1024 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=data,
+        max_chunk_size=6 * 1024 * 1024,
+        workflow_id=uuid4().hex,
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    response = app.main(
+        event=_sample_first_input_event(
+            internal_id=KNOWN_INTERNAL_ID1, message_id=message_id
+        ),
+        context=CONTEXT,
+    )
+    response = app.main(event=response, context=CONTEXT)
+    assert response["body"]["chunk_num"] == 3
+    upload_id = response["body"]["aws_upload_id"]
+    capsys.readouterr()
+
+    # the execution fails, the retry starts again from the first chunk
+    retried = MeshFetchMessageChunkApplication()
+    # moto reports every multipart upload as initiated in 2010
+    retried.config.fetch_abandoned_upload_seconds = 20 * 365 * 24 * 3600
+    response = retried.main(
+        event=_sample_first_input_event(
+            internal_id=KNOWN_INTERNAL_ID1, message_id=message_id
+        ),
+        context=CONTEXT,
+    )
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHFETCH0015 " in logs.out
+    assert "logReference=MESHFETCH0005a " not in logs.out
+    assert response["body"]["aws_upload_id"] == upload_id
+    # the first chunk's part is kept, the last chunk uploaded is fetched again
+    # as that invocation may not have completed
+    assert response["body"]["chunk_num"] == 3
+    assert [part["PartNumber"] for part in response["body"]["aws_part_etags"]] == [
+        1,
+        S3_MAX_PARTS // 3 + 1,
+    ]
+
+    response = retried.main(event=response, context=CONTEXT)
+    assert response["body"]["complete"] is True
+
+    s3_object = s3_client.get_object(
+        Bucket=response["body"]["s3_bucket"], Key=response["body"]["s3_key"]
+    )
+    assert s3_object["Body"].read() == data
+    assert not _multipart_uploads(s3_client, mesh_s3_bucket)
+
+
+def test_mesh_fetch_file_chunk_app_aborts_abandoned_upload(
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    mesh_s3_bucket: str,
+    capsys,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    data = random.randbytes(12 * 1024 * 1024)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox, data=data, workflow_id=uuid4().hex
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    response = app.main(
+        event=_sample_first_input_event(
+            internal_id=KNOWN_INTERNAL_ID1, message_id=message_id
+        ),
+        context=CONTEXT,
+    )
+    abandoned_upload_id = response["body"]["aws_upload_id"]
+
+    retried = MeshFetchMessageChunkApplication()
+    retried.config.fetch_abandoned_upload_seconds = 0
+    response = _fetch_all_chunks(retried, message_id)
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHFETCH0014 " in logs.out
+    assert "logReference=MESHFETCH0015 " not in logs.out
+    assert response["body"]["aws_upload_id"] != abandoned_upload_id
+
+    s3_object = s3_client.get_object(
+        Bucket=response["body"]["s3_bucket"], Key=response["body"]["s3_key"]
+    )
+    assert s3_object["Body"].read() == data
+    assert not _multipart_uploads(s3_client, mesh_s3_bucket)
+
+
+@pytest.mark.parametrize(
+    ("part_ids", "expected_chunk", "expected_parts"),
+    [
+        ([], 1, []),
+        # only the last invocation's parts, which may be incomplete
+        ([1, 2], 1, []),
+        ([1, 2, 2501, 5001], 3, [1, 2, 2501]),
+        # a part missing from the second invocation
+        ([1, 2, 2501, 2503, 5001], 2, [1, 2]),
+        # the first invocation's parts are missing
+        ([2501, 5001], 1, []),
+    ],
+)
+def test_reconcile_parts(
+    environment: str,
+    part_ids: list[int],
+    expected_chunk: int,
+    expected_parts: list[int],
+):
+    from mesh_fetch_message_chunk_application import (
+        FetchContext,
+        MeshFetchMessageChunkApplication,
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    # 2500 part numbers for each chunk
+    ctx = FetchContext(
+        message_id="MESSAGE1", mailbox_id="X26ABC1", response={}, number_of_chunks=4
+    )
+
+    resume_chunk, parts = app._reconcile_parts(
+        ctx, [{"PartNumber": part_id, "ETag": f'"{part_id}"'} for part_id in part_ids]
+    )
+
+    assert resume_chunk == expected_chunk
+    assert [part["PartNumber"] for part in parts] == expected_parts
+    assert all(part["ETag"] == f'"{part["PartNumber"]}"' for part in parts)
@@ -1,6 +1,7 @@
 """ Testing Get File From S3 Function """
 
 from nhs_aws_helpers import s3_resource
+from shared.send_parameters import SendParameters
 
 FILE_CONTENT = "123456789012345678901234567890123"
 FILE_SIZE = len(FILE_CONTENT)
@@ -13,18 +14,31 @@ def test_get_file_from_s3_with_parts(environment: str, mesh_s3_bucket: str):
     """
     Test _get_file_from_s3 getting an uncompressed large file
     """
-    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+    from mesh_send_message_chunk_application import (
+        MeshSendMessageChunkApplication,
+        SendContext,
+    )
 
     app = MeshSendMessageChunkApplication()
 
-    app.current_byte = 0
+    ctx = SendContext(
+        response={},
+        current_byte=0,
+        send_params=SendParameters(
+            s3_bucket=mesh_s3_bucket,
+            s3_key="X26ABC2/outbound/testfile.json",
+            sender="X26ABC2",
+            recipient="X26ABC1",
+            file_size=FILE_SIZE,
+        ),
+    )
 
-    app.s3_object = s3_resource().Object(
+    ctx.s3_object = s3_resource().Object(
         mesh_s3_bucket, "X26ABC2/outbound/testfile.json"
     )
-    app.config.crumb_size = 7
-    app.config.chunk_size = app.s3_object.content_length * 2
-    gen = app._get_chunk_from_s3()
+    ctx.crumb_size = 7
+    ctx.chunk_size = ctx.s3_object.content_length * 2
+    gen = app._get_chunk_from_s3(ctx)
     assert next(gen) == b"1234567"
     assert next(gen) == b"8901234"
     assert next(gen) == b"5678901"
@@ -36,17 +50,30 @@ def test_get_file_from_s3_without_parts(environment: str, mesh_s3_bucket: str):
     """
     Test _get_file_from_s3 getting an uncompressed small file
     """
-    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+    from mesh_send_message_chunk_application import (
+        MeshSendMessageChunkApplication,
+        SendContext,
+    )
 
     app = MeshSendMessageChunkApplication()
 
-    app.current_byte = 0
+    ctx = SendContext(
+        response={},
+        current_byte=0,
+        send_params=SendParameters(
+            s3_bucket=mesh_s3_bucket,
+            s3_key="X26ABC2/outbound/testfile.json",
+            sender="X26ABC2",
+            recipient="X26ABC1",
+            file_size=FILE_SIZE,
+        ),
+    )
 
-    app.s3_object = s3_resource().Object(
+    ctx.s3_object = s3_resource().Object(
         mesh_s3_bucket, "X26ABC2/outbound/testfile.json"
     )
-    app.config.crumb_size = app.s3_object.content_length + 1
-    app.config.chunk_size = app.s3_object.content_length * 2
-    gen = app._get_chunk_from_s3()
+    ctx.crumb_size = ctx.s3_object.content_length + 1
+    ctx.chunk_size = ctx.s3_object.content_length * 2
+    gen = app._get_chunk_from_s3(ctx)
     all_33_bytes = next(gen)
     assert all_33_bytes == b"123456789012345678901234567890123"
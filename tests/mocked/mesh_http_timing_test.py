@@ -0,0 +1,105 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+from mesh_client import MeshClient as _MeshClient
+from shared.http_timing import HttpTiming, mesh_endpoint
+from shared.mesh import MeshClient
+
+from .mesh_testing_common import CONTEXT, SANDBOX_URL
+
+_MAILBOX_URL = "https://localhost:8700/messageexchange/X26ABC1"
+
+
+@pytest.mark.parametrize(
+    ("method", "url", "expected"),
+    [
+        ("GET", _MAILBOX_URL, "handshake"),
+        ("POST", f"{_MAILBOX_URL}/outbox", "send_chunk"),
+        ("POST", f"{_MAILBOX_URL}/outbox/MSG1/2", "send_chunk"),
+        ("GET", f"{_MAILBOX_URL}/inbox?max_results=10", "list"),
+        ("GET", f"{_MAILBOX_URL}/inbox/MSG1", "retrieve_chunk"),
+        ("GET", f"{_MAILBOX_URL}/inbox/MSG1/3", "retrieve_chunk"),
+        ("PUT", f"{_MAILBOX_URL}/inbox/MSG1/status/acknowledged", "ack"),
+        ("POST", f"{_MAILBOX_URL}/outbox/tracking", "other"),
+    ],
+)
+def test_mesh_endpoint(method: str, url: str, expected: str):
+    assert mesh_endpoint(method, url) == expected
+
+
+def test_mesh_client_reports_http_timings(mesh_client_one: _MeshClient):
+    timings: list[HttpTiming] = []
+    data = uuid4().bytes * 1000
+
+    with MeshClient(
+        url=SANDBOX_URL,
+        mailbox=mesh_client_one._mailbox,
+        password="pwd123456",
+        shared_key=b"TestKey",
+        verify=False,
+        on_timing=timings.append,
+    ) as client:
+        message_id = client.send_chunk(
+            recipient=mesh_client_one._mailbox,
+            chunk=data,
+            chunk_num=1,
+            total_chunks=1,
+            precompressed=False,
+            workflow_id="HTTP_TIMING_TEST",
+        ).json()["message_id"]
+        assert client.list_messages() == [message_id]
+
+        response = client.retrieve_message_chunk(message_id, 1)
+        # streamed, so not reported until the body is read
+        assert [timing.endpoint for timing in timings] == ["send_chunk", "list"]
+        assert response.raw.read(decode_content=True) == data
+
+        client.acknowledge_message(message_id)
+
+    assert [timing.endpoint for timing in timings] == [
+        "send_chunk",
+        "list",
+        "retrieve_chunk",
+        "ack",
+    ]
+    send_chunk, list_messages, retrieve_chunk, _ = timings
+
+    # the connection is made once, then reused
+    assert send_chunk.connections == 1
+    assert send_chunk.connect > 0
+    assert send_chunk.tls > 0
+    assert list_messages.connections == 0
+    assert list_messages.connect == list_messages.tls == 0
+
+    assert send_chunk.status == int(HTTPStatus.ACCEPTED)
+    assert send_chunk.bytes_sent > len(data)
+    assert send_chunk.send > 0
+    assert send_chunk.ttfb > 0
+
+    assert retrieve_chunk.status == int(HTTPStatus.OK)
+    assert retrieve_chunk.bytes_received > 0
+    assert retrieve_chunk.transfer > 0
+
+    log_args = retrieve_chunk.log_args()
+    assert log_args["endpoint"] == "retrieve_chunk"
+    assert log_args["ttfb_ms"] == round(retrieve_chunk.ttfb * 1000, 3)
+
+
+def test_application_records_http_timings(
+    mesh_client_one: _MeshClient, environment: str, get_messages_sfn_arn: str, capsys
+):
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    app.config.http_timing = True
+    app.config.emit_metrics = True
+    app.metrics.enabled = True
+
+    response = app.main(event={"mailbox": mesh_client_one._mailbox}, context=CONTEXT)
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHHTTP0001 " in logs.out
+    assert '"mesh_list_ttfb_duration"' in logs.out
+    assert '"mesh_list_transfer_bytes"' in logs.out
@@ -0,0 +1,56 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+_SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "src")
+
+# the handler imports are run on every cold start, ~0.3s at the time of writing
+IMPORT_TIME_BUDGET_SECONDS = 1.0
+
+# type stubs and clients which should only be imported once first used
+DEFERRED_IMPORTS = ("mypy_boto3", "nhs_aws_helpers", "mesh_client")
+
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """cumulative import time in microseconds of each module imported, in a fresh interpreter"""
+    env = {**os.environ, "PYTHONPATH": os.path.abspath(_SRC_DIR)}
+    env.pop("WARM_UP_ON_INIT", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "mesh_poll_mailbox_application",
+        "mesh_fetch_message_chunk_application",
+        "mesh_send_message_chunk_application",
+        "mesh_check_send_parameters_application",
+        "mesh_dispatch_send_messages_application",
+    ],
+)
+def test_handler_import_time(module: str):
+    times = _import_times(module)
+
+    deferred = sorted(
+        name for name in times if name.split(".")[0].startswith(DEFERRED_IMPORTS)
+    )
+    assert not deferred
+
+    assert times[module] / 1_000_000 < IMPORT_TIME_BUDGET_SECONDS
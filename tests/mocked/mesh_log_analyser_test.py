@@ -0,0 +1,232 @@
+import json
+
+from mesh_client import MeshClient
+from mesh_log_analyser import LogAnalyser, parse_log_line, percentile, percentile_row
+
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import reset_sandbox_mailbox
+
+MESSAGE_ID = "20240101000000000000_ABCDEF"
+
+
+def _line(time: str, stream: str, reference: str, text: str, internal_id="") -> str:
+    internal = f" internalID={internal_id}" if internal_id else ""
+    return (
+        f"01/01/2024 00:00:{time} Log_Level=INFO Process={stream}{internal} "
+        f"logReference={reference} - {text}"
+    )
+
+
+def _event(stream: str, line: str) -> str:
+    return json.dumps({"logStreamName": stream, "timestamp": 0, "message": line})
+
+
+def test_parse_log_line():
+    line = _line(
+        "01.500",
+        "send",
+        "MESHSEND0006",
+        "Received data from s3 file='X26ABC2/outbound/file.dat' from bucket='mesh' "
+        "read bytes='1024' byte_range='bytes=0-1023'",
+        internal_id="ID1",
+    )
+    record = parse_log_line(line)
+    assert record
+    assert record.reference == "MESHSEND0006"
+    assert record.internal_id == "ID1"
+    assert record.stream == "send"
+    assert record.fields["bytes"] == "1024"
+    assert record.timestamp % 60 == 1.5
+
+    event = parse_log_line(_event("2024/01/01/[$LATEST]abc", line))
+    assert event
+    assert event.stream == "2024/01/01/[$LATEST]abc"
+    assert event.fields == record.fields
+
+    assert parse_log_line(json.dumps({"_aws": {}, "s3_read_duration": 1})) is None
+    assert parse_log_line("START RequestId: abc Version: $LATEST") is None
+
+
+def test_percentiles():
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 50) == 3.0
+    assert percentile([1.0, 2.0], 90) == 1.9
+    assert percentile([7.0], 99) == 7.0
+    assert percentile_row([]) is None
+    assert percentile_row([2.0, 1.0]) == {
+        "count": 2,
+        "p50": 1.5,
+        "p90": 1.9,
+        "p95": 1.95,
+        "p99": 1.99,
+        "max": 2.0,
+    }
+
+
+def _invocation(
+    stream: str, start: int, duration: float, request_id: str, *lines: tuple[str, str]
+) -> list[str]:
+    end = f"{start + duration:06.3f}"
+    return [
+        _event(
+            stream,
+            _line(
+                f"{start:06.3f}", stream, "LAMBDA0002", f"aws_request_id={request_id}"
+            ),
+        ),
+        *(
+            _event(stream, _line(f"{start:06.3f}", stream, reference, text, "ID1"))
+            for reference, text in lines
+        ),
+        _event(
+            stream,
+            _line(
+                end,
+                stream,
+                "LAMBDA0003",
+                f"Lambda completed duration={duration} aws_request_id={request_id}",
+                "ID1",
+            ),
+        ),
+    ]
+
+
+def _send_chunk(chunk: int, last: bool) -> list[tuple[str, str]]:
+    lines = [
+        (
+            "MESHSEND0005",
+            f"Send chunk started for file='out/file.dat' from bucket='mesh' chunk='{chunk}'",
+        ),
+        (
+            "MESHSEND0006",
+            "Received data from s3 file='out/file.dat' from bucket='mesh' read bytes='2000'",
+        ),
+        (
+            "MESHSEND0007",
+            f"Sent chunk='{chunk}' for file='None' message_id='{MESSAGE_ID}'",
+        ),
+    ]
+    if last:
+        lines.append(
+            (
+                "MESHSEND0008",
+                "chunk='2' is the final chunk for file='out/file.dat' from bucket='mesh'",
+            )
+        )
+    return lines
+
+
+def _fetch_chunk(chunk: int, last: bool) -> list[tuple[str, str]]:
+    lines = [
+        ("MESHFETCH0001", f"Downloading messageId='{MESSAGE_ID}'"),
+        (
+            "MESHFETCH0001b",
+            f"Getting chunk content_length='4000' chunk_num='{chunk}' for messageId='{MESSAGE_ID}'",
+        ),
+    ]
+    if last:
+        lines.append(
+            (
+                "MESHFETCH0004",
+                f"Last chunk downloaded for message_id='{MESSAGE_ID}'",
+            )
+        )
+    return lines
+
+
+def test_correlates_messages_and_chunks():
+    check = _invocation(
+        "check",
+        1,
+        0.5,
+        "R1",
+        (
+            "MESHSEND0001",
+            "Send file triggered for file='out/file.dat' from bucket='mesh'",
+        ),
+    )
+    send_one = _invocation("send", 2, 1.0, "R2", *_send_chunk(1, last=False))
+    send_two = _invocation("send", 4, 2.0, "R3", *_send_chunk(2, last=True))
+    poll = _invocation(
+        "poll",
+        10,
+        0.5,
+        "R4",
+        (
+            "MESHPOLL0001",
+            "mailbox='X26ABC1' has polled message_count='1' many messages",
+        ),
+    )
+    fetch_one = _invocation("fetch", 11, 2.0, "R5", *_fetch_chunk(1, last=False))
+    fetch_two = _invocation("fetch", 14, 4.0, "R6", *_fetch_chunk(2, last=True))
+
+    analyser = LogAnalyser()
+    # streams interleave in exported logs
+    analyser.add_lines(
+        [
+            *check,
+            *send_one[:2],
+            *poll,
+            *send_one[2:],
+            *send_two,
+            *fetch_one,
+            *fetch_two,
+        ]
+    )
+    assert [invocation.request_id for invocation in analyser.invocations] == [
+        "R1",
+        "R2",
+        "R4",
+        "R3",
+        "R5",
+        "R6",
+    ]
+
+    report = analyser.report()
+    send, fetch = report["messages"]
+    assert send["key"] == "mesh/out/file.dat"
+    assert send["message_id"] == MESSAGE_ID
+    assert send["chunks"] == 2
+    assert send["num_bytes"] == 4000
+    # from the check send parameters invocation to the final chunk being sent
+    assert send["latency"] == 3.0
+
+    assert fetch["message_id"] == MESSAGE_ID
+    assert fetch["num_bytes"] == 8000
+    # from the poll which listed it
+    assert fetch["latency"] == 4.0
+
+    percentiles = report["percentiles"]
+    assert percentiles["send_chunk_bytes_per_second"]["max"] == 2000
+    assert percentiles["send_chunk_bytes_per_second"]["p50"] == 1500
+    assert percentiles["fetch_chunk_bytes_per_second"]["p50"] == 1500
+    assert percentiles["invocation_seconds[fetch]"]["count"] == 2
+
+
+def test_analyse_captured_logs(
+    environment: str,
+    mesh_s3_bucket: str,
+    send_message_sfn_arn: str,
+    get_messages_sfn_arn: str,
+    mesh_client_one: MeshClient,
+    capsys,
+):
+    from mesh_state_machine import GET_MESSAGES, SEND_MESSAGE, state_machine
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    sent = state_machine(SEND_MESSAGE).run(sample_trigger_event(mesh_s3_bucket))
+    # one fetch at a time, the lambdas all log as the same process here
+    state_machine(GET_MESSAGES, map_concurrency=1).run(
+        {"mailbox": mesh_client_one._mailbox}
+    )
+    message_id = sent.output["body"]["message_id"]
+
+    analyser = LogAnalyser()
+    analyser.add_lines(capsys.readouterr().out.splitlines())
+    messages = {
+        message["direction"]: message for message in analyser.report()["messages"]
+    }
+
+    assert messages["send"]["message_id"] == message_id
+    assert messages["send"]["latency"] > 0
+    assert messages["fetch"]["message_id"] == message_id
+    assert messages["fetch"]["latency"] > 0
@@ -0,0 +1,145 @@
+from unittest import mock
+from uuid import uuid4
+
+from nhs_aws_helpers import secrets_client, ssm_client
+from shared.common import SECRETS_BATCH_SIZE, get_params_by_path, get_secrets
+
+
+def test_get_params_by_path_pages_recursively(environment: str):
+    ssm = ssm_client()
+    env = uuid4().hex
+    for index in range(25):
+        ssm.put_parameter(
+            Name=f"/{env}/mesh/mailboxes/MB{index}/INBOUND_BUCKET",
+            Overwrite=True,
+            Type="String",
+            Value=f"bucket{index}",
+        )
+
+    params = get_params_by_path(f"/{env}/mesh/mailboxes", ssm=ssm)
+
+    assert len(params) == 25
+    assert params[f"/{env}/mesh/mailboxes/MB24/INBOUND_BUCKET"] == "bucket24"
+
+
+def test_get_secrets_in_batches(environment: str):
+    secrets = secrets_client()
+    env = uuid4().hex
+    names = [f"/{env}/mesh/SECRET{index}" for index in range(SECRETS_BATCH_SIZE + 5)]
+    for name in names:
+        secrets.create_secret(Name=name, SecretString=f"value of {name}")
+
+    with mock.patch.object(
+        secrets, "batch_get_secret_value", wraps=secrets.batch_get_secret_value
+    ) as batch_get:
+        result, _ = get_secrets({*names, f"/{env}/mesh/MISSING"}, secrets=secrets)
+
+    assert batch_get.call_count == 2
+    # missing secrets are left out
+    assert result == {name: f"value of {name}" for name in names}
+
+
+def test_get_secrets_returns_errors(environment: str):
+    secrets = secrets_client()
+    env = uuid4().hex
+    name = f"/{env}/mesh/SECRET"
+    secrets.create_secret(Name=name, SecretString="value")
+    denied = f"/{env}/mesh/DENIED"
+
+    with mock.patch.object(
+        secrets,
+        "batch_get_secret_value",
+        return_value={
+            "SecretValues": [{"Name": name, "SecretString": "value"}],
+            "Errors": [{"SecretId": denied, "ErrorCode": "AccessDeniedException"}],
+        },
+    ):
+        result, errors = get_secrets({name, denied}, secrets=secrets)
+
+    assert result == {name: "value"}
+    assert errors == {denied: "AccessDeniedException"}
+
+
+def test_bulk_load_mailbox_params(environment: str, capsys):
+    import shared.application
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    app.config.bulk_load_mailbox_params = True
+
+    with mock.patch.object(
+        shared.application,
+        "get_params_by_path",
+        wraps=shared.application.get_params_by_path,
+    ) as get_params_by_path_spy:
+        app.ensure_params("X26ABC1")
+        # already loaded with the first mailbox
+        app.ensure_params("X26ABC2")
+
+    get_params_by_path_spy.assert_called_once()
+    for mailbox_id in ("X26ABC1", "X26ABC2"):
+        params = app.mailbox_params[mailbox_id]["params"]
+        assert params["MAILBOX_PASSWORD"] == "pwd123456"
+        assert params["INBOUND_BUCKET"]
+        assert params["INBOUND_FOLDER"]
+
+    assert app.mailbox_password("X26ABC2") == "pwd123456"
+    assert app._common_params_retrieved
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHINIT0003 " in logs.out
+
+
+def test_bulk_load_falls_back_for_mailboxes_outside_the_path(environment: str):
+    import shared.application
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    app.config.bulk_load_mailbox_params = True
+
+    with mock.patch.object(
+        shared.application, "get_params", wraps=shared.application.get_params
+    ) as get_params_spy:
+        app.ensure_params("UNKNOWN")
+
+    # the bulk load ran, then the mailbox was looked up by name
+    assert "X26ABC1" in app.mailbox_params
+    assert get_params_spy.call_count == 2
+    assert app.mailbox_params["UNKNOWN"]["params"] == {}
+
+
+def test_bulk_load_leaves_mailboxes_with_failed_secrets_unloaded(
+    environment: str, capsys
+):
+    import shared.application
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    app.config.bulk_load_mailbox_params = True
+    app.config.use_secrets_manager = True
+    base_path = f"{app.config.mailboxes_base_config_key.rstrip('/')}/"
+    secrets = secrets_client()
+    for secret_id in (
+        app.config.client_key_config_key,
+        app.config.shared_key_config_key,
+        f"{base_path}X26ABC1/MAILBOX_PASSWORD",
+    ):
+        secrets.create_secret(Name=secret_id, SecretString=f"value of {secret_id}")
+    denied = f"{base_path}X26ABC2/MAILBOX_PASSWORD"
+    get_secrets = shared.application.get_secrets
+
+    def _deny_one(secret_ids: set[str], secrets=None):
+        values, errors = get_secrets(secret_ids - {denied}, secrets=secrets)
+        return values, {**errors, denied: "AccessDeniedException"}
+
+    with mock.patch.object(shared.application, "get_secrets", side_effect=_deny_one):
+        app.load_all_mailbox_params()
+
+    assert app.mailbox_params["X26ABC1"]["params"]["MAILBOX_PASSWORD"] == (
+        f"value of {base_path}X26ABC1/MAILBOX_PASSWORD"
+    )
+    # fetched by name when next needed
+    assert "X26ABC2" not in app.mailbox_params
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHINIT0004 " in logs.out
@@ -0,0 +1,212 @@
+import json
+import sys
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from mesh_client import MeshClient
+from shared.metrics import InvocationMetrics
+
+from .mesh_fetch_message_chunk_application_test import _sample_first_input_event
+from .mesh_send_message_chunk_application_test import (
+    _sample_single_chunk_input_event,
+)
+from .mesh_testing_common import CONTEXT, FILE_CONTENT, KNOWN_INTERNAL_ID1
+
+
+def find_metric_records(logs: str) -> Generator[dict[str, Any], None, None]:
+    for line in logs.split("\n"):
+        if not line.startswith("{"):
+            continue
+        record = json.loads(line)
+        if "_aws" in record:
+            yield record
+
+
+def _metric_names(record: dict[str, Any]) -> set[str]:
+    return {
+        metric["Name"]
+        for directive in record["_aws"]["CloudWatchMetrics"]
+        for metric in directive["Metrics"]
+    }
+
+
+def test_invocation_metrics_emf_record():
+    metrics = InvocationMetrics(namespace="TestNamespace")
+    metrics.set_dimensions(mailbox="X26ABC1")
+
+    metrics.record("s3_read", 0.5, 1000)
+    metrics.record("s3_read", 0.5, 1000)
+    metrics.record("acknowledge", 0.25)
+
+    record = metrics.to_emf()
+    assert record
+
+    directive = record["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "TestNamespace"
+    assert directive["Dimensions"] == [["Mailbox"]]
+    assert record["Mailbox"] == "X26ABC1"
+    assert "WorkflowId" not in record
+
+    assert record["s3_read_duration"] == 1000
+    assert record["s3_read_bytes"] == 2000
+    assert record["s3_read_throughput"] == 2000
+    assert record["acknowledge_duration"] == 250
+    assert "acknowledge_bytes" not in record
+    assert _metric_names(record) == {
+        "s3_read_duration",
+        "s3_read_bytes",
+        "s3_read_throughput",
+        "acknowledge_duration",
+    }
+
+
+def test_invocation_metrics_flush_resets(capsys):
+    metrics = InvocationMetrics(namespace="TestNamespace")
+    with metrics.timer("mesh_upload") as timer:
+        timer.add_bytes(10)
+
+    metrics.flush()
+    metrics.flush()
+
+    records = list(find_metric_records(capsys.readouterr().out))
+    assert len(records) == 1
+    assert records[0]["mesh_upload_bytes"] == 10
+
+
+def test_invocation_metrics_disabled(capsys):
+    metrics = InvocationMetrics(namespace="TestNamespace", enabled=False)
+    metrics.record("mesh_upload", 1)
+    metrics.flush()
+
+    assert not list(find_metric_records(capsys.readouterr().out))
+    assert metrics.to_emf() is None
+
+
+def test_send_chunk_emits_phase_metrics(
+    environment: str,
+    mesh_s3_bucket: str,
+    send_message_sfn_arn: str,
+    capsys,
+):
+    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+
+    app = MeshSendMessageChunkApplication()
+    app.config.crumb_size = sys.maxsize
+    app.config.chunk_size = sys.maxsize
+    app.metrics.enabled = True
+
+    response = app.main(
+        event=_sample_single_chunk_input_event(mesh_s3_bucket), context=CONTEXT
+    )
+    assert response["body"]["complete"] is True
+
+    records = list(find_metric_records(capsys.readouterr().out))
+    assert len(records) == 1
+    record = records[0]
+
+    assert record["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["Mailbox", "WorkflowId"]
+    ]
+    assert record["Mailbox"] == "X26ABC2"
+    assert record["WorkflowId"] == "TESTWORKFLOW"
+    assert record["application"] == "MeshSendMessageChunkApplication"
+    assert record["s3_read_bytes"] == len(FILE_CONTENT)
+    assert record["compress_bytes"] == len(FILE_CONTENT)
+    assert record["mesh_upload_bytes"] > 0
+    assert {
+        "parameters_duration",
+        "s3_read_duration",
+        "compress_duration",
+        "mesh_upload_duration",
+        "mesh_upload_throughput",
+    }.issubset(_metric_names(record))
+
+
+def test_fetch_chunk_emits_phase_metrics(
+    environment: str,
+    mesh_s3_bucket: str,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    capsys,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    app = MeshFetchMessageChunkApplication()
+    app.metrics.enabled = True
+
+    content = FILE_CONTENT.encode()
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox, data=content, workflow_id="METRICS_TEST"
+    )
+
+    response = app.main(
+        event=_sample_first_input_event(
+            internal_id=KNOWN_INTERNAL_ID1, message_id=message_id
+        ),
+        context=CONTEXT,
+    )
+    assert response["body"]["complete"] is True
+
+    records = list(find_metric_records(capsys.readouterr().out))
+    assert len(records) == 1
+    record = records[0]
+
+    assert record["Mailbox"] == mesh_client_one._mailbox
+    assert record["WorkflowId"] == "METRICS_TEST"
+    assert record["internal_id"] == KNOWN_INTERNAL_ID1
+    assert record["mesh_download_bytes"] == len(content)
+    assert record["s3_upload_bytes"] == len(content)
+    assert {
+        "mesh_download_duration",
+        "s3_upload_duration",
+        "acknowledge_duration",
+    }.issubset(_metric_names(record))
+
+
+def test_concurrent_fetches_keep_their_own_dimensions(
+    environment: str,
+    mesh_s3_bucket: str,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    content = FILE_CONTENT.encode()
+    sent = {
+        mesh_client_two.send_message(
+            recipient=mesh_client_one._mailbox,
+            data=content,
+            workflow_id="METRICS_TEST_ONE",
+        ): (mesh_client_one._mailbox, "METRICS_TEST_ONE", len(content)),
+        mesh_client_one.send_message(
+            recipient=mesh_client_two._mailbox,
+            data=content * 2,
+            workflow_id="METRICS_TEST_TWO",
+        ): (mesh_client_two._mailbox, "METRICS_TEST_TWO", 2 * len(content)),
+    }
+
+    app = MeshFetchMessageChunkApplication()
+    contexts = []
+    for message_id, (mailbox, _, _) in sent.items():
+        event = _sample_first_input_event(
+            internal_id=KNOWN_INTERNAL_ID1, message_id=message_id
+        )
+        event["body"]["dest_mailbox"] = mailbox
+        ctx = app.new_context(event)
+        ctx.metrics.enabled = True
+        contexts.append(ctx)
+
+    with ThreadPoolExecutor(max_workers=len(contexts)) as executor:
+        responses = list(executor.map(app.fetch, contexts))
+
+    for ctx, response, (mailbox, workflow_id, size) in zip(
+        contexts, responses, sent.values(), strict=True
+    ):
+        assert response["body"]["complete"] is True
+        record = ctx.metrics.to_emf()
+        assert record
+        assert record["Mailbox"] == mailbox
+        assert record["WorkflowId"] == workflow_id
+        assert record["mesh_download_bytes"] == size
+        assert record["s3_upload_bytes"] == size
@@ -0,0 +1,260 @@
+"""
+Peak memory regression tests, sending and fetching payloads many times the crumb ( or part ) size
+and asserting the peak python allocations stay within a fixed multiple of it.
+
+S3 is replaced by stand-ins which generate downloads and spool uploads to disk, as moto holds whole
+objects in memory, so the peak measured is the application's alone. MESH is the sandbox, which runs
+in another process.
+"""
+
+import hashlib
+import os
+import random
+import tracemalloc
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from io import BytesIO
+from math import ceil
+from types import SimpleNamespace
+from typing import IO, Any
+
+import pytest
+from mesh_client import MeshClient
+from moto.core.models import responses_mock
+
+from .mesh_fetch_message_chunk_application_test import _fetch_all_chunks
+from .mesh_testing_common import CONTEXT, MB, reset_sandbox_mailbox
+
+CRUMB_SIZE = 1 * MB
+PAYLOAD_SIZE = 24 * MB
+
+# peak allocations allowed, as a multiple of the crumb size, a whole payload is 24 crumbs
+SEND_PEAK_CRUMBS = 6
+# urllib3 holds the raw, decompressed and buffered reads of a crumb while decoding
+FETCH_PEAK_CRUMBS = 8
+FETCH_PART_SIZE = 5 * MB
+FETCH_UPLOAD_CONCURRENCY = 2
+# when cutting parts, the parts awaiting upload and the part being cut are also held
+FETCH_PEAK_PARTS = FETCH_UPLOAD_CONCURRENCY + 1
+
+
+# random, so it does not compress. created before tracing starts, so it is not counted in the peak
+PAYLOAD = random.Random(PAYLOAD_SIZE).randbytes(PAYLOAD_SIZE)
+PAYLOAD_DIGEST = hashlib.sha256(PAYLOAD).hexdigest()
+# a crumb of this, gzip encoded, decompresses to hundreds of crumbs
+COMPRESSIBLE_PAYLOAD = bytes(PAYLOAD_SIZE)
+
+
+def _digest(blocks: Iterable[bytes]) -> str:
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _peak_allocations():
+    """the peak bytes allocated by python within the block, beyond those allocated at the start"""
+    result = SimpleNamespace(peak=0)
+    # moto's requests mock reads streamed request bodies into memory, MESH requests included
+    responses_mock.stop()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        yield result
+        _, peak = tracemalloc.get_traced_memory()
+        result.peak = peak - baseline
+    finally:
+        tracemalloc.stop()
+        responses_mock.start()
+
+
+class _SyntheticObject:
+    """stands in for an s3 object, generating the ranges requested"""
+
+    def __init__(self, bucket: str, key: str, size: int):
+        self.bucket_name = bucket
+        self.key = key
+        self.content_length = size
+
+    def get(self, Range: str) -> dict[str, Any]:
+        start, end = (int(pos) for pos in Range.removeprefix("bytes=").split("-"))
+        return {"Body": BytesIO(PAYLOAD[start : end + 1])}
+
+
+class _SpooledS3:
+    """stands in for the s3 resource, writing uploaded objects and parts to disk"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.completed: dict[str, list[int]] = {}
+        self.meta = SimpleNamespace(
+            client=SimpleNamespace(
+                get_paginator=lambda _: SimpleNamespace(paginate=lambda **_: [{}])
+            )
+        )
+
+    def _write(self, name: str, body: IO[bytes] | bytes) -> str:
+        stream = BytesIO(body) if isinstance(body, bytes) else body
+        with open(os.path.join(self.directory, name), "wb") as f:
+            while block := stream.read(MB):
+                f.write(block)
+        return hashlib.md5(name.encode()).hexdigest()
+
+    def Object(self, bucket: str, key: str):
+        name = key.replace("/", "_")
+        return SimpleNamespace(
+            put=lambda Body, **_: self._write(name, Body),
+            initiate_multipart_upload=lambda **_: SimpleNamespace(id=name),
+        )
+
+    def MultipartUploadPart(self, bucket: str, key: str, upload_id: str, part_id: int):
+        return SimpleNamespace(
+            upload=lambda Body, **_: {
+                "ETag": self._write(f"{upload_id}.{part_id}", Body)
+            }
+        )
+
+    def MultipartUpload(self, bucket: str, key: str, upload_id: str):
+        def _complete(MultipartUpload: dict[str, Any]):
+            self.completed[upload_id] = [
+                part["PartNumber"] for part in MultipartUpload["Parts"]
+            ]
+
+        return SimpleNamespace(complete=_complete)
+
+    def digest(self, key: str) -> str:
+        name = key.replace("/", "_")
+        files = [name]
+        if name in self.completed:
+            files = [f"{name}.{part_id}" for part_id in self.completed[name]]
+
+        def _blocks() -> Iterator[bytes]:
+            for file_name in files:
+                with open(os.path.join(self.directory, file_name), "rb") as f:
+                    yield from iter(lambda: f.read(MB), b"")
+
+        return _digest(_blocks())
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_send_peak_memory(
+    environment: str, mesh_client_one: MeshClient, compress: bool
+):
+    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+    from shared.send_parameters import SendParameters, send_message_input
+
+    chunk_size = 8 * MB
+    send_params = SendParameters(
+        s3_bucket="synthetic",
+        s3_key="X26ABC2/outbound/large.dat",
+        sender="X26ABC2",
+        recipient=mesh_client_one._mailbox,
+        workflow_id="PEAK_MEMORY_TEST",
+        file_size=PAYLOAD_SIZE,
+        compress=compress,
+        chunked=True,
+        total_chunks=ceil(PAYLOAD_SIZE / chunk_size),
+        chunk_size=chunk_size,
+    )
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    app = MeshSendMessageChunkApplication()
+    app.config.crumb_size = CRUMB_SIZE
+    s3_object = _SyntheticObject("synthetic", send_params.s3_key, PAYLOAD_SIZE)
+    app.s3 = SimpleNamespace(Object=lambda *_: s3_object)  # type: ignore[assignment]
+
+    response = send_message_input(send_params, "PEAKMEMORY", CRUMB_SIZE)
+    with _peak_allocations() as allocations:
+        while not response["body"].get("complete"):
+            response = app.main(event=response, context=CONTEXT)
+
+    assert response["body"]["chunk_number"] == send_params.total_chunks
+    # mesh_client holds each chunk after the first in memory, so it can retry it
+    assert allocations.peak < chunk_size + SEND_PEAK_CRUMBS * CRUMB_SIZE
+
+    message = mesh_client_one.retrieve_message(response["body"]["message_id"])
+    assert _digest(iter(lambda: message.read(MB), b"")) == PAYLOAD_DIGEST
+    message.acknowledge()
+
+
+@pytest.mark.parametrize(
+    ("chunk_size", "part_size", "expected_peak"),
+    [
+        # un-chunked message, spooled to a single put
+        (PAYLOAD_SIZE, 0, FETCH_PEAK_CRUMBS * CRUMB_SIZE),
+        # whole chunks buffered on disk then uploaded as parts
+        (8 * MB, 0, FETCH_PEAK_CRUMBS * CRUMB_SIZE),
+        # chunks cut into parts uploaded concurrently, the parts are held in memory
+        (
+            12 * MB,
+            FETCH_PART_SIZE,
+            FETCH_PEAK_PARTS * FETCH_PART_SIZE + FETCH_PEAK_CRUMBS * CRUMB_SIZE,
+        ),
+    ],
+)
+def test_fetch_peak_memory(
+    environment: str,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    tmp_path,
+    chunk_size: int,
+    part_size: int,
+    expected_peak: int,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=PAYLOAD,
+        max_chunk_size=chunk_size,
+        workflow_id="PEAK_MEMORY_TEST",
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.crumb_size = CRUMB_SIZE
+    app.config.fetch_part_size = part_size
+    app.config.fetch_upload_concurrency = FETCH_UPLOAD_CONCURRENCY
+    s3 = _SpooledS3(str(tmp_path))
+    app.s3 = s3  # type: ignore[assignment]
+
+    with _peak_allocations() as allocations:
+        response = _fetch_all_chunks(app, message_id)
+
+    assert response["body"]["complete"]
+    assert allocations.peak < expected_peak
+    assert s3.digest(response["body"]["s3_key"]) == PAYLOAD_DIGEST
+
+
+@pytest.mark.parametrize("chunk_size", [PAYLOAD_SIZE, 8 * MB])
+def test_fetch_gzip_encoded_peak_memory(
+    environment: str,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    tmp_path,
+    chunk_size: int,
+):
+    from mesh_fetch_message_chunk_application import MeshFetchMessageChunkApplication
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    message_id = mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox,
+        data=COMPRESSIBLE_PAYLOAD,
+        compress=True,
+        max_chunk_size=chunk_size,
+        workflow_id="PEAK_MEMORY_TEST",
+    )
+
+    app = MeshFetchMessageChunkApplication()
+    app.config.crumb_size = CRUMB_SIZE
+    s3 = _SpooledS3(str(tmp_path))
+    app.s3 = s3  # type: ignore[assignment]
+
+    with _peak_allocations() as allocations:
+        response = _fetch_all_chunks(app, message_id)
+
+    assert response["body"]["complete"]
+    assert allocations.peak < FETCH_PEAK_CRUMBS * CRUMB_SIZE
+    assert s3.digest(response["body"]["s3_key"]) == _digest([COMPRESSIBLE_PAYLOAD])
@@ -1,5 +1,7 @@
 import json
 from http import HTTPStatus
+from time import perf_counter, time
+from unittest import mock
 from uuid import uuid4
 
 from mesh_client import MeshClient
@@ -97,3 +99,266 @@ def test_mesh_poll_mailbox_singleton_check(
     response = app.main(event=mock_input, context=CONTEXT)
 
     assert response["statusCode"] == int(HTTPStatus.TOO_MANY_REQUESTS)
+
+
+def test_mesh_poll_many_mailboxes(
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+    capsys,
+):
+    message_ids = [
+        mesh_client_two.send_message(
+            recipient=mesh_client_one._mailbox,
+            workflow_id=uuid4().hex,
+            data=f"Hello {i}".encode(),
+        )
+        for i in range(2)
+    ]
+    unknown_mailbox = uuid4().hex
+    mock_input = {
+        "mailboxes": [
+            mesh_client_one._mailbox,
+            mesh_client_two._mailbox,
+            unknown_mailbox,
+        ]
+    }
+
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn,
+        input=json.dumps(mock_input),
+    )
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+
+    response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.OK)
+    assert response["body"]["message_count"] == len(message_ids)
+    # only the mailbox with messages is fanned out
+    assert [
+        (message["body"]["dest_mailbox"], message["body"]["message_id"])
+        for message in response["body"]["message_list"]
+    ] == [(mesh_client_one._mailbox, message_id) for message_id in message_ids]
+    assert response["more_messages"] is False
+    assert response["mailboxes"] == []
+
+    logs = capsys.readouterr()
+    # the unknown mailbox fails without failing the others
+    assert logs.out.count("logReference=MESHPOLL0003 ") == 1
+    assert "logReference=MESHPOLL0004 " in logs.out
+
+    # clients are pooled between invocations
+    pooled = app.clients.idle(mesh_client_two._mailbox)
+    assert len(pooled) == 1
+    assert len(app.clients.idle(mesh_client_one._mailbox)) == 1
+    assert not app.clients.idle(unknown_mailbox)
+
+    response = app.main(
+        event={"mailboxes": [mesh_client_two._mailbox]}, context=CONTEXT
+    )
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+    assert app.clients.idle(mesh_client_two._mailbox) == pooled
+
+
+def test_mesh_poll_many_mailboxes_more_messages(
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+):
+    page_limit = 10
+    for i in range(page_limit + 1):
+        mesh_client_two.send_message(
+            recipient=mesh_client_one._mailbox,
+            workflow_id=uuid4().hex,
+            data=f"Hello {i}".encode(),
+        )
+
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    app.config.get_messages_page_limit = page_limit
+
+    mock_input = {"mailboxes": [mesh_client_one._mailbox, mesh_client_two._mailbox]}
+    response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.OK)
+    assert response["body"]["message_count"] == page_limit
+    assert response["more_messages"] is True
+    assert response["mailboxes"] == [mesh_client_one._mailbox]
+
+
+def test_mesh_poll_many_mailboxes_singleton_check(
+    environment: str, get_messages_sfn_arn: str
+):
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+
+    mailbox = uuid4().hex
+    # one single mailbox execution and one for many mailboxes, including the same mailbox
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn,
+        input=json.dumps({"mailbox": mailbox}),
+    )
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn,
+        input=json.dumps({"mailboxes": [mailbox, uuid4().hex]}),
+    )
+
+    response = app.main(event={"mailboxes": [mailbox]}, context=CONTEXT)
+    assert response["statusCode"] == int(HTTPStatus.TOO_MANY_REQUESTS)
+
+    response = app.main(event={"mailbox": mailbox}, context=CONTEXT)
+    assert response["statusCode"] == int(HTTPStatus.TOO_MANY_REQUESTS)
+
+
+def test_mesh_poll_mailbox_adaptive_re_polls_busy_mailbox(
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+    capsys,
+):
+    import mesh_poll_mailbox_application
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    mock_input = {"mailbox": mesh_client_one._mailbox}
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn, input=json.dumps(mock_input)
+    )
+
+    app = MeshPollMailboxApplication()
+    app.config.poll_wait_seconds = 30
+
+    mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox, workflow_id=uuid4().hex, data=b"first"
+    )
+    response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.OK)
+    # keep polling once the messages are fetched
+    assert response["more_messages"] is True
+    poll_until = response["poll_until"]
+    assert poll_until > time()
+
+    for message in response["body"]["message_list"]:
+        mesh_client_one.acknowledge_message(message["body"]["message_id"])
+
+    waits: list[float] = []
+
+    def _message_arrives(seconds: float):
+        waits.append(seconds)
+        if len(waits) == 3:
+            mesh_client_two.send_message(
+                recipient=mesh_client_one._mailbox,
+                workflow_id=uuid4().hex,
+                data=b"second",
+            )
+
+    with mock.patch.object(mesh_poll_mailbox_application, "sleep", _message_arrives):
+        response = app.main(event=response, context=CONTEXT)
+
+    # backed off until the message arrived
+    assert waits == [1, 2, 4]
+    assert response["statusCode"] == int(HTTPStatus.OK)
+    assert response["body"]["message_count"] == 1
+    assert response["more_messages"] is True
+    assert response["poll_until"] == poll_until
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHPOLL0005 " in logs.out
+
+
+def test_mesh_poll_mailbox_adaptive_ends_when_quiet(
+    mesh_client_one: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+):
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    mock_input = {"mailbox": mesh_client_one._mailbox, "poll_until": time() + 2}
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn, input=json.dumps(mock_input)
+    )
+
+    app = MeshPollMailboxApplication()
+    app.config.poll_wait_seconds = 30
+
+    started = perf_counter()
+    response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+    assert 1.5 < perf_counter() - started < 5
+
+    # the poll window has passed, so no further re-polling
+    mock_input["poll_until"] = time() - 1
+    started = perf_counter()
+    response = app.main(event=mock_input, context=CONTEXT)
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+    assert perf_counter() - started < 1
+
+
+def test_mesh_poll_mailbox_adaptive_returns_once_quiet(
+    mesh_client_one: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+):
+    import mesh_poll_mailbox_application
+    from mesh_poll_mailbox_application import (
+        POLL_QUIET_POLLS,
+        MeshPollMailboxApplication,
+    )
+
+    # the poll window runs well beyond the re-polls of a quiet mailbox
+    mock_input = {"mailbox": mesh_client_one._mailbox, "poll_until": time() + 600}
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn, input=json.dumps(mock_input)
+    )
+
+    app = MeshPollMailboxApplication()
+    app.config.poll_wait_seconds = 600
+    app._last_busy[mesh_client_one._mailbox] = time()
+
+    waits: list[float] = []
+    with mock.patch.object(mesh_poll_mailbox_application, "sleep", waits.append):
+        response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+    assert waits == [1, 2, 4, 8]
+    assert len(waits) == POLL_QUIET_POLLS
+
+    # no longer treated as busy, so a poll outside the window does not re-poll
+    del mock_input["poll_until"]
+    waits.clear()
+    with mock.patch.object(mesh_poll_mailbox_application, "sleep", waits.append):
+        response = app.main(event=mock_input, context=CONTEXT)
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+    assert not waits
+
+
+def test_mesh_poll_mailbox_adaptive_disabled(
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+):
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    mock_input = {"mailbox": mesh_client_one._mailbox}
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn, input=json.dumps(mock_input)
+    )
+
+    app = MeshPollMailboxApplication()
+    mesh_client_two.send_message(
+        recipient=mesh_client_one._mailbox, workflow_id=uuid4().hex, data=b"hello"
+    )
+    response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.OK)
+    assert response["more_messages"] is False
+    assert "poll_until" not in response
@@ -0,0 +1,91 @@
+import json
+import pstats
+from unittest import mock
+
+from integration.test_helpers import temp_env_vars
+from mypy_boto3_s3 import S3Client
+from shared.profiling import Profiler
+
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import CONTEXT
+
+
+def test_profiler_sampling():
+    profiler = Profiler(sample_rate=0)
+    assert not profiler.sampled({"mailbox": "X26ABC1"})
+    assert not profiler.sampled({"profile": False})
+    assert not profiler.sampled("not a dict")
+    assert profiler.sampled({"profile": True})
+
+    assert Profiler(sample_rate=1).sampled({"mailbox": "X26ABC1"})
+
+
+def test_unsampled_invocation_is_not_profiled(
+    mesh_s3_bucket: str, environment: str, send_message_sfn_arn: str, capsys
+):
+    from mesh_check_send_parameters_application import (
+        MeshCheckSendParametersApplication,
+    )
+
+    app = MeshCheckSendParametersApplication()
+    with mock.patch.object(app.profiler, "start") as start:
+        app.main(event=sample_trigger_event(mesh_s3_bucket), context=CONTEXT)
+
+    start.assert_not_called()
+    assert "logReference=MESHPROF0001 " not in capsys.readouterr().out
+
+
+def test_profiled_invocation_writes_stats(
+    mesh_s3_bucket: str,
+    environment: str,
+    send_message_sfn_arn: str,
+    s3_client: S3Client,
+    tmp_path,
+    capsys,
+):
+    with temp_env_vars(PROFILE_S3_PREFIX="profiles/"):
+        from mesh_check_send_parameters_application import (
+            MeshCheckSendParametersApplication,
+        )
+
+        app = MeshCheckSendParametersApplication()
+
+    event = {**sample_trigger_event(mesh_s3_bucket), "profile": True}
+    response = app.main(event=event, context=CONTEXT)
+    assert response["statusCode"] == 200
+
+    internal_id = response["body"]["internal_id"]
+    key_prefix = (
+        f"profiles/MeshCheckSendParametersApplication/{internal_id}/TESTREQUEST"
+    )
+    keys = {
+        item["Key"]
+        for item in s3_client.list_objects_v2(
+            Bucket=mesh_s3_bucket, Prefix="profiles/"
+        )["Contents"]
+    }
+    assert keys == {f"{key_prefix}.prof", f"{key_prefix}.allocations.json"}
+
+    stats_path = tmp_path / "invocation.prof"
+    stats_path.write_bytes(
+        s3_client.get_object(Bucket=mesh_s3_bucket, Key=f"{key_prefix}.prof")[
+            "Body"
+        ].read()
+    )
+    stats = pstats.Stats(str(stats_path))
+    assert any(
+        func_name == "start" and file_name.endswith("application.py")
+        for file_name, _, func_name in stats.stats  # type: ignore[attr-defined]
+    )
+
+    allocations = json.loads(
+        s3_client.get_object(
+            Bucket=mesh_s3_bucket, Key=f"{key_prefix}.allocations.json"
+        )["Body"].read()
+    )
+    assert allocations["peak_memory"] > 0
+    assert allocations["top_allocations"]
+
+    logs = capsys.readouterr().out
+    assert "logReference=MESHPROF0001 " in logs
+    assert f"{key_prefix}.prof" in logs
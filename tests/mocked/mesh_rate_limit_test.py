@@ -0,0 +1,351 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from io import BytesIO
+from time import perf_counter
+from typing import Any, cast
+from uuid import uuid4
+
+import pytest
+from mesh_client import MeshClient as _MeshClient
+from mypy_boto3_dynamodb import DynamoDBClient
+from nhs_aws_helpers import dynamodb_client
+from requests import Response
+from shared.mesh import MAX_RATE_LIMITED_ATTEMPTS, MeshClient
+from shared.rate_limit import (
+    DEFAULT_RETRY_AFTER,
+    MAX_CONFLICTS,
+    DynamoDBTokenBucket,
+    InMemoryTokenBucket,
+    MeshRateLimited,
+    TokenBucket,
+    dispatch_limiter_from_config,
+    parse_retry_after,
+    rate_limiter_from_config,
+)
+
+from .mesh_testing_common import SANDBOX_URL
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.waits: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def wait(self, seconds: float):
+        self.waits.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(name="clock")
+def _clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture(name="rate_limit_table")
+def _rate_limit_table(environment: str) -> str:
+    table_name = f"{environment}-rate-limit"
+    dynamodb_client().create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "mailbox_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "mailbox_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return table_name
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2") == 2
+    assert parse_retry_after("0.5") == 0.5
+    assert parse_retry_after("-1") == 0
+    assert parse_retry_after(None) == DEFAULT_RETRY_AFTER
+    assert parse_retry_after("soon") == DEFAULT_RETRY_AFTER
+    assert parse_retry_after(formatdate(1010, usegmt=True), now=1000) == 10
+    assert parse_retry_after(formatdate(990, usegmt=True), now=1000) == 0
+
+
+def test_token_bucket_burst_then_rate(clock: FakeClock):
+    bucket = InMemoryTokenBucket(rate=2, burst=3, clock=clock, wait=clock.wait)
+
+    for _ in range(3):
+        bucket.acquire("X26ABC1")
+    assert not clock.waits
+
+    bucket.acquire("X26ABC1")
+    bucket.acquire("X26ABC1")
+    assert clock.waits == [0.5, 0.5]
+
+    # other mailboxes have their own bucket
+    bucket.acquire("X26ABC2")
+    assert clock.waits == [0.5, 0.5]
+
+
+def test_token_bucket_block_honours_retry_after(clock: FakeClock):
+    bucket = InMemoryTokenBucket(rate=10, burst=10, clock=clock, wait=clock.wait)
+    bucket.acquire("X26ABC1")
+
+    bucket.block("X26ABC1", 5)
+    # a shorter block does not shorten the existing one
+    bucket.block("X26ABC1", 1)
+
+    bucket.acquire("X26ABC1")
+    assert sum(clock.waits) == pytest.approx(5.1)
+
+
+def test_token_bucket_raises_beyond_max_wait(clock: FakeClock):
+    bucket = InMemoryTokenBucket(
+        rate=1, burst=1, max_wait=2, clock=clock, wait=clock.wait
+    )
+    bucket.acquire("X26ABC1")
+    bucket.block("X26ABC1", 60)
+
+    with pytest.raises(MeshRateLimited) as ex:
+        bucket.acquire("X26ABC1")
+    assert ex.value.retry_after == 60
+    assert not clock.waits
+
+
+class ContendedTokenBucket(InMemoryTokenBucket):
+    """a bucket whose state is always changed by another caller before it can be stored"""
+
+    def _store(self, key, state, version) -> bool:
+        return False
+
+
+def test_token_bucket_is_abstract():
+    with pytest.raises(TypeError):
+        TokenBucket(rate=1, burst=1)  # type: ignore[abstract]
+
+
+def test_token_bucket_backs_off_then_gives_up_on_lost_races(clock: FakeClock):
+    bucket = ContendedTokenBucket(rate=1, burst=1, clock=clock, wait=clock.wait)
+
+    with pytest.raises(MeshRateLimited):
+        bucket.acquire("X26ABC1")
+    assert len(clock.waits) == MAX_CONFLICTS - 1
+    assert all(wait > 0 for wait in clock.waits)
+    # jittered, so concurrent callers do not retry in step
+    assert len(set(clock.waits)) > 1
+
+    clock.waits.clear()
+    with pytest.raises(MeshRateLimited):
+        bucket.block("X26ABC1", 5)
+    assert len(clock.waits) == MAX_CONFLICTS - 1
+
+
+def test_dynamodb_token_bucket_shared_state(rate_limit_table: str, clock: FakeClock):
+    one = DynamoDBTokenBucket(
+        rate_limit_table, rate=1, burst=2, max_wait=60, clock=clock, wait=clock.wait
+    )
+    two = DynamoDBTokenBucket(
+        rate_limit_table, rate=1, burst=2, clock=clock, wait=clock.wait
+    )
+
+    one.acquire("X26ABC1")
+    two.acquire("X26ABC1")
+    assert not clock.waits
+
+    one.acquire("X26ABC1")
+    assert clock.waits == [1]
+
+    two.block("X26ABC1", 30)
+    one.acquire("X26ABC1")
+    # the block, then the refill of a token
+    assert clock.waits == [1, 30, 1]
+
+
+class AtomicWrites:
+    """dynamodb applies each conditional write atomically, moto does not across threads"""
+
+    def __init__(self, ddb: DynamoDBClient):
+        self._ddb = ddb
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._ddb, name)
+
+    def put_item(self, **kwargs):
+        with self._lock:
+            return self._ddb.put_item(**kwargs)
+
+
+def test_dynamodb_token_bucket_concurrent_acquire(rate_limit_table: str):
+    # no refill, so exactly burst tokens can be taken between all the threads
+    burst = 20
+    bucket = DynamoDBTokenBucket(
+        rate_limit_table,
+        rate=0.001,
+        burst=burst,
+        max_wait=0,
+        ddb=cast(DynamoDBClient, AtomicWrites(dynamodb_client())),
+    )
+
+    def _acquire(_) -> bool:
+        try:
+            bucket.acquire("X26ABC1")
+            return True
+        except MeshRateLimited:
+            return False
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        acquired = list(executor.map(_acquire, range(burst + 10)))
+
+    assert sum(acquired) == burst
+
+
+def _rate_limited_response(retry_after: str = "0") -> Response:
+    response = Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after
+    return response
+
+
+def test_mesh_client_retries_rate_limited_requests(mesh_client_one: _MeshClient):
+    bucket = InMemoryTokenBucket(rate=100, burst=100)
+    with MeshClient(
+        url=SANDBOX_URL,
+        mailbox=mesh_client_one._mailbox,
+        password="pwd123456",
+        shared_key=b"TestKey",
+        verify=False,
+        rate_limiter=bucket,
+    ) as client:
+        message_id = client.send_chunk(
+            recipient=mesh_client_one._mailbox,
+            chunk=b"rate limited",
+            chunk_num=1,
+            total_chunks=2,
+            precompressed=False,
+            workflow_id="RATE_LIMIT_TEST",
+        ).json()["message_id"]
+
+        send_request = client._session_request
+        calls = []
+
+        def _first_rate_limited(method, url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                return _rate_limited_response("0.1")
+            return send_request(method, url, **kwargs)
+
+        client._session_request = _first_rate_limited
+
+        started = perf_counter()
+        client.send_chunk(
+            recipient=mesh_client_one._mailbox,
+            chunk=BytesIO(b" and retried"),
+            chunk_num=2,
+            total_chunks=2,
+            message_id=message_id,
+            precompressed=False,
+        )
+
+        assert len(calls) == 2
+        # waited for the Retry-After
+        assert perf_counter() - started >= 0.1
+        assert message_id in mesh_client_one.list_messages()
+        message = mesh_client_one.retrieve_message(message_id)
+        assert message.read() == b"rate limited and retried"
+
+        # persistently rate limited
+        client._session_request = lambda method, url, **kwargs: _rate_limited_response()
+        bucket.max_wait = 100
+        with pytest.raises(MeshRateLimited):
+            client.list_messages()
+
+
+def test_mesh_client_does_not_resend_a_rate_limited_first_chunk(
+    mesh_client_one: _MeshClient,
+):
+    bucket = InMemoryTokenBucket(rate=100, burst=100)
+    with MeshClient(
+        url=SANDBOX_URL,
+        mailbox=mesh_client_one._mailbox,
+        password="pwd123456",
+        shared_key=b"TestKey",
+        verify=False,
+        rate_limiter=bucket,
+    ) as client:
+        calls = []
+
+        def _rate_limited(method, url, **kwargs):
+            calls.append(url)
+            return _rate_limited_response("0.1")
+
+        client._session_request = _rate_limited
+
+        # even though the body could be rewound, the step function decides whether to retry
+        with pytest.raises(MeshRateLimited):
+            client.send_chunk(
+                recipient=mesh_client_one._mailbox,
+                chunk=BytesIO(b"first chunk"),
+                chunk_num=1,
+                total_chunks=1,
+                precompressed=False,
+                workflow_id="RATE_LIMIT_TEST",
+            )
+        assert len(calls) == 1
+
+
+def test_mesh_client_gives_up_after_max_attempts(mesh_client_one: _MeshClient):
+    bucket = InMemoryTokenBucket(rate=1000, burst=1000)
+    with MeshClient(
+        url=SANDBOX_URL,
+        mailbox=mesh_client_one._mailbox,
+        password="pwd123456",
+        shared_key=b"TestKey",
+        verify=False,
+        rate_limiter=bucket,
+    ) as client:
+        calls = []
+
+        def _always_rate_limited(method, url, **kwargs):
+            calls.append(url)
+            return _rate_limited_response()
+
+        client._session_request = _always_rate_limited
+
+        with pytest.raises(MeshRateLimited):
+            client.list_messages()
+        assert len(calls) == MAX_RATE_LIMITED_ATTEMPTS
+
+
+def test_application_rate_limiter_from_config(environment: str):
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    assert app.rate_limiter is None
+
+    table_name = uuid4().hex
+    app.config.mesh_rate_limit = 5
+    app.config.mesh_rate_limit_burst = 10
+    app.config.rate_limit_table = table_name
+
+    bucket = rate_limiter_from_config(app.config)
+    assert isinstance(bucket, DynamoDBTokenBucket)
+    assert bucket.table_name == table_name
+    assert bucket.rate == 5
+    assert bucket.burst == 10
+
+
+def test_dispatch_limiter_from_config(environment: str):
+    from shared.config import EnvConfig
+
+    config = EnvConfig()
+    config.dispatch_max_starts_per_second = 0
+    assert dispatch_limiter_from_config(config) is None
+
+    config.dispatch_max_starts_per_second = 20
+    config.rate_limit_table = ""
+    # limited per dispatcher instance only
+    assert isinstance(dispatch_limiter_from_config(config), InMemoryTokenBucket)
+
+    config.rate_limit_table = uuid4().hex
+    bucket = dispatch_limiter_from_config(config)
+    assert isinstance(bucket, DynamoDBTokenBucket)
+    assert bucket.table_name == config.rate_limit_table
+    assert bucket.rate == 20
+    assert bucket.burst == 1
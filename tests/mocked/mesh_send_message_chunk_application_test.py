@@ -38,6 +38,10 @@ def test_mesh_send_file_chunk_app_no_chunks_happy_path(
     expected_lambda_response["body"].update(
         {"current_byte_position": len(FILE_CONTENT)}
     )
+    expected_lambda_response["body"].update(
+        {"chunk_size": sys.maxsize, "crumb_size": sys.maxsize}
+    )
+    expected_lambda_response["body"]["send_params"]["chunk_size"] = sys.maxsize
     lambda_response = app.main(event=mock_lambda_input, context=CONTEXT)
 
     lambda_response["body"].pop("message_id")
@@ -67,6 +71,8 @@ def test_mesh_send_file_chunk_app_2_chunks_happy_path(
     mock_response["body"].update({"complete": True})
     mock_response["body"]["send_params"].update({"compress": True, "chunked": True})
     mock_response["body"].update({"chunk_number": 4})
+    mock_response["body"].update({"chunk_size": 10, "crumb_size": 10})
+    mock_response["body"]["send_params"]["chunk_size"] = 10
     mock_response["body"].update({"current_byte_position": len(FILE_CONTENT)})
     count = 1
 
@@ -128,6 +134,10 @@ def test_mesh_send_file_chunk_app_no_chunks_invoke_via_eventbridge(
 
     expected_lambda_response = _sample_output_invoked_via_event_bridge(mesh_s3_bucket)
     expected_lambda_response["body"].update({"complete": True})
+    expected_lambda_response["body"].update(
+        {"chunk_size": sys.maxsize, "crumb_size": sys.maxsize, "total_chunks": 1}
+    )
+    expected_lambda_response["body"]["send_params"]["chunk_size"] = sys.maxsize
     expected_lambda_response["body"].update(
         {"current_byte_position": len(FILE_CONTENT)}
     )
@@ -0,0 +1,145 @@
+from unittest import mock
+
+import pytest
+from nhs_aws_helpers import s3_resource, ssm_client
+from shared.config import EnvConfig
+from shared.send_parameters import (
+    OutboundMappingIndex,
+    get_send_parameters_from_mapping,
+)
+
+from .conftest import put_parameter
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import CONTEXT
+
+
+def _put_mapping(environment: str, bucket_and_folder: str, src_mailbox: str):
+    ssm = ssm_client()
+    for name, value in (
+        ("src_mailbox", src_mailbox),
+        ("dest_mailbox", "X26ABC1"),
+        ("workflow_id", f"WORKFLOW_{src_mailbox}"),
+    ):
+        put_parameter(
+            ssm, f"/{environment}/mesh/mapping/{bucket_and_folder}{name}", value
+        )
+
+
+@pytest.fixture(name="mapping_index")
+def _mapping_index(environment: str) -> OutboundMappingIndex:
+    return OutboundMappingIndex(EnvConfig(), ssm_client())
+
+
+def test_mapping_index_loads_all_pages(
+    environment: str, mapping_index: OutboundMappingIndex
+):
+    # well over the 10 parameters returned per page
+    for i in range(20):
+        _put_mapping(environment, f"bucket/folder{i}/", f"MAILBOX{i}")
+    _put_mapping(environment, "bucket/", "ROOT")
+    _put_mapping(environment, "bucket/folder1/nested/", "NESTED")
+
+    with mock.patch.object(
+        mapping_index.ssm,
+        "get_parameters_by_path",
+        wraps=mapping_index.ssm.get_parameters_by_path,
+    ) as get_parameters_by_path:
+        for i in range(20):
+            mapping = mapping_index.get("bucket", f"folder{i}/file.dat")
+            assert mapping["src_mailbox"] == f"MAILBOX{i}"
+            assert mapping["workflow_id"] == f"WORKFLOW_MAILBOX{i}"
+
+        assert mapping_index.get("bucket", "file.dat")["src_mailbox"] == "ROOT"
+        assert (
+            mapping_index.get("bucket", "folder1/nested/file.dat")["src_mailbox"]
+            == "NESTED"
+        )
+
+        # loaded once, over many pages
+        assert get_parameters_by_path.call_count > 1
+        assert all(
+            call.kwargs["Recursive"] for call in get_parameters_by_path.call_args_list
+        )
+
+        calls = get_parameters_by_path.call_count
+        mapping_index.get("bucket", "folder5/another.dat")
+        assert get_parameters_by_path.call_count == calls
+
+
+def test_mapping_index_negative_cache(
+    environment: str, mapping_index: OutboundMappingIndex
+):
+    mapping_index.load()
+
+    with mock.patch.object(
+        mapping_index.ssm,
+        "get_parameters_by_path",
+        wraps=mapping_index.ssm.get_parameters_by_path,
+    ) as get_parameters_by_path:
+        assert mapping_index.get("bucket", "unmapped/file.dat") == {}
+        assert mapping_index.get("bucket", "unmapped/file.dat") == {}
+        assert get_parameters_by_path.call_count == 1
+        assert not get_parameters_by_path.call_args.kwargs["Recursive"]
+
+    _put_mapping(environment, "bucket/unmapped/", "ADDED")
+    assert mapping_index.get("bucket", "unmapped/file.dat") == {}
+
+    # picked up once the negative entry expires
+    mapping_index.negative_cache_time = 0
+    assert mapping_index.get("bucket", "unmapped/file.dat")["src_mailbox"] == "ADDED"
+
+
+def test_mapping_index_refreshes_after_cache_time(
+    environment: str, mapping_index: OutboundMappingIndex
+):
+    _put_mapping(environment, "bucket/folder/", "BEFORE")
+    assert mapping_index.get("bucket", "folder/file.dat")["src_mailbox"] == "BEFORE"
+
+    _put_mapping(environment, "bucket/folder/", "AFTER")
+    assert mapping_index.get("bucket", "folder/file.dat")["src_mailbox"] == "BEFORE"
+
+    mapping_index.cache_time = 0
+    assert mapping_index.get("bucket", "folder/file.dat")["src_mailbox"] == "AFTER"
+
+
+def test_get_send_parameters_from_mapping_paginates(
+    environment: str, mesh_s3_bucket: str
+):
+    ssm = ssm_client()
+    # unrelated parameters in the same folder push the mapping beyond the first page
+    for i in range(15):
+        put_parameter(
+            ssm,
+            f"/{environment}/mesh/mapping/{mesh_s3_bucket}/paged/param_{i:02}",
+            "unused",
+        )
+    _put_mapping(environment, f"{mesh_s3_bucket}/paged/", "PAGED")
+
+    s3_object = s3_resource().Object(mesh_s3_bucket, "paged/testfile.json")
+    params = get_send_parameters_from_mapping(s3_object, EnvConfig(), ssm)
+
+    assert params.sender == "PAGED"
+    assert params.recipient == "X26ABC1"
+    assert params.workflow_id == "WORKFLOW_PAGED"
+
+
+def test_check_send_parameters_uses_mapping_index(
+    environment: str, mesh_s3_bucket: str, send_message_sfn_arn: str
+):
+    from mesh_check_send_parameters_application import (
+        MeshCheckSendParametersApplication,
+    )
+
+    app = MeshCheckSendParametersApplication()
+
+    response = app.main(event=sample_trigger_event(mesh_s3_bucket), context=CONTEXT)
+    assert response["body"]["src_mailbox"] == "X26ABC2"
+
+    with mock.patch.object(
+        app.ssm, "get_parameters_by_path", wraps=app.ssm.get_parameters_by_path
+    ) as get_parameters_by_path:
+        response = app.main(event=sample_trigger_event(mesh_s3_bucket), context=CONTEXT)
+        assert response["body"]["src_mailbox"] == "X26ABC2"
+        assert response["body"]["workflow_id"] == "TESTWORKFLOW"
+
+        get_parameters_by_path.assert_not_called()
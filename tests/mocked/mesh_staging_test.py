@@ -0,0 +1,114 @@
+import random
+import zlib
+from itertools import pairwise
+
+import pytest
+from mesh_client import MeshClient
+from mypy_boto3_s3 import S3Client
+from shared.send_parameters import (
+    SendParameters,
+    calculate_chunks,
+    send_message_input,
+)
+from shared.staging import GzipChunker
+
+from .mesh_testing_common import CONTEXT, MB, reset_sandbox_mailbox
+
+
+def _hex_text(size: int, seed: int = 1) -> bytes:
+    # compresses to a little over half its size
+    return random.Random(seed).randbytes(size // 2).hex().encode()
+
+
+@pytest.mark.parametrize(
+    ("data", "chunk_size"),
+    [
+        (random.Random(1).randbytes(300_000), 64 * 1024),
+        (_hex_text(300_000), 64 * 1024),
+        (b"x" * 3_000_000, 64 * 1024),
+        (_hex_text(3 * MB), MB),
+        (b"", 1024),
+    ],
+)
+def test_gzip_chunker_members_fit_chunks(data: bytes, chunk_size: int):
+    chunker = GzipChunker(chunk_size)
+    # written in uneven crumbs, members are cut by block not by crumb
+    crumbs = [data[start : start + 7777] for start in range(0, len(data), 7777)]
+    compressed = b"".join(chunker.compress(crumb) for crumb in crumbs)
+    compressed += chunker.finish()
+
+    offsets = chunker.offsets
+    assert offsets[0] == 0
+    assert offsets[-1] == len(compressed)
+
+    decompressed = b""
+    for start, end in pairwise(offsets):
+        member = compressed[start:end]
+        assert len(member) <= chunk_size
+        # each chunk is decompressed on its own by the recipient
+        decompressor = zlib.decompressobj(47)
+        decompressed += decompressor.decompress(member)
+        assert decompressor.eof
+        assert not decompressor.unused_data
+
+    assert decompressed == data
+
+
+def test_staged_send(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    mesh_client_one: MeshClient,
+    capsys,
+):
+    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    content = _hex_text(4 * MB)
+    key = "X26ABC2/outbound/staged.txt"
+    s3_client.put_object(Bucket=mesh_s3_bucket, Key=key, Body=content)
+
+    chunk_size = MB
+    chunked, total_chunks = calculate_chunks(len(content), chunk_size)
+    send_params = SendParameters(
+        s3_bucket=mesh_s3_bucket,
+        s3_key=key,
+        sender="X26ABC2",
+        recipient=mesh_client_one._mailbox,
+        workflow_id="TESTWORKFLOW",
+        filename="staged.txt",
+        file_size=len(content),
+        compress=True,
+        chunked=chunked,
+        total_chunks=total_chunks,
+        chunk_size=chunk_size,
+    )
+    assert total_chunks == 4
+
+    app = MeshSendMessageChunkApplication()
+    app.config.send_staging_prefix = "staging"
+
+    event = send_message_input(send_params, "STAGEDSEND", 256 * 1024)
+    invocations = 0
+    while not event["body"].get("complete"):
+        event = app.main(event=event, context=CONTEXT)
+        invocations += 1
+
+    body = event["body"]
+    staged = body["staged"]
+    assert staged["key"].startswith("staging/")
+    assert staged["key"].endswith("/staged.txt.gz")
+    # compressed once, so the chunks are planned from the compressed size
+    assert body["total_chunks"] == invocations == len(staged["offsets"]) - 1 < 4
+    assert body["current_byte_position"] == staged["offsets"][-1]
+
+    message = mesh_client_one.retrieve_message(body["message_id"])
+    assert message.read() == content
+
+    # the staged object is removed once sent
+    listed = s3_client.list_objects_v2(Bucket=mesh_s3_bucket, Prefix="staging/")
+    assert not listed.get("Contents")
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHSEND0009 " in logs.out
+    assert "logReference=MESHSEND0010 " not in logs.out
@@ -0,0 +1,125 @@
+from unittest import mock
+
+from mesh_client import MeshClient
+from mypy_boto3_s3 import S3Client
+from shared.rate_limit import MeshRateLimited
+
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import FILE_CONTENT, reset_sandbox_mailbox
+
+
+def test_load_definitions():
+    from mesh_state_machine import (
+        GET_MESSAGES,
+        SEND_MESSAGE,
+        lambda_handlers,
+        load_definition,
+    )
+
+    get_messages = load_definition(GET_MESSAGES, {"var.get_message_max_concurrency": 3})
+    assert get_messages["StartAt"] == "Poll for messages"
+    fetch_messages = get_messages["States"]["For each waiting message"]
+    assert fetch_messages["MaxConcurrency"] == 3
+    assert fetch_messages["ResultPath"] is None
+    assert fetch_messages["Iterator"]["StartAt"] == "Fetch message chunk"
+
+    send_message = load_definition(SEND_MESSAGE)
+    assert send_message["StartAt"] == "Check send parameters"
+    assert send_message["States"]["Send message chunk"]["Retry"][1]["ErrorEquals"] == [
+        "MeshRateLimited"
+    ]
+
+    handlers = lambda_handlers()
+    assert handlers["fetch_message_chunk"] == "mesh_fetch_message_chunk_application"
+    assert handlers["send_message_chunk"] == "mesh_send_message_chunk_application"
+
+
+def test_send_then_get_messages(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+    get_messages_sfn_arn: str,
+    mesh_client_one: MeshClient,
+):
+    from mesh_state_machine import GET_MESSAGES, SEND_MESSAGE, state_machine
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    for _ in range(2):
+        mesh_client_one.send_message(
+            mesh_client_one._mailbox, b"waiting", workflow_id="STATE_MACHINE_TEST"
+        )
+
+    execution = state_machine(SEND_MESSAGE).run(sample_trigger_event(mesh_s3_bucket))
+    assert execution.status == "SUCCEEDED"
+    assert execution.output["body"]["complete"] is True
+    message_id = execution.output["body"]["message_id"]
+    assert execution.invocations == {
+        "check_send_parameters": 1,
+        "send_message_chunk": 1,
+    }
+    # check -> failed? -> send -> completed sending? -> success
+    assert execution.state_transitions == 5
+
+    execution = state_machine(GET_MESSAGES, map_concurrency=2).run(
+        {"mailbox": mesh_client_one._mailbox}
+    )
+    assert execution.status == "SUCCEEDED"
+    assert execution.invocations == {"poll_mailbox": 1, "fetch_message_chunk": 3}
+    # poll -> failed? -> map -> 3 x ( fetch -> last chunk? -> file complete ) -> more? -> complete
+    assert execution.state_transitions == 14
+    assert execution.states["Fetch message chunk"] == 3
+
+    s3_object = s3_client.get_object(
+        Bucket=mesh_s3_bucket,
+        Key=f"inbound/{mesh_client_one._mailbox}/{message_id}.dat",
+    )
+    assert s3_object["Body"].read().decode() == FILE_CONTENT
+    assert not mesh_client_one.list_messages()
+
+
+def test_task_retries(
+    environment: str,
+    mesh_s3_bucket: str,
+    send_message_sfn_arn: str,
+    mesh_client_one: MeshClient,
+):
+    from mesh_state_machine import SEND_MESSAGE, LocalLambdas, state_machine
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+    lambdas = LocalLambdas()
+    invoke = lambdas.invoke
+    sends: list[str] = []
+
+    def _rate_limit_first_send(function_name: str, payload):
+        if "send_message_chunk" in function_name:
+            sends.append(function_name)
+            if len(sends) == 1:
+                raise MeshRateLimited(1.0)
+        return invoke(function_name, payload)
+
+    with mock.patch.object(lambdas, "invoke", side_effect=_rate_limit_first_send):
+        execution = state_machine(SEND_MESSAGE, lambdas, retry_delay_scale=0).run(
+            sample_trigger_event(mesh_s3_bucket)
+        )
+
+    assert execution.status == "SUCCEEDED"
+    assert execution.invocations["send_message_chunk"] == 2
+    assert execution.states["Send message chunk"] == 2
+    assert execution.state_transitions == 6
+    assert len(mesh_client_one.list_messages()) == 1
+
+
+def test_task_failure_fails_execution(environment: str, mesh_s3_bucket: str):
+    from mesh_state_machine import SEND_MESSAGE, LocalLambdas, state_machine
+
+    lambdas = LocalLambdas()
+    with mock.patch.object(lambdas, "invoke", side_effect=ValueError("broken")):
+        execution = state_machine(SEND_MESSAGE, lambdas, retry_delay_scale=0).run(
+            sample_trigger_event(mesh_s3_bucket)
+        )
+
+    assert execution.status == "FAILED"
+    assert execution.error == "ValueError"
+    assert execution.cause == "broken"
+    assert execution.invocations == {"check_send_parameters": 1}
@@ -0,0 +1,134 @@
+import pytest
+from shared.config import MIN_MULTIPART_SIZE, EnvConfig, MiB
+from shared.metrics import InvocationMetrics
+from shared.tuning import (
+    MESH_MAX_CHUNK_SIZE,
+    MIN_CRUMB_SIZE,
+    S3_MAX_PARTS,
+    SizeTuner,
+    ThroughputTracker,
+)
+
+from .mesh_send_message_chunk_application_test import (
+    _sample_multi_chunk_input_event,
+)
+from .mesh_testing_common import CONTEXT
+
+
+@pytest.fixture(name="config")
+def _config() -> EnvConfig:
+    config = EnvConfig()
+    config.auto_tune_sizes = True
+    config.memory_size = 0
+    return config
+
+
+def test_throughput_tracker_ewma():
+    tracker = ThroughputTracker(weight=0.5)
+    assert tracker.rate is None
+
+    tracker.observe(100, 1)
+    assert tracker.rate == 100
+
+    tracker.observe(300, 1)
+    assert tracker.rate == 200
+
+    # ignored
+    tracker.observe(0, 1)
+    tracker.observe(100, 0)
+    assert tracker.rate == 200
+
+
+def test_static_sizes_when_not_auto_tuning(config: EnvConfig):
+    config.auto_tune_sizes = False
+    config.chunk_size = 10 * MiB
+    config.crumb_size = 2 * MiB
+    tuner = SizeTuner(config)
+    tuner.mesh.observe(1 * MiB, 10)
+
+    assert tuner.chunk_size(1024 * MiB) == 10 * MiB
+    assert tuner.crumb_size(10 * MiB) == 2 * MiB
+    assert tuner.crumb_size(1 * MiB) == 1 * MiB
+
+
+def test_chunk_size_bounded_by_mesh_max(config: EnvConfig):
+    tuner = SizeTuner(config)
+    assert tuner.chunk_size(10 * 1024 * MiB) == MESH_MAX_CHUNK_SIZE
+
+
+@pytest.mark.parametrize(
+    ("memory_size", "expected"),
+    [
+        (128, 21 * MiB + MiB // 3),
+        (1024, MESH_MAX_CHUNK_SIZE),
+        (64, MIN_MULTIPART_SIZE),
+    ],
+)
+def test_chunk_size_bounded_by_memory(
+    config: EnvConfig, memory_size: int, expected: int
+):
+    config.memory_size = memory_size
+    tuner = SizeTuner(config)
+    assert tuner.chunk_size(10 * 1024 * MiB) == expected
+
+
+def test_chunk_size_bounded_by_observed_throughput(config: EnvConfig):
+    tuner = SizeTuner(config)
+    metrics = InvocationMetrics(namespace="test")
+    metrics.record("mesh_upload", 10, 100 * 1024)  # 10KiB/s
+
+    tuner.observe(metrics)
+
+    assert tuner.chunk_size(10 * MiB) == MIN_MULTIPART_SIZE
+
+
+def test_chunk_size_respects_s3_part_limit(config: EnvConfig):
+    config.memory_size = 128
+    tuner = SizeTuner(config)
+    huge = 500 * 1024 * 1024 * MiB
+
+    assert tuner.chunk_size(huge) * S3_MAX_PARTS >= huge
+
+
+def test_crumb_size_from_observed_throughput(config: EnvConfig):
+    config.crumb_size = 20 * MiB
+    tuner = SizeTuner(config)
+    # nothing observed, use the configured crumb size
+    assert tuner.crumb_size(100 * MiB) == 20 * MiB
+
+    tuner.s3.observe(8 * MiB, 1)
+    assert tuner.crumb_size(100 * MiB) == 4 * MiB
+    assert tuner.crumb_size(2 * MiB) == 2 * MiB
+
+    for _ in range(10):
+        tuner.s3.observe(1, 10)
+    assert tuner.crumb_size(100 * MiB) == MIN_CRUMB_SIZE
+
+    # inbound uses the mesh throughput
+    assert tuner.crumb_size(100 * MiB, inbound=True) == 20 * MiB
+
+
+def test_send_chunk_replans_when_auto_tuning(
+    environment: str,
+    mesh_s3_bucket: str,
+    send_message_sfn_arn: str,
+):
+    from mesh_send_message_chunk_application import MeshSendMessageChunkApplication
+
+    app = MeshSendMessageChunkApplication()
+    app.config.auto_tune_sizes = True
+    app.config.memory_size = 128
+
+    # planned as 4 chunks of 10 bytes by the check send parameters lambda
+    mock_input = _sample_multi_chunk_input_event(mesh_s3_bucket)
+    response = app.main(event=mock_input, context=CONTEXT)
+
+    assert response["body"]["complete"] is True
+    assert response["body"]["total_chunks"] == 1
+    assert response["body"]["chunk_size"] >= MIN_MULTIPART_SIZE
+    assert response["body"]["send_params"]["chunked"] is False
+    assert response["body"]["send_params"]["total_chunks"] == 1
+
+    # throughput observed from the invocation
+    assert app.tuner.s3.rate
+    assert app.tuner.mesh.rate
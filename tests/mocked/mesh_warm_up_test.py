@@ -0,0 +1,90 @@
+from http import HTTPStatus
+from unittest import mock
+
+from mesh_client import MeshClient
+
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import CONTEXT
+
+
+def test_warm_up_builds_mesh_clients(
+    mesh_client_one: MeshClient,
+    environment: str,
+    get_messages_sfn_arn: str,
+    capsys,
+):
+    import shared.application
+    import shared.mesh
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    mailbox_id = mesh_client_one._mailbox
+
+    app = MeshPollMailboxApplication()
+    app.config.warm_up_on_init = True
+    app.config.mesh_mailbox_ids = [mailbox_id, "UNKNOWN"]
+
+    app.warm_up()
+
+    # the unknown mailbox is logged, but does not fail the init
+    assert not app.clients.idle("UNKNOWN")
+    [warm_client] = app.clients.idle(mailbox_id)
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHINIT0001 " in logs.out
+    assert "logReference=MESHINIT0002 " in logs.out
+
+    with mock.patch.object(
+        shared.application, "get_params", wraps=shared.application.get_params
+    ) as get_params, mock.patch.object(
+        shared.mesh, "MeshClient", wraps=shared.mesh.MeshClient
+    ) as mesh_client_class:
+        response = app.main(event={"mailbox": mailbox_id}, context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.NO_CONTENT)
+    # params were fetched and the client built during init
+    get_params.assert_not_called()
+    mesh_client_class.assert_not_called()
+    # and is kept in the pool for the next invocation
+    assert app.clients.idle(mailbox_id) == [warm_client]
+    assert not warm_client._close_called
+
+
+def test_warm_up_disabled(environment: str):
+    import shared.application
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+
+    app = MeshPollMailboxApplication()
+    app.config.mesh_mailbox_ids = ["X26ABC1"]
+
+    with mock.patch.object(
+        shared.application, "get_params", wraps=shared.application.get_params
+    ) as get_params:
+        app.warm_up()
+
+    get_params.assert_not_called()
+    assert not app.clients.idle("X26ABC1")
+
+
+def test_warm_up_loads_outbound_mappings(
+    mesh_s3_bucket: str, environment: str, send_message_sfn_arn: str
+):
+    from mesh_check_send_parameters_application import (
+        MeshCheckSendParametersApplication,
+    )
+
+    app = MeshCheckSendParametersApplication()
+    app.config.warm_up_on_init = True
+    app.config.mesh_mailbox_ids = ["X26ABC1"]
+
+    with mock.patch.object(
+        app.ssm, "get_parameters_by_path", wraps=app.ssm.get_parameters_by_path
+    ) as get_parameters_by_path:
+        app.warm_up()
+        assert get_parameters_by_path.call_count == 1
+
+        response = app.main(event=sample_trigger_event(mesh_s3_bucket), context=CONTEXT)
+
+    assert response["statusCode"] == int(HTTPStatus.OK)
+    assert get_parameters_by_path.call_count == 1
+    # no mesh client is needed to check send parameters
+    assert not app.clients.idle("X26ABC1")
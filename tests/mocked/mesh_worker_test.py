@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+from http import HTTPStatus
+from typing import Any
+from unittest import mock
+
+import pytest
+from mesh_client import MeshClient
+from mypy_boto3_s3 import S3Client
+from nhs_aws_helpers import dynamodb_client, sqs_client, stepfunctions
+
+from .mesh_check_send_parameters_application_test import sample_trigger_event
+from .mesh_testing_common import CONTEXT, FILE_CONTENT, reset_sandbox_mailbox
+
+
+@pytest.fixture(name="worker_lease_table")
+def _worker_lease_table(environment: str):
+    table_name = f"{environment}-worker-lease"
+    dynamodb_client().create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "mailbox_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "mailbox_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    with mock.patch.dict(os.environ, {"WORKER_LEASE_TABLE": table_name}):
+        yield table_name
+
+
+async def test_worker_send_then_poll_and_fetch(
+    environment: str,
+    mesh_s3_bucket: str,
+    s3_client: S3Client,
+    send_message_sfn_arn: str,
+    get_messages_sfn_arn: str,
+    mesh_client_one: MeshClient,
+):
+    from mesh_worker import MeshWorker
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+
+    worker = MeshWorker(mailbox_ids=[mesh_client_one._mailbox])
+
+    response = await worker.send(sample_trigger_event(mesh_s3_bucket))
+    assert response["statusCode"] == 200
+    assert response["body"]["complete"] is True
+    message_id = response["body"]["message_id"]
+
+    more_messages = await worker.poll(mesh_client_one._mailbox)
+    assert not more_messages
+
+    s3_object = s3_client.get_object(
+        Bucket=mesh_s3_bucket,
+        Key=f"inbound/{mesh_client_one._mailbox}/{message_id}.dat",
+    )
+    assert s3_object["Body"].read().decode() == FILE_CONTENT
+    assert message_id not in mesh_client_one.list_messages()
+
+
+@pytest.mark.parametrize("multi_mailbox", [False, True])
+async def test_worker_defers_to_running_step_function(
+    environment: str,
+    get_messages_sfn_arn: str,
+    mesh_client_one: MeshClient,
+    multi_mailbox: bool,
+):
+    from mesh_worker import MeshWorker
+
+    mesh_client_one.send_message(
+        mesh_client_one._mailbox, b"waiting", workflow_id="WORKER_TEST"
+    )
+
+    # an execution polling the mailbox alone, or along with others
+    sf_input: dict[str, Any] = (
+        {"mailboxes": ["X26ABC2", mesh_client_one._mailbox]}
+        if multi_mailbox
+        else {"mailbox": mesh_client_one._mailbox}
+    )
+    stepfunctions().start_execution(
+        stateMachineArn=get_messages_sfn_arn, input=json.dumps(sf_input)
+    )
+
+    worker = MeshWorker(mailbox_ids=[mesh_client_one._mailbox])
+    assert worker._step_function_running(mesh_client_one._mailbox)
+    assert not worker._step_function_running("X26ABC9")
+    assert not await worker.poll(mesh_client_one._mailbox)
+    assert mesh_client_one.list_messages()
+
+
+async def test_worker_sends_from_queue_and_stops(
+    environment: str,
+    mesh_s3_bucket: str,
+    send_message_sfn_arn: str,
+    get_messages_sfn_arn: str,
+    mesh_client_one: MeshClient,
+):
+    from mesh_worker import MeshWorker
+
+    reset_sandbox_mailbox(mesh_client_one._mailbox)
+
+    sqs = sqs_client()
+    queue_url = sqs.create_queue(QueueName=f"{environment}-send")["QueueUrl"]
+    sqs.send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps(sample_trigger_event(mesh_s3_bucket)),
+    )
+
+    worker = MeshWorker(
+        mailbox_ids=[],
+        send_queue_url=queue_url,
+        poll_interval=0.1,
+        shutdown_timeout=10,
+    )
+    running = asyncio.create_task(worker.run())
+
+    for _ in range(100):
+        if mesh_client_one.list_messages():
+            break
+        await asyncio.sleep(0.1)
+
+    worker.stop()
+    await asyncio.wait_for(running, timeout=30)
+
+    assert len(mesh_client_one.list_messages()) == 1
+    queue_attributes = sqs.get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=["All"]
+    )["Attributes"]
+    assert queue_attributes["ApproximateNumberOfMessages"] == "0"
+    assert queue_attributes["ApproximateNumberOfMessagesNotVisible"] == "0"
+
+
+async def test_step_function_defers_to_worker_lease(
+    environment: str,
+    mesh_s3_bucket: str,
+    get_messages_sfn_arn: str,
+    mesh_client_one: MeshClient,
+    mesh_client_two: MeshClient,
+    worker_lease_table: str,
+    capsys,
+):
+    from mesh_poll_mailbox_application import MeshPollMailboxApplication
+    from mesh_worker import MeshWorker
+
+    leased, other = mesh_client_one._mailbox, mesh_client_two._mailbox
+    reset_sandbox_mailbox(leased)
+    mesh_client_one.send_message(leased, b"waiting", workflow_id="WORKER_TEST")
+
+    worker = MeshWorker(mailbox_ids=[leased])
+    assert worker.lease
+    assert worker.lease.table_name == worker_lease_table
+
+    # the worker polls and fetches its own leased mailbox
+    assert not await worker.poll(leased)
+    assert not mesh_client_one.list_messages()
+    assert worker.lease.holder(leased) == worker.lease.owner
+    capsys.readouterr()
+
+    # while the get messages lambda leaves it alone
+    app = MeshPollMailboxApplication()
+    response = app.main(event={"mailbox": leased}, context=CONTEXT)
+    assert response["statusCode"] == HTTPStatus.TOO_MANY_REQUESTS
+
+    response = app.main(event={"mailboxes": [leased, other]}, context=CONTEXT)
+    assert response["statusCode"] == HTTPStatus.NO_CONTENT
+
+    logs = capsys.readouterr()
+    assert "logReference=MESHPOLL0002 " in logs.out
+    assert "logReference=MESHPOLL0006 " in logs.out
+    polled = [line for line in logs.out.splitlines() if "MESHMBOX0005" in line]
+    assert any(other in line for line in polled)
+    assert not any(leased in line for line in polled)
+
+    # as does another worker
+    other_worker = MeshWorker(mailbox_ids=[leased])
+    assert not await other_worker.poll(leased)
+
+    # until the lease is released
+    worker._release_leases()
+    assert worker.lease.holder(leased) is None
+    response = app.main(event={"mailbox": leased}, context=CONTEXT)
+    assert response["statusCode"] == HTTPStatus.NO_CONTENT
+
+
+def test_lease_expires(environment: str, worker_lease_table: str):
+    from shared.lease import MailboxLease
+
+    now = [1000.0]
+    lease = MailboxLease(worker_lease_table, duration=60, clock=lambda: now[0])
+    other = MailboxLease(worker_lease_table, duration=60, clock=lambda: now[0])
+
+    assert lease.acquire("X26ABC1")
+    # renewed by its owner only
+    assert lease.acquire("X26ABC1")
+    assert not other.acquire("X26ABC1")
+    assert other.held_elsewhere("X26ABC1")
+
+    now[0] += 61
+    assert not other.held_elsewhere("X26ABC1")
+    assert other.acquire("X26ABC1")
+    assert lease.held_elsewhere("X26ABC1")
+
+    # only released by its owner
+    lease.release("X26ABC1")
+    assert other.holder("X26ABC1") == other.owner
+
+
+@pytest.mark.parametrize(
+    ("argv", "expected"),
+    [
+        ([], ["X26ABC1", "X26ABC2"]),
+        (["--mailbox", "X26ABC3"], ["X26ABC3"]),
+        (["--mailbox", "X26ABC3", "--mailbox", "X26ABC1"], ["X26ABC3", "X26ABC1"]),
+    ],
+)
+def test_worker_cli_mailboxes(argv: list[str], expected: list[str]):
+    import mesh_worker
+
+    with mock.patch.dict(
+        os.environ, {"MESH_MAILBOX_IDS": "X26ABC1, X26ABC2"}
+    ), mock.patch.object(mesh_worker, "MeshWorker") as worker_class:
+        worker_class.return_value.run = mock.AsyncMock()
+        mesh_worker.main(argv)
+
+    assert worker_class.call_args.kwargs["mailbox_ids"] == expected